@@ -0,0 +1 @@
+"""Offline benchmarks for the bots, run with `python -m benchmarks.<name>`."""
@@ -0,0 +1,65 @@
+"""
+Compares a fresh aiohttp session per request (the bots' original behaviour)
+against the shared, pooled `AIClient` at 1, 10 and 100 concurrent requests.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_ai_client [--requests 300] [--no-tls]
+"""
+import argparse
+import asyncio
+import time
+import aiohttp
+from bots.shared.ai_client import AIClient
+from benchmarks.stub_openrouter import StubOpenRouter
+
+
+async def fetch_with_new_session(base_url: str, message: str) -> str:
+    """The pre-pooling request path: one ClientSession, and one handshake, per call."""
+    data = {"model": "openai/gpt-4", "prompt": message, "max_tokens": 1000, "temperature": 1.0}
+    async with aiohttp.ClientSession() as session:
+        async with session.post(base_url + "/completions", json=data, ssl=False) as response:
+            response_data = await response.json()
+            return response_data["choices"][0]["text"].strip()
+
+
+async def run_level(fetch, concurrency: int, total: int) -> float:
+    """Issues `total` requests with at most `concurrency` in flight and returns the wall time."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            await fetch(f"question {i}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    return time.perf_counter() - started
+
+
+async def main(total: int, tls: bool):
+    stub = StubOpenRouter(tls=tls)
+    await stub.start()
+    print(f"Stub server at {stub.base_url} ({total} requests per run)\n")
+    print(f"{'mode':<12}{'concurrency':>12}{'req/s':>10}{'ms/req':>10}{'handshakes':>12}")
+    try:
+        for concurrency in (1, 10, 100):
+            stub.reset()
+            elapsed = await run_level(lambda m: fetch_with_new_session(stub.base_url, m), concurrency, total)
+            print(f"{'per-request':<12}{concurrency:>12}{total / elapsed:>10.0f}"
+                  f"{elapsed * 1000 * concurrency / total:>10.2f}{len(stub.connections):>12}")
+
+            stub.reset()
+            async with AIClient("bench", base_url=stub.base_url, pool_size=100, ssl=False) as client:
+                elapsed = await run_level(client.fetch_ai_response, concurrency, total)
+            print(f"{'pooled':<12}{concurrency:>12}{total / elapsed:>10.0f}"
+                  f"{elapsed * 1000 * concurrency / total:>10.2f}{len(stub.connections):>12}")
+    finally:
+        await stub.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300, help="requests per run")
+    parser.add_argument("--no-tls", action="store_true", help="serve the stub over plain HTTP")
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, tls=not args.no_tls))
@@ -0,0 +1,172 @@
+"""
+Micro-benchmark of the response chunker: splits synthetic Markdown
+responses of growing size for each platform's limits, checks that the
+time per megabyte stays flat, and compares the messages with naive
+fixed-width slicing.
+
+The responses mix prose, URLs, CJK text, emoji sequences, accented
+characters, long unbroken tokens and fenced code blocks. Every split is
+checked: each message fits the platform's limit, code blocks are balanced,
+no word, URL or emoji is cut, and no text is lost. So is every message a
+streamed answer spills into, counted as the platform counts it.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_chunking [--sizes 1,2,4,8]
+"""
+import argparse
+import asyncio
+import random
+import re
+import time
+from bots.shared.chunking import DISCORD, FENCE, JOINERS, TELEGRAM, TWITTER, split_message
+from bots.shared.streaming import StreamingReply
+
+PLATFORMS = {"discord": DISCORD, "telegram": TELEGRAM, "twitter": TWITTER}
+URL = re.compile(r"https://\S+")
+WORDS = ["latency", "throughput", "the", "a", "queue", "shard", "token", "response", "caché", "naïve",
+         "cafe\u0301", "数据", "延迟", "👍🏽", "\U0001f468\u200d\U0001f469\u200d\U0001f467", "🚀",
+         "https://example.com/docs/chunking?page=2"]
+
+
+def paragraph(rng: random.Random) -> str:
+    sentences = []
+    for _ in range(rng.randint(1, 6)):
+        words = rng.choices(WORDS, k=rng.randint(4, 30))
+        sentences.append(" ".join(words).capitalize() + rng.choice([".", "!", "?", "…"]))
+    return " ".join(sentences)
+
+
+def code_block(rng: random.Random) -> str:
+    language = rng.choice(["python", "js", ""])
+    lines = [f"    value_{i} = compute({i}, \"{rng.choice(WORDS)}\")" for i in range(rng.randint(3, 150))]
+    return f"```{language}\n" + "\n".join(lines) + "\n```"
+
+
+def response(size: int, seed: int = 0) -> str:
+    """Builds a synthetic Markdown response of about `size` characters."""
+    rng = random.Random(seed)
+    parts = []
+    length = 0
+    while length < size:
+        roll = rng.random()
+        if roll < 0.2:
+            part = code_block(rng)
+        elif roll < 0.22:
+            part = "x" * rng.randint(300, 5000)
+        else:
+            part = paragraph(rng)
+        parts.append(part)
+        length += len(part) + 2
+    return "\n\n".join(parts)
+
+
+def naive_split(text: str, limit: int) -> list:
+    return [text[i:i + limit] for i in range(0, len(text), limit)]
+
+
+def broken_boundaries(chunks: list) -> int:
+    """Counts message boundaries that cut through a word; the chunker only does so in tokens longer than a message."""
+    return sum(1 for a, b in zip(chunks, chunks[1:]) if a[-1:].isalnum() and b[:1].isalnum())
+
+
+def check(name: str, text: str, chunks: list):
+    limits = PLATFORMS[name]
+    for chunk in chunks:
+        assert limits.measure(chunk) <= limits.limit, f"{name}: a message exceeds the limit"
+        if limits.markdown:
+            assert len(FENCE.findall(chunk)) % 2 == 0, f"{name}: unbalanced code block"
+    for a, b in zip(chunks, chunks[1:]):
+        assert not (b[0] in JOINERS or a[-1] == "\u200d" or "\U0001f3fb" <= b[0] <= "\U0001f3ff"
+                    or b[0] == "\u0301"), f"{name}: an emoji or accented character was split"
+    urls = set(URL.findall(text))
+    assert urls <= set(URL.findall("\n".join(chunks))), f"{name}: a URL was split"
+
+    def content(value):
+        if limits.markdown:
+            value = FENCE.sub("", value)
+        return re.sub(r"\s", "", value)
+
+    assert content("\n".join(chunks)) == content(text), f"{name}: text was lost or changed"
+
+
+def edge_cases():
+    """Checks a few splits by hand: code blocks re-opened with their language and emoji cut whole."""
+    code = "Intro.\n\n```python\n" + "\n".join(f"print({i})" for i in range(500)) + "\n```\n\nDone."
+    chunks = split_message(code, DISCORD)
+    assert all(chunk.startswith("```python\n") for chunk in chunks[1:-1]), "code block not re-opened"
+    assert all(chunk.endswith("\n```") for chunk in chunks[:-1]), "code block not closed"
+    chunks = split_message("\U0001f44d\U0001f3fd" * 1500, DISCORD)
+    assert all(chunk.startswith("\U0001f44d") for chunk in chunks), "emoji split from its skin tone"
+    chunks = split_message("One sentence here. " * 300, TWITTER, reserve=20)
+    assert all(chunk.endswith(".") for chunk in chunks), "tweet not cut at a sentence end"
+    assert split_message("short", TELEGRAM) == ["short"]
+
+
+async def stream(text: str, limits, fragment: int = 7) -> list:
+    """Streams `text` into messages through `StreamingReply`, `fragment` characters at a time; returns their texts."""
+    messages = []
+
+    async def edit(index, content, final):
+        messages[index] = content
+
+    async def send(content, final):
+        messages.append(content)
+        return len(messages) - 1
+
+    reply = StreamingReply(None, edit, send, limits, edit_interval=0.0)
+    for start in range(0, len(text), fragment):
+        await reply.feed(text[start:start + fragment])
+    await reply.finish()
+    return messages
+
+
+def streaming_cases():
+    """Checks that streamed messages fit the limit as the platform counts it and carry code blocks over."""
+    for name, text in (("emoji", "🚀 " * 5000), ("emoji runs", "👍🏽" * 3000),
+                       ("mixed", response(50_000, seed=3))):
+        for platform, limits in (("telegram", TELEGRAM), ("discord", DISCORD)):
+            messages = asyncio.run(stream(text, limits))
+            longest = max(limits.measure(message) for message in messages)
+            assert longest <= limits.limit, f"{platform} {name}: a streamed message counts {longest}"
+            assert "".join(FENCE.sub("", text).split()) == "".join(FENCE.sub("", "\n".join(messages)).split()), \
+                f"{platform} {name}: text lost"
+            assert all(len(FENCE.findall(message)) % 2 == 0 for message in messages), \
+                f"{platform} {name}: unbalanced code block"
+            assert all(message.startswith("👍") for message in messages) or name != "emoji runs", \
+                f"{platform} {name}: emoji split from its skin tone"
+    code = "Intro.\n\n```python\n" + "\n".join(f"print({i})" for i in range(500)) + "\n```\n\nDone."
+    messages = asyncio.run(stream(code, DISCORD))
+    assert len(messages) > 2 and all(len(message) <= DISCORD.limit for message in messages)
+    assert all(message.startswith("```python\n") for message in messages[1:-1]), "streamed code block not re-opened"
+    assert all(message.endswith("\n```") for message in messages[:-1]), "streamed code block not closed"
+    lines = [line for message in messages for line in message.split("\n") if line.startswith("print(")]
+    assert lines == [f"print({i})" for i in range(500)], "a streamed code line was lost or split"
+
+
+def main(sizes: list):
+    edge_cases()
+    streaming_cases()
+    print(f"{'platform':<10}{'MB':>4}{'seconds':>10}{'MB/s':>8}{'messages':>10}{'naive':>8}{'cut words':>11}"
+          f"{'naive cut':>11}")
+    for name, limits in PLATFORMS.items():
+        per_mb = []
+        for megabytes in sizes:
+            text = response(megabytes * 1_000_000)
+            started = time.perf_counter()
+            chunks = split_message(text, limits)
+            elapsed = time.perf_counter() - started
+            per_mb.append(elapsed / megabytes)
+            check(name, text, chunks)
+            naive = naive_split(text, limits.limit)
+            print(f"{name:<10}{megabytes:>4}{elapsed:>10.3f}{megabytes / elapsed:>8.1f}{len(chunks):>10}"
+                  f"{len(naive):>8}{broken_boundaries(chunks):>11}{broken_boundaries(naive):>11}")
+        # Allow for noise, but a quadratic splitter would grow with the size ratio
+        assert max(per_mb) < 3 * min(per_mb), f"{name}: splitting time grows faster than the input"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1,2,4,8", help="comma-separated response sizes in megabytes")
+    args = parser.parse_args()
+    main([int(size) for size in args.sizes.split(",")])
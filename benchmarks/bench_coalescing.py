@@ -0,0 +1,46 @@
+"""
+Fires bursts of identical concurrent prompts, as during a popular Discord
+event, and reports how many upstream calls single-flight coalescing saves.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_coalescing [--burst 100] [--latency 0.2]
+"""
+import argparse
+import asyncio
+import time
+from bots.shared.ai_client import AIClient
+from bots.shared.coalescing import RequestCoalescer
+from benchmarks.stub_openrouter import StubOpenRouter
+
+
+async def burst(client: AIClient, size: int, distinct: int) -> float:
+    """Sends `size` concurrent requests spread over `distinct` prompts and returns the wall time."""
+    started = time.perf_counter()
+    await asyncio.gather(*(client.fetch_ai_response(f"event question {i % distinct}") for i in range(size)))
+    return time.perf_counter() - started
+
+
+async def main(size: int, latency: float):
+    stub = StubOpenRouter(latency=latency)
+    await stub.start()
+    print(f"{'mode':<12}{'distinct':>10}{'callers':>10}{'upstream':>10}{'saved':>8}{'wall ms':>10}")
+    try:
+        for distinct in (1, 10, size):
+            for coalescer in (None, RequestCoalescer()):
+                stub.reset()
+                async with AIClient("bench", base_url=stub.base_url, coalescer=coalescer) as client:
+                    elapsed = await burst(client, size, distinct)
+                saved = coalescer.stats()["coalesced_calls"] if coalescer else 0
+                mode = "coalesced" if coalescer else "plain"
+                print(f"{mode:<12}{distinct:>10}{size:>10}{stub.requests:>10}{saved:>8}{elapsed * 1000:>10.1f}")
+    finally:
+        await stub.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--burst", type=int, default=100, help="concurrent callers per burst")
+    parser.add_argument("--latency", type=float, default=0.2, help="stub response latency in seconds")
+    args = parser.parse_args()
+    asyncio.run(main(args.burst, args.latency))
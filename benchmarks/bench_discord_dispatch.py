@@ -0,0 +1,237 @@
+"""
+Measures the cost of dispatching Discord button clicks and modal
+submissions, comparing the bot's custom_id table with the code it replaced.
+
+The previous bot built a new view and button for every `/ask`, defined its
+modal class again on every click, and matched custom_ids with string
+comparisons in `on_interaction`, one more comparison for every component
+added. The bot now sends views built once and looks each interaction up in
+a custom_id table.
+
+The runs, each over `--interactions` synthetic interactions:
+
+- `/ask` replies followed by a click on the button, which opens the form;
+- routing a mix of clicks, submissions and slash commands, with the
+  handlers left out, for the bot's 5 custom_ids and for `--components`
+  registered ones, through an if/elif chain and through the table.
+
+The checks: every custom_id reaches its handler on a freshly built bot, as
+after a restart; the form and views are the same objects on every
+interaction and never tracked by discord.py; "Regenerate" asks the last
+question again without the cache and "Continue" carries on the
+conversation; forgotten conversations and unknown ids are answered or
+ignored.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_discord_dispatch [--interactions 10000] [--components 100]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import time
+import discord
+from bots.discord import views
+from bots.discord.bot import CONTINUE_PROMPT, FORGOTTEN_MESSAGE, AIChatBot
+from bots.shared.ai_client import AIClient
+from bots.shared.memory import ConversationMemory
+from bots.shared.outbound import OutboundScheduler
+from bots.shared.scheduler import RequestScheduler
+from bots.shared.settings import Settings
+from benchmarks.stub_discord import StubDiscord
+
+
+class LegacyHandlers:
+    """The button and modal code of the bot before the custom_id table, for comparison."""
+
+    def __init__(self, bot):
+        self.bot = bot
+
+    async def ask_command(self, interaction):
+        button = discord.ui.Button(label="Ask the AI", style=discord.ButtonStyle.primary, custom_id="ask_ai_button")
+        view = discord.ui.View()
+        view.add_item(button)
+        await interaction.response.send_message("Click the button to ask the AI:", view=view, ephemeral=True)
+
+    async def handle_modal_interaction(self, interaction):
+        class AskModal(discord.ui.Modal, title="Ask the AI"):
+            question = discord.ui.TextInput(label="What would you like to ask the AI?",
+                                            style=discord.TextStyle.paragraph)
+
+            def __init__(self, bot):
+                super().__init__()
+                self.bot = bot
+
+            async def on_submit(self, interaction):
+                await interaction.response.defer(ephemeral=True)
+                await self.bot.show_thinking_message(interaction, self.question.value, command="ask")
+
+        await interaction.response.send_modal(AskModal(self.bot))
+
+    async def on_interaction(self, interaction):
+        custom_id = interaction.data.get("custom_id") if interaction.data else None
+        if custom_id == "ask_ai_button":
+            await self.handle_modal_interaction(interaction)
+
+
+def build_bot() -> AIChatBot:
+    """Builds the bot against a memory-backed AI client that is never opened, without reading the environment."""
+    return AIChatBot(ai_client=AIClient("bench", base_url="http://127.0.0.1:9", memory=ConversationMemory()),
+                     scheduler=RequestScheduler(), outbound=OutboundScheduler("discord", ()), jobs=None,
+                     settings=Settings())
+
+
+def record_requests(bot: AIChatBot) -> list:
+    """Replaces the bot's AI round trip with a recorder; returns the list of (message, use_cache, command)."""
+    calls = []
+
+    async def show_thinking_message(interaction, message, use_cache=True, command=None, replace_last=False):
+        calls.append((message, use_cache, command) + (("replace_last",) if replace_last else ()))
+
+    bot.show_thinking_message = show_thinking_message
+    return calls
+
+
+def submission(question: str) -> dict:
+    return {"custom_id": views.ASK_MODAL, "components": [
+        {"type": 1, "components": [{"type": 4, "custom_id": views.QUESTION_INPUT, "value": question}]}]}
+
+
+async def timed(coroutine_function, items) -> float:
+    started = time.perf_counter()
+    for item in items:
+        await coroutine_function(item)
+    return time.perf_counter() - started
+
+
+def row(label: str, seconds: float, count: int, baseline: float = None):
+    speedup = f"{baseline / seconds:>8.1f}x" if baseline else ""
+    print(f"{label:<44}{seconds:>8.3f}{seconds / count * 1e6:>10.1f}{speedup}")
+
+
+async def ask_flow(count: int):
+    """Times `/ask` followed by a click on its button, with the previous code and the current bot."""
+    discord_stub = StubDiscord()
+    bot = build_bot()
+    legacy = LegacyHandlers(bot)
+    interactions = [discord_stub.interaction(i, i, i) for i in range(count)]
+    clicks = [discord_stub.interaction(i, i, i, {"custom_id": "ask_ai_button", "component_type": 2})
+              for i in range(count)]
+    legacy_seconds = await timed(legacy.ask_command, interactions) + await timed(legacy.on_interaction, clicks)
+    for click in clicks:
+        click.data = {"custom_id": views.ASK_BUTTON, "component_type": 2}
+    seconds = await timed(bot.ask_command, interactions) + await timed(bot.on_interaction, clicks)
+    row("/ask + click, new view and modal class each", legacy_seconds, count)
+    row("/ask + click, components built once", seconds, count, legacy_seconds)
+
+    assert {id(i.response.view) for i in interactions} == {id(bot.ask_view)}
+    assert {id(c.response.modal) for c in clicks} == {id(bot.ask_modal)}
+    assert type(clicks[0].response.modal) is views.AskModal
+    await bot.outbound.close()
+
+
+def chain(pairs: list):
+    """An if/elif chain over `pairs` of (custom_id, handler), as the previous `on_interaction` grew."""
+    async def on_interaction(interaction):
+        custom_id = interaction.data.get("custom_id") if interaction.data else None
+        for candidate, handler in pairs:
+            if custom_id == candidate:
+                await handler(interaction)
+                return
+    return on_interaction
+
+
+async def routing(count: int, components: int):
+    """Times routing alone, with the handlers replaced by a counter, for few and many custom_ids."""
+    handled = []
+
+    async def handler(interaction):
+        handled.append(interaction)
+
+    discord_stub = StubDiscord()
+    bot = build_bot()
+    ids = list(bot.interaction_handlers)
+    many = ids + [f"ai:extra:{i}" for i in range(components - len(ids))]
+    # Clicks spread over the bot's own components, plus slash commands, which carry no custom_id
+    kinds = [{"custom_id": custom_id} for custom_id in ids] + [{"name": "call"}]
+    interactions = [discord_stub.interaction(i, i, i, kinds[i % len(kinds)]) for i in range(count)]
+    expected = sum(1 for interaction in interactions if "custom_id" in interaction.data)
+
+    for label, registered in ((f"{len(ids)} custom_ids", ids), (f"{components} custom_ids", many)):
+        # Rarely clicked components registered first, as a chain grows
+        pairs = [(custom_id, handler) for custom_id in reversed(registered)]
+        handled.clear()
+        chain_seconds = await timed(chain(pairs), interactions)
+        assert len(handled) == expected
+        bot.interaction_handlers = dict(pairs)
+        handled.clear()
+        seconds = await timed(bot.on_interaction, interactions)
+        assert len(handled) == expected
+        row(f"route, {label}, if/elif chain", chain_seconds, count)
+        row(f"route, {label}, custom_id table", seconds, count, chain_seconds)
+    await bot.outbound.close()
+
+
+async def check_handlers():
+    """Checks each custom_id's handler on a freshly built bot, as after a restart."""
+    discord_stub = StubDiscord()
+    bot = build_bot()
+    calls = record_requests(bot)
+    key = ("discord", 7, 7)
+
+    for custom_id in (views.ASK_BUTTON, views.LEGACY_ASK_BUTTON):
+        click = discord_stub.interaction(1, 7, 7, {"custom_id": custom_id, "component_type": 2})
+        await bot.on_interaction(click)
+        assert click.response.modal is bot.ask_modal
+
+    await bot.on_interaction(discord_stub.interaction(2, 7, 7, submission("What is a monad?")))
+    assert calls.pop() == ("What is a monad?", True, "ask")
+
+    memory = bot.ai_client.memory
+    memory.remember(key, "What is a monad?", "A monoid in the category of endofunctors.")
+    await bot.on_interaction(discord_stub.interaction(3, 7, 7, {"custom_id": views.REGENERATE_BUTTON}))
+    assert calls.pop() == ("What is a monad?", False, "regenerate", "replace_last")
+    assert memory.last_exchange(key)[1].startswith("A monoid"), "the old answer is kept until a new one arrives"
+    assert memory.history(key, skip_last=True) == [], "the regenerated exchange is not sent along"
+    # The bench client's upstream is unreachable, so the request fails and the old exchange stays
+    await bot.ai_client.fetch_ai_response("What is a monad?", use_cache=False, conversation=key, replace_last=True)
+    await bot.ai_client.close()
+    assert memory.last_exchange(key)[1].startswith("A monoid"), "a failed regeneration lost the exchange"
+    memory.remember(key, "What is a monad?", "A monad is ...", replace_last=True)
+    assert len(memory.history(key)) == 2, "the regenerated exchange is replaced, not kept twice"
+
+    await bot.on_interaction(discord_stub.interaction(4, 7, 7, {"custom_id": views.CONTINUE_BUTTON}))
+    assert calls.pop() == (CONTINUE_PROMPT, False, "continue")
+
+    for custom_id in (views.REGENERATE_BUTTON, views.CONTINUE_BUTTON):
+        await bot.on_interaction(discord_stub.interaction(5, 8, 8, {"custom_id": custom_id}))
+        assert discord_stub.events[5][-1][2] == FORGOTTEN_MESSAGE
+
+    sent = discord_stub.calls
+    for data in ({"custom_id": "someone-elses-button"}, {"name": "call"}, None):
+        await bot.on_interaction(discord_stub.interaction(6, 7, 7, data))
+    assert not calls and discord_stub.calls == sent, "unknown interactions are ignored"
+
+    for view in (bot.ask_view, bot.answer_view):
+        assert view.is_persistent() and view.is_finished() and not view.is_dispatchable()
+    assert bot.ask_modal.is_finished()
+    assert build_bot().interaction_handlers.keys() == bot.interaction_handlers.keys()
+    await bot.outbound.close()
+
+
+async def main(interactions: int, components: int):
+    with contextlib.redirect_stdout(io.StringIO()):
+        await check_handlers()
+    print(f"{'run':<44}{'seconds':>8}{'µs each':>10}{'speedup':>9}")
+    await ask_flow(interactions)
+    await routing(interactions, components)
+    print("\nevery custom_id reached its handler on a fresh bot; views and the form were built once")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--interactions", type=int, default=10_000, help="synthetic interactions per run")
+    parser.add_argument("--components", type=int, default=100, help="custom_ids registered in the larger routing run")
+    args = parser.parse_args()
+    asyncio.run(main(args.interactions, args.components))
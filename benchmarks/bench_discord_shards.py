@@ -0,0 +1,173 @@
+"""
+Measures how fast the sharded Discord bot takes in gateway events when its
+shards are spread over worker processes, and checks when it syncs commands.
+
+A local stub stands in for Discord's gateway and REST API. Each run starts
+`--shards` shards laid out round-robin over a number of processes, as
+`python -m bots.runtime --processes N` does with `DISCORD_SHARDS`, each
+process hosting its share on one `ShardedAIChatBot` with one AI client.
+Every shard receives `--guilds` guilds, then `--events` messages, and is
+told halfway to reconnect, which it must do by resuming its session. Each
+process reports the messages it handled per second, from the first to the
+last, and the time from logging in to its first message.
+
+The checks: every message reaches a process exactly once; every shard
+identifies once, with the count it was given, and resumes once; commands
+are synced by the process hosting shard 0 on the first start only, never on
+a reconnect or a restart with the same commands, and again once they
+change.
+
+The processes share one core unless the machine has more, so they add
+throughput only up to its core count.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_discord_shards [--shards 8] [--processes 1,2,4] [--guilds 20] [--events 2000]
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from bots.discord.sharding import shard_layout
+from benchmarks.stub_gateway import StubGateway
+
+CHILD_ENV = {
+    "AI_CACHE": "off",
+    "AI_JOBS": "0",
+}
+
+
+async def child(config: dict):
+    """Runs one worker process's bot against the stub until its shards got every message; prints its figures."""
+    import discord
+    import yarl
+    from bots.discord.bot import discord_bot_from_settings
+    from bots.shared.ai_client import AIClient
+    from bots.shared.outbound import OutboundScheduler
+    from bots.shared.scheduler import RequestScheduler
+    from bots.shared.settings import Settings
+
+    discord.http.Route.BASE = f"{config['base_url']}/api/v10"
+    discord.gateway.DiscordWebSocket.DEFAULT_GATEWAY = yarl.URL(config["gateway_url"])
+    shards = config["shards"]
+    # All shards share one identify window, as for a bot with a max_concurrency of at least `shards`
+    settings = Settings(discord_shards=shards, discord_identify_concurrency=shards,
+                        discord_commands_state=config["state"])
+    bot = discord_bot_from_settings(settings, shard_ids=config["shard_ids"], identify_start=config["identify_start"],
+                                    ai_client=AIClient("bench", base_url="http://127.0.0.1:9"),
+                                    scheduler=RequestScheduler(), outbound=OutboundScheduler("discord", ()), jobs=None)
+    if config["extra_command"]:
+        @bot.tree.command(name="ping", description="Replies with pong")
+        async def ping(interaction: discord.Interaction):
+            await interaction.response.send_message("pong")
+
+    expected = len(config["shard_ids"]) * config["events"]
+    seen = set()
+    times = []
+    done = asyncio.Event()
+
+    async def count(message: discord.Message):
+        seen.add(message.id)
+        # Wall clock, so the parent can line up the processes
+        times.append(time.time())
+        if len(times) == expected:
+            done.set()
+
+    bot.add_listener(count, "on_message")
+    started = time.time()
+    async with bot:
+        await bot.login("bench")
+        connection = asyncio.create_task(bot.connect())
+        await asyncio.wait_for(done.wait(), config["timeout"])
+        await bot.close()
+        connection.cancel()
+    guilds = len(bot.guilds)
+    await bot.ai_client.close()
+    seconds = times[-1] - times[0]
+    print(json.dumps({
+        "events": len(times), "unique": len(seen), "guilds": guilds, "seconds": seconds,
+        "events_per_second": (len(times) - 1) / seconds if seconds else 0.0,
+        "first_seconds": times[0] - started, "first_at": times[0], "last_at": times[-1],
+        "rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }), flush=True)
+
+
+async def run_processes(gateway: StubGateway, processes: int, state: str, events: int, guilds: int,
+                        extra_command: bool = False) -> list:
+    """Starts the worker processes of one layout at once; returns each one's figures."""
+    layout = shard_layout(gateway.shard_count, processes)
+    identify_start = time.time()
+    env = {**os.environ, **CHILD_ENV}
+    workers = []
+    for shard_ids in layout:
+        config = {"base_url": gateway.base_url, "gateway_url": gateway.gateway_url, "shards": gateway.shard_count,
+                  "shard_ids": shard_ids, "identify_start": identify_start, "state": state, "events": events,
+                  "extra_command": extra_command, "timeout": 300.0}
+        workers.append(await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "benchmarks.bench_discord_shards", "--child", json.dumps(config),
+            stdout=asyncio.subprocess.PIPE, env=env))
+    results = []
+    for shard_ids, worker in zip(layout, workers):
+        output, _ = await worker.communicate()
+        assert worker.returncode == 0, f"worker for shards {shard_ids} exited with {worker.returncode}"
+        result = json.loads(output.decode().strip().splitlines()[-1])
+        assert result["events"] == result["unique"] == len(shard_ids) * events, "every message arrives once"
+        assert result["guilds"] == len(shard_ids) * guilds, "each shard received its own guilds"
+        results.append(result)
+    return results
+
+
+async def run_layout(shards: int, processes: int, guilds: int, events: int) -> list:
+    """Runs one layout against a fresh gateway, three times: first start, restart, restart with a new command."""
+    with tempfile.TemporaryDirectory() as directory:
+        state = os.path.join(directory, "discord_commands.json")
+        syncs = []
+        for extra_command in (False, False, True):
+            gateway = StubGateway(shards, guilds, events)
+            await gateway.start()
+            try:
+                results = await run_processes(gateway, processes, state, events, guilds, extra_command)
+            finally:
+                await gateway.stop()
+            assert sorted(shard_id for shard_id, _ in gateway.identifies) == list(range(shards)), \
+                "each shard identifies exactly once"
+            assert sorted(gateway.resumes) == list(range(shards)), "each shard resumes after its reconnect"
+            syncs.append(len(gateway.command_syncs))
+            if not extra_command:
+                measured = results
+        assert syncs == [1, 0, 1], f"commands synced on start, restart and change: {syncs}"
+    return measured
+
+
+def main(shards: int, process_counts: list, guilds: int, events: int):
+    print(f"{shards} shards, {guilds} guilds and {events} messages each, one reconnect per shard, "
+          f"{os.cpu_count()} CPU(s)\n")
+    print(f"{'processes':>9}{'shards each':>13}{'msgs/s each':>13}{'msgs/s total':>14}{'first msg s':>13}{'RSS MB':>9}")
+    for processes in process_counts:
+        results = asyncio.run(run_layout(shards, processes, guilds, events))
+        rates = [result["events_per_second"] for result in results]
+        span = max(result["last_at"] for result in results) - min(result["first_at"] for result in results)
+        total = shards * events / span
+        first = max(result["first_seconds"] for result in results)
+        rss = sum(result["rss_kb"] for result in results) / 1024
+        print(f"{processes:>9}{shards / processes:>13.1f}{sum(rates) / len(rates):>13.0f}{total:>14.0f}"
+              f"{first:>13.2f}{rss:>9.1f}")
+    print("\nevery message arrived once; commands synced on the first start and after a change only")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shards", type=int, default=8, help="total gateway shards")
+    parser.add_argument("--processes", default="1,2,4", help="comma-separated process counts to compare")
+    parser.add_argument("--guilds", type=int, default=20, help="guilds per shard")
+    parser.add_argument("--events", type=int, default=2000, help="messages per shard")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        asyncio.run(child(json.loads(args.child)))
+    else:
+        main(args.shards, [int(count) for count in args.processes.split(",")], args.guilds, args.events)
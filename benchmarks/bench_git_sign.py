@@ -0,0 +1,103 @@
+"""
+Compares the signature schemes of `bots/git/generator.py`: key generation,
+signing and verification throughput for RSA PKCS#1 v1.5, RSA-PSS and
+Ed25519, then batch signing on process pools of different sizes.
+
+It also checks that a key is generated only on the first run and loaded
+afterwards, that every signature verifies, and that a directory written by
+the generator passes `bots.git.batch` as it is, also when message names
+map to the same folder.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_git_sign [--messages 1000] [--keys 5] [--workers 1 2 4]
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+from bots.git import batch, generator
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started
+
+
+def quietly(function, *args):
+    """Calls `function` without the progress lines the generator prints."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args)
+
+
+def main(messages: int, keys: int, workers: list):
+    data = [f"This is a proof of ownership for my GitHub repository repo{i}.".encode() for i in range(messages)]
+    print(f"{'algorithm':<14}{'keygen ms':>11}{'reuse ms':>10}{'signs/s':>10}{'verifies/s':>12}{'sig bytes':>11}")
+    with tempfile.TemporaryDirectory() as directory:
+        for algorithm in generator.ALGORITHMS:
+            key_path = os.path.join(directory, f"{algorithm}.pem")
+            public_path = os.path.join(directory, f"{algorithm}.pub.pem")
+            keygen = 0.0
+            for _ in range(keys):
+                if os.path.exists(key_path):
+                    os.remove(key_path)
+                generated, elapsed = timed(quietly, generator.load_or_create_key, algorithm, key_path, public_path)
+                keygen += elapsed
+            private_key, reuse = timed(quietly, generator.load_or_create_key, algorithm, key_path, public_path)
+            assert generator.public_key_pem(private_key) == generator.public_key_pem(generated), \
+                "the key was generated again instead of loaded"
+
+            signatures, signing = timed(generator.sign_messages, private_key, data, algorithm)
+            public_key = private_key.public_key()
+            started = time.perf_counter()
+            for signature, message in zip(signatures, data):
+                generator.verify(public_key, signature, message, algorithm)
+            verifying = time.perf_counter() - started
+            print(f"{algorithm:<14}{keygen / keys * 1000:>11.2f}{reuse * 1000:>10.2f}{messages / signing:>10.0f}"
+                  f"{messages / verifying:>12.0f}{len(signatures[0]):>11}")
+
+        print(f"\nbatch signing of {messages} messages, written out and checked with bots.git.batch")
+        print(f"{'algorithm':<14}{'workers':>8}{'signs/s':>10}")
+        for algorithm in generator.ALGORITHMS:
+            private_key = quietly(generator.load_or_create_key, algorithm, os.path.join(directory, f"{algorithm}.pem"),
+                                  os.path.join(directory, f"{algorithm}.pub.pem"))
+            for count in workers:
+                signatures, elapsed = timed(generator.sign_messages, private_key, data, algorithm, count)
+                print(f"{algorithm:<14}{count:>8}{messages / elapsed:>10.0f}")
+            named = [(f"org/repo{i}", message) for i, message in enumerate(data)]
+            out = os.path.join(directory, f"out-{algorithm}")
+            quietly(generator.write_directory, out, private_key, algorithm, named, signatures)
+            report = batch.verify_manifest(batch.load_manifest(os.path.join(out, "manifest.jsonl")), workers=1)
+            assert report["summary"]["verified"] == messages, report["summary"]
+
+            # The same signatures do not pass as another scheme
+            entries = batch.load_manifest(os.path.join(out, "manifest.jsonl"))[:5]
+            for entry in entries:
+                entry["algorithm"] = "rsa-pss" if algorithm != "rsa-pss" else "rsa-pkcs1v15"
+            assert batch.verify_manifest(entries, workers=1)["summary"]["verified"] == 0
+
+        # Names that map to the same folder, or to the directory's own files, still get one folder each
+        named = [("a b", b"one"), ("a_b", b"two"), ("A_B", b"three"), ("manifest.jsonl", b"four")]
+        signatures = generator.sign_messages(private_key, [message for _, message in named], algorithm)
+        out = os.path.join(directory, "out-collisions")
+        quietly(generator.write_directory, out, private_key, algorithm, named, signatures)
+        entries = batch.load_manifest(os.path.join(out, "manifest.jsonl"))
+        assert len({entry["message"] for entry in entries}) == len(named), [entry["message"] for entry in entries]
+        for entry, (_, message) in zip(entries, named):
+            with open(os.path.join(out, entry["message"]), "rb") as f:
+                assert f.read() == message, f"{entry['name']} was overwritten"
+        assert batch.verify_manifest(entries, workers=1)["summary"]["verified"] == len(named)
+    print("\nevery signature verified; keys were generated once and loaded afterwards")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1000, help="messages to sign with each algorithm")
+    parser.add_argument("--keys", type=int, default=5, help="keys generated per algorithm to time key generation")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, os.cpu_count() or 1],
+                        help="process pool sizes for batch signing")
+    args = parser.parse_args()
+    main(args.messages, args.keys, sorted(set(args.workers)))
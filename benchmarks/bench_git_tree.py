@@ -0,0 +1,143 @@
+"""
+Signs and verifies a synthetic repository with `bots.git.tree`, comparing
+full runs that hash every file with incremental runs that reuse the hash
+cache.
+
+The tree has `--files` small files spread over nested directories, plus
+`--large` files of `--large-size` MB that are hashed through mmap. File
+times are set an hour back, as in a checkout that is not being edited.
+After the first signature some files are modified, removed and added.
+
+The checks: an unchanged tree verifies without hashing anything; after the
+edits only the changed files are hashed, and the report names exactly
+those; the incremental root equals a full run's root; a re-signed tree
+verifies again.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_git_tree [--files 50000] [--changes 100] [--workers 1 8]
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import tempfile
+import time
+from bots.git import generator, tree
+
+
+def build(root: str, files: int, large: int, large_size: int):
+    """Writes the synthetic tree and a README with the owner's key; returns the private key."""
+    rng = random.Random(1)
+    for i in range(files):
+        directory = os.path.join(root, f"pkg{i % 50}", f"mod{i % 500}")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"file{i}.py"), "wb") as f:
+            f.write(rng.randbytes(rng.randint(200, 8000)))
+    os.makedirs(os.path.join(root, "assets"), exist_ok=True)
+    for i in range(large):
+        with open(os.path.join(root, "assets", f"blob{i}.bin"), "wb") as f:
+            f.write(os.urandom(large_size * 1024 * 1024))
+    with contextlib.redirect_stdout(io.StringIO()):
+        private_key = generator.load_or_create_key("ed25519", os.path.join(root, "..", "owner.pem"),
+                                                   os.path.join(root, "..", "owner.pub.pem"))
+    with open(os.path.join(root, "README.md"), "w") as f:
+        f.write(f"# Synthetic repository\n\n```plaintext\n{generator.public_key_pem(private_key).decode()}```\n")
+    age_files(root)
+    return private_key
+
+
+def age_files(root: str, paths: list = None, seconds: float = 3600):
+    """Moves the mtime of `paths`, or of every file, back so none of them falls in the cache's racy window."""
+    when = time.time() - seconds
+    if paths is None:
+        paths = [os.path.join(directory, name) for directory, _, names in os.walk(root) for name in names]
+    for path in paths:
+        os.utime(os.path.join(root, path), (when, when))
+
+
+def edit(root: str, changes: int):
+    """Modifies, removes and adds files; returns the (added, removed, modified) paths."""
+    rng = random.Random(2)
+    paths = tree.list_files(root, {tree.MANIFEST_NAME})
+    picked = rng.sample([p for p in paths if p.endswith(".py")], changes + changes // 10)
+    modified, removed = sorted(picked[:changes] + ["assets/blob0.bin"]), sorted(picked[changes:])
+    for path in modified:
+        with open(os.path.join(root, path), "r+b") as f:
+            f.seek(100)
+            f.write(b"an edit")
+    for path in removed:
+        os.remove(os.path.join(root, path))
+    added = sorted(f"pkg0/mod0/new{i}.py" for i in range(changes // 10))
+    for path in added:
+        with open(os.path.join(root, path), "w") as f:
+            f.write("print('new')\n")
+    return added, removed, modified
+
+
+def timed(function, *args, **kwargs):
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = function(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def row(label: str, seconds: float, hashed: int, total: int):
+    print(f"{label:<38}{seconds:>9.2f}{hashed:>9}{total / seconds:>12.0f}")
+
+
+def main(files: int, large: int, large_size: int, changes: int, workers: list):
+    with tempfile.TemporaryDirectory() as directory:
+        root = os.path.join(directory, "repo")
+        started = time.perf_counter()
+        private_key = build(root, files, large, large_size)
+        total = files + large + 1
+        print(f"built {total} files ({large} x {large_size} MB) in {time.perf_counter() - started:.1f}s\n")
+        print(f"{'run':<38}{'seconds':>9}{'hashed':>9}{'files/s':>12}")
+        cache_path = os.path.join(directory, "cache.json")
+
+        for count in workers:
+            result, elapsed = timed(tree.hash_tree, root, None, count, {tree.MANIFEST_NAME})
+            row(f"full hash, {count} thread{'s' if count > 1 else ''}", elapsed, result["hashed"], total)
+            assert result["hashed"] == total
+        full_root = result["root"]
+
+        manifest, elapsed = timed(tree.sign_tree, root, private_key, "ed25519", cache=tree.HashCache(cache_path))
+        row("sign, empty cache", elapsed, total, total)
+        assert manifest["root"] == full_root
+
+        report, elapsed = timed(tree.verify_tree, root, cache=tree.HashCache(cache_path))
+        row("verify unchanged, cached", elapsed, report["hashed"], total)
+        assert report["ok"] and report["hashed"] == 0, report
+
+        added, removed, modified = edit(root, changes)
+        age_files(root, added + modified)
+        report, elapsed = timed(tree.verify_tree, root, cache=tree.HashCache(cache_path))
+        row(f"verify after {len(added) + len(removed) + len(modified)} edits, cached", elapsed, report["hashed"], total)
+        assert not report["ok"] and report["signature_valid"]
+        assert (report["added"], report["removed"], report["modified"]) == (added, removed, modified), report
+        assert report["hashed"] == len(added) + len(modified), report["hashed"]
+
+        full, elapsed = timed(tree.hash_tree, root, None, None, {tree.MANIFEST_NAME})
+        row("full hash after edits", elapsed, full["hashed"], total)
+        assert full["root"] == report["root"], "the incremental root differs from a full run's"
+
+        manifest, elapsed = timed(tree.sign_tree, root, private_key, "ed25519", cache=tree.HashCache(cache_path))
+        row("re-sign after edits, cached", elapsed, 0, total)
+        report, elapsed = timed(tree.verify_tree, root, cache=tree.HashCache(cache_path))
+        row("verify re-signed tree, cached", elapsed, report["hashed"], total)
+        assert report["ok"], report
+    print("\nincremental runs hashed only the edited files and reported exactly those")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=50_000, help="small files in the tree")
+    parser.add_argument("--large", type=int, default=8, help="large files, hashed through mmap")
+    parser.add_argument("--large-size", type=int, default=8, help="size of each large file in MB")
+    parser.add_argument("--changes", type=int, default=100, help="files modified after signing")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, (os.cpu_count() or 1) + 4],
+                        help="hashing thread counts for the full runs")
+    args = parser.parse_args()
+    main(args.files, args.large, args.large_size, args.changes, sorted(set(args.workers)))
@@ -0,0 +1,146 @@
+"""
+Generates signed README/key/signature/message sets for many repositories and
+compares verifying them one at a time, the way `bots/git/run.py` does, with
+the batch verifier in `bots.git.batch`.
+
+The repositories belong to `--keys` owners. Some of them are broken on
+purpose: an uploaded key that is not the owner's, a message changed after
+signing, and a README without a key. The checks: the batch report flags
+exactly those, and each worker parses every owner's key at most once.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_git_verify [--repos 1000] [--keys 20] [--workers 1 2 4]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from cryptography.hazmat.primitives.serialization import load_pem_public_key
+from bots.git import batch
+
+README = """# Repository {i}
+
+Some project description that makes the README a realistic size.
+{filler}
+#### Repository Owner's Public Key
+
+```plaintext
+{key}```
+"""
+
+
+def pem(key) -> bytes:
+    return key.public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+
+
+def generate(directory: str, repos: int, keys: int):
+    """Writes `repos` repositories and a manifest; returns (manifest path, expected statuses by name)."""
+    owners = [rsa.generate_private_key(public_exponent=65537, key_size=2048) for _ in range(keys)]
+    stranger = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    filler = "\n".join(f"- feature {n}: lorem ipsum dolor sit amet" for n in range(200))
+    expected = {}
+    manifest = os.path.join(directory, "manifest.jsonl")
+    with open(manifest, "w") as out:
+        for i in range(repos):
+            name = f"repo{i}"
+            root = os.path.join(directory, name)
+            os.makedirs(root)
+            owner = owners[i % keys]
+            message = f"This is a proof of ownership for my GitHub repository {name}."
+            signature = owner.sign(message.encode(), padding.PKCS1v15(), hashes.SHA256())
+            status = batch.VERIFIED
+            readme_key, uploaded = pem(owner.public_key()), pem(owner.public_key())
+            if i % 50 == 7:
+                uploaded, status = pem(stranger.public_key()), batch.KEY_MISMATCH
+            elif i % 77 == 11:
+                message, status = message + " Edited.", batch.INVALID_SIGNATURE
+            elif i % 91 == 13:
+                readme_key, status = b"", batch.KEY_NOT_FOUND
+            with open(os.path.join(root, "README.md"), "w") as f:
+                f.write(README.format(i=i, filler=filler, key=readme_key.decode()))
+            with open(os.path.join(root, "public_key.pem"), "wb") as f:
+                f.write(uploaded)
+            with open(os.path.join(root, "signature.bin"), "wb") as f:
+                f.write(signature)
+            with open(os.path.join(root, "message.txt"), "w") as f:
+                f.write(message)
+            expected[name] = status
+            out.write(json.dumps({"name": name, "readme": f"{name}/README.md", "key": f"{name}/public_key.pem",
+                                  "signature": f"{name}/signature.bin", "message": f"{name}/message.txt"}) + "\n")
+    return manifest, expected
+
+
+def extract(path: str) -> str:
+    """The key extraction of `run.py`: the whole file is read and searched."""
+    with open(path, "r") as f:
+        content = f.read()
+    start = content.find("-----BEGIN PUBLIC KEY-----")
+    end = content.find("-----END PUBLIC KEY-----") + len("-----END PUBLIC KEY-----")
+    if start == -1 or end == -1:
+        raise ValueError("Public key not found")
+    return content[start:end]
+
+
+def one_at_a_time(entries: list):
+    """Verifies each entry like `run.py`: full reads, a fresh PEM parse per entry. Returns (verified, keys parsed)."""
+    verified = parsed = 0
+    for entry in entries:
+        try:
+            owner = extract(entry["readme"])
+            if owner.strip() != extract(entry["key"]).strip():
+                continue
+            public_key = load_pem_public_key(owner.encode())
+            parsed += 1
+            with open(entry["signature"], "rb") as f:
+                signature = f.read()
+            with open(entry["message"], "r") as f:
+                message = f.read()
+            public_key.verify(signature, message.encode(), padding.PKCS1v15(), hashes.SHA256())
+            verified += 1
+        except Exception:
+            pass
+    return verified, parsed
+
+
+def main(repos: int, keys: int, workers: list):
+    with tempfile.TemporaryDirectory() as directory:
+        started = time.perf_counter()
+        manifest, expected = generate(directory, repos, keys)
+        print(f"generated {repos} repositories for {keys} owners in {time.perf_counter() - started:.1f}s\n")
+        entries = batch.load_manifest(manifest)
+        should_verify = sum(status == batch.VERIFIED for status in expected.values())
+
+        print(f"{'verifier':<22}{'seconds':>9}{'repos/s':>9}{'keys parsed':>13}")
+        started = time.perf_counter()
+        verified, parsed = one_at_a_time(entries)
+        elapsed = time.perf_counter() - started
+        print(f"{'one at a time':<22}{elapsed:>9.3f}{repos / elapsed:>9.0f}{parsed:>13}")
+        assert verified == should_verify, (verified, should_verify)
+
+        for count in workers:
+            batch._keys.clear()
+            report = batch.verify_manifest(batch.load_manifest(manifest), workers=count)
+            summary = report["summary"]
+            label = f"batch, {summary['workers']} worker{'s' if summary['workers'] > 1 else ''}"
+            print(f"{label:<22}{summary['seconds']:>9.3f}{repos / summary['seconds']:>9.0f}{summary['keys_parsed']:>13}")
+            statuses = {result["name"]: result["status"] for result in report["results"]}
+            assert statuses == expected, {name: s for name, s in statuses.items() if s != expected[name]}
+            assert summary["verified"] == should_verify
+            assert summary["keys_parsed"] <= keys * summary["workers"], summary["keys_parsed"]
+
+    failures = {status: n for status, n in summary["statuses"].items() if status != batch.VERIFIED}
+    print(f"\nevery report flagged exactly the broken repositories: {failures}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repos", type=int, default=1000, help="repositories to generate")
+    parser.add_argument("--keys", type=int, default=20, help="distinct owners, each with an RSA key")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, os.cpu_count() or 1],
+                        help="process pool sizes to try")
+    args = parser.parse_args()
+    main(args.repos, args.keys, sorted(set(args.workers)))
@@ -0,0 +1,148 @@
+"""
+Pushes AI jobs through the durable job queue and reports throughput for
+different worker pool sizes, then simulates a crash and checks that a new
+pipeline resumes the interrupted jobs. Last, two bots share one store, as
+when started in the same directory with the same `AI_JOBS_PATH`, and must
+neither claim nor recover each other's jobs.
+
+The AI backend is the local OpenRouter stub and answers are "delivered" to
+an in-memory stand-in that takes `--deliver-latency` per message, like an
+edit on a chat platform. Every run uses a fresh SQLite store in a
+temporary directory.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_jobs [--jobs 500] [--ai-latency 0.05]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from bots.shared.ai_client import AIClient
+from bots.shared.jobs import INTERRUPTED_MESSAGE, JobPipeline, JobStore, job_store_path
+from benchmarks.stub_openrouter import StubOpenRouter
+
+
+class Deliverer:
+    """Records delivered answers by message id."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.delivered = {}
+
+    async def __call__(self, target: dict, response: str):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.delivered[target["message_id"]] = response
+
+
+async def throughput(path: str, ai_client: AIClient, workers: int, jobs: int, deliver_latency: float):
+    """Returns (seconds, enqueue microseconds per job) for `jobs` jobs on `workers` workers."""
+    deliverer = Deliverer(deliver_latency)
+    pipeline = JobPipeline(JobStore(path), ai_client, workers=workers)
+    pipeline.register("bench", deliverer)
+    await pipeline.start()
+    started = time.perf_counter()
+    for i in range(jobs):
+        pipeline.submit("bench", {"message_id": i}, f"question {i}", use_cache=False, conversation=("bench", i))
+    enqueued = time.perf_counter() - started
+    while pipeline.completed + pipeline.failed < jobs:
+        await asyncio.sleep(0.005)
+    elapsed = time.perf_counter() - started
+    await pipeline.close()
+    assert pipeline.failed == 0, f"{pipeline.failed} jobs failed"
+    assert len(deliverer.delivered) == jobs, f"only {len(deliverer.delivered)} of {jobs} answers delivered"
+    return elapsed, enqueued / jobs * 1e6
+
+
+async def restart(path: str, ai_client: AIClient, max_age: float):
+    """Leaves jobs queued, running and stale as a crash would, and checks that a new pipeline sorts them out."""
+    store = JobStore(path)
+    for i in range(10):
+        store.enqueue("bench", {"message_id": i}, f"queued {i}")
+    # Eight were running when the process "crashed", and the first three are too old to resume
+    for _ in range(8):
+        store.claim()
+    store.connection.execute("UPDATE jobs SET created_at = created_at - ? WHERE id <= 3", (max_age * 2,))
+    store.close()
+
+    deliverer = Deliverer(0.0)
+    pipeline = JobPipeline(JobStore(path), ai_client, workers=4, max_age=max_age)
+    pipeline.register("bench", deliverer)
+    await pipeline.start()
+    while pipeline.completed < 7:
+        await asyncio.sleep(0.005)
+    counts = pipeline.store.counts()
+    await pipeline.close()
+    assert pipeline.abandoned == 3, f"{pipeline.abandoned} stale jobs given up, expected 3"
+    assert pipeline.resumed == 7, f"{pipeline.resumed} jobs resumed, expected 7"
+    assert all(deliverer.delivered[i] == INTERRUPTED_MESSAGE for i in range(3)), "stale jobs not cleaned up"
+    assert all(deliverer.delivered[i] != INTERRUPTED_MESSAGE for i in range(3, 10)), "resumed jobs not answered"
+    assert counts[JobStore.QUEUED] == counts[JobStore.RUNNING] == 0, f"jobs left behind: {counts}"
+    return pipeline.resumed, pipeline.abandoned
+
+
+async def shared_store(path: str, ai_client: AIClient):
+    """Runs two platforms' pipelines on one store and checks each only takes its own jobs."""
+    store = JobStore(path)
+    for i in range(5):
+        store.enqueue("telegram", {"message_id": i}, f"telegram {i}")
+    # A Discord job another live process is answering right now
+    store.enqueue("discord", {"message_id": 100}, "discord running")
+    running = store.claim(("discord",))
+    store.enqueue("discord", {"message_id": 101}, "discord queued")
+    store.close()
+
+    deliverer = Deliverer(0.0)
+    pipeline = JobPipeline(JobStore(path), ai_client, workers=2)
+    pipeline.register("telegram", deliverer)
+    await pipeline.start()
+    while pipeline.completed < 5:
+        await asyncio.sleep(0.005)
+    await asyncio.sleep(0.05)
+    counts = pipeline.store.counts(("discord",))
+    await pipeline.close()
+    assert pipeline.failed == 0, "a pipeline claimed a job it has no deliverer for"
+    assert sorted(deliverer.delivered) == list(range(5)), f"delivered {sorted(deliverer.delivered)}"
+    assert counts[JobStore.RUNNING] == 1 and counts[JobStore.QUEUED] == 1, f"Discord jobs were touched: {counts}"
+    store = JobStore(path)
+    assert running.id not in {job.id for job in store.interrupted(("telegram",))}
+    store.close()
+
+    assert job_store_path("ai_jobs.sqlite3", "discord", 2) == "ai_jobs.discord.2.sqlite3"
+    assert len({job_store_path("ai_jobs.sqlite3", platform) for platform in ("discord", "telegram", "twitter")}
+               | {job_store_path("ai_jobs.sqlite3"), job_store_path("ai_jobs.sqlite3", shard_id=0)}) == 5
+
+
+async def main(jobs: int, ai_latency: float, deliver_latency: float):
+    stub = StubOpenRouter(latency=ai_latency)
+    await stub.start()
+    ai_client = AIClient("bench", base_url=stub.base_url)
+    await ai_client.start()
+    print(f"{jobs} jobs, AI latency {ai_latency * 1000:.0f} ms, delivery latency {deliver_latency * 1000:.0f} ms\n")
+    print(f"{'workers':>8}{'seconds':>10}{'jobs/s':>10}{'enqueue':>12}")
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            for workers in (1, 2, 4, 8, 16, 32):
+                path = os.path.join(directory, f"jobs-{workers}.sqlite3")
+                elapsed, enqueue = await throughput(path, ai_client, workers, jobs, deliver_latency)
+                print(f"{workers:>8}{elapsed:>10.2f}{jobs / elapsed:>10.1f}{enqueue:>10.1f}us")
+
+            resumed, abandoned = await restart(os.path.join(directory, "restart.sqlite3"), ai_client, 60.0)
+            print(f"\nrestart: resumed {resumed} interrupted jobs, cleaned up {abandoned} stale ones")
+
+            await shared_store(os.path.join(directory, "shared.sqlite3"), ai_client)
+            print("shared:  two bots on one store only claimed and recovered their own platform's jobs")
+    finally:
+        await ai_client.close()
+        await stub.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=500)
+    parser.add_argument("--ai-latency", type=float, default=0.05, help="stub AI latency in seconds")
+    parser.add_argument("--deliver-latency", type=float, default=0.005, help="delivery latency in seconds")
+    args = parser.parse_args()
+    asyncio.run(main(args.jobs, args.ai_latency, args.deliver_latency))
@@ -0,0 +1,110 @@
+"""
+Measures what conversation memory costs: bytes per remembered conversation
+for a large population of active users, compared with naively keeping every
+message dict, and the prompt size of follow-up questions once the token
+budget kicks in.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_memory [--users 100000] [--turns 10] [--budget 1000]
+"""
+import argparse
+import asyncio
+import tracemalloc
+from bots.shared.ai_client import AIClient
+from bots.shared.memory import ConversationMemory, estimate_tokens
+from benchmarks.stub_openrouter import StubOpenRouter
+
+QUESTION = "Could you explain that in a bit more detail, with an example? "
+ANSWER = "Sure. " + "Here is a longer explanation with an example that goes on for a while. " * 6
+
+
+def exchanges(users: int, turns: int):
+    """Yields (user, question, answer) with distinct strings, as real traffic would."""
+    for turn in range(turns):
+        for user in range(users):
+            yield user, f"[{user}/{turn}] {QUESTION}", f"[{user}/{turn}] {ANSWER}"
+
+
+def measure(build, users: int, turns: int):
+    """Fills a store built by `build()` and returns (store, bytes held)."""
+    tracemalloc.start()
+    store, add = build()
+    for user, question, answer in exchanges(users, turns):
+        add(store, ("discord", 1, user), question, answer)
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return store, held
+
+
+def text_chars(store) -> int:
+    """Returns the characters of message text a store holds."""
+    if isinstance(store, dict):
+        return sum(len(m["content"]) for messages in store.values() for m in messages)
+    return sum(len(text) for c in store.conversations.values() for text in c.turns)
+
+
+def naive_store():
+    """Unbounded dict of chat message lists, the straightforward way to add memory."""
+    def add(store, key, question, answer):
+        messages = store.setdefault(key, [])
+        messages.append({"role": "user", "content": question})
+        messages.append({"role": "assistant", "content": answer})
+    return {}, add
+
+
+def memory_store(budget: int, max_total_tokens: int):
+    def add(store, key, question, answer):
+        store.remember(key, question, answer)
+    return ConversationMemory(token_budget=budget, max_total_tokens=max_total_tokens), add
+
+
+async def follow_ups(budget: int, turns: int):
+    """Holds one conversation against the stub and returns the estimated prompt tokens per request."""
+    stub = StubOpenRouter(text=ANSWER)
+    await stub.start()
+    sizes = []
+    try:
+        memory = ConversationMemory(token_budget=budget)
+        async with AIClient("bench", base_url=stub.base_url, memory=memory) as client:
+            for turn in range(turns):
+                await client.fetch_ai_response(f"[{turn}] {QUESTION}", conversation=("bench", 1, 1))
+                sizes.append(sum(estimate_tokens(m["content"]) for m in stub.last_payload["messages"]))
+    finally:
+        await stub.stop()
+    return sizes
+
+
+def main(users: int, turns: int, budget: int):
+    print(f"{users} conversations x {turns} exchanges, history budget {budget} tokens")
+    print(f"{'store':<28}{'kept':>10}{'MB':>10}{'bytes/conv':>12}{'text/conv':>11}{'overhead':>10}")
+    rows = [
+        ("naive message dicts", naive_store),
+        ("memory, all kept", lambda: memory_store(budget, users * budget)),
+        ("memory, default total cap", lambda: memory_store(budget, 20_000_000)),
+    ]
+    for name, build in rows:
+        store, held = measure(build, users, turns)
+        kept = len(store) if isinstance(store, dict) else len(store.conversations)
+        per_conversation = held / max(kept, 1)
+        text = text_chars(store) / max(kept, 1)
+        print(f"{name:<28}{kept:>10}{held / 2**20:>10.1f}{per_conversation:>12.0f}{text:>11.0f}"
+              f"{per_conversation - text:>10.0f}")
+        if isinstance(store, ConversationMemory):
+            assert store.total_tokens <= store.max_total_tokens
+            assert all(c.tokens <= budget or len(c.turns) == 2 for c in store.conversations.values())
+        del store
+
+    sizes = asyncio.run(follow_ups(budget, turns * 3))
+    print(f"\nprompt tokens per follow-up over {len(sizes)} turns: "
+          f"first {sizes[0]}, max {max(sizes)}, last {sizes[-1]} (budget {budget} + the new message)")
+    assert max(sizes) <= budget + estimate_tokens(f"[{len(sizes)}] {QUESTION}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--budget", type=int, default=1000)
+    args = parser.parse_args()
+    main(args.users, args.turns, args.budget)
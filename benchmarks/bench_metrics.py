@@ -0,0 +1,125 @@
+"""
+Measures what request tracing and metrics cost, and checks what they export.
+
+The micro-benchmark runs the tracing a request goes through (the request
+counter, six stage marks, three of them delivered chunks) in a tight loop
+and reports the cost per request. The end-to-end run sends requests through
+the pooled AI client to a local stub with metrics on and off, so the
+overhead can be set against a request's latency. Finally `/metrics` is
+scraped from a `MetricsServer` and checked for the stage histograms and the
+token and cache counters.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_metrics [--iterations 200000] [--requests 2000]
+"""
+import argparse
+import asyncio
+import time
+import aiohttp
+from bots.shared import metrics
+from bots.shared.ai_client import AIClient
+from bots.shared.cache import MemoryCacheBackend, ResponseCache
+from bots.shared.metrics import MetricsRegistry, MetricsServer, mark, trace_request
+from benchmarks.stub_openrouter import StubOpenRouter
+
+
+def traced_request(registry: MetricsRegistry):
+    with trace_request("telegram", "ask", registry):
+        mark("thinking_sent")
+        mark("ai_start")
+        mark("first_byte")
+        mark("ai_done")
+        for _ in range(3):
+            mark("chunk_delivered")
+
+
+def micro(iterations: int) -> float:
+    """Returns the tracing cost of one request in microseconds."""
+    registry = MetricsRegistry()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        traced_request(registry)
+    elapsed = time.perf_counter() - started
+    # The loop and call overhead the bots would not pay
+    started = time.perf_counter()
+    for _ in range(iterations):
+        pass
+    baseline = time.perf_counter() - started
+    assert registry.stages.count("telegram", "chunk_delivered") == 3 * iterations
+    assert registry.requests.value("telegram", "ask") == iterations
+    return (elapsed - baseline) / iterations * 1e6
+
+
+async def end_to_end(base_url: str, requests: int, concurrency: int, enabled: bool) -> float:
+    """Sends `requests` traced AI requests and returns the seconds taken."""
+    metrics.METRICS_ENABLED = enabled
+    semaphore = asyncio.Semaphore(concurrency)
+    async with AIClient("bench", base_url=base_url) as client:
+        async def request(i):
+            async with semaphore:
+                with trace_request("telegram", "ask"):
+                    await client.fetch_ai_response(f"question {i}", use_cache=False)
+                    mark("chunk_delivered")
+
+        started = time.perf_counter()
+        await asyncio.gather(*(request(i) for i in range(requests)))
+        return time.perf_counter() - started
+
+
+async def scrape(base_url: str) -> str:
+    """Serves the shared registry, answers a cached and an uncached request, and returns the scraped text."""
+    metrics.METRICS_ENABLED = True
+    server = MetricsServer(host="127.0.0.1", port=0)
+    await server.start()
+    cache = ResponseCache(MemoryCacheBackend(), deterministic_only=False)
+    async with AIClient("bench", base_url=base_url, cache=cache) as client:
+        for _ in range(2):
+            with trace_request("discord", "call"):
+                await client.fetch_ai_response("the same question")
+    async with aiohttp.ClientSession() as session:
+        async with session.get(f"http://127.0.0.1:{server.port}/metrics") as response:
+            assert response.status == 200
+            assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            text = await response.text()
+    await server.stop()
+    return text
+
+
+async def main(iterations: int, requests: int, concurrency: int, latency: float):
+    per_request = micro(iterations)
+    assert per_request < 100, f"tracing costs {per_request:.0f} us per request"
+    print(f"tracing cost: {per_request:.2f} us per request ({iterations} requests, 6 stages and the counters)\n")
+
+    stub = StubOpenRouter(latency=latency)
+    await stub.start()
+    try:
+        # Warm up the stub and the connection pool
+        await end_to_end(stub.base_url, concurrency, concurrency, False)
+        print(f"{requests} AI requests, {concurrency} at a time, stub latency {latency * 1000:.0f} ms\n")
+        print(f"{'metrics':<10}{'seconds':>10}{'requests/s':>12}")
+        for enabled in (False, True, False, True):
+            elapsed = await end_to_end(stub.base_url, requests, concurrency, enabled)
+            print(f"{'on' if enabled else 'off':<10}{elapsed:>10.2f}{requests / elapsed:>12.0f}")
+        text = await scrape(stub.base_url)
+    finally:
+        await stub.stop()
+
+    for expected in ('bot_stage_seconds_bucket{platform="telegram",stage="first_byte",le="0.005"}',
+                     'bot_stage_seconds_count{platform="discord",stage="done"} 2',
+                     'bot_requests_total{platform="discord",command="call"} 2',
+                     'ai_cache_requests_total{result="hit"} 1',
+                     'ai_cache_requests_total{result="miss"} 1',
+                     'ai_tokens_total{kind="completion"}'):
+        assert expected in text, f"/metrics lacks {expected}"
+    print(f"\n/metrics: {len(text.splitlines())} lines, stage histograms and token and cache counters present")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200_000, help="traced requests in the micro-benchmark")
+    parser.add_argument("--requests", type=int, default=2000, help="AI requests per end-to-end run")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.01, help="stub AI latency in seconds")
+    args = parser.parse_args()
+    asyncio.run(main(args.iterations, args.requests, args.concurrency, args.latency))
@@ -0,0 +1,240 @@
+"""
+Replays a burst of streamed answers against a fake chat platform that
+enforces Telegram-style rate limits, once with naive sends and once through
+the outbound scheduler.
+
+Each chat gets a "Thinking..." placeholder, a stream of interim edits as
+tokens arrive, the final edit and a few follow-up messages. The fake
+platform answers 429 with a retry-after when a send exceeds its global or
+per-chat bucket; naive sends lose that message, the scheduler waits it out.
+Limits and timings are scaled by `--speed` so the run takes seconds.
+
+The scheduled run is checked: no message is lost, each chat receives its
+sends in order, and every message ends up showing its final text.
+
+Last, `--discord-users` users ask the Discord bot at once in one channel,
+with Discord's limits: their "Thinking..." follow-ups and answer edits go
+through each interaction's webhook, so they must not queue behind the
+channel's 5 messages per 5 seconds.
+
+Also checks that a scheduler closed with routes still waiting in line or
+paused by a rate limit sends normally once it is used again.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_outbound [--chats 50] [--edits 30] [--follow-ups 3]
+"""
+import argparse
+import asyncio
+import time
+from bots.shared.outbound import DISCORD_ROUTES, PRIORITY_COSMETIC, PRIORITY_FINAL, OutboundScheduler, RouteLimit
+from bots.shared.resilience import LatencyTracker
+from bots.shared.scheduler import TokenBucket
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"429: retry after {retry_after:.3f}s")
+        self.retry_after = retry_after
+
+
+class FakePlatform:
+    """A chat platform with one global bucket and one bucket per chat, answering 429 when either is empty."""
+
+    def __init__(self, limits: tuple, latency: float):
+        self.limits = limits
+        self.latency = latency
+        self.buckets = {}
+        self.rate_limited = 0
+        # Per chat, the sends in the order they landed: ("send", message_id, text) or ("edit", message_id, text)
+        self.delivered = {}
+        self.message_ids = 0
+
+    def bucket(self, key, limit: RouteLimit) -> TokenBucket:
+        if key not in self.buckets:
+            self.buckets[key] = TokenBucket(limit.rate, limit.capacity)
+        return self.buckets[key]
+
+    async def call(self, chat: int, kind: str, text: str, message_id: int = None) -> int:
+        buckets = [self.bucket((limit.name, chat) if limit.per_route else limit.name, limit)
+                   for limit in self.limits if limit.matches(("chat", chat))]
+        for bucket in buckets:
+            bucket.refill()
+        empty = [bucket for bucket in buckets if bucket.tokens < 1]
+        if empty:
+            self.rate_limited += 1
+            raise RateLimited(max((1 - bucket.tokens) / bucket.rate for bucket in empty))
+        for bucket in buckets:
+            bucket.tokens -= 1
+        await asyncio.sleep(self.latency)
+        if message_id is None:
+            self.message_ids += 1
+            message_id = self.message_ids
+        self.delivered.setdefault(chat, []).append((kind, message_id, text))
+        return message_id
+
+
+def scaled_limits(speed: float) -> tuple:
+    # Telegram's limits, sped up
+    return (
+        RouteLimit("global", 30 * speed, 30, per_route=False),
+        RouteLimit("chat", 1 * speed, 3),
+    )
+
+
+async def conversation(chat: int, send, edits: int, follow_ups: int, token_interval: float, answer_latency):
+    """Streams one answer into a chat; `send(chat, kind, text, message_id, priority, merge_key)` delivers it."""
+    message_id = await send(chat, "send", "Thinking...", None, PRIORITY_COSMETIC, None)
+    if message_id is None:
+        return
+    interim = []
+    for i in range(edits):
+        await asyncio.sleep(token_interval)
+        # Interim edits are fired without waiting, as tokens keep arriving
+        interim.append(asyncio.ensure_future(
+            send(chat, "edit", f"partial {i}", message_id, PRIORITY_COSMETIC, message_id)))
+    # Lets the last interim edit queue before the final one
+    await asyncio.sleep(0)
+    started = time.monotonic()
+    await send(chat, "edit", "final", message_id, PRIORITY_FINAL, message_id)
+    for i in range(follow_ups):
+        await send(chat, "send", f"follow-up {i}", None, PRIORITY_FINAL, None)
+    answer_latency.record(time.monotonic() - started)
+    await asyncio.gather(*interim)
+
+
+async def run(scheduled: bool, chats: int, edits: int, follow_ups: int, speed: float, latency: float):
+    limits = scaled_limits(speed)
+    platform = FakePlatform(limits, latency)
+    scheduler = OutboundScheduler("bench", limits, retry_after=lambda e: getattr(e, "retry_after", None),
+                                  workers=16, max_retries=10) if scheduled else None
+    answer_latency = LatencyTracker(chats)
+    dropped = {PRIORITY_FINAL: 0, PRIORITY_COSMETIC: 0}
+
+    async def send(chat, kind, text, message_id, priority, merge_key):
+        call = lambda: platform.call(chat, kind, text, message_id)  # noqa: E731
+        try:
+            if scheduler is None:
+                return await call()
+            return await scheduler.send(("chat", chat), call, priority, merge_key)
+        except RateLimited:
+            dropped[priority] += 1
+            return None
+
+    started = time.perf_counter()
+    await asyncio.gather(*(conversation(chat + 1, send, edits, follow_ups, 0.2 / speed, answer_latency)
+                           for chat in range(chats)))
+    elapsed = time.perf_counter() - started
+    stats = scheduler.stats() if scheduler is not None else None
+    if scheduler is not None:
+        await scheduler.close()
+    return platform, stats, dropped, answer_latency, elapsed
+
+
+def check(platform: FakePlatform, chats: int, follow_ups: int):
+    for chat in range(1, chats + 1):
+        delivered = platform.delivered[chat]
+        sends = [text for kind, _, text in delivered if kind == "send"]
+        assert sends == ["Thinking..."] + [f"follow-up {i}" for i in range(follow_ups)], f"chat {chat}: {sends}"
+        edits = [text for kind, _, text in delivered if kind == "edit"]
+        assert edits and edits[-1] == "final", f"chat {chat} does not show the final text"
+        numbers = [int(text.split()[1]) for text in edits[:-1]]
+        assert numbers == sorted(numbers), f"chat {chat}: edits landed out of order"
+        final = [kind for kind, _, text in delivered].index("edit") + len(edits) - 1
+        assert all(kind == "send" for kind, _, _ in delivered[final + 1:]), f"chat {chat}: edit after the follow-ups"
+
+
+def ms(seconds) -> str:
+    return "-" if seconds is None else f"{seconds * 1000:.0f}"
+
+
+async def discord_channel(users: int, latency: float) -> float:
+    """Answers `users` interactions in one channel through the Discord bot's outbound routes; returns the seconds."""
+    from bots.discord.bot import AIChatBot
+    from bots.shared.ai_client import AIClient
+    from bots.shared.scheduler import RequestScheduler
+    from bots.shared.settings import Settings
+    from benchmarks.stub_discord import StubDiscord
+
+    discord_stub = StubDiscord(latency=latency)
+    bot = AIChatBot(ai_client=AIClient("bench", base_url="http://127.0.0.1:9"), scheduler=RequestScheduler(),
+                    outbound=OutboundScheduler("discord", DISCORD_ROUTES), jobs=None, settings=Settings())
+
+    async def answer(interaction):
+        thinking = await bot.followup(interaction, "Thinking...", PRIORITY_COSMETIC)
+        await bot.edit_message(interaction, thinking, f"answer {interaction.id}")
+
+    interactions = [discord_stub.interaction(i, i, 42) for i in range(users)]
+    started = time.perf_counter()
+    await asyncio.gather(*(answer(interaction) for interaction in interactions))
+    elapsed = time.perf_counter() - started
+    await bot.outbound.close()
+    assert all(discord_stub.answered_at(i, f"answer {i}") for i in range(users)), "an answer was not delivered"
+    return elapsed
+
+
+async def restart() -> bool:
+    """Closes a scheduler with routes in line and on a timer, then checks that later sends still go out."""
+    scheduler = OutboundScheduler("bench", (RouteLimit("chat", rate=0.5, capacity=1),), workers=1)
+
+    async def call():
+        await asyncio.sleep(0.01)
+        return "sent"
+
+    # One worker: most routes wait in line, and each sent route waits two seconds for its next token
+    pending = [asyncio.ensure_future(scheduler.send(("chat", chat), call)) for chat in range(5) for _ in range(2)]
+    await asyncio.sleep(0.03)
+    await scheduler.close()
+    await asyncio.gather(*pending, return_exceptions=True)
+    results = await asyncio.wait_for(asyncio.gather(scheduler.send(("chat", 8), call),
+                                                    scheduler.send(("chat", 9), call)), 1.0)
+    workers_alive = all(not worker.done() for worker in scheduler.workers)
+    await scheduler.close()
+    return results == ["sent", "sent"] and workers_alive
+
+
+def main(chats: int, edits: int, follow_ups: int, speed: float, latency: float, discord_users: int):
+    print(f"{chats} chats, {edits} interim edits and {follow_ups} follow-ups each, "
+          f"Telegram limits x{speed:g}, send latency {latency * 1000:.0f} ms\n")
+    print(f"{'mode':<10}{'seconds':>8}{'429s':>7}{'lost':>6}{'lost final':>12}{'merged':>8}"
+          f"{'answer p50/p95 ms':>19}{'final queue p50/p95':>21}{'cosmetic p50/p95':>18}")
+    for scheduled in (False, True):
+        platform, stats, dropped, answer, elapsed = asyncio.run(
+            run(scheduled, chats, edits, follow_ups, speed, latency))
+        lost = dropped[PRIORITY_FINAL] + dropped[PRIORITY_COSMETIC]
+        if stats is not None:
+            queue = stats["queue_latency"]
+            final = f"{ms(queue['final']['p50'])}/{ms(queue['final']['p95'])}"
+            cosmetic = f"{ms(queue['cosmetic']['p50'])}/{ms(queue['cosmetic']['p95'])}"
+            merged = stats["merged"]
+        else:
+            final = cosmetic = "-"
+            merged = 0
+        print(f"{'scheduled' if scheduled else 'naive':<10}{elapsed:>8.2f}{platform.rate_limited:>7}{lost:>6}"
+              f"{dropped[PRIORITY_FINAL]:>12}{merged:>8}"
+              f"{ms(answer.percentile(50)) + '/' + ms(answer.percentile(95)):>19}{final:>21}{cosmetic:>18}")
+        if scheduled:
+            assert lost == 0 and stats["failed"] == 0, "the scheduler lost a message"
+            assert merged, "no interim edit was merged"
+            check(platform, chats, follow_ups)
+
+    elapsed = asyncio.run(discord_channel(discord_users, latency))
+    # One channel bucket would allow 5 sends, then one per second
+    assert elapsed < 1.0, f"{discord_users} Discord answers in one channel took {elapsed:.2f}s"
+    print(f"\ndiscord:  {discord_users} users answered in one channel in {elapsed:.2f}s; "
+          f"a channel bucket would need {2 * discord_users - 5}s")
+
+    assert asyncio.run(restart()), "a send after close did not go out"
+    print("restart:  sends after close went out; no worker picked up a closed route")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--edits", type=int, default=30, help="interim streaming edits per answer")
+    parser.add_argument("--follow-ups", type=int, default=3, help="follow-up messages per answer")
+    parser.add_argument("--speed", type=float, default=20.0, help="factor applied to the rate limits and timings")
+    parser.add_argument("--latency", type=float, default=0.005, help="fake platform latency per send in seconds")
+    parser.add_argument("--discord-users", type=int, default=20, help="users asking the Discord bot in one channel")
+    args = parser.parse_args()
+    main(args.chats, args.edits, args.follow_ups, args.speed, args.latency, args.discord_users)
@@ -0,0 +1,123 @@
+"""
+Exercises the AI client's resilience layer against a fault-injecting stub:
+
+- flaky upstream (30% 503s): success rate with and without retries
+- rate limiting (429 with Retry-After): retries wait as told
+- stalled requests: timeouts bound how long a handler can hang
+- slow tail (5% of requests take 1 s): p99 with and without hedging
+- outage: the circuit breaker fails fast instead of waiting on every call
+- bad streams: garbled events are skipped, and a stream without content
+  answers with the error message instead of an empty, cached reply
+
+Run from the repository root:
+
+    python -m benchmarks.bench_resilience
+"""
+import asyncio
+import time
+from bots.shared.ai_client import ERROR_RESPONSE, AIClient
+from bots.shared.cache import MemoryCacheBackend, ResponseCache
+from bots.shared.resilience import CircuitBreaker, RetryPolicy
+from benchmarks.stub_openrouter import StubOpenRouter
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+async def run(client: AIClient, requests: int, concurrency: int = 10):
+    """Sends `requests` prompts and returns (successes, per-request latencies)."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    successes = 0
+
+    async def one(i):
+        nonlocal successes
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.fetch_ai_response(f"question {i}")
+            latencies.append(time.perf_counter() - started)
+            successes += response != ERROR_RESPONSE
+
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return successes, latencies
+
+
+def report(label, requests, successes, latencies, extra=""):
+    print(f"{label:<34}{successes:>5}/{requests:<5}{percentile(latencies, 50) * 1000:>9.1f}"
+          f"{percentile(latencies, 99) * 1000:>9.1f}{max(latencies) * 1000:>9.1f}  {extra}")
+
+
+async def stream(client: AIClient, prompt: str) -> str:
+    return "".join([fragment async for fragment in client.stream_ai_response(prompt)])
+
+
+async def bad_streams():
+    """Checks that garbled events and empty streams never reach a handler as an exception or an empty reply."""
+    stub = StubOpenRouter(text="one two three four five six seven eight nine ten", garbled_rate=0.3)
+    await stub.start()
+    async with AIClient("bench", base_url=stub.base_url) as client:
+        answers = [await stream(client, f"question {i}") for i in range(20)]
+    await stub.stop()
+    garbled = client.malformed_events
+    assert garbled > 0, "no event was garbled"
+    assert all(answer and answer != ERROR_RESPONSE for answer in answers), "a garbled event failed the answer"
+
+    stub = StubOpenRouter(text="")
+    await stub.start()
+    cache = ResponseCache(MemoryCacheBackend(), deterministic_only=False)
+    async with AIClient("bench", base_url=stub.base_url, cache=cache) as client:
+        answers = [await stream(client, "question") for _ in range(2)]
+    await stub.stop()
+    assert answers == [ERROR_RESPONSE] * 2, f"an empty stream answered {answers}"
+    assert stub.requests == 2, "an empty answer was cached"
+    print(f"\nbad streams: skipped {garbled} garbled events; empty streams answered with an error")
+
+
+async def main():
+    print(f"{'scenario':<34}{'ok':>11}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+
+    stub = StubOpenRouter(latency=0.01, error_rate=0.3)
+    await stub.start()
+    for label, retry in (("flaky, no retries", None), ("flaky, 3 attempts", RetryPolicy(base_delay=0.05))):
+        async with AIClient("bench", base_url=stub.base_url, retry=retry) as client:
+            successes, latencies = await run(client, 200)
+        report(label, 200, successes, latencies, f"retries={client.retries}")
+    await stub.stop()
+
+    stub = StubOpenRouter(latency=0.01, error_rate=0.3, error_status=429, retry_after="0.2")
+    await stub.start()
+    async with AIClient("bench", base_url=stub.base_url, retry=RetryPolicy()) as client:
+        successes, latencies = await run(client, 100)
+    report("429 + Retry-After: 0.2", 100, successes, latencies, f"retries={client.retries}")
+    await stub.stop()
+
+    stub = StubOpenRouter(latency=0.01, stall_rate=0.1)
+    await stub.start()
+    async with AIClient("bench", base_url=stub.base_url, read_timeout=0.5, total_timeout=1.0) as client:
+        successes, latencies = await run(client, 100)
+    report("10% stalls, 0.5 s read timeout", 100, successes, latencies)
+    await stub.stop()
+
+    stub = StubOpenRouter(latency=0.02, slow_rate=0.05, slow_latency=1.0)
+    await stub.start()
+    for label, hedge in (("slow tail, no hedging", None), ("slow tail, hedge at p90", 90)):
+        async with AIClient("bench", base_url=stub.base_url, hedge_percentile=hedge) as client:
+            successes, latencies = await run(client, 1000)
+        report(label, 1000, successes, latencies, f"hedged={client.hedged_requests} wins={client.hedge_wins}")
+    await stub.stop()
+
+    stub = StubOpenRouter(latency=0.01, stall_rate=1.0)
+    await stub.start()
+    for label, breaker in (("outage, no breaker", None), ("outage, breaker (5 failures)", CircuitBreaker())):
+        async with AIClient("bench", base_url=stub.base_url, read_timeout=0.2, breaker=breaker) as client:
+            successes, latencies = await run(client, 100, concurrency=1)
+        report(label, 100, successes, latencies, f"breaker={breaker.stats() if breaker else None}")
+    await stub.stop()
+
+    await bad_streams()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
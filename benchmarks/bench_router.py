@@ -0,0 +1,109 @@
+"""
+Simulates the model router against stubbed backends with different latency
+and failure profiles, and compares it with sending everything to one backend.
+
+- degradation: the preferred backend slows from 20 ms to 1.5 s for the middle
+  third of the run; the router demotes it once its p95 passes the latency
+  budget and routes to the slower but steady backup
+- errors: the preferred backend fails 40% of requests; the router fails over
+- rules: short /ask prompts go to the cheap model, everything else to the big one
+
+Run from the repository root:
+
+    python -m benchmarks.bench_router [--requests 1500]
+"""
+import argparse
+import asyncio
+import time
+from bots.shared.ai_client import ERROR_RESPONSE, AIClient
+from bots.shared.router import AIRouter, RoutingRule
+from benchmarks.stub_openrouter import StubOpenRouter
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+async def drive(backend, requests: int, concurrency: int, on_progress=None):
+    """Sends `requests` prompts with `concurrency` in flight; returns latencies and error count."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+    done = 0
+
+    async def one(i):
+        nonlocal errors, done
+        async with semaphore:
+            started = time.perf_counter()
+            response = await backend.fetch_ai_response(f"question {i}", command="call")
+            latencies.append(time.perf_counter() - started)
+            errors += response == ERROR_RESPONSE
+            done += 1
+            if on_progress:
+                on_progress(done)
+
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return latencies, errors
+
+
+def report(label, latencies, errors, extra=""):
+    print(f"{label:<30}{percentile(latencies, 50) * 1000:>9.1f}{percentile(latencies, 95) * 1000:>9.1f}"
+          f"{percentile(latencies, 99) * 1000:>9.1f}{errors:>8}  {extra}")
+
+
+async def main(requests: int, concurrency: int):
+    primary = StubOpenRouter(latency=0.02, text="primary")
+    backup = StubOpenRouter(latency=0.06, text="backup")
+    await primary.start()
+    await backup.start()
+
+    def degrade(done):
+        # The primary is slow for the middle third of the run
+        primary.latency = 1.5 if requests // 3 <= done < 2 * requests // 3 else 0.02
+
+    def clients():
+        return {
+            "primary": AIClient("bench", base_url=primary.base_url, model="big-model"),
+            "backup": AIClient("bench", base_url=backup.base_url, model="backup-model"),
+        }
+
+    print(f"{'scenario':<30}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    try:
+        async with AIClient("bench", base_url=primary.base_url) as static:
+            latencies, errors = await drive(static, requests, concurrency, degrade)
+        report("degradation, primary only", latencies, errors)
+
+        async with AIRouter(clients(), latency_budget=0.3, health_window=2.0) as router:
+            latencies, errors = await drive(router, requests, concurrency, degrade)
+        served = {name: health.requests for name, health in router.health.items()}
+        report("degradation, router", latencies, errors, f"served={served}")
+
+        primary.latency = 0.02
+        primary.error_rate = 0.4
+        async with AIClient("bench", base_url=primary.base_url) as static:
+            latencies, errors = await drive(static, requests, concurrency)
+        report("40% errors, primary only", latencies, errors)
+
+        async with AIRouter(clients(), max_error_rate=0.5) as router:
+            latencies, errors = await drive(router, requests, concurrency)
+        report("40% errors, router", latencies, errors, f"failovers={router.failovers}")
+
+        primary.error_rate = 0.0
+        rules = [RoutingRule(["backup", "primary"], commands=["ask"], max_prompt_chars=280)]
+        async with AIRouter(clients(), rules=rules, default=["primary", "backup"]) as router:
+            short_ask = await router.fetch_ai_response("What is Python?", command="ask")
+            long_ask = await router.fetch_ai_response("Explain " * 100, command="ask")
+            call = await router.fetch_ai_response("What is Python?", command="call")
+        print(f"\nrules: short /ask -> {short_ask}, long /ask -> {long_ask}, /call -> {call}")
+    finally:
+        await primary.stop()
+        await backup.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1500, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=20, help="requests in flight")
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency))
@@ -0,0 +1,88 @@
+"""
+Compares the startup time and memory of the unified runtime, hosting the
+Discord, Telegram and Twitter bots in one process, with three separate bot
+processes.
+
+Each process imports its bots, builds them on the shared AI client and
+scheduler and starts the Twitter workers against a stub API, then reports
+its peak RSS. Connecting to the platforms is left out, so the benchmark
+runs offline.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_runtime [--runs 3]
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+PLATFORMS = ["discord", "telegram", "twitter"]
+
+CHILD_ENV = {
+    "TELEGRAM_BOT_TOKEN": "123456:bench",
+    "OPEN_ROUTER_API_KEY": "bench",
+    "AI_CACHE": "off",
+}
+
+
+async def child(platforms: list):
+    """Builds a runtime for `platforms` without connecting, then prints its peak RSS."""
+    from bots.runtime import BotRuntime
+    from benchmarks.stub_twitter import StubTwitterAPI
+
+    runtime = BotRuntime(platforms, options={"twitter": {"api": StubTwitterAPI()}})
+    await runtime.setup()
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"rss_kb": rss_kb}), flush=True)
+    await runtime.shutdown()
+
+
+def launch(platforms: list) -> subprocess.Popen:
+    env = {**os.environ, **CHILD_ENV}
+    command = [sys.executable, "-m", "benchmarks.bench_runtime", "--child", ",".join(platforms)]
+    return subprocess.Popen(command, stdout=subprocess.PIPE, env=env, text=True)
+
+
+def start(groups: list):
+    """Starts one process per platform group at once; returns (seconds until all are ready, total RSS in MB)."""
+    started = time.perf_counter()
+    processes = [launch(group) for group in groups]
+    total_kb = 0
+    for process in processes:
+        for line in process.stdout:
+            if line.startswith("{"):
+                total_kb += json.loads(line)["rss_kb"]
+                break
+    elapsed = time.perf_counter() - started
+    for process in processes:
+        process.wait()
+    return elapsed, total_kb / 1024
+
+
+def main(runs: int):
+    layouts = [
+        ("three processes", [[name] for name in PLATFORMS]),
+        ("unified runtime", [PLATFORMS]),
+    ]
+    print(f"{'layout':<18}{'processes':>10}{'startup s':>11}{'RSS MB':>9}")
+    for name, groups in layouts:
+        results = [start(groups) for _ in range(runs)]
+        elapsed = min(r[0] for r in results)
+        rss = min(r[1] for r in results)
+        print(f"{name:<18}{len(groups):>10}{elapsed:>11.2f}{rss:>9.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3, help="runs per layout; the best is reported")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        asyncio.run(child(args.child.split(",")))
+    else:
+        main(args.runs)
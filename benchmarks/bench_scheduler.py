@@ -0,0 +1,100 @@
+"""
+Simulates one chatty Telegram group flooding the catch-all handler while other
+users send explicit /ask commands, and reports what the request scheduler
+does: wait times per priority lane, peak queue depth and shed requests.
+
+Also checks two edge cases: a waiter cancelled just as its slot is freed
+gets CancelledError, and a request shed for a full queue costs no tokens.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_scheduler [--messages 500] [--commands 50] [--concurrency 16]
+"""
+import argparse
+import asyncio
+import random
+import time
+from bots.shared.scheduler import PRIORITY_COMMAND, PRIORITY_MESSAGE, RequestScheduler, RequestShed
+
+
+async def edge_cases():
+    """Checks cancelling a waiter whose slot is freed before it resumes, and shedding a request on a full queue."""
+    scheduler = RequestScheduler(max_concurrency=1)
+    await scheduler.acquire()
+    waiter = asyncio.create_task(scheduler.acquire())
+    await asyncio.sleep(0)
+    waiter.cancel()
+    # The cancellation cancels the waiter's future; releasing now pops its entry before the task resumes
+    scheduler.release()
+    try:
+        await waiter
+    except asyncio.CancelledError:
+        pass
+    assert scheduler.active == 0 and not scheduler.waiters, "the freed slot was lost"
+
+    scheduler = RequestScheduler(max_concurrency=1, max_queue=0, user_rate=1e-6, user_burst=2)
+    await scheduler.acquire("user")
+    try:
+        await scheduler.acquire("user")
+        raise AssertionError("a full queue admitted a request")
+    except RequestShed as e:
+        assert e.reason == "queue_full", e.reason
+    scheduler.release()
+    # The shed request took none of the user's two tokens
+    await scheduler.acquire("user")
+    scheduler.release()
+
+
+async def main(messages: int, commands: int, concurrency: int, latency: float):
+    scheduler = RequestScheduler(max_concurrency=concurrency)
+    upstream_active = 0
+    upstream_peak = 0
+    queue_peak = 0
+
+    async def request(user_id, chat_id, priority):
+        nonlocal upstream_active, upstream_peak, queue_peak
+        try:
+            async with scheduler.slot(user_id, chat_id, priority):
+                upstream_active += 1
+                upstream_peak = max(upstream_peak, upstream_active)
+                queue_peak = max(queue_peak, sum(scheduler.stats()["queue_depth"].values()))
+                await asyncio.sleep(latency * random.uniform(0.5, 1.5))
+                upstream_active -= 1
+        except RequestShed:
+            pass
+
+    await edge_cases()
+    random.seed(7)
+    jobs = []
+    # The group: 50 members posting into one chat as fast as they can type
+    for i in range(messages):
+        jobs.append(request(f"member{i % 50}", "busy-group", PRIORITY_MESSAGE))
+    # Everyone else: one /ask each from their own chat
+    for i in range(commands):
+        jobs.append(request(f"asker{i}", f"dm{i}", PRIORITY_COMMAND))
+    random.shuffle(jobs)
+
+    started = time.perf_counter()
+    await asyncio.gather(*jobs)
+    elapsed = time.perf_counter() - started
+
+    stats = scheduler.stats()
+    print(f"{messages} catch-all messages from one group, {commands} commands, "
+          f"concurrency cap {concurrency}, upstream latency ~{latency * 1000:.0f} ms\n")
+    print(f"peak upstream concurrency: {upstream_peak}")
+    print(f"peak queue depth:          {queue_peak}")
+    print(f"shed:                      {stats['shed']}")
+    for lane, waits in stats["waits"].items():
+        print(f"{lane:<8} admitted {waits['admitted']:>5}  avg wait {waits['avg_wait'] * 1000:>8.1f} ms"
+              f"  max wait {waits['max_wait'] * 1000:>8.1f} ms")
+    print(f"\nwall time: {elapsed:.2f} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=500, help="catch-all messages from the busy group")
+    parser.add_argument("--commands", type=int, default=50, help="explicit commands from other users")
+    parser.add_argument("--concurrency", type=int, default=16, help="global concurrency cap")
+    parser.add_argument("--latency", type=float, default=0.2, help="simulated upstream latency in seconds")
+    args = parser.parse_args()
+    asyncio.run(main(args.messages, args.commands, args.concurrency, args.latency))
@@ -0,0 +1,173 @@
+"""
+Measures the import time of each entry point with `python -X importtime`
+and checks it against a per-entry-point budget.
+
+Every entry point is imported `--runs` times in a fresh interpreter; the
+median of the time spent importing modules the bare interpreter does not
+load is compared with its budget in `BUDGETS`. The heaviest packages each
+entry point pulls in are listed, so a regression points at its cause.
+
+Importing must also be free of side effects. A separate interpreter
+imports every entry point under an audit hook and fails on any file or
+network access made by code in `bots/` (the import system reading the
+modules themselves does not count), and checks that `bots.shared` and
+`bots.runtime` load no platform SDK or HTTP stack, and that `.env` is not
+read, until a bot is built.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_startup [--runs 5] [--scale 1.5] [--budgets budgets.json]
+
+`--scale` multiplies every budget, for slower machines; `--budgets` names a
+JSON object of entry point to milliseconds that overrides `BUDGETS`. The
+exit status is 1 if any budget is exceeded or a side effect is found.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Milliseconds allowed to import each entry point; the platform SDKs dominate the bots'
+BUDGETS = {
+    "bots.shared": 10,
+    "bots.runtime": 150,
+    "bots.discord.bot": 800,
+    "bots.telegram.bot": 900,
+    "bots.twitter.bot": 700,
+    "bots.git.run": 80,
+    "bots.git.batch": 150,
+    "bots.git.tree": 200,
+}
+
+# Modules that must not be loaded by importing these entry points
+FORBIDDEN = {
+    "bots.shared": ("aiohttp", "discord", "dotenv", "telegram", "tweepy"),
+    "bots.runtime": ("aiohttp", "discord", "dotenv", "telegram", "tweepy"),
+    "bots.discord.bot": ("dotenv", "telegram", "tweepy"),
+    "bots.telegram.bot": ("discord", "dotenv", "tweepy"),
+    "bots.twitter.bot": ("discord", "dotenv", "telegram"),
+}
+
+AUDITED_EVENTS = ("open", "socket.connect", "socket.getaddrinfo", "subprocess.Popen", "urllib.Request")
+
+# Run in a fresh interpreter: imports every entry point and reports I/O made by code in bots/
+AUDIT_SCRIPT = """
+import importlib, json, os, sys
+root = os.path.join(os.getcwd(), "bots") + os.sep
+events = set(json.loads(sys.argv[1]))
+found = []
+
+def hook(event, args):
+    if event not in events:
+        return
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        # The import system reading modules, or a library doing I/O while being imported
+        if filename.startswith("<frozen importlib") or os.sep + "importlib" + os.sep in filename:
+            return
+        if filename.startswith(root):
+            found.append([current, event, repr(args[0])[:120], f"{filename}:{frame.f_lineno}"])
+            return
+        frame = frame.f_back
+
+current = None
+sys.addaudithook(hook)
+loaded, errors = {}, {}
+for current in json.loads(sys.argv[2]):
+    before = set(sys.modules)
+    try:
+        importlib.import_module(current)
+    except Exception as e:
+        errors[current] = f"{type(e).__name__}: {e}"
+    loaded[current] = sorted(set(sys.modules) - before)
+print(json.dumps({"found": found, "loaded": loaded, "errors": errors}))
+"""
+
+
+def parse_importtime(stderr: str) -> list:
+    """Returns (module, depth, cumulative µs) for every line of `-X importtime` output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|", 2)
+        stripped = name.lstrip()
+        rows.append((stripped, (len(name) - len(stripped) - 1) // 2, int(cumulative)))
+    return rows
+
+
+def importtime(statement: str) -> list:
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement],
+                            capture_output=True, text=True, check=True)
+    return parse_importtime(result.stderr)
+
+
+def measure(module: str, baseline: set) -> tuple:
+    """Imports `module` once; returns (milliseconds, {package: milliseconds}) for what the interpreter lacks."""
+    rows = [row for row in importtime(f"import {module}") if row[0] not in baseline]
+    total = sum(cumulative for name, depth, cumulative in rows if depth == 0)
+    packages = {}
+    for name, depth, cumulative in rows:
+        if "." not in name and name != "bots":
+            packages[name] = max(packages.get(name, 0), cumulative / 1000)
+    return total / 1000, packages
+
+
+def audit(modules: list) -> dict:
+    result = subprocess.run([sys.executable, "-c", AUDIT_SCRIPT, json.dumps(AUDITED_EVENTS), json.dumps(modules)],
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def main(runs: int, scale: float, budgets: dict, top: int) -> int:
+    baseline = {name for name, _, _ in importtime("pass")}
+    failures = []
+    print(f"{'entry point':<20}{'median ms':>10}{'budget ms':>11}  heaviest imports")
+    for module, budget in budgets.items():
+        budget *= scale
+        samples = [measure(module, baseline) for _ in range(runs)]
+        elapsed = statistics.median(ms for ms, _ in samples)
+        packages = samples[-1][1]
+        heaviest = ", ".join(f"{name} {ms:.0f}" for name, ms in
+                             sorted(packages.items(), key=lambda item: -item[1])[:top])
+        over = elapsed > budget
+        print(f"{module:<20}{elapsed:>10.1f}{budget:>11.0f}  {heaviest}{'  OVER BUDGET' if over else ''}")
+        if over:
+            failures.append(f"{module} took {elapsed:.1f} ms, over its {budget:.0f} ms budget")
+
+    # Each entry point in its own interpreter, so one's imports do not hide another's
+    for module in budgets:
+        report = audit([module])
+        for entry, event, argument, where in report["found"]:
+            failures.append(f"importing {entry} made {event} {argument} at {where}")
+        for entry, error in report["errors"].items():
+            failures.append(f"importing {entry} raised {error}")
+        loaded = {name.partition(".")[0] for name in report["loaded"][module]}
+        for name in FORBIDDEN.get(module, ()):
+            if name in loaded:
+                failures.append(f"importing {module} loaded {name}")
+
+    print()
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if not failures:
+        print("every entry point is within budget, and importing one reads no file and opens no connection")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="imports of each entry point; the median counts")
+    parser.add_argument("--scale", type=float, default=float(os.getenv("STARTUP_BUDGET_SCALE", "1")),
+                        help="multiplier for every budget (default: STARTUP_BUDGET_SCALE or 1)")
+    parser.add_argument("--budgets", help="JSON file of entry point to milliseconds, overriding the defaults")
+    parser.add_argument("--top", type=int, default=3, help="heaviest packages listed per entry point")
+    args = parser.parse_args()
+    budgets = dict(BUDGETS)
+    if args.budgets:
+        with open(args.budgets) as f:
+            budgets.update(json.load(f))
+    sys.exit(main(args.runs, args.scale, budgets, args.top))
@@ -0,0 +1,146 @@
+"""
+Load generator for Telegram update ingestion: replays synthetic text
+messages through long polling and through the webhook server, and reports
+updates/s, how long updates wait to be acknowledged and how long until the
+bot's first reply.
+
+Polling updates are queued on a stub Bot API and count as acknowledged
+when a later getUpdates offset passes them. Webhook updates are POSTed by
+the generator and count as acknowledged when the POST returns.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_telegram_ingest [--updates 1000] [--concurrency 50] [--workers 16]
+"""
+import argparse
+import asyncio
+import time
+import aiohttp
+from bots.shared.ai_client import AIClient
+from bots.shared.outbound import OutboundScheduler
+from bots.shared.scheduler import RequestScheduler
+from bots.telegram.bot import TelegramAIChatBot
+from bots.telegram.webhook import SECRET_HEADER, TelegramWebhookServer
+from benchmarks.stub_openrouter import StubOpenRouter
+from benchmarks.stub_telegram import StubTelegramAPI, make_update
+
+SECRET = "bench-secret"
+
+
+def percentile(samples: list, percentile: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+
+
+def build_bot(telegram: StubTelegramAPI, ai_url: str, workers: int) -> TelegramAIChatBot:
+    # Admission and send limits are lifted so ingestion is the only thing measured
+    scheduler = RequestScheduler(max_concurrency=1000, max_queue=100_000)
+    outbound = OutboundScheduler("telegram", (), workers=workers)
+    return TelegramAIChatBot(ai_client=AIClient("bench", base_url=ai_url), scheduler=scheduler,
+                             token="123456:bench", base_url=telegram.base_url, workers=workers, outbound=outbound)
+
+
+def synthetic_updates(count: int) -> list:
+    # One chat per update, so each reply can be matched to its update
+    return [make_update(i + 1, f"synthetic question {i}", chat_id=100_000 + i, user_id=i) for i in range(count)]
+
+
+async def wait_for_replies(telegram: StubTelegramAPI, count: int, timeout: float = 120.0):
+    deadline = time.perf_counter() + timeout
+    while len(telegram.edits) < count and time.perf_counter() < deadline:
+        await asyncio.sleep(0.01)
+
+
+async def run_polling(telegram: StubTelegramAPI, ai_url: str, updates: list, workers: int):
+    """Returns (seconds, ack latencies, first reply latencies) for long polling."""
+    bot = build_bot(telegram, ai_url, workers)
+    application = bot.application
+    await application.initialize()
+    await application.start()
+    await application.updater.start_polling(poll_interval=0.0, timeout=10)
+    started = time.perf_counter()
+    for update in updates:
+        telegram.push(update)
+    await wait_for_replies(telegram, len(updates))
+    elapsed = time.perf_counter() - started
+    await application.updater.stop()
+    await application.stop()
+    await application.shutdown()
+    await bot.outbound.close()
+    await bot.ai_client.close()
+
+    acks = [telegram.acked_at[u] - telegram.pushed_at[u] for u in telegram.acked_at]
+    replies = [telegram.first_reply_at[u["message"]["chat"]["id"]] - telegram.pushed_at[u["update_id"]]
+               for u in updates if u["message"]["chat"]["id"] in telegram.first_reply_at]
+    return elapsed, acks, replies
+
+
+async def run_webhook(telegram: StubTelegramAPI, ai_url: str, updates: list, workers: int, concurrency: int):
+    """Returns (seconds, ack latencies, first reply latencies) for the webhook server."""
+    bot = build_bot(telegram, ai_url, workers)
+    server = TelegramWebhookServer(bot.application, SECRET, host="127.0.0.1", port=0, workers=workers,
+                                   queue_size=len(updates))
+    await server.start()
+    url = f"http://127.0.0.1:{server.port}{server.path}"
+    acks = []
+    posted_at = {}
+    pending = iter(updates)
+
+    async with aiohttp.ClientSession() as session:
+        async with session.post(url, json=updates[0], headers={SECRET_HEADER: "wrong"}) as response:
+            assert response.status == 403, "an update with a wrong secret token was accepted"
+
+        async def sender():
+            for update in pending:
+                posted_at[update["message"]["chat"]["id"]] = sent = time.perf_counter()
+                async with session.post(url, json=update, headers={SECRET_HEADER: SECRET}) as response:
+                    assert response.status == 200, f"update refused with {response.status}"
+                acks.append(time.perf_counter() - sent)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(sender() for _ in range(concurrency)))
+        await wait_for_replies(telegram, len(updates))
+        elapsed = time.perf_counter() - started
+
+    await server.stop()
+    await bot.outbound.close()
+    await bot.ai_client.close()
+    replies = [at - posted_at[chat] for chat, at in telegram.first_reply_at.items() if chat in posted_at]
+    return elapsed, acks, replies
+
+
+async def main(count: int, concurrency: int, workers: int, ai_latency: float, api_latency: float):
+    ai = StubOpenRouter(latency=ai_latency)
+    telegram = StubTelegramAPI(latency=api_latency)
+    await ai.start()
+    await telegram.start()
+    print(f"{count} updates, {workers} workers, AI latency {ai_latency * 1000:.0f} ms, "
+          f"Bot API latency {api_latency * 1000:.0f} ms\n")
+    print(f"{'mode':<10}{'updates/s':>11}{'ack p50':>10}{'ack p95':>10}{'reply p50':>11}{'reply p95':>11}"
+          f"{'getUpdates':>12}")
+    try:
+        for mode in ("polling", "webhook"):
+            telegram.reset()
+            updates = synthetic_updates(count)
+            if mode == "polling":
+                elapsed, acks, replies = await run_polling(telegram, ai.base_url, updates, workers)
+            else:
+                elapsed, acks, replies = await run_webhook(telegram, ai.base_url, updates, workers, concurrency)
+            assert len(telegram.edits) == count, f"{mode}: only {len(telegram.edits)} of {count} updates answered"
+            print(f"{mode:<10}{count / elapsed:>11.1f}{percentile(acks, 50) * 1000:>9.1f}ms"
+                  f"{percentile(acks, 95) * 1000:>9.1f}ms{percentile(replies, 50) * 1000:>10.1f}ms"
+                  f"{percentile(replies, 95) * 1000:>10.1f}ms{telegram.calls.get('getUpdates', 0):>12}")
+    finally:
+        await telegram.stop()
+        await ai.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50, help="concurrent webhook POSTs")
+    parser.add_argument("--workers", type=int, default=16, help="updates the bot handles concurrently")
+    parser.add_argument("--ai-latency", type=float, default=0.05, help="stub AI latency in seconds")
+    parser.add_argument("--api-latency", type=float, default=0.005, help="stub Bot API latency in seconds")
+    args = parser.parse_args()
+    asyncio.run(main(args.updates, args.concurrency, args.workers, args.ai_latency, args.api_latency))
@@ -0,0 +1,71 @@
+"""
+Replays a mention stream into `AIChatBotListener` from a stand-in stream
+thread and reports throughput for different worker pool sizes.
+
+The AI backend is the local OpenRouter stub and tweepy is replaced by a
+stub whose calls block like real REST round trips. Each run also checks that
+the bot's identity is resolved once at startup: handling events must not
+call `api.me()`.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_twitter_listener [--mentions 200] [--recording mentions.jsonl]
+"""
+import argparse
+import asyncio
+import threading
+import time
+from bots.shared.ai_client import AIClient
+from bots.shared.outbound import OutboundScheduler
+from bots.shared.scheduler import RequestScheduler
+from bots.twitter.bot import AIChatBotListener
+from benchmarks.stub_openrouter import StubOpenRouter
+from benchmarks.stub_twitter import StubTwitterAPI, recorded_mentions
+
+
+def replay(base_url: str, workers: int, mentions: int, recording: str, api_latency: float):
+    """Feeds the recorded stream into a listener and returns (seconds, statuses posted)."""
+    api = StubTwitterAPI(latency=api_latency)
+    # Admission and posting limits are lifted so the worker count is the only bound on concurrency
+    scheduler = RequestScheduler(max_concurrency=1000, user_burst=1000, chat_burst=1000)
+    ai_client = AIClient("bench", base_url=base_url)
+    outbound = OutboundScheduler("twitter", (), workers=workers)
+    listener = AIChatBotListener(api, ai_client=ai_client, scheduler=scheduler, workers=workers, outbound=outbound)
+    identity_calls = api.count("me")
+    started = time.perf_counter()
+    for status in recorded_mentions(mentions, recording):
+        listener.on_status(status)
+    listener.run_async(listener.queue.join())
+    elapsed = time.perf_counter() - started
+    listener.run_async(ai_client.close())
+    listener.close()
+    per_event = api.count("me") - identity_calls
+    assert per_event == 0, f"api.me() was called {per_event} times while handling events"
+    return elapsed, api.count("update_status")
+
+
+def main(mentions: int, recording: str, ai_latency: float, api_latency: float):
+    stub = StubOpenRouter(latency=ai_latency)
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    asyncio.run_coroutine_threadsafe(stub.start(), loop).result()
+
+    print(f"{mentions} mentions, AI latency {ai_latency * 1000:.0f} ms, tweepy latency {api_latency * 1000:.0f} ms\n")
+    print(f"{'workers':>8}{'seconds':>10}{'mentions/s':>12}{'posted':>8}")
+    try:
+        for workers in (1, 2, 4, 8, 16, 32):
+            elapsed, posted = replay(stub.base_url, workers, mentions, recording, api_latency)
+            print(f"{workers:>8}{elapsed:>10.2f}{mentions / elapsed:>12.1f}{posted:>8}")
+    finally:
+        asyncio.run_coroutine_threadsafe(stub.stop(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mentions", type=int, default=200, help="mentions to replay per run")
+    parser.add_argument("--recording", help="JSON-lines mention recording to replay instead of synthetic mentions")
+    parser.add_argument("--ai-latency", type=float, default=0.1, help="stub AI latency in seconds")
+    parser.add_argument("--api-latency", type=float, default=0.02, help="stub tweepy call latency in seconds")
+    args = parser.parse_args()
+    main(args.mentions, args.recording, args.ai_latency, args.api_latency)
@@ -0,0 +1,195 @@
+"""
+Posts long AI answers to mentions in flat and in thread mode and checks the
+reply graph recorded by a stub tweepy API.
+
+In flat mode every part replies to the mention; in thread mode each part
+must reply to the part before it, numbered 1/n to n/n. The thread
+publisher is then run against injected failures, exhausted retries that
+are resumed, an unexpected error, and a tight posting limit, checking that
+no part is posted twice, that no error stops a worker and that the limit
+is respected.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_twitter_threads [--mentions 40] [--answer-length 1500]
+"""
+import argparse
+import asyncio
+import threading
+import time
+from bots.shared.ai_client import AIClient
+from bots.shared.outbound import OutboundScheduler
+from bots.shared.scheduler import RequestScheduler
+from bots.twitter.bot import AIChatBotListener
+from bots.twitter.threads import ThreadPublisher
+from benchmarks.stub_openrouter import StubOpenRouter
+from benchmarks.stub_twitter import StubTwitterAPI, make_status
+
+ANSWER = ("Threads keep long answers readable. Each part replies to the one before it, so the answer "
+          "reads from top to bottom. ")
+
+
+def check_thread(api: StubTwitterAPI, mention_id: int) -> int:
+    """Walks the chain under a mention, checking order and numbering, and returns its length."""
+    chain = []
+    parent = mention_id
+    while True:
+        replies = api.replies_to(parent)
+        assert len(replies) <= 1, f"tweet {parent} has {len(replies)} replies; parts are siblings"
+        if not replies:
+            break
+        parent = replies[0]
+        chain.append(api.statuses[parent][0])
+    total = len(chain)
+    assert total, f"mention {mention_id} was not answered"
+    if total > 1:
+        for i, text in enumerate(chain):
+            assert text.endswith(f" {i + 1}/{total}"), f"part {i + 1} of {total} is numbered wrong: {text[-10:]!r}"
+    return total
+
+
+def check_unique(api: StubTwitterAPI):
+    # A part posted twice would reply to the same tweet with the same text
+    posts = list(api.statuses.values())
+    assert len(posts) == len(set(posts)), "a part was posted twice"
+
+
+def run_listener(base_url: str, mode: str, mentions: int, api_latency: float):
+    """Answers `mentions` mentions through the listener and returns (seconds, api)."""
+    api = StubTwitterAPI(latency=api_latency)
+    scheduler = RequestScheduler(max_concurrency=1000, user_burst=1000, chat_burst=1000)
+    ai_client = AIClient("bench", base_url=base_url)
+    # The posting limit is lifted; the publisher's own pacing is measured below
+    outbound = OutboundScheduler("twitter", (), workers=16)
+    listener = AIChatBotListener(api, ai_client=ai_client, scheduler=scheduler, reply_mode=mode, outbound=outbound)
+    started = time.perf_counter()
+    for i in range(mentions):
+        listener.on_status(make_status(i + 1, f"/ask question {i}", f"user{i}", 100 + i))
+    listener.run_async(listener.queue.join())
+    elapsed = time.perf_counter() - started
+    listener.run_async(ai_client.close())
+    listener.close()
+    return elapsed, api
+
+
+def publisher_for(api: StubTwitterAPI, **options) -> ThreadPublisher:
+    async def post(text, reply_to):
+        return api.update_status(text, in_reply_to_status_id=reply_to).id
+
+    return ThreadPublisher(post, **options)
+
+
+async def faults(answer: str, threads: int):
+    """Publishes threads while every fifth post fails; returns (tweets, retries)."""
+    api = StubTwitterAPI(fail_every=5)
+    publisher = publisher_for(api, backoff=0.001, max_attempts=20)
+    await publisher.start()
+    await asyncio.gather(*(publisher.publish(i, i, f"{i} {answer}", mention=f"@user{i} ") for i in range(threads)))
+    await publisher.close()
+    for i in range(threads):
+        check_thread(api, i)
+    check_unique(api)
+    assert publisher.retries, "no failure was injected"
+    return publisher.tweets, publisher.retries
+
+
+async def resume(answer: str):
+    """Lets a thread fail for good, publishes it again, and returns how many publishes it took."""
+    api = StubTwitterAPI(fail_every=3)
+    publisher = publisher_for(api, max_attempts=1)
+    await publisher.start()
+    publishes = 0
+    while True:
+        publishes += 1
+        try:
+            await publisher.publish("mention", 1, answer, mention="@user ")
+            break
+        except Exception:
+            assert publisher.threads["mention"].posted, "the thread kept no progress"
+    await publisher.close()
+    check_thread(api, 1)
+    check_unique(api)
+    return publishes
+
+
+async def unexpected_error(answer: str):
+    """Checks that a `post` raising something other than a tweepy error fails its thread but not the worker."""
+    api = StubTwitterAPI()
+    calls = []
+
+    async def post(text, reply_to):
+        calls.append(text)
+        if len(calls) == 1:
+            raise RuntimeError("unexpected")
+        return api.update_status(text, in_reply_to_status_id=reply_to).id
+
+    publisher = ThreadPublisher(post, workers=1, max_attempts=1)
+    await publisher.start()
+    try:
+        await asyncio.wait_for(publisher.publish("broken", 1, answer, mention="@user "), 3.0)
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("publish did not raise the post's error")
+    # The only worker is still alive and posts the next thread
+    await asyncio.wait_for(publisher.publish("next", 2, answer, mention="@user "), 3.0)
+    assert not any(task.done() for task in publisher.workers), "the worker died"
+    await publisher.close()
+    check_thread(api, 2)
+
+
+async def pacing(tweets: int, per_second: int):
+    """Posts `tweets` tweets under a limit of `per_second` and returns the seconds taken."""
+    api = StubTwitterAPI()
+    publisher = publisher_for(api, posts_per_window=per_second, window=1.0)
+    await publisher.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(publisher.publish(i, i, f"tweet {i}") for i in range(tweets)))
+    elapsed = time.perf_counter() - started
+    await publisher.close()
+    expected = (tweets - per_second) / per_second
+    assert elapsed >= expected * 0.9, f"{tweets} tweets took {elapsed:.2f}s, the limit allows no less than {expected:.2f}s"
+    return elapsed
+
+
+def main(mentions: int, answer_length: int, ai_latency: float, api_latency: float):
+    answer = (ANSWER * (answer_length // len(ANSWER) + 1))[:answer_length]
+    stub = StubOpenRouter(latency=ai_latency, text=answer)
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    asyncio.run_coroutine_threadsafe(stub.start(), loop).result()
+
+    print(f"{mentions} mentions, {answer_length}-character answers, tweepy latency {api_latency * 1000:.0f} ms\n")
+    print(f"{'mode':<8}{'seconds':>10}{'tweets':>8}{'longest chain':>15}{'max siblings':>14}")
+    try:
+        for mode in ("flat", "thread"):
+            elapsed, api = run_listener(stub.base_url, mode, mentions, api_latency)
+            siblings = max(len(api.replies_to(i + 1)) for i in range(mentions))
+            if mode == "thread":
+                chain = max(check_thread(api, i + 1) for i in range(mentions))
+                check_unique(api)
+            else:
+                chain = 1
+            print(f"{mode:<8}{elapsed:>10.2f}{api.count('update_status'):>8}{chain:>15}{siblings:>14}")
+    finally:
+        asyncio.run_coroutine_threadsafe(stub.stop(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+
+    tweets, retries = asyncio.run(faults(answer, mentions))
+    print(f"\nfailures: {tweets} tweets posted with {retries} retries, every thread intact, no duplicates")
+    publishes = asyncio.run(resume(answer))
+    print(f"resume:   a thread failing for good was completed over {publishes} publishes, no duplicates")
+    asyncio.run(unexpected_error(answer))
+    print("errors:   a post raising an unexpected error failed its thread; the worker kept posting")
+    elapsed = asyncio.run(pacing(30, 10))
+    print(f"pacing:   30 tweets at 10 per second took {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mentions", type=int, default=40)
+    parser.add_argument("--answer-length", type=int, default=1500, help="characters per AI answer")
+    parser.add_argument("--ai-latency", type=float, default=0.05, help="stub AI latency in seconds")
+    parser.add_argument("--api-latency", type=float, default=0.02, help="stub tweepy call latency in seconds")
+    args = parser.parse_args()
+    main(args.mentions, args.answer_length, args.ai_latency, args.api_latency)
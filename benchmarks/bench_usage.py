@@ -0,0 +1,156 @@
+"""
+Measures what token accounting costs on the request path and checks that
+quotas are enforced.
+
+The micro-benchmark reserves and settles requests for many users in a tight
+loop and reports the cost per request. The flush run writes the usage of
+that many accounts to SQLite while a ticker task measures how long the
+event loop is held up. The end-to-end run sends requests through the pooled
+AI client to a local stub with and without a ledger.
+
+The checks: `max_tokens` shrinks as a user's quota runs out, a user over
+quota is answered with `QUOTA_RESPONSE` without an upstream call, streamed
+answers are billed from the usage on the stream's last event, cached
+answers are free, and the usage survives a restart.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_usage [--iterations 200000] [--accounts 100000] [--requests 2000]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from bots.shared.ai_client import AIClient
+from bots.shared.cache import MemoryCacheBackend, ResponseCache
+from bots.shared.usage import QUOTA_RESPONSE, UsageLedger, metered
+from benchmarks.stub_openrouter import StubOpenRouter
+
+
+def micro(iterations: int, accounts: int) -> float:
+    """Returns the cost of reserving and settling one request in microseconds."""
+    ledger = UsageLedger(user_quota=10 ** 12, chat_quota=10 ** 12)
+    history = [{"role": "user", "content": "an earlier question"}, {"role": "assistant", "content": "an answer"}]
+    started = time.perf_counter()
+    for i in range(iterations):
+        with metered(ledger, ("telegram", i % accounts, i % accounts), None, "a question", history, 1000) as held:
+            held.report({"prompt_tokens": 20, "completion_tokens": 200})
+    elapsed = time.perf_counter() - started
+    assert len(ledger.pending) == min(iterations, accounts)
+    assert not ledger.held, "a hold was not released"
+    ledger.connection.close()
+    return elapsed / iterations * 1e6
+
+
+async def flush(path: str, accounts: int):
+    """Flushes the usage of `accounts` accounts; returns (seconds, longest event loop stall)."""
+    ledger = UsageLedger(path, user_quota=10 ** 9)
+    for i in range(accounts):
+        ledger.record(("discord", str(i % 1000), str(i)), 20, 200)
+    stalls = []
+
+    async def ticker():
+        while True:
+            before = time.perf_counter()
+            await asyncio.sleep(0.001)
+            stalls.append(time.perf_counter() - before - 0.001)
+
+    task = asyncio.create_task(ticker())
+    started = time.perf_counter()
+    await ledger.flush()
+    elapsed = time.perf_counter() - started
+    task.cancel()
+    assert ledger.used[("user", "discord", "7")] == 220
+    assert not ledger.pending
+    await ledger.close()
+    return elapsed, max(stalls, default=0.0)
+
+
+async def end_to_end(base_url: str, requests: int, concurrency: int, ledger) -> float:
+    """Sends `requests` AI requests from different users and returns the seconds taken."""
+    semaphore = asyncio.Semaphore(concurrency)
+    async with AIClient("bench", base_url=base_url, ledger=ledger) as client:
+        async def request(i):
+            async with semaphore:
+                await client.fetch_ai_response(f"question {i}", conversation=("telegram", i, i))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(request(i) for i in range(requests)))
+        return time.perf_counter() - started
+
+
+async def check_quotas(stub: StubOpenRouter, path: str):
+    # The stub answers 50 words and counts words as tokens
+    stub.text = " ".join(["word"] * 50)
+    ledger = UsageLedger(path, user_quota=500, min_tokens=64)
+    user = ("telegram", 1, 1)
+    async with AIClient("bench", base_url=stub.base_url, ledger=ledger, max_tokens=1000) as client:
+        limits = []
+        while True:
+            before = stub.requests
+            answer = await client.fetch_ai_response("how much is left?", conversation=user)
+            if answer == QUOTA_RESPONSE:
+                assert stub.requests == before, "a request over quota reached the API"
+                break
+            limits.append(stub.last_payload["max_tokens"])
+        assert limits[0] < 500 and limits == sorted(limits, reverse=True) and len(set(limits)) > 1, limits
+        assert ledger.remaining(("telegram", "1", "1")) < 64 + 5
+
+        # Another user is unaffected, streams are billed from their last event
+        fragments = [f async for f in client.stream_ai_response("stream it", conversation=("telegram", 2, 2))]
+        assert QUOTA_RESPONSE not in fragments
+        assert ledger.used[("user", "telegram", "2")] == 2 + 50, ledger.used[("user", "telegram", "2")]
+
+    ledger = UsageLedger(path, user_quota=500)
+    assert ledger.remaining(("telegram", "1", "1")) < 64 + 5, "usage was lost on restart"
+    assert ledger.used[("user", "telegram", "2")] == 52
+    ledger.connection.close()
+
+    # Cached answers cost nothing
+    ledger = UsageLedger(user_quota=500)
+    cache = ResponseCache(MemoryCacheBackend(), deterministic_only=False)
+    async with AIClient("bench", base_url=stub.base_url, ledger=ledger, cache=cache, max_tokens=300) as client:
+        await client.fetch_ai_response("cached", conversation=("discord", 3, 3))
+        used = ledger.used[("user", "discord", "3")]
+        await client.fetch_ai_response("cached", conversation=("discord", 3, 3))
+        assert ledger.used[("user", "discord", "3")] == used, "a cached answer was billed"
+    return limits
+
+
+async def main(iterations: int, accounts: int, requests: int, concurrency: int, latency: float):
+    per_request = micro(iterations, accounts)
+    assert per_request < 50, f"accounting costs {per_request:.0f} us per request"
+    print(f"reserve and settle: {per_request:.2f} us per request ({iterations} requests, {accounts} users)")
+
+    with tempfile.TemporaryDirectory() as directory:
+        elapsed, stall = await flush(os.path.join(directory, "flush.sqlite3"), accounts)
+        assert stall < 0.1, f"flushing held the event loop up for {stall * 1000:.0f} ms"
+        print(f"flush of {accounts} accounts: {elapsed * 1000:.0f} ms on a worker thread, "
+              f"longest event loop stall {stall * 1000:.1f} ms\n")
+
+        stub = StubOpenRouter(latency=latency)
+        await stub.start()
+        try:
+            await end_to_end(stub.base_url, concurrency, concurrency, None)
+            print(f"{requests} AI requests, {concurrency} at a time, stub latency {latency * 1000:.0f} ms\n")
+            print(f"{'ledger':<10}{'seconds':>10}{'requests/s':>12}")
+            for on in (False, True, False, True):
+                ledger = UsageLedger(os.path.join(directory, "e2e.sqlite3"), user_quota=10 ** 9) if on else None
+                elapsed = await end_to_end(stub.base_url, requests, concurrency, ledger)
+                print(f"{'on' if on else 'off':<10}{elapsed:>10.2f}{requests / elapsed:>12.0f}")
+            limits = await check_quotas(stub, os.path.join(directory, "quota.sqlite3"))
+        finally:
+            await stub.stop()
+    print(f"\nmax_tokens as a 500 token quota ran out: {limits}, then refused without an upstream call")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200_000, help="requests in the micro-benchmark")
+    parser.add_argument("--accounts", type=int, default=100_000, help="distinct users billed")
+    parser.add_argument("--requests", type=int, default=2000, help="AI requests per end-to-end run")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.01, help="stub AI latency in seconds")
+    args = parser.parse_args()
+    asyncio.run(main(args.iterations, args.accounts, args.requests, args.concurrency, args.latency))
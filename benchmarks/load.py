@@ -0,0 +1,344 @@
+"""
+Offline load test of the bots: drives each bot's real handlers with
+synthetic traffic against local stubs of OpenRouter and of the chat
+platforms, and reports what a release would change.
+
+Scenarios:
+
+    telegram-burst  --requests /ask updates pushed at once to the long polling bot
+    discord-burst   --requests /call interactions dispatched at once, as the gateway would
+    twitter-steady  --mentions /ask mentions fed from a stream thread at --rate per second
+
+Each scenario reports requests/s, p50 and p99 end-to-end latency (from the
+platform receiving a request to the bot's last message for it), peak
+resident memory and its growth, the peak number of open sockets (the bots'
+and the in-process stubs') and the upstream AI requests made. The AI stub's
+latency, streaming speed and error rate are configurable; the bots' request
+scheduler is sized by --concurrency, and platform send limits are lifted
+unless --platform-limits is given (Twitter's 300 tweets per 3 hours always
+are, as they would stall any load test).
+
+`--json` saves the results, and `--compare` sets them against a saved run,
+exiting with status 1 when a number got worse by more than --tolerance, so a
+commit can be checked against its parent:
+
+    git checkout HEAD~1 && python -m benchmarks.load --json before.json
+    git checkout - && python -m benchmarks.load --compare before.json
+
+Run from the repository root:
+
+    python -m benchmarks.load [--scenario all] [--requests 1000] [--streaming] [--ai-error-rate 0.05]
+"""
+import argparse
+import asyncio
+import dataclasses
+import json
+import os
+import subprocess
+import sys
+import time
+from bots.shared import metrics
+from bots.shared.ai_client import AIClient
+from bots.shared.metrics import METRICS
+from bots.shared.outbound import DISCORD_ROUTES, TELEGRAM_ROUTES, OutboundScheduler
+from bots.shared.scheduler import RequestScheduler
+from bots.shared.settings import settings_from_env
+from benchmarks.stub_discord import StubDiscord
+from benchmarks.stub_openrouter import StubOpenRouter
+from benchmarks.stub_telegram import StubTelegramAPI, make_update
+from benchmarks.stub_twitter import StubTwitterAPI, make_status
+
+SCENARIOS = ("telegram-burst", "discord-burst", "twitter-steady")
+# Result fields compared against a baseline, and whether higher is better
+COMPARED = (("throughput", True), ("p50_ms", False), ("p99_ms", False), ("peak_rss_mb", False),
+            ("peak_sockets", False))
+
+
+def resident_bytes() -> int:
+    """Returns the process's resident memory, or its peak where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def open_sockets():
+    """Returns the number of sockets the process has open, or None where /proc is unavailable."""
+    try:
+        fds = os.listdir("/proc/self/fd")
+    except OSError:
+        return None
+    count = 0
+    for fd in fds:
+        try:
+            if os.readlink(f"/proc/self/fd/{fd}").startswith("socket:"):
+                count += 1
+        except OSError:
+            pass
+    return count
+
+
+class ResourceSampler:
+    """Samples resident memory and open sockets while a scenario runs."""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.start_rss = resident_bytes()
+        self.peak_rss = self.start_rss
+        self.peak_sockets = open_sockets()
+        self.task = None
+
+    def sample(self):
+        self.peak_rss = max(self.peak_rss, resident_bytes())
+        sockets = open_sockets()
+        if sockets is not None:
+            self.peak_sockets = max(self.peak_sockets, sockets)
+
+    async def run(self):
+        while True:
+            self.sample()
+            await asyncio.sleep(self.interval)
+
+    async def __aenter__(self):
+        self.task = asyncio.create_task(self.run())
+        return self
+
+    async def __aexit__(self, *exc):
+        self.task.cancel()
+        self.sample()
+
+
+def percentile(samples: list, percentile: float):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+
+
+def lifted_scheduler(options) -> RequestScheduler:
+    # Every request comes from its own user, so only the concurrency cap applies
+    return RequestScheduler(max_concurrency=options.concurrency, max_queue=1_000_000,
+                            user_burst=1_000_000, chat_burst=1_000_000)
+
+
+def outbound(platform: str, routes: tuple, options) -> OutboundScheduler:
+    return OutboundScheduler(platform, routes if options.platform_limits else (), workers=options.outbound_workers)
+
+
+def bot_settings(options):
+    return dataclasses.replace(settings_from_env(), ai_streaming=options.streaming)
+
+
+def errors(platform: str) -> float:
+    return sum(value for (name, _), value in METRICS.errors.values.items() if name == platform)
+
+
+async def telegram_burst(ai_url: str, options) -> list:
+    """Pushes `options.requests` /ask updates at once and returns their latencies."""
+    from bots.telegram import bot as telegram_bot
+    telegram = StubTelegramAPI(latency=options.api_latency)
+    await telegram.start()
+    bot = telegram_bot.TelegramAIChatBot(ai_client=AIClient("load", base_url=ai_url),
+                                         scheduler=lifted_scheduler(options), token="123456:load",
+                                         base_url=telegram.base_url, workers=options.concurrency,
+                                         outbound=outbound("telegram", TELEGRAM_ROUTES, options),
+                                         settings=bot_settings(options))
+    application = bot.application
+    await application.initialize()
+    await application.start()
+    await application.updater.start_polling(poll_interval=0.0, timeout=10)
+    done = METRICS.stages.count("telegram", "done")
+    updates = [make_update(i + 1, f"/ask load question {i}", chat_id=200_000 + i, user_id=200_000 + i)
+               for i in range(options.requests)]
+    for update in updates:
+        telegram.push(update)
+    # Each handled update marks "done"; streaming edits a message several times, so edits alone do not tell
+    deadline = time.perf_counter() + options.timeout
+    while METRICS.stages.count("telegram", "done") - done < len(updates) and time.perf_counter() < deadline:
+        await asyncio.sleep(0.01)
+    await application.updater.stop()
+    await application.stop()
+    await application.shutdown()
+    await bot.outbound.close()
+    await bot.ai_client.close()
+    await telegram.stop()
+    return [telegram.edits[u["message"]["chat"]["id"]] - telegram.pushed_at[u["update_id"]]
+            for u in updates if u["message"]["chat"]["id"] in telegram.edits]
+
+
+async def discord_burst(ai_url: str, options) -> list:
+    """Dispatches `options.requests` /call interactions at once and returns their latencies."""
+    from bots.discord import bot as discord_bot
+    discord = StubDiscord(latency=options.api_latency)
+    bot = discord_bot.AIChatBot(ai_client=AIClient("load", base_url=ai_url), scheduler=lifted_scheduler(options),
+                                outbound=outbound("discord", DISCORD_ROUTES, options), settings=bot_settings(options))
+    interactions = [discord.interaction(i + 1, 300_000 + i, 400_000 + i) for i in range(options.requests)]
+    # discord.py runs each interaction's handler in its own task
+    tasks = [asyncio.create_task(bot.call_command(interaction, f"load question {interaction.id}"))
+             for interaction in interactions]
+    await asyncio.wait(tasks, timeout=options.timeout)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await bot.outbound.close()
+    await bot.ai_client.close()
+    return [discord.events[i.id][-1][0] - discord.created_at[i.id] for i in interactions if i.id in discord.events]
+
+
+def twitter_steady(ai_url: str, options) -> list:
+    """Feeds `options.mentions` /ask mentions at `options.rate` per second and returns their latencies."""
+    from bots.twitter.bot import AIChatBotListener
+    api = StubTwitterAPI(latency=options.api_latency)
+    ai_client = AIClient("load", base_url=ai_url)
+    # The listener runs its own loop; this thread plays the stream's
+    listener = AIChatBotListener(api, ai_client=ai_client, scheduler=lifted_scheduler(options),
+                                 workers=options.concurrency,
+                                 outbound=OutboundScheduler("twitter", (), workers=options.outbound_workers))
+    received_at = {}
+    started = time.perf_counter()
+    for i in range(options.mentions):
+        delay = started + i / options.rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        status = make_status(500_000 + i, f"/ask load question {i}", f"user{i}", 500_000 + i)
+        received_at[status.id] = time.perf_counter()
+        listener.on_status(status)
+    listener.run_async(asyncio.wait_for(listener.queue.join(), options.timeout))
+    listener.run_async(ai_client.close())
+    listener.close()
+    return [api.replied_at[id] - at for id, at in received_at.items() if id in api.replied_at]
+
+
+async def run_scenario(name: str, ai: StubOpenRouter, options) -> dict:
+    platform = name.split("-")[0]
+    requests = options.mentions if name == "twitter-steady" else options.requests
+    ai_requests = ai.requests
+    failed = errors(platform)
+    async with ResourceSampler() as sampler:
+        started = time.perf_counter()
+        if name == "telegram-burst":
+            latencies = await telegram_burst(ai.base_url, options)
+        elif name == "discord-burst":
+            latencies = await discord_burst(ai.base_url, options)
+        else:
+            latencies = await asyncio.to_thread(twitter_steady, ai.base_url, options)
+        elapsed = time.perf_counter() - started
+    p50, p99 = percentile(latencies, 50), percentile(latencies, 99)
+    return {
+        "requests": requests,
+        "answered": len(latencies),
+        "seconds": round(elapsed, 3),
+        "throughput": round(len(latencies) / elapsed, 1),
+        "p50_ms": None if p50 is None else round(p50 * 1000, 1),
+        "p99_ms": None if p99 is None else round(p99 * 1000, 1),
+        "peak_rss_mb": round(sampler.peak_rss / 2 ** 20, 1),
+        "rss_growth_mb": round((sampler.peak_rss - sampler.start_rss) / 2 ** 20, 1),
+        "peak_sockets": sampler.peak_sockets,
+        "ai_requests": ai.requests - ai_requests,
+        "errors": int(errors(platform) - failed),
+    }
+
+
+def print_results(results: dict):
+    print(f"{'scenario':<16}{'answered':>10}{'seconds':>9}{'req/s':>9}{'p50 ms':>9}{'p99 ms':>9}"
+          f"{'peak MB':>9}{'+MB':>7}{'sockets':>9}{'AI calls':>10}{'errors':>8}")
+    for name, r in results.items():
+        print(f"{name:<16}{str(r['answered']) + '/' + str(r['requests']):>10}{r['seconds']:>9.2f}"
+              f"{r['throughput']:>9.1f}{r['p50_ms'] or 0:>9.1f}{r['p99_ms'] or 0:>9.1f}{r['peak_rss_mb']:>9.1f}"
+              f"{r['rss_growth_mb']:>7.1f}{str(r['peak_sockets']):>9}{r['ai_requests']:>10}{r['errors']:>8}")
+
+
+def compare(results: dict, settings: dict, baseline: dict, tolerance: float) -> list:
+    """Prints each compared number's change against the baseline and returns the regressions."""
+    regressions = []
+    print(f"\nagainst {baseline.get('commit') or 'the baseline'} (tolerance {tolerance:.0%}):")
+    differing = [key for key, value in baseline.get("settings", {}).items()
+                 if key not in ("json", "compare", "tolerance") and settings.get(key) != value]
+    if differing:
+        print(f"  note: the baseline ran with different {', '.join(differing)}")
+    for name, result in results.items():
+        before = baseline["results"].get(name)
+        if before is None:
+            continue
+        changes = []
+        for field, higher_is_better in COMPARED:
+            old, new = before.get(field), result.get(field)
+            if not old or new is None:
+                continue
+            change = new / old - 1
+            worse = -change if higher_is_better else change
+            flag = ""
+            if worse > tolerance:
+                regressions.append(f"{name} {field}: {old} -> {new}")
+                flag = " !"
+            changes.append(f"{field} {change:+.0%}{flag}")
+        print(f"  {name:<16}{', '.join(changes)}")
+    return regressions
+
+
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main(options) -> dict:
+    # Completion is counted from the request traces
+    metrics.METRICS_ENABLED = True
+    answer = " ".join(f"word{i}" for i in range(options.answer_words))
+    ai = StubOpenRouter(latency=options.ai_latency, text=answer, token_delay=options.token_delay,
+                        error_rate=options.ai_error_rate)
+    await ai.start()
+    scenarios = SCENARIOS if options.scenario == "all" else (options.scenario,)
+    print(f"AI latency {options.ai_latency * 1000:.0f} ms, {'streamed' if options.streaming else 'whole'} "
+          f"answers of {options.answer_words} words, AI error rate {options.ai_error_rate:.0%}, "
+          f"platform latency {options.api_latency * 1000:.0f} ms, concurrency {options.concurrency}, "
+          f"platform limits {'on' if options.platform_limits else 'lifted'}\n")
+    results = {}
+    try:
+        for name in scenarios:
+            results[name] = await run_scenario(name, ai, options)
+    finally:
+        await ai.stop()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=("all",) + SCENARIOS, default="all")
+    parser.add_argument("--requests", type=int, default=1000, help="requests per burst scenario")
+    parser.add_argument("--mentions", type=int, default=500, help="mentions in the steady Twitter scenario")
+    parser.add_argument("--rate", type=float, default=100.0, help="mentions per second in the steady scenario")
+    parser.add_argument("--concurrency", type=int, default=64, help="AI requests each bot runs at once")
+    parser.add_argument("--outbound-workers", type=int, default=8, help="sends each bot has in flight at once")
+    parser.add_argument("--ai-latency", type=float, default=0.1, help="stub AI latency in seconds")
+    parser.add_argument("--ai-error-rate", type=float, default=0.0, help="fraction of AI requests answered 503")
+    parser.add_argument("--answer-words", type=int, default=50, help="words in each AI answer")
+    parser.add_argument("--streaming", action="store_true", help="stream answers into the messages as they arrive")
+    parser.add_argument("--token-delay", type=float, default=0.002, help="seconds between streamed words")
+    parser.add_argument("--api-latency", type=float, default=0.005, help="stub platform latency per call in seconds")
+    parser.add_argument("--platform-limits", action="store_true",
+                        help="pace sends within Telegram's and Discord's rate limits")
+    parser.add_argument("--timeout", type=float, default=300.0, help="seconds a scenario may take")
+    parser.add_argument("--json", help="file to save the results to")
+    parser.add_argument("--compare", help="results saved by an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative change counted as a regression")
+    args = parser.parse_args()
+
+    results = asyncio.run(main(args))
+    print_results(results)
+    for name, result in results.items():
+        assert result["answered"] == result["requests"], f"{name}: {result['requests'] - result['answered']} unanswered"
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"commit": current_commit(), "settings": vars(args), "results": results}, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, vars(args), json.load(f), args.tolerance)
+        if regressions:
+            print("\nregressions:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
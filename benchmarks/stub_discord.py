@@ -0,0 +1,105 @@
+import asyncio
+import itertools
+import time
+from types import SimpleNamespace
+
+
+class StubWebhookMessage:
+    """A follow-up message that records its edits."""
+
+    def __init__(self, channel: "StubDiscord", message_id: int, interaction_id: int, content: str):
+        self.channel = channel
+        self.id = message_id
+        self.interaction_id = interaction_id
+        self.content = content
+
+    async def edit(self, content: str = None, **kwargs):
+        await self.channel.round_trip()
+        self.content = content
+        self.channel.record("edit", self.interaction_id, content)
+        return self
+
+
+class StubFollowup:
+    def __init__(self, channel: "StubDiscord", interaction_id: int):
+        self.channel = channel
+        self.interaction_id = interaction_id
+
+    async def send(self, content: str = None, ephemeral: bool = False, **kwargs):
+        await self.channel.round_trip()
+        message = StubWebhookMessage(self.channel, next(self.channel.ids), self.interaction_id, content)
+        self.channel.record("send", self.interaction_id, content)
+        return message
+
+
+class StubInteractionResponse:
+    def __init__(self, channel: "StubDiscord"):
+        self.channel = channel
+        self.deferred = False
+        # The last view sent and modal shown in response
+        self.view = None
+        self.modal = None
+
+    async def defer(self, ephemeral: bool = False, **kwargs):
+        await self.channel.round_trip()
+        self.deferred = True
+
+    async def send_message(self, content: str = None, view=None, **kwargs):
+        await self.channel.round_trip()
+        self.view = view
+
+    async def send_modal(self, modal):
+        await self.channel.round_trip()
+        self.modal = modal
+
+
+class StubDiscord:
+    """
+    A stand-in for Discord's interaction endpoints, without a gateway.
+
+    `interaction()` builds an object shaped like a `discord.Interaction` for
+    the fields the bot reads; its deferral, follow-up messages and edits
+    sleep for `latency` seconds like REST round trips and are recorded with
+    their time, so benchmarks can measure when each interaction was answered.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        """
+        Args:
+            latency (float): Seconds each REST call takes.
+        """
+        self.latency = latency
+        self.ids = itertools.count(1_000_000)
+        self.created_at = {}
+        # Per interaction: (time, "send" or "edit", text) in the order they happened
+        self.events = {}
+        self.calls = 0
+
+    async def round_trip(self):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def record(self, kind: str, interaction_id: int, content: str):
+        self.events.setdefault(interaction_id, []).append((time.perf_counter(), kind, content))
+
+    def interaction(self, interaction_id: int, user_id: int, channel_id: int, data: dict = None):
+        """Builds an interaction from `user_id` in `channel_id`, e.g. a button click with `data={"custom_id": ...}`."""
+        self.created_at[interaction_id] = time.perf_counter()
+        return SimpleNamespace(
+            id=interaction_id,
+            application_id=1,
+            token=f"token-{interaction_id}",
+            user=SimpleNamespace(id=user_id, display_name=f"user{user_id}"),
+            channel_id=channel_id,
+            data=data if data is not None else {},
+            response=StubInteractionResponse(self),
+            followup=StubFollowup(self, interaction_id),
+        )
+
+    def answered_at(self, interaction_id: int, text: str):
+        """Returns when the interaction's "Thinking..." message was edited to `text`, or None."""
+        for at, kind, content in self.events.get(interaction_id, ()):
+            if kind == "edit" and content == text:
+                return at
+        return None
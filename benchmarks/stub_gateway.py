@@ -0,0 +1,186 @@
+import asyncio
+import json
+import time
+from aiohttp import WSMsgType, web
+
+APPLICATION_ID = 900_000_000_000_000_001
+BOT_USER = {"id": str(APPLICATION_ID), "username": "bench-bot", "discriminator": "0", "global_name": None,
+            "avatar": None, "bot": True}
+OWNER = {"id": "900000000000000002", "username": "owner", "discriminator": "0", "global_name": None, "avatar": None}
+
+# Gateway opcodes
+DISPATCH, HEARTBEAT, IDENTIFY, RESUME, RECONNECT, HELLO, HEARTBEAT_ACK = 0, 1, 2, 6, 7, 10, 11
+
+
+def guild_ids(shard_id: int, shard_count: int, count: int) -> list:
+    """Returns `count` guild ids that Discord would route to `shard_id`: (id >> 22) % shard_count."""
+    return [(k * shard_count + shard_id) << 22 for k in range(1, count + 1)]
+
+
+def make_guild(guild_id: int) -> dict:
+    """Builds the GUILD_CREATE payload of a guild with one text channel and no members."""
+    return {
+        "id": str(guild_id), "name": f"guild-{guild_id}", "icon": None, "owner_id": OWNER["id"],
+        "member_count": 1, "large": False, "unavailable": False, "features": [], "afk_timeout": 300,
+        "verification_level": 0, "default_message_notifications": 0, "explicit_content_filter": 0,
+        "mfa_level": 0, "premium_tier": 0, "nsfw_level": 0, "system_channel_flags": 0, "preferred_locale": "en-US",
+        "roles": [{"id": str(guild_id), "name": "@everyone", "permissions": "0", "position": 0, "color": 0,
+                   "hoist": False, "managed": False, "mentionable": False}],
+        "channels": [{"id": str(guild_id + 1), "type": 0, "name": "general", "position": 0,
+                      "permission_overwrites": [], "nsfw": False, "topic": None}],
+        "members": [], "threads": [], "emojis": [], "stickers": [], "voice_states": [], "presences": [],
+    }
+
+
+def make_message(message_id: int, guild_id: int, user_id: int) -> dict:
+    """Builds the MESSAGE_CREATE payload of a plain text message in the guild's channel."""
+    return {
+        "id": str(message_id), "channel_id": str(guild_id + 1), "guild_id": str(guild_id), "type": 0,
+        "author": {"id": str(user_id), "username": f"user{user_id}", "discriminator": "0", "global_name": None,
+                   "avatar": None},
+        "content": f"hello from {user_id}", "timestamp": "2024-01-01T00:00:00+00:00", "edited_timestamp": None,
+        "tts": False, "mention_everyone": False, "mentions": [], "mention_roles": [], "attachments": [],
+        "embeds": [], "pinned": False, "flags": 0,
+    }
+
+
+def json_response(data) -> web.Response:
+    # discord.py parses a body as JSON only if its content type is exactly application/json, without a charset
+    return web.Response(body=json.dumps(data).encode(), headers={"Content-Type": "application/json"})
+
+
+class GatewaySession:
+    """One shard's session: what it was sent, so a resumed connection carries on where it stopped."""
+
+    __slots__ = ("shard_id", "session_id", "sequence", "sent", "reconnected")
+
+    def __init__(self, shard_id: int, session_id: str):
+        self.shard_id = shard_id
+        self.session_id = session_id
+        self.sequence = 0
+        self.sent = 0
+        self.reconnected = False
+
+
+class StubGateway:
+    """
+    A local stand-in for Discord's gateway and the REST endpoints a bot calls at login.
+
+    Each shard that identifies gets a READY with its `guilds` guilds,
+    routed by guild id as Discord does, a GUILD_CREATE for each, then
+    `events` MESSAGE_CREATE dispatches as fast as the client reads them.
+    With `reconnect`, every shard is told to reconnect halfway through and
+    must resume its session to receive the rest. Identifies, resumes and
+    command syncs are recorded.
+    """
+
+    def __init__(self, shard_count: int, guilds: int, events: int, reconnect: bool = True):
+        """
+        Args:
+            shard_count (int): Shards clients must identify with.
+            guilds (int): Guilds per shard.
+            events (int): Messages sent to each shard.
+            reconnect (bool): Whether each shard is asked to reconnect and resume halfway.
+        """
+        self.shard_count = shard_count
+        self.guilds = guilds
+        self.events = events
+        self.reconnect = reconnect
+        self.sessions = {}
+        self.identifies = []
+        self.resumes = []
+        self.command_syncs = []
+        self._runner = None
+        self.base_url = None
+        self.gateway_url = None
+
+    async def handle_user(self, request: web.Request) -> web.Response:
+        return json_response(BOT_USER)
+
+    async def handle_application(self, request: web.Request) -> web.Response:
+        return json_response({
+            "id": str(APPLICATION_ID), "name": "bench", "description": "", "icon": None, "bot_public": True,
+            "bot_require_code_grant": False, "owner": OWNER, "verify_key": "0" * 64, "flags": 0,
+        })
+
+    async def handle_commands(self, request: web.Request) -> web.Response:
+        self.command_syncs.append(await request.json())
+        return json_response([])
+
+    async def send(self, ws: web.WebSocketResponse, session: GatewaySession, event: str, data: dict):
+        session.sequence += 1
+        await ws.send_str(json.dumps({"op": DISPATCH, "t": event, "s": session.sequence, "d": data}))
+
+    async def stream(self, ws: web.WebSocketResponse, session: GatewaySession):
+        """Sends the shard's remaining messages; asks for a reconnect halfway if configured."""
+        guilds = guild_ids(session.shard_id, self.shard_count, self.guilds)
+        try:
+            while session.sent < self.events:
+                if self.reconnect and not session.reconnected and session.sent == self.events // 2:
+                    session.reconnected = True
+                    await ws.send_str(json.dumps({"op": RECONNECT, "d": None}))
+                    return
+                index = session.sent
+                await self.send(ws, session, "MESSAGE_CREATE",
+                                make_message(session.shard_id * self.events + index + 1,
+                                             guilds[index % len(guilds)], 1000 + index))
+                session.sent += 1
+        except ConnectionResetError:
+            return
+
+    async def handle_gateway(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        await ws.send_str(json.dumps({"op": HELLO, "d": {"heartbeat_interval": 45_000}}))
+        streaming = None
+        async for message in ws:
+            if message.type != WSMsgType.TEXT:
+                break
+            payload = json.loads(message.data)
+            op, data = payload["op"], payload.get("d")
+            if op == HEARTBEAT:
+                await ws.send_str(json.dumps({"op": HEARTBEAT_ACK, "d": None}))
+            elif op == IDENTIFY:
+                shard_id, shard_count = data["shard"]
+                assert shard_count == self.shard_count, f"identified with {shard_count} shards"
+                self.identifies.append((shard_id, time.time()))
+                session = self.sessions[f"s{shard_id}"] = GatewaySession(shard_id, f"s{shard_id}")
+                guilds = guild_ids(shard_id, self.shard_count, self.guilds)
+                await self.send(ws, session, "READY", {
+                    "v": 10, "user": BOT_USER, "session_id": session.session_id,
+                    "resume_gateway_url": self.gateway_url, "shard": [shard_id, shard_count],
+                    "guilds": [{"id": str(guild_id), "unavailable": True} for guild_id in guilds],
+                    "application": {"id": str(APPLICATION_ID), "flags": 0},
+                })
+                for guild_id in guilds:
+                    await self.send(ws, session, "GUILD_CREATE", make_guild(guild_id))
+                streaming = asyncio.create_task(self.stream(ws, session))
+            elif op == RESUME:
+                session = self.sessions[data["session_id"]]
+                self.resumes.append(session.shard_id)
+                await self.send(ws, session, "RESUMED", {})
+                streaming = asyncio.create_task(self.stream(ws, session))
+        if streaming is not None:
+            streaming.cancel()
+        return ws
+
+    async def start(self):
+        """Starts the server on a free localhost port; sets `base_url` for REST and `gateway_url`."""
+        app = web.Application()
+        app.router.add_get("/api/v10/users/@me", self.handle_user)
+        app.router.add_get("/api/v10/oauth2/applications/@me", self.handle_application)
+        app.router.add_put("/api/v10/applications/{application_id}/commands", self.handle_commands)
+        app.router.add_get("/gateway", self.handle_gateway)
+        self._runner = web.AppRunner(app, access_log=None, shutdown_timeout=0.5)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}"
+        self.gateway_url = f"ws://127.0.0.1:{port}/gateway"
+
+    async def stop(self):
+        """Stops the server."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,169 @@
+import asyncio
+import datetime
+import json
+import random
+import ssl
+import tempfile
+from aiohttp import web
+
+
+class StubOpenRouter:
+    """
+    A local stand-in for the OpenRouter API.
+
+    Answers `/chat/completions` (and the legacy `/completions`, used by the
+    pre-pooling baseline) with a fixed completion after an optional delay and
+    records every client connection it sees, so benchmarks can count how many
+    TCP/TLS handshakes a client performed.
+
+    Faults can be injected per request: HTTP errors (optionally with a
+    `Retry-After` header), stalls that never answer in time, a slow tail of
+    requests, or a full outage via `down`. Streamed events can be garbled.
+    """
+
+    def __init__(self, latency: float = 0.0, text: str = "stub response", tls: bool = False,
+                 token_delay: float = 0.0, error_rate: float = 0.0, error_status: int = 503,
+                 retry_after: str = None, stall_rate: float = 0.0, stall_seconds: float = 3600.0,
+                 slow_rate: float = 0.0, slow_latency: float = 1.0, garbled_rate: float = 0.0, seed: int = 0):
+        """
+        Args:
+            latency (float): Seconds to wait before answering each request.
+            text (str): The completion text returned for every request.
+            tls (bool): Serve over HTTPS with a throwaway self-signed certificate.
+            token_delay (float): Seconds between streamed tokens when a request asks for `stream`.
+            error_rate (float): Fraction of requests answered with `error_status`.
+            error_status (int): HTTP status of injected errors.
+            retry_after (str): `Retry-After` header value sent with injected errors.
+            stall_rate (float): Fraction of requests that hang for `stall_seconds`.
+            stall_seconds (float): How long a stalled request hangs.
+            slow_rate (float): Fraction of requests answered after `slow_latency` instead of `latency`.
+            slow_latency (float): Latency of the slow tail in seconds.
+            garbled_rate (float): Fraction of streamed events sent truncated, as invalid JSON.
+            seed (int): Seed of the fault injection's random generator.
+        """
+        self.latency = latency
+        self.token_delay = token_delay
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.garbled_rate = garbled_rate
+        self.down = False
+        self.random = random.Random(seed)
+        self.text = text
+        self.tls = tls
+        self.requests = 0
+        self.connections = set()
+        self.last_payload = None
+        self._runner = None
+        self.base_url = None
+
+    async def handle_completions(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        self.connections.add(request.transport.get_extra_info("peername"))
+        data = await request.json()
+        self.last_payload = data
+        chat = request.path.endswith("/chat/completions")
+        if self.down or self.random.random() < self.error_rate:
+            headers = {"Retry-After": self.retry_after} if self.retry_after else None
+            return web.json_response({"error": "injected"}, status=self.error_status, headers=headers)
+        if self.random.random() < self.stall_rate:
+            await asyncio.sleep(self.stall_seconds)
+        latency = self.slow_latency if self.random.random() < self.slow_rate else self.latency
+        if latency:
+            await asyncio.sleep(latency)
+        if data.get("stream"):
+            return await self.stream_completion(request, chat, data)
+        if chat:
+            return web.json_response({"choices": [{"message": {"role": "assistant", "content": self.text}}],
+                                      "usage": self.usage(data)})
+        return web.json_response({"choices": [{"text": self.text}]})
+
+    def usage(self, data: dict) -> dict:
+        # Word counts stand in for the token counts the real API reports
+        return {"prompt_tokens": sum(len(m["content"].split()) for m in data["messages"]),
+                "completion_tokens": len(self.text.split())}
+
+    async def stream_completion(self, request: web.Request, chat: bool, data: dict) -> web.StreamResponse:
+        """Sends the completion word by word as server-sent events."""
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        await response.write(b": OPENROUTER PROCESSING\n\n")
+        for token in self.text.split(" "):
+            choice = {"delta": {"content": token + " "}} if chat else {"text": token + " "}
+            event = json.dumps({"choices": [choice]})
+            if self.random.random() < self.garbled_rate:
+                event = event[:len(event) // 2]
+            await response.write(f"data: {event}\n\n".encode())
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+        if chat:
+            # Like OpenRouter, the last event carries the usage and no choices
+            await response.write(f"data: {json.dumps({'choices': [], 'usage': self.usage(data)})}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    def reset(self):
+        """Clears the request and connection counters."""
+        self.requests = 0
+        self.connections = set()
+
+    async def start(self):
+        """Starts the server on a free localhost port and sets `base_url`."""
+        app = web.Application()
+        app.router.add_post("/chat/completions", self.handle_completions)
+        app.router.add_post("/completions", self.handle_completions)
+        # Stalled handlers would otherwise hold up shutdown for a minute
+        self._runner = web.AppRunner(app, access_log=None, shutdown_timeout=0.5)
+        await self._runner.setup()
+        ssl_context = _self_signed_context() if self.tls else None
+        site = web.TCPSite(self._runner, "127.0.0.1", 0, ssl_context=ssl_context)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        scheme = "https" if self.tls else "http"
+        self.base_url = f"{scheme}://127.0.0.1:{port}"
+
+    async def stop(self):
+        """Stops the server."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+def _self_signed_context() -> ssl.SSLContext:
+    """Builds a server SSL context with a freshly generated self-signed certificate."""
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "127.0.0.1")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    with tempfile.NamedTemporaryFile(suffix=".pem") as cert_file, \
+            tempfile.NamedTemporaryFile(suffix=".pem") as key_file:
+        cert_file.write(cert.public_bytes(serialization.Encoding.PEM))
+        key_file.write(key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        ))
+        cert_file.flush()
+        key_file.flush()
+        context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        context.load_cert_chain(cert_file.name, key_file.name)
+    return context
@@ -0,0 +1,142 @@
+import asyncio
+import time
+from aiohttp import web
+
+
+def make_update(update_id: int, text: str, chat_id: int, user_id: int) -> dict:
+    """Builds the JSON of a Telegram update carrying a private text message; a leading "/word" is a command."""
+    update = {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+            "text": text,
+        },
+    }
+    if text.startswith("/"):
+        command = text.split(" ", 1)[0]
+        update["message"]["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+    return update
+
+
+class StubTelegramAPI:
+    """
+    A local stand-in for the Telegram Bot API.
+
+    Serves `getUpdates` long polling from a queue of pushed updates and
+    answers `sendMessage`/`editMessageText` with plausible messages. It
+    records when each update was pushed, acknowledged (a later `getUpdates`
+    offset passed it) and first answered in its chat, so benchmarks can
+    compare polling with webhook delivery.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        """
+        Args:
+            latency (float): Seconds to wait before answering each send or edit.
+        """
+        self.latency = latency
+        self.pending = []
+        self.new_updates = asyncio.Event()
+        self.pushed_at = {}
+        self.acked_at = {}
+        self.first_reply_at = {}
+        self.edits = {}
+        self.calls = {}
+        self.message_ids = 0
+        self._runner = None
+        self.base_url = None
+
+    def push(self, update: dict):
+        """Makes an update available to `getUpdates`."""
+        self.pending.append(update)
+        self.pushed_at[update["update_id"]] = time.perf_counter()
+        self.new_updates.set()
+
+    def message(self, chat_id: int, text: str) -> dict:
+        self.message_ids += 1
+        return {
+            "message_id": self.message_ids,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": text,
+        }
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = {key: value for key, value in (await request.post()).items()}
+        result = await getattr(self, f"on_{method}", self.on_other)(params)
+        return web.json_response({"ok": True, "result": result})
+
+    async def on_getMe(self, params):
+        return {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+    async def on_getUpdates(self, params):
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = float(params.get("timeout") or 0)
+        now = time.perf_counter()
+        remaining = []
+        for update in self.pending:
+            if update["update_id"] < offset:
+                self.acked_at.setdefault(update["update_id"], now)
+            else:
+                remaining.append(update)
+        self.pending = remaining
+        if not self.pending and timeout:
+            self.new_updates.clear()
+            try:
+                await asyncio.wait_for(self.new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.pending[:limit]
+
+    async def on_sendMessage(self, params):
+        chat_id = int(params["chat_id"])
+        self.first_reply_at.setdefault(chat_id, time.perf_counter())
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self.message(chat_id, params.get("text", ""))
+
+    async def on_editMessageText(self, params):
+        chat_id = int(params["chat_id"])
+        self.edits[chat_id] = time.perf_counter()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self.message(chat_id, params.get("text", ""))
+
+    async def on_other(self, params):
+        # deleteWebhook, setWebhook, close and the like
+        return True
+
+    def reset(self):
+        """Clears recorded updates and replies."""
+        self.pending = []
+        self.pushed_at = {}
+        self.acked_at = {}
+        self.first_reply_at = {}
+        self.edits = {}
+        self.calls = {}
+
+    async def start(self):
+        """Starts the server on a free localhost port and sets `base_url`, ending in `/bot`."""
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        self._runner = web.AppRunner(app, access_log=None, shutdown_timeout=0.5)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}/bot"
+
+    async def stop(self):
+        """Stops the server."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
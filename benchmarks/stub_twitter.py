@@ -0,0 +1,107 @@
+import itertools
+import json
+import threading
+import time
+from types import SimpleNamespace
+from tweepy import TweepError
+
+
+class StubTwitterAPI:
+    """
+    A stand-in for `tweepy.API` that records every call instead of hitting Twitter.
+
+    Each method sleeps for `latency` seconds to model the blocking REST round
+    trip, and is safe to call from several threads at once. Posted tweets are
+    kept with the tweet they reply to, so benchmarks can check the reply
+    graph, and every `fail_every`-th post can be made to fail.
+    """
+
+    def __init__(self, screen_name: str = "ai_bot", user_id: int = 1, latency: float = 0.0,
+                 fail_every: int = 0):
+        """
+        Args:
+            screen_name (str): The bot account's screen name.
+            user_id (int): The bot account's numeric id.
+            latency (float): Seconds each call blocks for.
+            fail_every (int): Make every n-th `update_status` raise `TweepError`; never if 0.
+        """
+        self.user = SimpleNamespace(id=user_id, screen_name=screen_name)
+        self.latency = latency
+        self.fail_every = fail_every
+        self.calls = []
+        self.statuses = {}
+        # When each tweet first got a reply, to measure how long mentions wait for an answer
+        self.replied_at = {}
+        self.attempts = 0
+        self.lock = threading.Lock()
+        self.ids = itertools.count(10_000)
+
+    def record(self, name: str, *args, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.calls.append((name, args, kwargs))
+            return SimpleNamespace(id=next(self.ids))
+
+    def count(self, name: str) -> int:
+        """Returns how many times `name` was called."""
+        return sum(1 for call in self.calls if call[0] == name)
+
+    def me(self):
+        self.record("me")
+        return self.user
+
+    def verify_credentials(self):
+        self.record("verify_credentials")
+        return self.user
+
+    def update_status(self, status, **kwargs):
+        with self.lock:
+            self.attempts += 1
+            failing = self.fail_every and self.attempts % self.fail_every == 0
+        if failing:
+            raise TweepError("Internal error", api_code=131)
+        posted = self.record("update_status", status, **kwargs)
+        with self.lock:
+            self.statuses[posted.id] = (status, kwargs.get("in_reply_to_status_id"))
+            self.replied_at.setdefault(kwargs.get("in_reply_to_status_id"), time.perf_counter())
+        return posted
+
+    def replies_to(self, status_id: int) -> list:
+        """Returns the ids of the posted tweets replying to `status_id`, oldest first."""
+        return [key for key, (_, parent) in self.statuses.items() if parent == status_id]
+
+    def send_direct_message(self, recipient_id, text, **kwargs):
+        return self.record("send_direct_message", recipient_id, text, **kwargs)
+
+
+def make_status(status_id: int, text: str, screen_name: str, user_id: int):
+    """Builds an object shaped like a tweepy `Status` for the fields the bot reads."""
+    return SimpleNamespace(id=status_id, text=text, user=SimpleNamespace(id=user_id, screen_name=screen_name))
+
+
+def recorded_mentions(count: int, path: str = None):
+    """
+    Yields mention statuses to replay into a listener.
+
+    Args:
+        count (int): Number of statuses to yield.
+        path (str): Optional JSON-lines recording with `id`, `text`, `screen_name` and
+            `user_id` fields; it is cycled until `count` statuses have been yielded.
+            Without it a synthetic mix of `/ask` and `/call` mentions is generated.
+    """
+    if path:
+        with open(path) as f:
+            records = [json.loads(line) for line in f if line.strip()]
+    else:
+        records = [
+            {
+                "id": i,
+                "text": f"{'/call' if i % 4 == 0 else '/ask'} question number {i % 50}?",
+                "screen_name": f"user{i % 300}",
+                "user_id": 100 + i % 300,
+            }
+            for i in range(min(count, 1000))
+        ]
+    for i, record in zip(range(count), itertools.cycle(records)):
+        yield make_status(record["id"] + i, record["text"], record["screen_name"], record["user_id"])
@@ -0,0 +1 @@
+"""AI-powered chat bots for Discord, Telegram and Twitter."""
@@ -1,19 +1,47 @@
+import asyncio
+import time
 import discord
 from discord.ext import commands
-import requests
-import json
-import aiohttp
-import os
-from dotenv import load_dotenv
+from bots.shared.ai_client import ai_client_from_env
+from bots.shared.chunking import DISCORD, MessageChunker, deliver_chunks
+from bots.shared.jobs import job_pipeline_from_env
+from bots.shared.metrics import mark, record_error, trace_request
+from bots.shared.outbound import PRIORITY_COSMETIC, PRIORITY_FINAL, outbound_scheduler_from_env
+from bots.shared.scheduler import SHED_MESSAGE, RequestShed, request_scheduler_from_env
+from bots.shared.settings import Settings, settings_from_env
+from bots.shared.streaming import StreamingReply
+from bots.discord.sharding import IDENTIFY_INTERVAL, CommandSyncState, command_tree_hash, identify_delay
+from bots.discord.views import (
+    ASK_BUTTON,
+    ASK_MODAL,
+    CONTINUE_BUTTON,
+    LEGACY_ASK_BUTTON,
+    QUESTION_INPUT,
+    REGENERATE_BUTTON,
+    AskModal,
+    answer_view,
+    ask_view,
+    modal_values,
+)
 
-# Load environment variables from .env
-load_dotenv()
+CONTINUE_PROMPT = "Continue your previous answer from where it stopped."
+FORGOTTEN_MESSAGE = "I no longer remember that conversation; ask again with /ask or /call."
+
+
+def discord_retry_after(error: Exception):
+    """Returns the seconds Discord asks to wait if `error` is a rate limit answer, else None."""
+    if isinstance(error, discord.RateLimited):
+        return error.retry_after
+    if isinstance(error, discord.HTTPException) and error.status == 429:
+        retry_after = error.response.headers.get("Retry-After") if error.response is not None else None
+        return float(retry_after) if retry_after else 1.0
+    return None
+
+
+def interaction_route(token: str) -> tuple:
+    """Returns the outbound route of an interaction's follow-ups and edits: its webhook, keyed by token."""
+    return ("interaction", token)
 
-# Fetch tokens and keys from environment variables
-DISCORD_BOT_TOKEN = os.getenv("DISCORD_BOT_TOKEN")
-OPEN_ROUTER_API_KEY = os.getenv("OPEN_ROUTER_API_KEY")
-CLIENT_ID = os.getenv("CLIENT_ID")
-AI_BASE_URL = "https://openrouter.ai/api/v1"
 
 class AIChatBot(commands.Bot):
     """
@@ -21,22 +49,108 @@ class AIChatBot(commands.Bot):
     Provides both interactive and direct command-based querying functionalities.
     """
 
-    def __init__(self):
+    def __init__(self, ai_client=None, scheduler=None, shard_id: int = None, shard_count: int = None, jobs=None,
+                 outbound=None, settings: Settings = None, **client_options):
         """
         Initializes the bot with required intents, command prefix, and event listeners.
         Sets up bot commands and defines intents for message content.
+
+        Args:
+            ai_client (AIClient): The AI client; one is built from the environment, and owned by the bot, if omitted.
+            scheduler (RequestScheduler): Admission control for AI requests; built from the environment if omitted.
+            shard_id (int): The shard this bot connects as, when the gateway is split across processes.
+            shard_count (int): Total number of shards.
+            jobs (JobPipeline): Durable job queue answering requests; built from the environment, and owned
+                by the bot, if omitted. Requests are answered inline when there is none.
+            outbound (OutboundScheduler): Paces the bot's messages and edits; built from the environment if omitted.
+            settings (Settings): The bot's settings; read from the environment, and `.env`, if omitted.
+            client_options: Further options of the discord.py client, e.g. `shard_ids` of a `ShardedAIChatBot`.
         """
+        self.settings = settings or settings_from_env()
         intents = discord.Intents.default()
         intents.message_content = True
-        super().__init__(command_prefix="/", intents=intents)
+        super().__init__(command_prefix="/", intents=intents, shard_id=shard_id, shard_count=shard_count,
+                         **client_options)
+
+        # Shared AI client, opened in setup_hook and closed with the bot unless it was passed in
+        self.owns_ai_client = ai_client is None
+        self.ai_client = ai_client or ai_client_from_env()
+        # Caps concurrent AI requests and rate-limits each user and channel
+        self.scheduler = scheduler or request_scheduler_from_env()
+        # Optional durable queue between the handlers and the AI calls
+        self.owns_jobs = jobs is None
+        if jobs is None:
+            # A sharded bot is named after its first shard, so each process keeps its own store
+            store_shard = shard_id if shard_id is not None else min(client_options.get("shard_ids") or (), default=None)
+            jobs = job_pipeline_from_env(self.ai_client, self.scheduler, store_shard, platform="discord")
+        self.jobs = jobs
+        if self.jobs is not None:
+            self.jobs.register("discord", self.deliver_job)
+        # discord.py waits out the buckets Discord reports; this paces channels ahead of that, answers first
+        self.outbound = outbound or outbound_scheduler_from_env("discord", retry_after=discord_retry_after)
+
+        # Components are built once and sent with every message; their clicks are looked up by custom_id
+        self.ask_view = ask_view()
+        self.answer_view = answer_view()
+        self.ask_modal = AskModal()
+        self.interaction_handlers = {
+            ASK_BUTTON: self.open_ask_modal,
+            LEGACY_ASK_BUTTON: self.open_ask_modal,
+            ASK_MODAL: self.submit_question,
+            REGENERATE_BUTTON: self.regenerate,
+            CONTINUE_BUTTON: self.continue_answer,
+        }
 
         # Initialize commands and interactions
         self.setup_commands()
 
+    async def setup_hook(self):
+        """Opens the pooled AI client, resumes queued jobs and syncs changed commands, once the bot has logged in."""
+        await self.ai_client.start()
+        if self.jobs is not None and self.owns_jobs:
+            await self.jobs.start()
+        # Commands are global, so with several shards only the first one syncs them
+        if self.syncs_commands():
+            await self.sync_commands()
+
+    def syncs_commands(self) -> bool:
+        """Whether this bot is the one that syncs the global commands: the first shard's."""
+        return not self.shard_id
+
+    async def sync_commands(self) -> bool:
+        """
+        Uploads the command tree to Discord if it changed since the last sync.
+
+        The tree's hash is compared with the one stored in
+        `DISCORD_COMMANDS_STATE`. This runs once per login, in `setup_hook`,
+        so reconnects never sync, and restarts with unchanged commands make
+        no API call.
+
+        Returns:
+            bool: Whether the commands were synced.
+        """
+        digest = command_tree_hash(self.tree)
+        state = CommandSyncState(self.settings.discord_commands_state)
+        if state.synced_hash(self.application_id) == digest:
+            print("Commands unchanged since the last sync.")
+            return False
+        await self.tree.sync()
+        state.record(self.application_id, digest)
+        print(f"Synced {len(self.tree.get_commands())} commands.")
+        return True
+
+    async def close(self):
+        """Closes the job queue and the AI client's connections, if the bot owns them, before shutting the bot down."""
+        if self.jobs is not None and self.owns_jobs:
+            await self.jobs.close()
+        await self.outbound.close()
+        if self.owns_ai_client:
+            await self.ai_client.close()
+        await super().close()
+
     async def on_ready(self):
-        """Event that runs when the bot is ready and connected to Discord."""
+        """Event that runs when the bot is ready and connected to Discord, after every reconnect."""
         print(f"Logged in as {self.user}!")
-        await self.tree.sync()
 
     def setup_commands(self):
         """Registers all bot commands in the command tree."""
@@ -49,9 +163,39 @@ class AIChatBot(commands.Bot):
         
         # Register the /call command with personalized greeting
         @self.tree.command(name="call")
-        async def call(interaction: discord.Interaction, message: str):
+        async def call(interaction: discord.Interaction, message: str, fresh: bool = False):
             """Handles a direct AI call with a personalized greeting."""
-            await self.call_command(interaction, message)
+            await self.call_command(interaction, message, use_cache=not fresh)
+
+    async def followup(self, interaction: discord.Interaction, text: str, priority: int = PRIORITY_FINAL):
+        """
+        Sends an ephemeral follow-up message through the outbound scheduler.
+
+        Args:
+            interaction (discord.Interaction): The Discord interaction object.
+            text (str): The message's text.
+            priority (int): `PRIORITY_FINAL` for answers, `PRIORITY_COSMETIC` for placeholders and greetings.
+
+        Returns:
+            discord.WebhookMessage: The sent message.
+        """
+        return await self.outbound.send(interaction_route(interaction.token),
+                                        lambda: interaction.followup.send(text, ephemeral=True), priority)
+
+    async def edit_message(self, interaction: discord.Interaction, message: discord.WebhookMessage, text: str,
+                           priority: int = PRIORITY_FINAL, view: discord.ui.View = discord.utils.MISSING):
+        """
+        Replaces a message's text through the outbound scheduler; a queued edit of the same message is dropped.
+
+        Args:
+            interaction (discord.Interaction): The interaction whose webhook sent the message.
+            message (discord.WebhookMessage): The message to edit.
+            text (str): The new text.
+            priority (int): `PRIORITY_FINAL` for answers, `PRIORITY_COSMETIC` for interim streaming edits.
+            view (discord.ui.View): Components to show under the text; the message's are kept if omitted.
+        """
+        await self.outbound.send(interaction_route(interaction.token), lambda: message.edit(content=text, view=view),
+                                 priority, merge_key=message.id)
 
     async def ask_command(self, interaction: discord.Interaction):
         """
@@ -60,126 +204,324 @@ class AIChatBot(commands.Bot):
         Args:
             interaction (discord.Interaction): The Discord interaction object.
         """
-        button = discord.ui.Button(label="Ask the AI", style=discord.ButtonStyle.primary, custom_id="ask_ai_button")
-        view = discord.ui.View()
-        view.add_item(button)
-        await interaction.response.send_message("Click the button to ask the AI:", view=view, ephemeral=True)
+        await interaction.response.send_message("Click the button to ask the AI:", view=self.ask_view, ephemeral=True)
 
-    async def call_command(self, interaction: discord.Interaction, message: str):
+    async def call_command(self, interaction: discord.Interaction, message: str, use_cache: bool = True):
         """
         Directly sends the user's message to the AI with a personalized greeting, and displays the response.
 
         Args:
             interaction (discord.Interaction): The Discord interaction object.
             message (str): The message to be processed by the AI.
+            use_cache (bool): Whether a cached response may be shown; `/call fresh:True` turns it off.
         """
         await interaction.response.defer(ephemeral=True)
         greeting = f"Hello, {interaction.user.display_name}, I am your assistant."
-        await interaction.followup.send(greeting, ephemeral=True)
-        await self.show_thinking_message(interaction, message)
+        await self.followup(interaction, greeting, PRIORITY_COSMETIC)
+        await self.show_thinking_message(interaction, message, use_cache=use_cache, command="call")
 
-    async def fetch_ai_response(self, message: str) -> str:
+    async def fetch_ai_response(self, message: str, use_cache: bool = True, command: str = None, user_id=None,
+                                conversation=None, replace_last: bool = False) -> str:
         """
         Fetches an AI-generated response based on the given user message.
 
         Args:
             message (str): The user's input message to send to the AI.
+            use_cache (bool): Whether the response cache may answer this request.
+            command (str): The command that triggered the request, used for model routing.
+            user_id: The requesting user, used for model routing.
+            conversation: Key of the conversation to continue, if any.
+            replace_last (bool): Whether the answer replaces the conversation's newest exchange.
 
         Returns:
             str: The response from the AI, or an error message if the request fails.
         """
-        headers = {
-            "Authorization": f"Bearer {OPEN_ROUTER_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        data = {
-            "model": "openai/gpt-4",
-            "prompt": message,
-            "max_tokens": 1000,
-            "temperature": 1.0
-        }
+        return await self.ai_client.fetch_ai_response(message, use_cache=use_cache, command=command, user_id=user_id,
+                                                      conversation=conversation, replace_last=replace_last)
 
-        async with aiohttp.ClientSession() as session:
-            async with session.post(AI_BASE_URL + "/completions", headers=headers, json=data) as response:
-                if response.status == 200:
-                    response_data = await response.json()
-                    return response_data["choices"][0]["text"].strip()
-                else:
-                    error_message = await response.text()
-                    print(f"HTTP error {response.status}: {error_message}")
-                    return "Failed to get a response due to an HTTP error."
+    def conversation_key(self, interaction: discord.Interaction) -> tuple:
+        """Identifies the conversation of the interaction's user in its channel."""
+        return ("discord", interaction.channel_id, interaction.user.id)
 
-    async def show_thinking_message(self, interaction: discord.Interaction, message: str):
+    async def show_thinking_message(self, interaction: discord.Interaction, message: str, use_cache: bool = True,
+                                    command: str = None, replace_last: bool = False):
         """
         Displays a "Thinking..." message, fetches an AI response, and updates the message with the final response.
 
         Args:
             interaction (discord.Interaction): The Discord interaction object.
             message (str): The user's message to be processed by the AI.
+            use_cache (bool): Whether the response cache may answer this request.
+            command (str): The command that triggered the request, used for model routing.
+            replace_last (bool): Whether the answer replaces the conversation's newest exchange.
+        """
+        with trace_request("discord", command):
+            thinking_message = await self.followup(interaction, "Thinking...", PRIORITY_COSMETIC)
+            mark("thinking_sent")
+            if self.jobs is not None:
+                await self.submit_job(interaction, message, thinking_message, use_cache=use_cache, command=command,
+                                      replace_last=replace_last)
+                return
+            try:
+                async with self.scheduler.slot(interaction.user.id, interaction.channel_id):
+                    if self.settings.ai_streaming:
+                        await self.stream_response(interaction, message, thinking_message, use_cache=use_cache,
+                                                   command=command, replace_last=replace_last)
+                        return
+                    ai_response = await self.fetch_ai_response(message, use_cache=use_cache, command=command,
+                                                               user_id=interaction.user.id,
+                                                               conversation=self.conversation_key(interaction),
+                                                               replace_last=replace_last)
+            except RequestShed:
+                record_error("shed")
+                await self.edit_message(interaction, thinking_message, SHED_MESSAGE)
+                return
+            await self.display_response_with_chunks(interaction, ai_response, thinking_message)
+
+    async def submit_job(self, interaction: discord.Interaction, message: str,
+                         thinking_message: discord.WebhookMessage, use_cache: bool = True, command: str = None,
+                         replace_last: bool = False):
+        """
+        Queues the AI request on the job pipeline, which later edits the "Thinking..." message.
+
+        Args:
+            interaction (discord.Interaction): The Discord interaction object.
+            message (str): The user's message to be processed by the AI.
+            thinking_message (discord.WebhookMessage): The "Thinking..." message to answer in.
+            use_cache (bool): Whether the response cache may answer this request.
+            command (str): The command that triggered the request, used for model routing.
+            replace_last (bool): Whether the answer replaces the conversation's newest exchange.
+        """
+        try:
+            self.scheduler.take_tokens(interaction.user.id, interaction.channel_id)
+        except RequestShed:
+            record_error("shed")
+            await self.edit_message(interaction, thinking_message, SHED_MESSAGE)
+            return
+        # The interaction token lets the answer be delivered even after a restart, for up to 15 minutes
+        target = {
+            "application_id": interaction.application_id,
+            "token": interaction.token,
+            "message_id": thinking_message.id,
+        }
+        self.jobs.submit("discord", target, message, use_cache=use_cache, command=command,
+                         user_id=interaction.user.id, conversation=self.conversation_key(interaction),
+                         replace_last=replace_last)
+
+    async def deliver_job(self, target: dict, response: str):
+        """
+        Delivers a queued job's AI response by editing its "Thinking..." message, in chunks if needed.
+
+        Args:
+            target (dict): The interaction's application id and token, and the message id.
+            response (str): The AI response.
         """
-        thinking_message = await interaction.followup.send("Thinking...", ephemeral=True)
-        ai_response = await self.fetch_ai_response(message)
-        await self.display_response_with_chunks(interaction, ai_response, thinking_message)
+        webhook = discord.Webhook.partial(target["application_id"], target["token"], client=self)
+        route = interaction_route(target["token"])
+
+        async def edit(text):
+            await self.outbound.send(route, lambda: webhook.edit_message(target["message_id"], content=text,
+                                                                         view=self.answer_view),
+                                     merge_key=target["message_id"])
+
+        async def send(text):
+            await self.outbound.send(route, lambda: webhook.send(text, ephemeral=True))
+
+        await deliver_chunks(MessageChunker(DISCORD).split(response), edit, send)
+
+    async def stream_response(self, interaction: discord.Interaction, message: str,
+                              thinking_message: discord.WebhookMessage, use_cache: bool = True,
+                              command: str = None, replace_last: bool = False):
+        """
+        Streams the AI response into the "Thinking..." message as tokens arrive, spilling into
+        follow-up messages once it passes Discord's 2000 character limit.
+
+        Args:
+            interaction (discord.Interaction): The Discord interaction object.
+            message (str): The user's message to be processed by the AI.
+            thinking_message (discord.WebhookMessage): The initial "Thinking..." message to edit.
+            use_cache (bool): Whether the response cache may answer this request.
+            command (str): The command that triggered the request, used for model routing.
+            replace_last (bool): Whether the answer replaces the conversation's newest exchange.
+        """
+        async def edit(target, text, final):
+            # The first message's last edit carries the answer's buttons
+            view = self.answer_view if final and target is thinking_message else discord.utils.MISSING
+            await self.edit_message(interaction, target, text,
+                                    PRIORITY_FINAL if final else PRIORITY_COSMETIC, view)
+
+        async def send(text, final):
+            return await self.followup(interaction, text, PRIORITY_FINAL if final else PRIORITY_COSMETIC)
+
+        reply = StreamingReply(thinking_message, edit, send, DISCORD)
+        fragments = self.ai_client.stream_ai_response(message, use_cache=use_cache, command=command,
+                                                      user_id=interaction.user.id,
+                                                      conversation=self.conversation_key(interaction),
+                                                      replace_last=replace_last)
+        async for fragment in fragments:
+            await reply.feed(fragment)
+        await reply.finish()
 
     async def display_response_with_chunks(self, interaction: discord.Interaction, response: str, message: discord.WebhookMessage):
         """
-        Edits or splits the AI response into manageable chunks if the response length exceeds Discord's message limit.
+        Edits the AI response into the "Thinking..." message, splitting it on paragraph, sentence and
+        code block boundaries into follow-up messages if it exceeds Discord's message limit.
 
         Args:
             interaction (discord.Interaction): The Discord interaction object.
             response (str): The full AI response to be displayed.
             message (discord.WebhookMessage): The initial "Thinking..." message to edit.
         """
-        if len(response) > 2000:
-            response_chunks = [response[i:i + 2000] for i in range(0, len(response), 2000)]
-            await message.edit(content=response_chunks[0])
-            for chunk in response_chunks[1:]:
-                await interaction.followup.send(chunk, ephemeral=True)
-        else:
-            await message.edit(content=response)
+        async def edit(text):
+            await self.edit_message(interaction, message, text, view=self.answer_view)
+
+        async def send(text):
+            await self.followup(interaction, text)
+
+        await deliver_chunks(MessageChunker(DISCORD).split(response), edit, send)
+
+    async def open_ask_modal(self, interaction: discord.Interaction):
+        """
+        Presents the question form when the "Ask the AI" button is clicked.
+
+        Args:
+            interaction (discord.Interaction): The button's interaction.
+        """
+        await interaction.response.send_modal(self.ask_modal)
 
-    async def handle_modal_interaction(self, interaction: discord.Interaction):
+    async def submit_question(self, interaction: discord.Interaction):
         """
-        Presents a modal to the user to collect input and processes the response upon submission.
+        Answers the question submitted through the form.
 
         Args:
-            interaction (discord.Interaction): The Discord interaction object.
+            interaction (discord.Interaction): The modal submission's interaction.
+        """
+        await interaction.response.defer(ephemeral=True)
+        question = modal_values(interaction.data).get(QUESTION_INPUT, "")
+        await self.show_thinking_message(interaction, question, command="ask")
+
+    async def regenerate(self, interaction: discord.Interaction):
         """
-        class AskModal(discord.ui.Modal, title="Ask the AI"):
-            question = discord.ui.TextInput(label="What would you like to ask the AI?", style=discord.TextStyle.paragraph)
+        Asks the conversation's last question again, bypassing the cache, and sends the new answer.
 
-            def __init__(self, bot):
-                super().__init__()
-                self.bot = bot  # Store bot instance to access bot methods
+        The new answer arrives in a new "Thinking..." message; the old one is
+        left as it is. In the conversation memory the new exchange replaces
+        the old one once it arrives, so follow-up questions build on the new
+        answer, while a request that is shed or fails keeps the old one. The
+        question comes from the memory, so this works for answers sent
+        before a restart only while the conversation is remembered.
 
-            async def on_submit(self, interaction: discord.Interaction):
-                """
-                Handles submission of the modal, defers the interaction, and processes the user message.
+        Args:
+            interaction (discord.Interaction): The "Regenerate" button's interaction.
+        """
+        await interaction.response.defer(ephemeral=True)
+        memory = getattr(self.ai_client, "memory", None)
+        exchange = memory.last_exchange(self.conversation_key(interaction)) if memory is not None else None
+        if exchange is None:
+            await self.followup(interaction, FORGOTTEN_MESSAGE)
+            return
+        await self.show_thinking_message(interaction, exchange[0], use_cache=False, command="regenerate",
+                                         replace_last=True)
 
-                Args:
-                    interaction (discord.Interaction): The Discord interaction object upon modal submission.
-                """
-                await interaction.response.defer(ephemeral=True)
-                user_message = self.question.value
-                await self.bot.show_thinking_message(interaction, user_message)
+    async def continue_answer(self, interaction: discord.Interaction):
+        """
+        Asks the AI to carry on with its last answer in the conversation.
 
-        await interaction.response.send_modal(AskModal(self))
+        Args:
+            interaction (discord.Interaction): The "Continue" button's interaction.
+        """
+        await interaction.response.defer(ephemeral=True)
+        if not self.ai_client.history(self.conversation_key(interaction)):
+            await self.followup(interaction, FORGOTTEN_MESSAGE)
+            return
+        await self.show_thinking_message(interaction, CONTINUE_PROMPT, use_cache=False, command="continue")
 
     async def on_interaction(self, interaction: discord.Interaction):
         """
-        Handles interactions for button clicks and modal submissions.
+        Dispatches button clicks and modal submissions to their handlers by custom_id.
+
+        One dictionary lookup per interaction, however many components the bot
+        has; slash commands carry no custom_id and are left to the command tree.
 
         Args:
             interaction (discord.Interaction): The Discord interaction object.
         """
-        custom_id = interaction.data.get("custom_id") if interaction.data else None
-        if custom_id == "ask_ai_button":
-            await self.handle_modal_interaction(interaction)
+        data = interaction.data
+        handler = self.interaction_handlers.get(data.get("custom_id")) if data else None
+        if handler is not None:
+            await handler(interaction)
+
+
+class ShardedAIChatBot(AIChatBot, commands.AutoShardedBot):
+    """
+    The bot on several gateway shards in one process, sharing one AI client, scheduler and outbound queue.
+
+    With `shard_ids` the process hosts those shards of `shard_count`, so the
+    shards can be spread over worker processes (see `bots.runtime.run_sharded`); without, it
+    hosts all of them, `shard_count` or Discord's recommended number. Each
+    shard's first identify waits for its slot in Discord's identify buckets,
+    counted from `identify_start`, which the worker processes share.
+    """
+
+    def __init__(self, shard_ids: list = None, shard_count: int = None, identify_start: float = None, **kwargs):
+        """
+        Args:
+            shard_ids (list): Shards hosted by this process; all of them if omitted.
+            shard_count (int): Total number of shards; Discord's recommendation if omitted.
+            identify_start (float): Wall clock time of the first identify slot; when the first shard
+                identifies if omitted.
+            kwargs: The arguments of `AIChatBot`.
+        """
+        super().__init__(shard_count=shard_count, shard_ids=shard_ids, **kwargs)
+        self.identify_start = identify_start
+        self.identified = set()
+
+    def syncs_commands(self) -> bool:
+        return self.shard_ids is None or 0 in self.shard_ids
+
+    async def before_identify_hook(self, shard_id: int, *, initial: bool = False):
+        """Waits for the shard's identify slot the first time; later identifies keep discord.py's pacing."""
+        if shard_id in self.identified:
+            await super().before_identify_hook(shard_id, initial=initial)
+            return
+        self.identified.add(shard_id)
+        now = time.time()
+        if self.identify_start is None:
+            self.identify_start = now - (shard_id // self.settings.discord_identify_concurrency) * IDENTIFY_INTERVAL
+        await asyncio.sleep(identify_delay(shard_id, self.identify_start, self.settings.discord_identify_concurrency,
+                                           now))
+
+
+def discord_bot_from_settings(settings: Settings = None, shard_id: int = None, shard_count: int = None,
+                              shard_ids: list = None, identify_start: float = None, **kwargs) -> AIChatBot:
+    """
+    Builds the single connection bot, or the auto-sharded one when `DISCORD_SHARDS` is set or shards are assigned.
+
+    Args:
+        settings (Settings): The bot's settings; read from the environment if omitted.
+        shard_id (int): The single shard of an `AIChatBot`, when each process runs one.
+        shard_count (int): Total number of shards; `DISCORD_SHARDS` for the sharded bot if omitted.
+        shard_ids (list): Shards a `ShardedAIChatBot` hosts in this process.
+        identify_start (float): Shared start of the identify slots, see `ShardedAIChatBot`.
+        kwargs: Further arguments of `AIChatBot`.
+
+    Returns:
+        AIChatBot: The bot.
+    """
+    settings = settings or settings_from_env()
+    if shard_ids is None and settings.discord_shards is None:
+        return AIChatBot(shard_id=shard_id, shard_count=shard_count, settings=settings, **kwargs)
+    if shard_count is None and settings.discord_shards != "auto":
+        shard_count = settings.discord_shards
+    return ShardedAIChatBot(shard_ids=shard_ids, shard_count=shard_count, identify_start=identify_start,
+                            settings=settings, **kwargs)
+
 
 # Instantiate and run the bot
 def run_discord_bot():
-    bot = AIChatBot()
-    bot.run(DISCORD_BOT_TOKEN)
+    settings = settings_from_env()
+    bot = discord_bot_from_settings(settings)
+    bot.run(settings.discord_bot_token)
 
 if __name__ == "__main__":
     run_discord_bot()
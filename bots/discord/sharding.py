@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+
+# Seconds Discord requires between identifies of the same rate limit bucket
+IDENTIFY_INTERVAL = 5.0
+
+
+def shard_layout(shard_count: int, processes: int) -> list:
+    """
+    Spreads the gateway shards over worker processes, round-robin.
+
+    Round-robin keeps every process's shards in different identify buckets
+    early on, so all processes come online together.
+
+    Args:
+        shard_count (int): Total number of shards.
+        processes (int): Number of worker processes.
+
+    Returns:
+        list: The shard ids of each process.
+
+    Raises:
+        ValueError: If there are more processes than shards.
+    """
+    if processes > shard_count:
+        raise ValueError(f"{processes} processes need at least as many shards, not {shard_count}")
+    return [list(range(index, shard_count, processes)) for index in range(processes)]
+
+
+def identify_delay(shard_id: int, start: float, concurrency: int, now: float) -> float:
+    """
+    Returns how long a shard waits before its first identify.
+
+    Discord lets `concurrency` shards identify every `IDENTIFY_INTERVAL`
+    seconds, shard `i` in bucket `i % concurrency`. Giving shard `i` the slot
+    `start + (i // concurrency) * IDENTIFY_INTERVAL` keeps every bucket within
+    its limit across processes, without them talking to each other.
+
+    Args:
+        shard_id (int): The shard about to identify.
+        start (float): Wall clock time of the first slot, the same in every process.
+        concurrency (int): Discord's `max_concurrency` for the bot.
+        now (float): The current wall clock time.
+
+    Returns:
+        float: Seconds to wait, 0 if the slot has passed.
+    """
+    return max(0.0, start + (shard_id // concurrency) * IDENTIFY_INTERVAL - now)
+
+
+def command_tree_hash(tree) -> str:
+    """
+    Hashes the payload `CommandTree.sync` would upload for the global commands.
+
+    Args:
+        tree (discord.app_commands.CommandTree): The bot's command tree.
+
+    Returns:
+        str: Hex SHA-256 of the commands' canonical JSON.
+    """
+    payload = sorted((command.to_dict(tree) for command in tree.get_commands()),
+                     key=lambda command: (command.get("type", 1), command["name"]))
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+class CommandSyncState:
+    """
+    The hash of the commands last synced, per application, in a JSON file.
+
+    A bot compares its command tree's hash with the stored one at startup
+    and syncs only when they differ, so restarts and reconnects do not
+    upload unchanged commands.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): The JSON file; created on the first sync.
+        """
+        self.path = path
+
+    def load(self) -> dict:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def synced_hash(self, application_id) -> str:
+        """Returns the hash stored for the application, or None."""
+        return self.load().get(str(application_id))
+
+    def record(self, application_id, digest: str):
+        """Stores the hash of the commands just synced, replacing the file atomically."""
+        hashes = self.load()
+        hashes[str(application_id)] = digest
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w") as f:
+            json.dump(hashes, f, indent=2, sort_keys=True)
+        os.replace(temporary, self.path)
@@ -0,0 +1,83 @@
+import discord
+
+# custom_ids of the bot's components; fixed, so messages sent before a restart stay clickable
+ASK_BUTTON = "ai:ask"
+# The button's id before the ids were namespaced, still on older messages
+LEGACY_ASK_BUTTON = "ask_ai_button"
+ASK_MODAL = "ai:ask:modal"
+QUESTION_INPUT = "question"
+REGENERATE_BUTTON = "ai:regenerate"
+CONTINUE_BUTTON = "ai:continue"
+
+
+class StaticView(discord.ui.View):
+    """
+    A persistent view that only describes its components; the bot dispatches their interactions.
+
+    discord.py stores every view it sends, per message, and runs a timeout
+    for ephemeral ones. A `StaticView` is built once and sent with every
+    message, so it reports itself finished and not dispatchable, and the
+    library neither stores nor times it out. Clicks reach
+    `AIChatBot.on_interaction` by their fixed custom_ids, before and after a
+    restart.
+    """
+
+    def __init__(self, *items: discord.ui.Item):
+        super().__init__(timeout=None)
+        for item in items:
+            self.add_item(item)
+
+    def is_finished(self) -> bool:
+        return True
+
+    def is_dispatchable(self) -> bool:
+        return False
+
+
+class AskModal(discord.ui.Modal, title="Ask the AI"):
+    """The question form opened by the "Ask the AI" button; one instance is shown to every user."""
+
+    question = discord.ui.TextInput(label="What would you like to ask the AI?", style=discord.TextStyle.paragraph,
+                                    custom_id=QUESTION_INPUT)
+
+    def __init__(self):
+        super().__init__(timeout=None, custom_id=ASK_MODAL)
+
+    def is_finished(self) -> bool:
+        # Submissions are dispatched by the bot, so the library has no instance to track
+        return True
+
+
+def ask_view() -> StaticView:
+    """Builds the view of `/ask`'s reply: a button opening the question form."""
+    return StaticView(discord.ui.Button(label="Ask the AI", style=discord.ButtonStyle.primary, custom_id=ASK_BUTTON))
+
+
+def answer_view() -> StaticView:
+    """Builds the view attached to answers: regenerate the answer, or continue it."""
+    return StaticView(
+        discord.ui.Button(label="Regenerate", style=discord.ButtonStyle.secondary, custom_id=REGENERATE_BUTTON),
+        discord.ui.Button(label="Continue", style=discord.ButtonStyle.secondary, custom_id=CONTINUE_BUTTON),
+    )
+
+
+def modal_values(data: dict) -> dict:
+    """
+    Returns the values of a submitted modal's text inputs.
+
+    Args:
+        data (dict): The interaction's data, whose inputs sit in action rows or labels.
+
+    Returns:
+        dict: Values by the inputs' custom_id.
+    """
+    values = {}
+    pending = list(data.get("components", ()))
+    while pending:
+        component = pending.pop()
+        if "value" in component:
+            values[component["custom_id"]] = component["value"]
+        pending += component.get("components", ())
+        if "component" in component:
+            pending.append(component["component"])
+    return values
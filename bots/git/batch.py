@@ -0,0 +1,277 @@
+"""
+Verifies repository ownership for many repositories at once.
+
+`run.py` checks a single README/key/signature/message set. This module
+checks a whole manifest of them. Each line of the manifest is a JSON object:
+
+    {"name": "org/repo", "readme": "repo/README.md", "key": "repo/public_key.pem",
+     "signature": "repo/signature.bin", "message": "repo/message.txt"}
+
+Relative paths are resolved against the manifest's directory. A JSON array of
+such objects is accepted as well. An optional `algorithm` names the signature
+scheme: `rsa-pkcs1v15` (the default, as in `run.py`), `rsa-pss` or `ed25519`,
+as written by `generator.py`. Each entry passes when the key in the
+README is the uploaded key and the signature over the message verifies with
+it. Entries are spread over a process pool. Each worker caches parsed keys by
+fingerprint, so an owner with many repositories is parsed once per worker.
+Files are read as streams: the README only up to its key, and the message
+is hashed in chunks. The report is JSON. The exit status is 1 if any entry
+failed.
+
+Usage:
+
+    python -m bots.git.batch manifest.jsonl [--workers 4] [--report report.json]
+"""
+import argparse
+import base64
+import binascii
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from cryptography.exceptions import InvalidSignature, UnsupportedAlgorithm
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ed25519, padding, rsa, utils
+from cryptography.hazmat.primitives.serialization import load_der_public_key
+
+BEGIN = b"-----BEGIN PUBLIC KEY-----"
+END = b"-----END PUBLIC KEY-----"
+CHUNK_SIZE = 64 * 1024
+FIELDS = ("readme", "key", "signature", "message")
+# RSA paddings by scheme; Ed25519 has none
+PADDINGS = {
+    "rsa-pkcs1v15": padding.PKCS1v15(),
+    "rsa-pss": padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.DIGEST_LENGTH),
+}
+ALGORITHMS = (*PADDINGS, "ed25519")
+DEFAULT_ALGORITHM = "rsa-pkcs1v15"
+
+# Entry statuses, in the order they are checked
+VERIFIED = "verified"
+KEY_NOT_FOUND = "key_not_found"
+KEY_MISMATCH = "key_mismatch"
+UNSUPPORTED_KEY = "unsupported_key"
+INVALID_SIGNATURE = "invalid_signature"
+ERROR = "error"
+
+# Parsed public keys of this process by fingerprint
+_keys = {}
+
+
+class VerificationError(Exception):
+    """An entry failed verification; `status` says which check failed."""
+
+    def __init__(self, status: str, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def read_public_key(path: str) -> bytes:
+    """
+    Reads the first PEM public key in a file.
+
+    The file is read in chunks and reading stops at the end of the key, so a
+    long README is not loaded whole.
+
+    Args:
+        path (str): A README, `public_key.pem` or any text file holding the key.
+
+    Returns:
+        bytes: The key in DER form.
+
+    Raises:
+        VerificationError: With `KEY_NOT_FOUND` if the file has no complete key.
+    """
+    buffer = b""
+    start = -1
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            buffer += chunk
+            if start == -1:
+                start = buffer.find(BEGIN)
+                if start == -1:
+                    # Keep enough of the tail to find a marker split across chunks
+                    buffer = buffer[-len(BEGIN):]
+                    continue
+                buffer = buffer[start + len(BEGIN):]
+                start = 0
+            end = buffer.find(END)
+            if end != -1:
+                try:
+                    return base64.b64decode(b"".join(buffer[:end].split()), validate=True)
+                except binascii.Error:
+                    raise VerificationError(KEY_NOT_FOUND, f"Malformed public key in {path}")
+    raise VerificationError(KEY_NOT_FOUND, f"Public key not found in {path}")
+
+
+def fingerprint(der: bytes) -> str:
+    """Returns the SHA-256 fingerprint of a DER encoded key as hex."""
+    return hashlib.sha256(der).hexdigest()
+
+
+def parsed_key(der: bytes, key_fingerprint: str):
+    """
+    Returns the public key for `der`, parsing it only the first time this process sees it.
+
+    Returns:
+        tuple: (key, whether it was parsed by this call)
+    """
+    key = _keys.get(key_fingerprint)
+    if key is not None:
+        return key, False
+    try:
+        key = load_der_public_key(der)
+    except (ValueError, UnsupportedAlgorithm) as e:
+        raise VerificationError(UNSUPPORTED_KEY, f"Cannot load public key: {e}")
+    if not isinstance(key, (rsa.RSAPublicKey, ed25519.Ed25519PublicKey)):
+        raise VerificationError(UNSUPPORTED_KEY, f"Unsupported key type {type(key).__name__}")
+    _keys[key_fingerprint] = key
+    return key, True
+
+
+def message_digest(path: str) -> bytes:
+    """Hashes a message file with SHA-256 in chunks."""
+    digest = hashes.Hash(hashes.SHA256())
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.finalize()
+
+
+def verify_entry(entry: dict) -> dict:
+    """
+    Verifies one manifest entry.
+
+    Args:
+        entry (dict): `readme`, `key`, `signature` and `message` paths and an optional `name`.
+
+    Returns:
+        dict: `name`, `status`, `ok`, the README key's `fingerprint`, an `error` message
+            for failures, `key_parsed` (False when the key came from the cache) and `seconds`.
+    """
+    started = time.perf_counter()
+    result = {"name": entry.get("name") or entry["readme"], "status": VERIFIED, "ok": True,
+              "fingerprint": None, "error": None, "key_parsed": False}
+    try:
+        owner = read_public_key(entry["readme"])
+        result["fingerprint"] = fingerprint(owner)
+        if read_public_key(entry["key"]) != owner:
+            raise VerificationError(KEY_MISMATCH, "Uploaded public key does not match the owner's key in the README")
+        key, result["key_parsed"] = parsed_key(owner, result["fingerprint"])
+        algorithm = entry.get("algorithm") or DEFAULT_ALGORITHM
+        if isinstance(key, ed25519.Ed25519PublicKey) != (algorithm == "ed25519"):
+            raise VerificationError(UNSUPPORTED_KEY, f"A {type(key).__name__} cannot verify {algorithm} signatures")
+        with open(entry["signature"], "rb") as f:
+            signature = f.read()
+        try:
+            if algorithm == "ed25519":
+                # Ed25519 signs the message itself, not a digest, so it is read whole
+                with open(entry["message"], "rb") as f:
+                    key.verify(signature, f.read())
+            else:
+                key.verify(signature, message_digest(entry["message"]), PADDINGS[algorithm],
+                           utils.Prehashed(hashes.SHA256()))
+        except InvalidSignature:
+            raise VerificationError(INVALID_SIGNATURE, "Invalid signature")
+    except VerificationError as e:
+        result.update(status=e.status, ok=False, error=str(e))
+    except (OSError, KeyError, ValueError) as e:
+        result.update(status=ERROR, ok=False, error=f"{type(e).__name__}: {e}")
+    result["seconds"] = round(time.perf_counter() - started, 6)
+    return result
+
+
+def load_manifest(path: str) -> list:
+    """
+    Reads a manifest in JSON lines or as a JSON array.
+
+    Returns:
+        list: The entries, with paths made absolute relative to the manifest's directory.
+
+    Raises:
+        ValueError: If an entry is not an object or lacks one of the paths.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    if text.lstrip().startswith("["):
+        entries = json.loads(text)
+    else:
+        entries = [json.loads(line) for line in text.splitlines() if line.strip()]
+    base = os.path.dirname(os.path.abspath(path))
+    for i, entry in enumerate(entries, 1):
+        if not isinstance(entry, dict):
+            raise ValueError(f"Manifest entry {i} is not an object")
+        missing = [field for field in FIELDS if not entry.get(field)]
+        if missing:
+            raise ValueError(f"Manifest entry {i} lacks {', '.join(missing)}")
+        if entry.get("algorithm", DEFAULT_ALGORITHM) not in ALGORITHMS:
+            raise ValueError(f"Manifest entry {i} has unknown algorithm {entry['algorithm']!r}")
+        for field in FIELDS:
+            entry[field] = os.path.join(base, entry[field])
+    return entries
+
+
+def verify_manifest(entries: list, workers: int = None) -> dict:
+    """
+    Verifies every entry, on a process pool unless `workers` is 1.
+
+    Args:
+        entries (list): Manifest entries as returned by `load_manifest`.
+        workers (int): Processes to use; one per CPU by default.
+
+    Returns:
+        dict: `results` in manifest order and a `summary` with counts per status,
+            keys parsed and the seconds taken.
+    """
+    started = time.perf_counter()
+    workers = min(workers or os.cpu_count() or 1, max(1, len(entries)))
+    if workers == 1:
+        results = [verify_entry(entry) for entry in entries]
+    else:
+        # Large chunks keep inter-process traffic down and let each worker reuse its parsed keys
+        chunksize = max(1, len(entries) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(verify_entry, entries, chunksize=chunksize))
+    statuses = {}
+    for result in results:
+        statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+    summary = {
+        "entries": len(results),
+        "verified": statuses.get(VERIFIED, 0),
+        "failed": len(results) - statuses.get(VERIFIED, 0),
+        "statuses": statuses,
+        "keys_parsed": sum(result.pop("key_parsed") for result in results),
+        "workers": workers,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+    return {"summary": summary, "results": results}
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("manifest", help="JSON lines (or JSON array) of readme/key/signature/message entries")
+    parser.add_argument("--workers", type=int, default=None, help="processes to verify on, default one per CPU")
+    parser.add_argument("--report", help="write the JSON report here instead of to stdout")
+    args = parser.parse_args(argv)
+
+    try:
+        entries = load_manifest(args.manifest)
+    except (OSError, ValueError) as e:
+        parser.error(f"cannot read manifest: {e}")
+    report = verify_manifest(entries, args.workers)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        summary = report["summary"]
+        print(f"{summary['verified']} of {summary['entries']} verified, {summary['failed']} failed "
+              f"in {summary['seconds']}s; report written to {args.report}")
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    return 0 if report["summary"]["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
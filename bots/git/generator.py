@@ -1,73 +1,294 @@
-from cryptography.hazmat.primitives.asymmetric import rsa, padding
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa, padding
 from cryptography.hazmat.primitives import serialization, hashes
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import base64
+import json
 import os
+import re
 
-def generate_keys():
-    """Generate an RSA public-private key pair."""
-    private_key = rsa.generate_private_key(
-        public_exponent=65537,
-        key_size=2048
-    )
-    public_key = private_key.public_key()
+# Signature schemes: RSA with PKCS#1 v1.5 (what run.py checks), RSA-PSS and Ed25519
+ALGORITHMS = ("rsa-pkcs1v15", "rsa-pss", "ed25519")
+DEFAULT_ALGORITHM = "rsa-pkcs1v15"
+DEFAULT_MESSAGE = "This is a proof of ownership for my GitHub repository."
+
+# The key and scheme of a signing worker process, set by `_init_worker`
+_worker_key = None
+_worker_algorithm = None
 
-    # Save private key
-    private_key_path = "private_key.pem"
-    with open(private_key_path, "wb") as f:
+
+def generate_keys(algorithm=DEFAULT_ALGORITHM, private_key_path="private_key.pem", public_key_path="public_key.pem"):
+    """Generate a key pair for `algorithm` and save both halves as PEM."""
+    if algorithm == "ed25519":
+        private_key = ed25519.Ed25519PrivateKey.generate()
+    else:
+        private_key = rsa.generate_private_key(
+            public_exponent=65537,
+            key_size=2048
+        )
+
+    # Save private key, readable by the owner only
+    fd = os.open(private_key_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
         f.write(
             private_key.private_bytes(
                 encoding=serialization.Encoding.PEM,
-                format=serialization.PrivateFormat.TraditionalOpenSSL,
+                format=serialization.PrivateFormat.PKCS8,
                 encryption_algorithm=serialization.NoEncryption()
             )
         )
 
-    # Save public key
-    public_key_path = "public_key.pem"
+    write_public_key(private_key, public_key_path)
+    print(f"Keys generated:\n- Private Key: {private_key_path}\n- Public Key: {public_key_path}")
+    return private_key, public_key_path
+
+
+def write_public_key(private_key, public_key_path):
+    """Save the public half of `private_key` as PEM."""
     with open(public_key_path, "wb") as f:
-        f.write(
-            public_key.public_bytes(
-                encoding=serialization.Encoding.PEM,
-                format=serialization.PublicFormat.SubjectPublicKeyInfo
-            )
+        f.write(public_key_pem(private_key))
+
+
+def public_key_pem(private_key):
+    """Return the public half of `private_key` as PEM bytes."""
+    return private_key.public_key().public_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+
+
+def load_private_key(private_key_pem, validated=False):
+    """
+    Load a PEM private key.
+
+    The consistency check OpenSSL runs on a loaded RSA key takes tens of
+    milliseconds, longer than a hundred signatures. It is skipped only if
+    `validated` is set, for the copies of an already loaded key that
+    `sign_messages` hands to its worker processes; any key read from disk,
+    such as a `--key` file, is checked.
+    """
+    return serialization.load_pem_private_key(private_key_pem, password=None,
+                                              unsafe_skip_rsa_key_validation=validated)
+
+
+def load_or_create_key(algorithm=DEFAULT_ALGORITHM, private_key_path="private_key.pem",
+                       public_key_path="public_key.pem"):
+    """
+    Load the private key at `private_key_path`, generating it on first use.
+
+    Key generation is the slow part of signing (an RSA key takes tens to
+    hundreds of milliseconds), so the key is made once and reused by every
+    later run.
+    """
+    if not os.path.exists(private_key_path):
+        private_key, _ = generate_keys(algorithm, private_key_path, public_key_path)
+        return private_key
+    with open(private_key_path, "rb") as f:
+        private_key = load_private_key(f.read())
+    is_ed25519 = isinstance(private_key, ed25519.Ed25519PrivateKey)
+    if is_ed25519 != (algorithm == "ed25519") or not (is_ed25519 or isinstance(private_key, rsa.RSAPrivateKey)):
+        raise ValueError(f"{private_key_path} holds a {type(private_key).__name__}, which cannot sign {algorithm}")
+    if not os.path.exists(public_key_path):
+        write_public_key(private_key, public_key_path)
+    print(f"Loaded existing key: {private_key_path}")
+    return private_key
+
+
+def sign(private_key, data, algorithm=DEFAULT_ALGORITHM):
+    """Sign `data` (bytes) with `private_key` using the `algorithm` scheme."""
+    if algorithm == "ed25519":
+        return private_key.sign(data)
+    if algorithm == "rsa-pss":
+        return private_key.sign(
+            data,
+            padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.DIGEST_LENGTH),
+            hashes.SHA256()
         )
+    return private_key.sign(data, padding.PKCS1v15(), hashes.SHA256())
+
+
+def verify(public_key, signature, data, algorithm=DEFAULT_ALGORITHM):
+    """Verify `signature` over `data`; raises `InvalidSignature` if it does not match."""
+    if algorithm == "ed25519":
+        public_key.verify(signature, data)
+    elif algorithm == "rsa-pss":
+        public_key.verify(
+            signature,
+            data,
+            padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.DIGEST_LENGTH),
+            hashes.SHA256()
+        )
+    else:
+        public_key.verify(signature, data, padding.PKCS1v15(), hashes.SHA256())
 
-    print(f"Keys generated:\n- Private Key: {private_key_path}\n- Public Key: {public_key_path}")
-    return private_key, public_key_path
 
-def sign_message(private_key, message):
+def sign_message(private_key, message, algorithm=DEFAULT_ALGORITHM, directory="."):
     """Sign a message using the private key."""
-    signature = private_key.sign(
-        message.encode(),
-        padding.PKCS1v15(),
-        hashes.SHA256()
-    )
+    signature = sign(private_key, message.encode(), algorithm)
 
     # Save the message and signature
-    message_path = "message.txt"
+    message_path = os.path.join(directory, "message.txt")
     with open(message_path, "w") as f:
         f.write(message)
 
-    signature_path = "signature.bin"
+    signature_path = os.path.join(directory, "signature.bin")
     with open(signature_path, "wb") as f:
         f.write(signature)
 
     print(f"Message signed:\n- Message: {message_path}\n- Signature: {signature_path}")
     return message_path, signature_path
 
+
+def _init_worker(private_key_pem, algorithm):
+    """Load the signing key once per worker process."""
+    global _worker_key, _worker_algorithm
+    # Serialized by `sign_messages` from a key that was checked when it was loaded
+    _worker_key = load_private_key(private_key_pem, validated=True)
+    _worker_algorithm = algorithm
+
+
+def _sign_in_worker(data):
+    return sign(_worker_key, data, _worker_algorithm)
+
+
+def sign_messages(private_key, messages, algorithm=DEFAULT_ALGORITHM, workers=1):
+    """
+    Sign many messages, on a pool of `workers` processes if more than one.
+
+    Each worker loads the key once and signs its share of the messages in
+    large chunks, so the per-message cost is the signature itself.
+
+    Returns the signatures in the order of `messages` (a list of bytes).
+    """
+    if workers <= 1 or len(messages) < 2:
+        return [sign(private_key, data, algorithm) for data in messages]
+    private_key_pem = private_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption()
+    )
+    chunksize = max(1, len(messages) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(private_key_pem, algorithm)) as executor:
+        return list(executor.map(_sign_in_worker, messages, chunksize=chunksize))
+
+
+def safe_name(name):
+    """Turn a message name into a directory name."""
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", name).strip("._") or "message"
+
+
+def unique_folder(name, used):
+    """
+    Turn a message name into a directory name no other message in `used` has.
+
+    Names that only differ in characters `safe_name` replaces, or in case
+    (on case-insensitive file systems), would share a folder; later ones get
+    a `-2`, `-3`, ... suffix instead. The chosen name is added to `used`.
+    """
+    base = safe_name(name)
+    folder, number = base, 1
+    while folder.lower() in used:
+        number += 1
+        folder = f"{base}-{number}"
+    used.add(folder.lower())
+    return folder
+
+
+def write_directory(directory, private_key, algorithm, named_messages, signatures):
+    """
+    Write signatures as `<directory>/<name>/message.txt` and `signature.bin`.
+
+    The directory also gets `public_key.pem` and a `manifest.jsonl` that
+    `batch.py` can verify directly. Every message gets its own folder, even
+    when two names map to the same one; the manifest records which is which.
+    """
+    os.makedirs(directory, exist_ok=True)
+    write_public_key(private_key, os.path.join(directory, "public_key.pem"))
+    # The directory's own files are taken too
+    used = {"public_key.pem", "manifest.jsonl"}
+    with open(os.path.join(directory, "manifest.jsonl"), "w") as manifest:
+        for (name, message), signature in zip(named_messages, signatures):
+            folder = unique_folder(name, used)
+            os.makedirs(os.path.join(directory, folder), exist_ok=True)
+            with open(os.path.join(directory, folder, "message.txt"), "wb") as f:
+                f.write(message)
+            with open(os.path.join(directory, folder, "signature.bin"), "wb") as f:
+                f.write(signature)
+            manifest.write(json.dumps({
+                "name": name, "readme": "public_key.pem", "key": "public_key.pem",
+                "signature": f"{folder}/signature.bin", "message": f"{folder}/message.txt",
+                "algorithm": algorithm,
+            }) + "\n")
+    print(f"{len(signatures)} signatures written to {directory}/ (manifest: {directory}/manifest.jsonl)")
+
+
+def write_bundle(path, private_key, algorithm, named_messages, signatures):
+    """Write every message and base64 signature, with the public key, to one JSON file."""
+    bundle = {
+        "algorithm": algorithm,
+        "public_key": public_key_pem(private_key).decode(),
+        "signatures": [
+            {"name": name, "message": message.decode("utf-8", "replace"),
+             "signature": base64.b64encode(signature).decode()}
+            for (name, message), signature in zip(named_messages, signatures)
+        ],
+    }
+    with open(path, "w") as f:
+        json.dump(bundle, f, indent=2)
+    print(f"{len(signatures)} signatures written to {path}")
+
+
+def read_messages(path):
+    """Read one message per line; a line `name<TAB>message` names its message."""
+    named_messages = []
+    with open(path, "r") as f:
+        for number, line in enumerate(f, 1):
+            line = line.rstrip("\n")
+            if not line:
+                continue
+            name, tab, message = line.partition("\t")
+            if not tab:
+                name, message = f"message-{number:05d}", line
+            named_messages.append((name, message.encode()))
+    return named_messages
+
+
 def main():
-    # Step 1: Generate Keys
-    private_key, public_key_path = generate_keys()
+    parser = argparse.ArgumentParser(description="Sign proof-of-ownership messages with a reusable key.")
+    parser.add_argument("--algorithm", choices=ALGORITHMS, default=DEFAULT_ALGORITHM)
+    parser.add_argument("--key", default="private_key.pem", help="private key to use, created on first use")
+    parser.add_argument("--public-key", default="public_key.pem", help="where the public key is written")
+    parser.add_argument("--message", action="append", default=[], help="a message to sign; repeatable")
+    parser.add_argument("--messages", help="file with one message per line, optionally `name<TAB>message`")
+    parser.add_argument("--out", help="directory to write one folder per message into, plus a manifest")
+    parser.add_argument("--bundle", help="JSON file to write every signature into")
+    parser.add_argument("--workers", type=int, default=1, help="processes to sign on")
+    args = parser.parse_args()
+
+    # Step 1: Load the key, generating it only on the first run
+    private_key = load_or_create_key(args.algorithm, args.key, args.public_key)
 
-    # Step 2: Define the Message
-    message = "This is a proof of ownership for my GitHub repository."
+    # Step 2: Without a batch, sign the single proof of ownership as before
+    if not (args.messages or args.out or args.bundle or len(args.message) > 1):
+        message = args.message[0] if args.message else DEFAULT_MESSAGE
+        message_path, signature_path = sign_message(private_key, message, args.algorithm)
+        print("\nFiles ready for upload:")
+        print(f"- Public Key: {args.public_key}")
+        print(f"- Message: {message_path}")
+        print(f"- Signature: {signature_path}")
+        return
 
-    # Step 3: Sign the Message
-    message_path, signature_path = sign_message(private_key, message)
+    # Step 3: Sign the batch and write it out
+    named_messages = [(f"message-{i:05d}", m.encode()) for i, m in enumerate(args.message or [DEFAULT_MESSAGE], 1)]
+    if args.messages:
+        named_messages = read_messages(args.messages)
+    signatures = sign_messages(private_key, [m for _, m in named_messages], args.algorithm, args.workers)
+    if args.bundle:
+        write_bundle(args.bundle, private_key, args.algorithm, named_messages, signatures)
+    if args.out or not args.bundle:
+        write_directory(args.out or "signatures", private_key, args.algorithm, named_messages, signatures)
 
-    print("\nFiles ready for upload:")
-    print(f"- Public Key: {public_key_path}")
-    print(f"- Message: {message_path}")
-    print(f"- Signature: {signature_path}")
 
 if __name__ == "__main__":
     main()
@@ -59,22 +59,23 @@ def verify_signature(readme_public_key, uploaded_public_key, signature_path, mes
     except Exception as e:
         raise ValueError(f"❌ Signature verification failed: {e}")
 
-# Example usage
-readme_path = "public_key.pem"
-uploaded_public_key_path = "public_key.pem"
-signature_path = "signature.bin"
-message_path = "message.txt"
+def main(readme_path="public_key.pem", uploaded_public_key_path="public_key.pem", signature_path="signature.bin",
+         message_path="message.txt"):
+    """Verifies the example files in the working directory."""
+    try:
+        print("🚀 Starting verification process...")
+        # Extract owner's public key from README
+        owner_public_key = extract_public_key_from_readme(readme_path)
 
-try:
-    print("🚀 Starting verification process...")
-    # Extract owner's public key from README
-    owner_public_key = extract_public_key_from_readme(readme_path)
+        # Extract owner's public key from public_key.pem
+        uploaded_public_key = extract_public_key(uploaded_public_key_path)
 
-    # Extract owner's public key from public_key.pem
-    uploaded_public_key = extract_public_key(uploaded_public_key_path)
+        # Verify the uploaded signature
+        verify_signature(owner_public_key, uploaded_public_key, signature_path, message_path)
+        print("✅ Verification process completed successfully! 🎊")
+    except ValueError as e:
+        print(f"❌ Error: {e}")
 
-    # Verify the uploaded signature
-    verify_signature(owner_public_key, uploaded_public_key, signature_path, message_path)
-    print("✅ Verification process completed successfully! 🎊")
-except ValueError as e:
-    print(f"❌ Error: {e}")
+# Run the example when the script is executed directly
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+"""
+Binds an ownership signature to the contents of a whole repository.
+
+`sign` hashes every file of a working tree into a Merkle tree. It signs the
+root with the key from `generator.py` and writes a manifest with the root,
+the signature, the public key and every file's hash. `verify` hashes the
+tree again, compares the root and checks the signature. The key it checks
+with is the one in the repository's README, as in `run.py`, or one given
+with `--public-key`. On a mismatch it reports which files were added,
+removed or modified.
+
+In a git working tree the files are those git tracks or would track
+(`git ls-files`); elsewhere every file except `.git` is included. Files are
+hashed on a thread pool, and large files are mapped with mmap rather than
+read. A cache keyed on each file's (size, mtime) means a run after small
+changes only hashes the changed files.
+
+Usage:
+
+    python -m bots.git.tree sign  REPO [--key private_key.pem] [--algorithm ed25519]
+    python -m bots.git.tree verify REPO [--public-key public_key.pem]
+"""
+import argparse
+import base64
+import hashlib
+import json
+import mmap
+import os
+import stat
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.serialization import load_der_public_key, load_pem_public_key
+from bots.git.batch import VerificationError, read_public_key
+from bots.git.generator import ALGORITHMS, DEFAULT_ALGORITHM, load_or_create_key, public_key_pem, sign, verify
+
+MANIFEST_NAME = "tree-manifest.json"
+CACHE_NAME = "tree-hash-cache.json"
+VERSION = 1
+# Files at least this large are hashed through mmap instead of read()
+MMAP_THRESHOLD = 1024 * 1024
+# Small files are handed to the pool in groups to keep per-task overhead down
+GROUP_SIZE = 256
+# Files modified this close to a cache write may change again within the same mtime, so they are not cached
+RACY_WINDOW_NS = 2_000_000_000
+# Prefix of the signed message, so a tree signature cannot pass for another kind of signature
+SIGNED_PREFIX = b"bots-git-tree-v1:"
+
+
+def list_files(root: str, exclude=()) -> list:
+    """
+    Lists the files of a working tree as sorted relative paths with `/` separators.
+
+    Args:
+        root (str): The tree's top directory.
+        exclude: Relative paths to leave out, such as the manifest itself.
+    """
+    paths = None
+    if os.path.exists(os.path.join(root, ".git")):
+        try:
+            output = subprocess.run(
+                ["git", "-C", root, "ls-files", "-z", "--cached", "--others", "--exclude-standard"],
+                check=True, capture_output=True,
+            ).stdout
+            paths = {path for path in output.decode("utf-8", "surrogateescape").split("\0") if path}
+        except (OSError, subprocess.CalledProcessError) as e:
+            print(f"git ls-files failed ({e}); listing every file instead")
+    if paths is None:
+        paths = set()
+        for directory, directories, files in os.walk(root):
+            directories[:] = [d for d in directories if d != ".git"]
+            relative = os.path.relpath(directory, root).replace(os.sep, "/")
+            prefix = "" if relative == "." else f"{relative}/"
+            paths.update(prefix + name for name in files)
+    return sorted(paths.difference(exclude))
+
+
+def file_mode(st) -> str:
+    """Returns a git style mode: `120000` for links, `100755` for executables, else `100644`."""
+    if stat.S_ISLNK(st.st_mode):
+        return "120000"
+    return "100755" if st.st_mode & stat.S_IXUSR else "100644"
+
+
+def hash_file(path: str, st) -> str:
+    """Returns the SHA-256 of a file's contents, or of a symlink's target, as hex."""
+    if stat.S_ISLNK(st.st_mode):
+        return hashlib.sha256(os.fsencode(os.readlink(path))).hexdigest()
+    with open(path, "rb") as f:
+        if st.st_size >= MMAP_THRESHOLD:
+            # hashlib releases the GIL on large buffers, so mapped files hash in parallel
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return hashlib.sha256(mapped).hexdigest()
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def leaf_hash(path: str, mode: str, digest: str) -> bytes:
+    return hashlib.sha256(b"\x00" + f"{mode} {path}\x00{digest}".encode("utf-8", "surrogateescape")).digest()
+
+
+def merkle_root(files: list) -> str:
+    """
+    Returns the Merkle root of `files` as hex.
+
+    Args:
+        files (list): (path, size, mode, digest) rows sorted by path.
+    """
+    level = [leaf_hash(path, mode, digest) for path, _, mode, digest in files]
+    if not level:
+        return hashlib.sha256(b"").hexdigest()
+    while len(level) > 1:
+        # An odd node out is carried up a level unchanged
+        level = [hashlib.sha256(b"\x01" + level[i] + level[i + 1]).digest() if i + 1 < len(level) else level[i]
+                 for i in range(0, len(level), 2)]
+    return level[0].hex()
+
+
+class HashCache:
+    """
+    File hashes keyed on (size, mtime), so unchanged files are not hashed again.
+
+    Entries live in a JSON file, inside `.git` when the tree has one so that
+    the cache is never part of the tree.
+    """
+
+    def __init__(self, path: str = None):
+        """
+        Args:
+            path (str): The cache file; None keeps nothing between runs.
+        """
+        self.path = path
+        self.entries = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    data = json.load(f)
+                if data.get("version") == VERSION:
+                    self.entries = data["entries"]
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Ignoring unreadable hash cache {path}: {e}")
+
+    def get(self, path: str, st):
+        entry = self.entries.get(path)
+        if entry and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+            return entry[2]
+        return None
+
+    def save(self, files: list, mtimes: dict):
+        """Replaces the entries with `files`, leaving out files modified too recently to trust."""
+        if not self.path:
+            return
+        now = time.time_ns()
+        entries = {path: [size, mtimes[path], digest] for path, size, _, digest in files
+                   if now - mtimes[path] > RACY_WINDOW_NS}
+        if entries == self.entries and os.path.exists(self.path):
+            return
+        self.entries = entries
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w") as f:
+            # dumps() runs the C encoder; dump() to a file would encode in Python
+            f.write(json.dumps({"version": VERSION, "entries": entries}, separators=(",", ":")))
+        os.replace(temporary, self.path)
+
+
+def default_cache_path(root: str) -> str:
+    git = os.path.join(root, ".git")
+    return os.path.join(git, CACHE_NAME) if os.path.isdir(git) else None
+
+
+def hash_tree(root: str, cache: HashCache = None, workers: int = None, exclude=()) -> dict:
+    """
+    Hashes every file of a working tree.
+
+    Args:
+        root (str): The tree's top directory.
+        cache (HashCache): Hashes of earlier runs; updated with this run's.
+        workers (int): Hashing threads; by default `os.cpu_count()` plus four for I/O.
+        exclude: Relative paths to leave out.
+
+    Returns:
+        dict: `root` (the Merkle root), `files` as (path, size, mode, digest) rows,
+            and the number of files `hashed` and taken from the `cached` hashes.
+    """
+    cache = cache or HashCache()
+    paths = list_files(root, exclude)
+    rows = [None] * len(paths)
+    mtimes = {}
+    small, large = [], []
+    prefix = os.path.join(root, "")
+    for i, path in enumerate(paths):
+        full = prefix + path
+        try:
+            st = os.lstat(full)
+        except FileNotFoundError:
+            # Listed by git but deleted from the working tree
+            continue
+        if not (stat.S_ISREG(st.st_mode) or stat.S_ISLNK(st.st_mode)):
+            continue
+        mtimes[path] = st.st_mtime_ns
+        rows[i] = [path, st.st_size, file_mode(st), cache.get(path, st)]
+        if rows[i][3] is None:
+            (large if st.st_size >= MMAP_THRESHOLD else small).append((i, full, st))
+
+    def hash_group(group):
+        for i, full, st in group:
+            rows[i][3] = hash_file(full, st)
+
+    groups = [small[i:i + GROUP_SIZE] for i in range(0, len(small), GROUP_SIZE)] + [[item] for item in large]
+    if groups:
+        with ThreadPoolExecutor(max_workers=workers or (os.cpu_count() or 1) + 4) as executor:
+            # list() re-raises the first error of any group
+            list(executor.map(hash_group, groups))
+    files = [tuple(row) for row in rows if row is not None]
+    cache.save(files, mtimes)
+    hashed = len(small) + len(large)
+    return {"root": merkle_root(files), "files": files, "hashed": hashed, "cached": len(files) - hashed}
+
+
+def sign_tree(root: str, private_key, algorithm: str = DEFAULT_ALGORITHM, manifest_path: str = None,
+              cache: HashCache = None, workers: int = None) -> dict:
+    """
+    Hashes a tree, signs its Merkle root and writes the manifest.
+
+    Returns:
+        dict: The manifest as written.
+    """
+    manifest_path = manifest_path or os.path.join(root, MANIFEST_NAME)
+    tree = hash_tree(root, cache, workers, exclude=excluded(root, manifest_path))
+    signature = sign(private_key, SIGNED_PREFIX + tree["root"].encode(), algorithm)
+    manifest = {
+        "version": VERSION,
+        "algorithm": algorithm,
+        "root": tree["root"],
+        "signature": base64.b64encode(signature).decode(),
+        "public_key": public_key_pem(private_key).decode(),
+        "files": [list(row) for row in tree["files"]],
+    }
+    with open(manifest_path, "w") as f:
+        f.write(json.dumps(manifest, separators=(",", ":")))
+    print(f"Signed {len(tree['files'])} files ({tree['hashed']} hashed, {tree['cached']} cached), "
+          f"root {tree['root'][:16]}..., manifest {manifest_path}")
+    return manifest
+
+
+def excluded(root: str, manifest_path: str) -> set:
+    """The manifest never hashes itself."""
+    relative = os.path.relpath(os.path.abspath(manifest_path), os.path.abspath(root))
+    return {relative.replace(os.sep, "/"), MANIFEST_NAME}
+
+
+def verify_tree(root: str, manifest_path: str = None, public_key=None, cache: HashCache = None,
+                workers: int = None) -> dict:
+    """
+    Checks a tree against its signed manifest.
+
+    Args:
+        root (str): The tree's top directory.
+        manifest_path (str): The manifest; `tree-manifest.json` in the tree by default.
+        public_key: The owner's key. By default the key in the tree's README.md.
+        cache (HashCache): Hashes of earlier runs.
+        workers (int): Hashing threads.
+
+    Returns:
+        dict: `ok`, `signature_valid`, `root` and `expected_root`, the `added`, `removed` and
+            `modified` paths, `error` if the key or signature could not be checked, and the
+            `hashed`/`cached` counts.
+    """
+    manifest_path = manifest_path or os.path.join(root, MANIFEST_NAME)
+    with open(manifest_path, "r") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != VERSION or manifest.get("algorithm") not in ALGORITHMS:
+        raise ValueError(f"{manifest_path} is not a version {VERSION} tree manifest")
+    tree = hash_tree(root, cache, workers, exclude=excluded(root, manifest_path))
+    report = {"ok": False, "signature_valid": False, "root": tree["root"], "expected_root": manifest["root"],
+              "added": [], "removed": [], "modified": [], "error": None,
+              "hashed": tree["hashed"], "cached": tree["cached"]}
+
+    try:
+        if public_key is None:
+            public_key = load_der_public_key(read_public_key(os.path.join(root, "README.md")))
+        owner = public_key.public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+        if owner != manifest["public_key"].encode():
+            raise VerificationError("key_mismatch", "The manifest was signed with a key other than the owner's")
+        verify(public_key, base64.b64decode(manifest["signature"]),
+               SIGNED_PREFIX + manifest["root"].encode(), manifest["algorithm"])
+        report["signature_valid"] = True
+    except InvalidSignature:
+        report["error"] = "Invalid signature"
+    except (VerificationError, OSError, ValueError, TypeError) as e:
+        report["error"] = str(e)
+
+    if tree["root"] != manifest["root"]:
+        signed = {row[0]: tuple(row[1:]) for row in manifest["files"]}
+        current = {row[0]: tuple(row[1:]) for row in tree["files"]}
+        report["added"] = sorted(current.keys() - signed.keys())
+        report["removed"] = sorted(signed.keys() - current.keys())
+        report["modified"] = sorted(path for path in current.keys() & signed.keys() if current[path] != signed[path])
+    report["ok"] = report["signature_valid"] and tree["root"] == manifest["root"]
+    return report
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("sign", "verify"))
+    parser.add_argument("root", help="top directory of the working tree")
+    parser.add_argument("--manifest", help=f"manifest path, default {MANIFEST_NAME} in the tree")
+    parser.add_argument("--key", default="private_key.pem", help="private key to sign with, created on first use")
+    parser.add_argument("--algorithm", choices=ALGORITHMS, default=DEFAULT_ALGORITHM)
+    parser.add_argument("--public-key", help="owner's public key to verify with, default the one in README.md")
+    parser.add_argument("--cache", help=f"hash cache file, default .git/{CACHE_NAME} when the tree has .git")
+    parser.add_argument("--no-cache", action="store_true", help="hash every file")
+    parser.add_argument("--workers", type=int, default=None, help="hashing threads")
+    args = parser.parse_args(argv)
+
+    cache = HashCache(None if args.no_cache else args.cache or default_cache_path(args.root))
+    if args.command == "sign":
+        private_key = load_or_create_key(args.algorithm, args.key)
+        sign_tree(args.root, private_key, args.algorithm, args.manifest, cache, args.workers)
+        return 0
+
+    public_key = None
+    if args.public_key:
+        with open(args.public_key, "rb") as f:
+            public_key = load_pem_public_key(f.read())
+    report = verify_tree(args.root, args.manifest, public_key, cache, args.workers)
+    json.dump(report, sys.stdout, indent=2)
+    print()
+    return 0 if report["ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
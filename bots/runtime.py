@@ -0,0 +1,420 @@
+import argparse
+import asyncio
+import dataclasses
+import multiprocessing
+import signal
+import time
+from bots.shared.settings import Settings, settings_from_env
+
+PLATFORMS = ("discord", "telegram", "twitter")
+
+# Settings whose presence enables a platform when BOT_PLATFORMS is not set
+PLATFORM_CREDENTIALS = {
+    "discord": "discord_bot_token",
+    "telegram": "telegram_bot_token",
+    "twitter": "twitter_api_key",
+}
+
+
+class DiscordAdapter:
+    """Hosts the Discord bot on the runtime's loop: one shard, or with `DISCORD_SHARDS` or `shard_ids` several."""
+
+    def __init__(self, ai_client, scheduler, jobs=None, shard_id: int = None, shard_count: int = None,
+                 settings: Settings = None, shard_ids: list = None, identify_start: float = None):
+        self.ai_client = ai_client
+        self.scheduler = scheduler
+        self.jobs = jobs
+        self.settings = settings
+        self.shard_id = shard_id
+        self.shard_count = shard_count
+        self.shard_ids = shard_ids
+        self.identify_start = identify_start
+        self.bot = None
+        self.task = None
+
+    async def setup(self):
+        # Imported here so disabled platforms cost neither import time nor memory
+        from bots.discord.bot import discord_bot_from_settings
+        self.bot = discord_bot_from_settings(self.settings, shard_id=self.shard_id, shard_count=self.shard_count,
+                                             shard_ids=self.shard_ids, identify_start=self.identify_start,
+                                             ai_client=self.ai_client, scheduler=self.scheduler, jobs=self.jobs)
+
+    async def start(self):
+        # Logging in first gives the client its HTTP session, which queued jobs need to deliver answers
+        await self.bot.login(self.bot.settings.discord_bot_token)
+        self.task = asyncio.create_task(self.bot.connect())
+
+    @property
+    def outbound(self):
+        return self.bot.outbound
+
+    async def stop(self):
+        await self.bot.close()
+        if self.task is not None:
+            await asyncio.gather(self.task, return_exceptions=True)
+
+
+class TelegramAdapter:
+    """Hosts the Telegram bot on the runtime's loop, polling or behind a webhook per `TELEGRAM_MODE`."""
+
+    def __init__(self, ai_client, scheduler, jobs=None, settings: Settings = None, **bot_options):
+        self.ai_client = ai_client
+        self.scheduler = scheduler
+        self.jobs = jobs
+        self.settings = settings
+        self.bot_options = bot_options
+        self.bot = None
+        self.webhook = None
+
+    async def setup(self):
+        from bots.telegram.bot import TelegramAIChatBot
+        self.bot = TelegramAIChatBot(ai_client=self.ai_client, scheduler=self.scheduler, jobs=self.jobs,
+                                     settings=self.settings, **self.bot_options)
+        if self.bot.settings.telegram_mode == "webhook":
+            from bots.telegram.webhook import webhook_server_from_env
+            self.webhook = webhook_server_from_env(self.bot.application, workers=self.bot.workers)
+
+    async def start(self):
+        if self.webhook is not None:
+            await self.webhook.start()
+            return
+        application = self.bot.application
+        await application.initialize()
+        await application.start()
+        await application.updater.start_polling()
+
+    @property
+    def outbound(self):
+        return self.bot.outbound
+
+    async def stop(self):
+        if self.webhook is not None:
+            await self.webhook.stop()
+        else:
+            application = self.bot.application
+            if application.updater.running:
+                await application.updater.stop()
+            if application.running:
+                await application.stop()
+            await application.shutdown()
+        # A manually started application does not call post_shutdown
+        await self.bot.outbound.close()
+
+
+class TwitterAdapter:
+    """Hosts the Twitter listener's workers on the runtime's loop; tweepy's stream keeps its own thread."""
+
+    def __init__(self, ai_client, scheduler, jobs=None, api=None, auth=None, settings: Settings = None):
+        self.ai_client = ai_client
+        self.scheduler = scheduler
+        self.jobs = jobs
+        self.settings = settings or settings_from_env()
+        self.api = api
+        self.auth = auth
+        self.listener = None
+        self.stream = None
+
+    async def setup(self):
+        import tweepy
+        from bots.twitter.bot import AIChatBotListener, twitter_auth
+        self.auth = self.auth or twitter_auth(self.settings)
+        self.listener = AIChatBotListener(
+            self.api or tweepy.API(self.auth),
+            ai_client=self.ai_client,
+            scheduler=self.scheduler,
+            loop=asyncio.get_running_loop(),
+            jobs=self.jobs,
+            settings=self.settings,
+        )
+        await self.listener.start_workers()
+
+    async def start(self):
+        from tweepy import Stream
+        self.stream = Stream(self.auth, self.listener)
+        self.stream.filter(track=[f"@{self.listener.screen_name}"], is_async=True)
+
+    @property
+    def outbound(self):
+        return self.listener.outbound
+
+    async def stop(self):
+        if self.stream is not None:
+            self.stream.disconnect()
+        await self.listener.aclose()
+
+
+ADAPTERS = {
+    "discord": DiscordAdapter,
+    "telegram": TelegramAdapter,
+    "twitter": TwitterAdapter,
+}
+
+
+def enabled_platforms(settings: Settings = None) -> list:
+    """
+    Returns the platforms to run.
+
+    `BOT_PLATFORMS` lists them explicitly, e.g. `discord,telegram`; without
+    it every platform whose credentials are set is enabled.
+
+    Args:
+        settings (Settings): The runtime's settings; read from the environment if omitted.
+
+    Returns:
+        list: Platform names.
+    """
+    settings = settings or settings_from_env()
+    if settings.bot_platforms:
+        platforms = list(settings.bot_platforms)
+        unknown = set(platforms) - set(PLATFORMS)
+        if unknown:
+            raise ValueError(f"Unknown platforms in BOT_PLATFORMS: {', '.join(sorted(unknown))}")
+        return platforms
+    return [name for name in PLATFORMS if getattr(settings, PLATFORM_CREDENTIALS[name])]
+
+
+class BotRuntime:
+    """
+    Runs several bot adapters in one process on one event loop.
+
+    The adapters share a single AI client (with its connection pool, response
+    cache and conversation memory) and a single request scheduler, so rate
+    limits and concurrency caps apply across platforms and only one HTTP
+    stack is built. With `AI_JOBS=1` they also share one durable job queue,
+    started once every adapter can deliver answers. With `METRICS_PORT` set
+    the process serves its metrics on `/metrics`.
+
+    The shared components are imported when the runtime is built, so the
+    parent of a sharded runtime and `--help` load none of them.
+    """
+
+    def __init__(self, platforms: list, ai_client=None, scheduler=None, shard_id: int = None,
+                 shard_count: int = None, options: dict = None, stats_interval: float = 0.0,
+                 settings: Settings = None):
+        """
+        Args:
+            platforms (list): Names of the platforms to run, see `PLATFORMS`.
+            ai_client (AIClient): The shared AI client; built from the environment if omitted.
+            scheduler (RequestScheduler): The shared scheduler; built from the environment if omitted.
+            shard_id (int): The Discord shard this process connects as, in sharded mode.
+            shard_count (int): Total number of Discord shards, in sharded mode.
+            options (dict): Extra adapter keyword arguments by platform name.
+            stats_interval (float): Seconds between printed runtime statistics; off if 0.
+            settings (Settings): Settings passed to every bot; read from the environment if omitted.
+        """
+        from bots.shared.ai_client import ai_client_from_env
+        from bots.shared.jobs import job_pipeline_from_env
+        from bots.shared.metrics import metrics_server_from_env
+        from bots.shared.scheduler import request_scheduler_from_env
+
+        self.settings = settings or settings_from_env()
+        self.platforms = platforms
+        self.ai_client = ai_client or ai_client_from_env()
+        self.scheduler = scheduler or request_scheduler_from_env()
+        self.jobs = job_pipeline_from_env(self.ai_client, self.scheduler, shard_id)
+        self.metrics_server = metrics_server_from_env()
+        self.shard_id = shard_id
+        self.shard_count = shard_count
+        self.options = options or {}
+        self.stats_interval = stats_interval
+        self.adapters = {}
+        self.stopping = None
+
+    async def setup(self):
+        """Opens the shared AI client and builds every adapter, without connecting to any platform."""
+        await self.ai_client.start()
+        if self.metrics_server is not None:
+            await self.metrics_server.start()
+        for name in self.platforms:
+            options = dict(self.options.get(name, {}))
+            options.setdefault("settings", self.settings)
+            if name == "discord":
+                options.setdefault("shard_id", self.shard_id)
+                options.setdefault("shard_count", self.shard_count)
+            adapter = ADAPTERS[name](self.ai_client, self.scheduler, jobs=self.jobs, **options)
+            await adapter.setup()
+            self.adapters[name] = adapter
+
+    async def run(self):
+        """Sets up and starts every adapter, then runs until SIGINT or SIGTERM."""
+        self.stopping = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, self.stopping.set)
+
+        stats_task = None
+        try:
+            await self.setup()
+            for name, adapter in self.adapters.items():
+                await adapter.start()
+                print(f"Started the {name} bot.")
+            if self.jobs is not None:
+                await self.jobs.start()
+            if self.stats_interval:
+                stats_task = asyncio.create_task(self.log_stats())
+            await self.stopping.wait()
+        finally:
+            if stats_task is not None:
+                stats_task.cancel()
+            await self.shutdown()
+
+    def stop(self):
+        """Asks a running runtime to shut down."""
+        if self.stopping is not None:
+            self.stopping.set()
+
+    async def shutdown(self):
+        """Stops the job workers and the adapters in reverse order, then closes the shared AI client."""
+        if self.jobs is not None:
+            await self.jobs.stop()
+        for name, adapter in reversed(list(self.adapters.items())):
+            try:
+                await adapter.stop()
+            except Exception as e:
+                print(f"Failed to stop the {name} bot: {e}")
+        self.adapters = {}
+        if self.jobs is not None:
+            await self.jobs.close()
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+        await self.ai_client.close()
+
+    def stats(self) -> dict:
+        """Returns the shared components' statistics and each platform's outbound sends."""
+        cache = getattr(self.ai_client, "cache", None)
+        memory = getattr(self.ai_client, "memory", None)
+        return {
+            "platforms": list(self.adapters),
+            "ai": self.ai_client.stats(),
+            "cache": cache.stats() if cache is not None else None,
+            "memory": memory.stats() if memory is not None else None,
+            "scheduler": self.scheduler.stats(),
+            "jobs": self.jobs.stats() if self.jobs is not None else None,
+            "outbound": {name: adapter.outbound.stats() for name, adapter in self.adapters.items()},
+        }
+
+    async def log_stats(self):
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            print(f"Runtime stats: {self.stats()}")
+
+
+def run_shard(shard_id: int, shard_count: int, platforms: list, stats_interval: float = 0.0, shard_ids: list = None,
+              identify_start: float = None):
+    """
+    Runs one process of the sharded runtime.
+
+    Discord's gateway is split into `shard_count` shards: this process
+    connects as shard `shard_id`, or with `shard_ids` hosts those shards on
+    one auto-sharded bot. Telegram polling and the Twitter stream allow only
+    one consumer, so they run in the first process only.
+
+    Args:
+        shard_id (int): Index of this process.
+        shard_count (int): Total number of shards.
+        platforms (list): Platforms enabled for the whole runtime.
+        stats_interval (float): Seconds between printed runtime statistics; off if 0.
+        shard_ids (list): Shards this process hosts, with `DISCORD_SHARDS`.
+        identify_start (float): Wall clock time of the first identify slot, shared by the processes.
+    """
+    if shard_id:
+        platforms = [name for name in platforms if name == "discord"]
+    if not platforms:
+        return
+    options = {"discord": {"shard_ids": shard_ids, "identify_start": identify_start}} if shard_ids else None
+    runtime = BotRuntime(platforms, shard_id=shard_id, shard_count=shard_count, options=options,
+                         stats_interval=stats_interval)
+    asyncio.run(runtime.run())
+
+
+def run_sharded(processes: int, platforms: list, stats_interval: float = 0.0, settings: Settings = None):
+    """
+    Runs the bots across several processes to use more than one core.
+
+    Without `DISCORD_SHARDS` each process connects as one Discord shard.
+    With `DISCORD_SHARDS=N` the N shards are spread round-robin over the
+    processes, each hosting its share on one auto-sharded bot; their first
+    identifies follow one schedule, so together they respect Discord's
+    identify limit. Each process has its own event loop, AI client and
+    scheduler, shared by its shards; use the SQLite response cache
+    (`AI_CACHE=sqlite`) to share cached answers between processes. SIGTERM
+    is forwarded to every process.
+
+    Args:
+        processes (int): Number of processes.
+        platforms (list): Platforms to run.
+        stats_interval (float): Seconds between printed runtime statistics; off if 0.
+        settings (Settings): The runtime's settings; read from the environment if omitted.
+
+    Raises:
+        ValueError: If `DISCORD_SHARDS` is `auto`, or lower than the number of processes.
+    """
+    from bots.discord.sharding import shard_layout
+
+    settings = settings or settings_from_env()
+    if "discord" not in platforms:
+        print("Only Discord can be sharded; running a single process.")
+        processes = 1
+    shards = settings.discord_shards
+    if shards == "auto":
+        raise ValueError("DISCORD_SHARDS=auto is for a single process; set a number to spread shards over processes")
+    layout = shard_layout(shards, processes) if shards is not None else [None] * processes
+    shard_count = shards if shards is not None else processes
+    identify_start = time.time()
+    context = multiprocessing.get_context("spawn")
+    children = [
+        context.Process(target=run_shard,
+                        args=(index, shard_count, platforms, stats_interval, layout[index], identify_start),
+                        name=f"bots-shard-{index}")
+        for index in range(processes)
+    ]
+    for child in children:
+        child.start()
+
+    def forward(signum, frame):
+        for child in children:
+            if child.is_alive():
+                child.terminate()
+
+    signal.signal(signal.SIGTERM, forward)
+    try:
+        for child in children:
+            child.join()
+    except KeyboardInterrupt:
+        # The children received the same SIGINT and shut down on their own
+        for child in children:
+            child.join()
+
+
+def main():
+    """Runs the enabled bots in one process, or sharded across `BOT_PROCESSES` processes."""
+    parser = argparse.ArgumentParser(description="Runs the Discord, Telegram and Twitter bots together.")
+    parser.add_argument("--platforms", help="comma-separated platforms to run (default: BOT_PLATFORMS, "
+                                            "or every platform with credentials)")
+    parser.add_argument("--processes", type=int,
+                        help="processes to shard the bots across (default: BOT_PROCESSES or 1)")
+    parser.add_argument("--stats-interval", type=float,
+                        help="seconds between printed runtime statistics (default: BOT_STATS_INTERVAL or off)")
+    args = parser.parse_args()
+    settings = settings_from_env()
+    if args.platforms:
+        settings = dataclasses.replace(
+            settings, bot_platforms=tuple(name.strip() for name in args.platforms.split(",") if name.strip()))
+    processes = args.processes if args.processes is not None else settings.bot_processes
+    stats_interval = args.stats_interval if args.stats_interval is not None else settings.bot_stats_interval
+    platforms = enabled_platforms(settings)
+    if not platforms:
+        parser.error("No platforms enabled; set BOT_PLATFORMS or the platforms' credentials.")
+
+    if processes > 1:
+        try:
+            run_sharded(processes, platforms, stats_interval, settings)
+        except ValueError as e:
+            parser.error(str(e))
+    else:
+        asyncio.run(BotRuntime(platforms, stats_interval=stats_interval, settings=settings).run())
+
+
+# Run the bots when the script is executed directly
+if __name__ == "__main__":
+    main()
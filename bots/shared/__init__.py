@@ -0,0 +1,90 @@
+"""
+Building blocks shared by the Discord, Telegram and Twitter bots.
+
+Names are imported from their modules on first use, so importing the package
+is free and a bot only loads the parts it uses.
+"""
+import importlib
+
+# Exported names by the module defining them
+_EXPORTS = {
+    "ai_client": ("AI_BASE_URL", "AIClient", "ai_client_from_env"),
+    "cache": ("MemoryCacheBackend", "ResponseCache", "SQLiteCacheBackend", "response_cache_from_env"),
+    "chunking": ("MessageChunker", "MessageLimits", "deliver_chunks", "split_message"),
+    "coalescing": ("RequestCoalescer",),
+    "jobs": ("JobPipeline", "JobStore", "job_pipeline_from_env"),
+    "memory": ("ConversationMemory", "conversation_memory_from_env"),
+    "metrics": ("METRICS", "MetricsRegistry", "MetricsServer", "RequestTrace", "metrics_server_from_env",
+                "trace_request"),
+    "outbound": ("PRIORITY_COSMETIC", "PRIORITY_FINAL", "OutboundScheduler", "RouteLimit",
+                 "outbound_scheduler_from_env"),
+    "resilience": ("CircuitBreaker", "CircuitOpen", "RetryPolicy"),
+    "router": ("AIRouter", "RoutingRule"),
+    "scheduler": ("PRIORITY_COMMAND", "PRIORITY_MESSAGE", "RequestScheduler", "RequestShed"),
+    "settings": ("Settings", "load_env", "settings_from_env"),
+    "streaming": ("StreamingReply",),
+    "usage": ("QUOTA_RESPONSE", "QuotaExceeded", "UsageLedger", "usage_ledger_from_env"),
+}
+_MODULES = {name: module for module, names in _EXPORTS.items() for name in names}
+
+__all__ = [
+    "AI_BASE_URL",
+    "METRICS",
+    "PRIORITY_COMMAND",
+    "PRIORITY_COSMETIC",
+    "PRIORITY_FINAL",
+    "PRIORITY_MESSAGE",
+    "QUOTA_RESPONSE",
+    "AIClient",
+    "AIRouter",
+    "CircuitBreaker",
+    "CircuitOpen",
+    "ConversationMemory",
+    "JobPipeline",
+    "JobStore",
+    "MemoryCacheBackend",
+    "MessageChunker",
+    "MessageLimits",
+    "MetricsRegistry",
+    "MetricsServer",
+    "OutboundScheduler",
+    "QuotaExceeded",
+    "RequestCoalescer",
+    "RequestScheduler",
+    "RequestShed",
+    "RequestTrace",
+    "ResponseCache",
+    "RetryPolicy",
+    "RouteLimit",
+    "RoutingRule",
+    "SQLiteCacheBackend",
+    "Settings",
+    "StreamingReply",
+    "UsageLedger",
+    "ai_client_from_env",
+    "conversation_memory_from_env",
+    "deliver_chunks",
+    "job_pipeline_from_env",
+    "load_env",
+    "metrics_server_from_env",
+    "outbound_scheduler_from_env",
+    "response_cache_from_env",
+    "settings_from_env",
+    "split_message",
+    "trace_request",
+    "usage_ledger_from_env",
+]
+
+
+def __getattr__(name: str):
+    module = _MODULES.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    # Cached, so later lookups skip this function
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
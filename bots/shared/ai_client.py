@@ -0,0 +1,602 @@
+import asyncio
+import json
+import os
+import time
+import aiohttp
+from .cache import response_cache_from_env
+from .coalescing import RequestCoalescer, make_request_key
+from .memory import conversation_memory_from_env
+from .metrics import METRICS, mark, record_error, record_usage
+from .resilience import CircuitBreaker, CircuitOpen, LatencyTracker, RetryPolicy, parse_retry_after
+from .usage import QUOTA_RESPONSE, QuotaExceeded, charge_usage, metered, usage_ledger_from_env
+
+AI_BASE_URL = "https://openrouter.ai/api/v1"
+ERROR_RESPONSE = "Failed to get a response due to an HTTP error."
+
+
+class AIClient:
+    """
+    An async client for the OpenRouter chat completions API shared by all bots.
+
+    Keeps one long-lived aiohttp session with a keep-alive connection pool, so
+    consecutive requests reuse open TCP/TLS connections instead of paying a
+    fresh handshake per message. The session is bound to the owning bot's
+    lifecycle through `start()` and `close()`.
+
+    Every request is bounded by connect/read/total timeouts. 429 and 5xx
+    answers are retried according to the `RetryPolicy`, a `CircuitBreaker`
+    makes calls fail fast while upstream is down, and with `hedge_percentile`
+    set a second, hedged request is sent when the first is slower than that
+    percentile of recent latencies.
+
+    With a `ConversationMemory`, requests that name a conversation carry its
+    recent turns, so users can ask follow-up questions.
+
+    Requests are timed on the current request's trace (AI start, first
+    byte, AI done), and cache lookups, failures and the tokens the API
+    reports are counted in the shared metrics registry.
+
+    With a `UsageLedger`, requests that name a conversation are billed to
+    its platform, chat and user: they are refused with `QUOTA_RESPONSE`
+    when over quota, and their `max_tokens` is fitted to the prompt and the
+    quota left.
+    """
+
+    def __init__(self, api_key: str, base_url: str = AI_BASE_URL, pool_size: int = 100,
+                 dns_ttl: int = 300, keepalive_timeout: float = 30.0, ssl=True,
+                 model: str = "openai/gpt-4", max_tokens: int = 1000, temperature: float = 1.0,
+                 cache=None, coalescer=None, connect_timeout: float = 5.0, read_timeout: float = 30.0,
+                 total_timeout: float = 60.0, retry: RetryPolicy = None, breaker: CircuitBreaker = None,
+                 hedge_percentile: float = None, hedge_min_samples: int = 20, memory=None,
+                 summarize: bool = False, ledger=None):
+        """
+        Initializes the client without opening any connections.
+
+        Args:
+            api_key (str): The OpenRouter API key.
+            base_url (str): The base URL of the AI API.
+            pool_size (int): Maximum number of pooled connections to the AI API.
+            dns_ttl (int): Seconds to cache DNS lookups for.
+            keepalive_timeout (float): Seconds an idle pooled connection is kept open.
+            ssl: TLS setting passed to the connector (`True`, `False` or an `ssl.SSLContext`).
+            model (str): The model requested from the AI API.
+            max_tokens (int): Maximum number of tokens to generate.
+            temperature (float): Sampling temperature.
+            cache (ResponseCache): Optional response cache consulted before each request.
+            coalescer (RequestCoalescer): Optional single-flight deduplication of identical concurrent requests.
+            connect_timeout (float): Seconds allowed to establish a connection.
+            read_timeout (float): Seconds allowed between two reads from the socket.
+            total_timeout (float): Seconds allowed for a whole non-streaming request.
+            retry (RetryPolicy): Retry policy for 429/5xx answers and network errors; no retries if omitted.
+            breaker (CircuitBreaker): Optional circuit breaker around the upstream API.
+            hedge_percentile (float): Latency percentile after which a hedged request is sent; off if omitted.
+            hedge_min_samples (int): Latency samples required before hedging starts.
+            memory (ConversationMemory): Optional per-conversation history sent with each request.
+            summarize (bool): Whether turns that fall out of the memory budget are summarized by the AI.
+            ledger (UsageLedger): Optional token accounting and quotas.
+        """
+        self.api_key = api_key
+        self.base_url = base_url
+        self.pool_size = pool_size
+        self.dns_ttl = dns_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.ssl = ssl
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.cache = cache
+        self.coalescer = coalescer
+        self.timeout = aiohttp.ClientTimeout(total=total_timeout, connect=connect_timeout, sock_read=read_timeout)
+        # Streams legitimately run longer than any total budget, so only connect and read are bounded
+        self.stream_timeout = aiohttp.ClientTimeout(total=None, connect=connect_timeout, sock_read=read_timeout)
+        self.retry = retry or RetryPolicy(max_attempts=1)
+        self.breaker = breaker
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.memory = memory
+        self.summarize = summarize
+        self.ledger = ledger
+        self.latency = LatencyTracker()
+        self.retries = 0
+        self.hedged_requests = 0
+        self.hedge_wins = 0
+        self.malformed_events = 0
+        self._session = None
+
+    async def start(self):
+        """Opens the pooled HTTP session. Calling it again is a no-op."""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                ttl_dns_cache=self.dns_ttl,
+                keepalive_timeout=self.keepalive_timeout,
+                ssl=self.ssl,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=self.timeout,
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json"
+                },
+            )
+        if self.ledger is not None:
+            await self.ledger.start()
+
+    async def close(self):
+        """Closes the HTTP session and every pooled connection, the response cache, the memory and the ledger."""
+        if self.memory is not None:
+            self.memory.close()
+        if self.ledger is not None:
+            await self.ledger.close()
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        if self.cache is not None:
+            self.cache.close()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """The underlying session. Raises if the client has not been started."""
+        if self._session is None or self._session.closed:
+            raise RuntimeError("AIClient is not started; call `await client.start()` first.")
+        return self._session
+
+    def build_payload(self, message: str, stream: bool = False, history: list = None, max_tokens: int = None) -> dict:
+        """
+        Builds the JSON body of a chat completions request.
+
+        Args:
+            message (str): The user's input message to send to the AI.
+            stream (bool): Whether to ask the API for a server-sent event stream.
+            history (list): Earlier messages of the conversation, oldest first.
+            max_tokens (int): Lower limit on the tokens to generate than the client's own, if any.
+
+        Returns:
+            dict: The request body.
+        """
+        data = {
+            "model": self.model,
+            "messages": (history or []) + [{"role": "user", "content": message}],
+            "max_tokens": min(self.max_tokens, max_tokens) if max_tokens else self.max_tokens,
+            "temperature": self.temperature
+        }
+        if stream:
+            data["stream"] = True
+        return data
+
+    def use_cache_for(self, data: dict, use_cache: bool) -> bool:
+        """Returns whether a request goes through the response cache."""
+        return use_cache and self.cache is not None and self.cache.cacheable(data)
+
+    def cache_lookup(self, data: dict) -> dict:
+        """
+        Returns the request whose cached answer may serve `data`.
+
+        Answers cut short by a quota are not cached, but a full answer serves
+        the same request with a lower `max_tokens` for free.
+        """
+        if data["max_tokens"] == self.max_tokens:
+            return data
+        return {**data, "max_tokens": self.max_tokens}
+
+    def history(self, conversation, skip_last: bool = False) -> list:
+        """Returns the remembered messages of a conversation, or none without memory."""
+        if self.memory is None or conversation is None:
+            return []
+        return self.memory.history(conversation, skip_last=skip_last)
+
+    def remember(self, conversation, message: str, response_text: str, replace_last: bool = False):
+        """Stores a successful exchange in the conversation's memory."""
+        if self.memory is not None and conversation is not None:
+            summarize = self.summarize_turns if self.summarize else None
+            self.memory.remember(conversation, message, response_text, summarize=summarize,
+                                 replace_last=replace_last)
+
+    async def summarize_turns(self, prompt: str):
+        """Asks the AI for a summary of old conversation turns; returns None on failure."""
+        return await self.complete(prompt, use_cache=False)
+
+    async def fetch_ai_response(self, message: str, use_cache: bool = True, command: str = None, user_id=None,
+                                conversation=None, replace_last: bool = False) -> str:
+        """
+        Fetches an AI-generated response based on the given user message.
+
+        Args:
+            message (str): The user's input message to send to the AI.
+            use_cache (bool): Whether the response cache may answer or store this request.
+            command (str): The bot command that triggered the request; only used by `AIRouter`.
+            user_id: The requesting user; only used by `AIRouter`.
+            conversation: Key of the conversation whose history is sent along and extended, if any.
+            replace_last (bool): Ask the conversation's newest question again: its exchange is not sent
+                along and is replaced by the new one once the answer arrives.
+
+        Returns:
+            str: The response from the AI, or an error message if the request fails or is over quota.
+        """
+        history = self.history(conversation, skip_last=replace_last)
+        try:
+            with metered(self.ledger, conversation, user_id, message, history, self.max_tokens) as reservation:
+                response_text = await self.complete(message, use_cache=use_cache, history=history,
+                                                    max_tokens=reservation and reservation.max_tokens)
+                if reservation is not None:
+                    reservation.produced(response_text)
+        except QuotaExceeded as e:
+            print(f"{e}; refusing the request.")
+            record_error("quota")
+            return QUOTA_RESPONSE
+        if response_text is None:
+            return ERROR_RESPONSE
+        self.remember(conversation, message, response_text, replace_last)
+        return response_text
+
+    async def complete(self, message: str, use_cache: bool = True, history: list = None, max_tokens: int = None):
+        """
+        Fetches an AI-generated response, reporting failure as None instead of an error message.
+
+        Args:
+            message (str): The user's input message to send to the AI.
+            use_cache (bool): Whether the response cache may answer or store this request.
+            history (list): Earlier messages of the conversation, oldest first.
+            max_tokens (int): Lower limit on the tokens to generate than the client's own, if any.
+
+        Returns:
+            str: The response from the AI, or None if the request failed.
+        """
+        await self.start()
+        data = self.build_payload(message, history=history, max_tokens=max_tokens)
+        cached = self.use_cache_for(data, use_cache)
+        if cached:
+            response_text = self.cache.get(self.cache_lookup(data))
+            METRICS.cache.inc("miss" if response_text is None else "hit")
+            if response_text is not None:
+                # A cached answer costs no tokens
+                charge_usage({})
+                mark("ai_done")
+                return response_text
+
+        mark("ai_start")
+        if self.coalescer is not None:
+            response_text = await self.coalescer.run(make_request_key(data), lambda: self.request_completion(data))
+        else:
+            response_text = await self.request_completion(data)
+        mark("ai_done")
+        if response_text is None:
+            record_error("ai")
+        if cached and response_text is not None and data["max_tokens"] == self.max_tokens:
+            self.cache.set(data, response_text)
+        return response_text
+
+    async def request_completion(self, data: dict):
+        """
+        Sends one chat completions request upstream, retrying and hedging as configured.
+
+        Args:
+            data (dict): The request body.
+
+        Returns:
+            str: The completion text, or None if the request failed for good.
+        """
+        attempt = 0
+        while True:
+            try:
+                if self.breaker is not None:
+                    self.breaker.check()
+            except CircuitOpen as e:
+                print(f"{e}; failing fast.")
+                return None
+
+            attempt += 1
+            status, body, retry_after = None, None, None
+            try:
+                status, body, retry_after = await self.send_hedged(data)
+            except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+                print(f"AI request failed: {e!r}")
+
+            if status == 200:
+                if self.breaker is not None:
+                    self.breaker.record_success()
+                return body["choices"][0]["message"]["content"].strip()
+            if status is not None:
+                print(f"HTTP error {status}: {body}")
+                if not self.retry.is_retryable(status):
+                    # Client errors mean upstream is reachable; they are not worth retrying
+                    if self.breaker is not None:
+                        self.breaker.record_success()
+                    return None
+            if self.breaker is not None:
+                self.breaker.record_failure()
+
+            delay = self.retry.delay(attempt, retry_after)
+            if delay is None:
+                return None
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+    async def send_once(self, data: dict):
+        """
+        Posts one chat completions request.
+
+        Args:
+            data (dict): The request body.
+
+        Returns:
+            tuple: The HTTP status, the decoded JSON body (or error text) and the `Retry-After` delay.
+        """
+        started = time.monotonic()
+        async with self.session.post(self.base_url + "/chat/completions", json=data) as response:
+            mark("first_byte")
+            if response.status == 200:
+                body = await response.json()
+                self.latency.record(time.monotonic() - started)
+                record_usage(body.get("usage"))
+                charge_usage(body.get("usage"))
+                return response.status, body, None
+            error_message = await response.text()
+            return response.status, error_message, parse_retry_after(response.headers.get("Retry-After"))
+
+    def hedge_delay(self):
+        """Returns how long to wait before hedging a request, or None when hedging is off."""
+        if self.hedge_percentile is None or len(self.latency.samples) < self.hedge_min_samples:
+            return None
+        return self.latency.percentile(self.hedge_percentile)
+
+    async def send_hedged(self, data: dict):
+        """
+        Posts a chat completions request, sending a second copy if the first is unusually slow.
+
+        Whichever copy succeeds first wins and the other is cancelled. If both
+        fail, the last failure is returned or raised.
+
+        Args:
+            data (dict): The request body.
+
+        Returns:
+            tuple: See `send_once`.
+        """
+        delay = self.hedge_delay()
+        if delay is None:
+            return await self.send_once(data)
+
+        first = asyncio.ensure_future(self.send_once(data))
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+
+        self.hedged_requests += 1
+        hedge = asyncio.ensure_future(self.send_once(data))
+        pending = {first, hedge}
+        outcome = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and task.result()[0] == 200:
+                        if task is hedge:
+                            self.hedge_wins += 1
+                        return task.result()
+                    outcome = task
+        finally:
+            for task in pending:
+                task.cancel()
+        return outcome.result()
+
+    def stats(self) -> dict:
+        """Returns retry, hedging, latency and circuit breaker figures for the AI backend."""
+        return {
+            "retries": self.retries,
+            "hedged_requests": self.hedged_requests,
+            "hedge_wins": self.hedge_wins,
+            "malformed_events": self.malformed_events,
+            "latency_p50": self.latency.percentile(50),
+            "latency_p95": self.latency.percentile(95),
+            "breaker": self.breaker.stats() if self.breaker is not None else None,
+            "usage": self.ledger.stats() if self.ledger is not None else None,
+        }
+
+    async def stream_ai_response(self, message: str, use_cache: bool = True, command: str = None, user_id=None,
+                                 conversation=None, replace_last: bool = False):
+        """
+        Streams an AI-generated response as it is generated.
+
+        Args:
+            message (str): The user's input message to send to the AI.
+            use_cache (bool): Whether the response cache may answer or store this request.
+            command (str): The bot command that triggered the request; only used by `AIRouter`.
+            user_id: The requesting user; only used by `AIRouter`.
+            conversation: Key of the conversation whose history is sent along and extended, if any.
+            replace_last (bool): Ask the conversation's newest question again: its exchange is not sent
+                along and is replaced by the new one once the answer arrives.
+
+        Yields:
+            str: The next fragment of the response, or a single error message if the request fails or is over quota.
+        """
+        history = self.history(conversation, skip_last=replace_last)
+        fragments = []
+        try:
+            with metered(self.ledger, conversation, user_id, message, history, self.max_tokens) as reservation:
+                async for fragment in self.stream_completion(message, use_cache=use_cache, history=history,
+                                                             max_tokens=reservation and reservation.max_tokens):
+                    fragments.append(fragment)
+                    yield fragment
+                if reservation is not None and fragments != [ERROR_RESPONSE]:
+                    reservation.produced("".join(fragments))
+        except QuotaExceeded as e:
+            print(f"{e}; refusing the request.")
+            record_error("quota")
+            yield QUOTA_RESPONSE
+            return
+        response_text = "".join(fragments).strip()
+        if response_text and response_text != ERROR_RESPONSE:
+            self.remember(conversation, message, response_text, replace_last)
+
+    async def stream_completion(self, message: str, use_cache: bool = True, history: list = None,
+                                max_tokens: int = None):
+        """
+        Streams an AI-generated response without touching the conversation memory.
+
+        Consumes the server-sent event stream of the chat completions endpoint and
+        yields text fragments in order. Leading whitespace of the completion is
+        dropped, matching `fetch_ai_response`.
+
+        Args:
+            message (str): The user's input message to send to the AI.
+            use_cache (bool): Whether the response cache may answer or store this request.
+            history (list): Earlier messages of the conversation, oldest first.
+            max_tokens (int): Lower limit on the tokens to generate than the client's own, if any.
+
+        Yields:
+            str: The next fragment of the response, or a single error message if the request fails or brings no content.
+        """
+        await self.start()
+        data = self.build_payload(message, stream=True, history=history, max_tokens=max_tokens)
+        cached = self.use_cache_for(data, use_cache)
+        if cached:
+            response_text = self.cache.get(self.cache_lookup(data))
+            METRICS.cache.inc("miss" if response_text is None else "hit")
+            if response_text is not None:
+                charge_usage({})
+                mark("ai_done")
+                yield response_text
+                return
+        fragments = []
+
+        try:
+            if self.breaker is not None:
+                self.breaker.check()
+        except CircuitOpen as e:
+            print(f"{e}; failing fast.")
+            record_error("ai")
+            yield ERROR_RESPONSE
+            return
+
+        mark("ai_start")
+        try:
+            url = self.base_url + "/chat/completions"
+            async with self.session.post(url, json=data, timeout=self.stream_timeout) as response:
+                if response.status != 200:
+                    error_message = await response.text()
+                    print(f"HTTP error {response.status}: {error_message}")
+                    if self.breaker is not None:
+                        if self.retry.is_retryable(response.status):
+                            self.breaker.record_failure()
+                        else:
+                            self.breaker.record_success()
+                    record_error("ai")
+                    yield ERROR_RESPONSE
+                    return
+                if self.breaker is not None:
+                    self.breaker.record_success()
+
+                started = False
+                async for line in response.content:
+                    line = line.strip()
+                    # Skip blank separators and SSE comments such as ": OPENROUTER PROCESSING"
+                    if not line.startswith(b"data:"):
+                        continue
+                    payload = line[len(b"data:"):].strip()
+                    if payload == b"[DONE]":
+                        break
+                    try:
+                        chunk = json.loads(payload)
+                    except ValueError:
+                        # A truncated or garbled event loses its fragment, not the whole answer
+                        self.malformed_events += 1
+                        continue
+                    # Some providers report usage on the last event, some never do in a stream
+                    record_usage(chunk.get("usage"))
+                    charge_usage(chunk.get("usage"))
+                    if not chunk.get("choices"):
+                        continue
+                    text = chunk["choices"][0].get("delta", {}).get("content") or ""
+                    if not started:
+                        text = text.lstrip()
+                        started = bool(text)
+                        if started:
+                            mark("first_byte")
+                    if text:
+                        fragments.append(text)
+                        yield text
+        except (asyncio.TimeoutError, aiohttp.ClientError, ValueError) as e:
+            print(f"AI stream failed: {e!r}")
+            if self.breaker is not None:
+                self.breaker.record_failure()
+            record_error("ai")
+            if not fragments:
+                yield ERROR_RESPONSE
+            return
+
+        mark("ai_done")
+        if not fragments:
+            # Nothing would replace "Thinking...", and an empty answer must not be cached
+            print("AI stream ended without any content")
+            record_error("ai")
+            yield ERROR_RESPONSE
+            return
+        if cached and data["max_tokens"] == self.max_tokens:
+            self.cache.set(data, "".join(fragments).strip())
+
+
+def ai_client_settings_from_env() -> dict:
+    """
+    Reads the AI client settings from environment variables.
+
+    Covers `OPEN_ROUTER_API_KEY`, `AI_POOL_SIZE`, `AI_MAX_TOKENS` and `AI_TEMPERATURE`, the
+    response cache (see `response_cache_from_env`), `AI_COALESCE`, the
+    timeouts `AI_CONNECT_TIMEOUT`, `AI_READ_TIMEOUT` and `AI_TIMEOUT`,
+    `AI_MAX_ATTEMPTS`, the circuit breaker's `AI_BREAKER_THRESHOLD` and
+    `AI_BREAKER_RESET`, `AI_HEDGE_PERCENTILE` (hedging is off unless set),
+    the conversation memory (see `conversation_memory_from_env`) and
+    `AI_MEMORY_SUMMARIZE`. Each call returns fresh cache, coalescer, retry,
+    breaker and memory objects.
+
+    Returns:
+        dict: Keyword arguments for `AIClient`.
+    """
+    hedge_percentile = os.getenv("AI_HEDGE_PERCENTILE")
+    return dict(
+        api_key=os.getenv("OPEN_ROUTER_API_KEY"),
+        pool_size=int(os.getenv("AI_POOL_SIZE", "100")),
+        max_tokens=int(os.getenv("AI_MAX_TOKENS", "1000")),
+        temperature=float(os.getenv("AI_TEMPERATURE", "1.0")),
+        cache=response_cache_from_env(),
+        coalescer=RequestCoalescer() if os.getenv("AI_COALESCE", "1") == "1" else None,
+        connect_timeout=float(os.getenv("AI_CONNECT_TIMEOUT", "5")),
+        read_timeout=float(os.getenv("AI_READ_TIMEOUT", "30")),
+        total_timeout=float(os.getenv("AI_TIMEOUT", "60")),
+        retry=RetryPolicy(max_attempts=int(os.getenv("AI_MAX_ATTEMPTS", "3"))),
+        breaker=CircuitBreaker(
+            failure_threshold=int(os.getenv("AI_BREAKER_THRESHOLD", "5")),
+            reset_timeout=float(os.getenv("AI_BREAKER_RESET", "30")),
+        ),
+        hedge_percentile=float(hedge_percentile) if hedge_percentile else None,
+        memory=conversation_memory_from_env(),
+        summarize=os.getenv("AI_MEMORY_SUMMARIZE", "0") == "1",
+    )
+
+
+def ai_client_from_env():
+    """
+    Builds the AI backend configured through environment variables.
+
+    With `AI_ROUTES` pointing at a routing file an `AIRouter` over several
+    backends is returned (see `router_from_config`), otherwise a single
+    `AIClient` configured by `ai_client_settings_from_env`. Either bills
+    requests to the ledger of `usage_ledger_from_env`.
+
+    Returns:
+        AIClient | AIRouter: The configured, not yet started, backend.
+    """
+    routes = os.getenv("AI_ROUTES")
+    if routes:
+        # Imported here because the router module builds on AIClient
+        from .router import router_from_config
+        return router_from_config(routes, ai_client_settings_from_env)
+    return AIClient(**ai_client_settings_from_env(), ledger=usage_ledger_from_env())
@@ -0,0 +1,221 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Optional
+
+# Leading argument that makes /ask and /call skip the response cache
+BYPASS_FLAG = "--fresh"
+
+
+def make_cache_key(payload: dict) -> str:
+    """
+    Builds a cache key from a chat completions request body.
+
+    Every message is normalized (case-folded, whitespace collapsed) so
+    trivially different spellings of the same question share an entry; the
+    whole conversation history is part of the key, so a follow-up is only
+    answered from the cache after the same earlier turns. The model,
+    temperature and max_tokens are part of the key as given.
+
+    Args:
+        payload (dict): The request body built by `AIClient.build_payload`.
+
+    Returns:
+        str: A hex digest identifying the request.
+    """
+    messages = [[m["role"], " ".join(m["content"].split()).casefold()] for m in payload["messages"]]
+    material = json.dumps(
+        [messages, payload["model"], payload["temperature"], payload["max_tokens"]],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+def strip_bypass_flag(text: str):
+    """
+    Removes a leading `--fresh` flag from a command's text.
+
+    Args:
+        text (str): The text following the command.
+
+    Returns:
+        tuple: The remaining text and whether the cache may be used.
+    """
+    head, _, rest = text.strip().partition(" ")
+    if head == BYPASS_FLAG:
+        return rest.strip(), False
+    return text, True
+
+
+class MemoryCacheBackend:
+    """An in-process LRU store whose entries expire after a TTL."""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600.0):
+        """
+        Args:
+            max_entries (int): Number of entries kept before the least recently used is evicted.
+            ttl (float): Seconds an entry stays valid.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: str):
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def close(self):
+        self.entries.clear()
+
+
+class SQLiteCacheBackend:
+    """An on-disk store so cached responses survive restarts."""
+
+    def __init__(self, path: str, max_entries: int = 100_000, ttl: float = 86400.0):
+        """
+        Args:
+            path (str): Location of the SQLite database file.
+            max_entries (int): Number of entries kept before the least recently used are pruned.
+            ttl (float): Seconds an entry stays valid.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.writes = 0
+        self.connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, used_at REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS responses_used_at ON responses (used_at)")
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        row = self.connection.execute(
+            "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at < now:
+            self.connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+            return None
+        self.connection.execute("UPDATE responses SET used_at = ? WHERE key = ?", (now, key))
+        return value
+
+    def set(self, key: str, value: str):
+        now = time.time()
+        self.connection.execute(
+            "INSERT OR REPLACE INTO responses (key, value, expires_at, used_at) VALUES (?, ?, ?, ?)",
+            (key, value, now + self.ttl, now),
+        )
+        # Counting rows is a table scan, so pruning runs every few hundred writes
+        self.writes += 1
+        if self.writes % 256 == 0:
+            self.prune()
+
+    def prune(self):
+        """Deletes expired entries and the least recently used ones above `max_entries`."""
+        self.connection.execute("DELETE FROM responses WHERE expires_at < ?", (time.time(),))
+        overflow = len(self) - self.max_entries
+        if overflow > 0:
+            self.connection.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY used_at LIMIT ?)",
+                (overflow,),
+            )
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+
+class ResponseCache:
+    """
+    A response cache placed in front of the AI call.
+
+    Wraps a storage backend, keeps hit/miss counters and decides which
+    requests may be cached. By default only deterministic requests
+    (temperature 0) are cached, since sampled answers differ per call.
+    """
+
+    def __init__(self, backend, deterministic_only: bool = True):
+        """
+        Args:
+            backend: A `MemoryCacheBackend`, `SQLiteCacheBackend` or any object with `get`/`set`/`close`.
+            deterministic_only (bool): Only cache requests made with temperature 0.
+        """
+        self.backend = backend
+        self.deterministic_only = deterministic_only
+        self.hits = 0
+        self.misses = 0
+
+    def cacheable(self, payload: dict) -> bool:
+        """Returns whether a request may be served from or stored in the cache."""
+        return not self.deterministic_only or payload["temperature"] == 0
+
+    def get(self, payload: dict) -> Optional[str]:
+        """Looks up a cached response for a request, counting the hit or miss."""
+        value = self.backend.get(make_cache_key(payload))
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, payload: dict, response: str):
+        """Stores the response to a request."""
+        self.backend.set(make_cache_key(payload), response)
+
+    def stats(self) -> dict:
+        """Returns the hit and miss counters and the number of stored entries."""
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.backend)}
+
+    def close(self):
+        self.backend.close()
+
+
+def response_cache_from_env() -> Optional[ResponseCache]:
+    """
+    Builds the response cache configured through environment variables.
+
+    `AI_CACHE` selects the backend (`off`, `memory` or `sqlite`, default
+    `off`); `AI_CACHE_PATH`, `AI_CACHE_SIZE` and `AI_CACHE_TTL` tune it and
+    `AI_CACHE_ANY_TEMPERATURE=1` also caches non-deterministic requests.
+
+    Returns:
+        ResponseCache: The configured cache, or None when caching is off.
+    """
+    kind = os.getenv("AI_CACHE", "off")
+    if kind == "off":
+        return None
+    max_entries = int(os.getenv("AI_CACHE_SIZE", "1024"))
+    ttl = float(os.getenv("AI_CACHE_TTL", "3600"))
+    if kind == "memory":
+        backend = MemoryCacheBackend(max_entries=max_entries, ttl=ttl)
+    elif kind == "sqlite":
+        backend = SQLiteCacheBackend(os.getenv("AI_CACHE_PATH", "ai_cache.sqlite3"), max_entries=max_entries, ttl=ttl)
+    else:
+        raise ValueError(f"Unknown AI_CACHE backend: {kind!r}")
+    return ResponseCache(backend, deterministic_only=os.getenv("AI_CACHE_ANY_TEMPERATURE", "0") != "1")
@@ -0,0 +1,239 @@
+import asyncio
+import re
+import unicodedata
+from .metrics import mark
+
+# Characters Telegram counts twice: its limits are in UTF-16 code units, and these need a surrogate pair
+ASTRAL = re.compile("[\U00010000-\U0010ffff]")
+# Characters Twitter counts twice: everything outside Latin and a few punctuation ranges, emoji included
+TWITTER_HEAVY = re.compile("[^\u0000-\u10ff\u2000-\u200d\u2010-\u201f\u2032-\u2037]")
+# A line opening or closing a Markdown code block
+FENCE = re.compile(r"^ {0,3}(`{3,}|~{3,})[^\n]*$", re.MULTILINE)
+# The end of a sentence: terminal punctuation, optionally closed by a quote or bracket, then whitespace
+SENTENCE_END = re.compile("[.!?\u2026\u3002\uff01\uff1f][\"')\\]\u201d\u2019]*(?=\\s)")
+# Characters that belong to the character before them
+JOINERS = "\u200d\ufe0e\ufe0f"
+# Room kept in every message for closing a code block that has to be split
+FENCE_RESERVE = 8
+
+
+class MessageLimits:
+    """
+    How long a platform's messages may be and how their length is counted.
+
+    A message's length is its number of code points plus one for every
+    character matching `heavy`, so no character counts more than twice.
+    """
+
+    def __init__(self, limit: int, heavy: re.Pattern = None, markdown: bool = True):
+        """
+        Args:
+            limit (int): Maximum message length.
+            heavy (re.Pattern): Characters counting twice towards the limit, if any.
+            markdown (bool): Whether the platform renders code blocks, which are then re-opened across messages.
+        """
+        self.limit = limit
+        self.heavy = heavy
+        self.markdown = markdown
+
+    def measure(self, text: str) -> int:
+        """Returns the length of `text` as the platform counts it."""
+        if self.heavy is None or text.isascii():
+            return len(text)
+        return len(text) + len(self.heavy.findall(text))
+
+
+DISCORD = MessageLimits(2000)
+# Telegram counts message length in UTF-16 code units
+TELEGRAM = MessageLimits(4096, heavy=ASTRAL)
+# Tweets are plain text, and Twitter counts emoji and CJK characters twice
+TWITTER = MessageLimits(280, heavy=TWITTER_HEAVY, markdown=False)
+
+
+def code_blocks(text: str) -> list:
+    """
+    Finds the fenced code blocks of a Markdown text.
+
+    Args:
+        text (str): The Markdown text.
+
+    Returns:
+        list: `(body_start, body_end, opening_line, marker)` per block; an unclosed block ends with the text.
+    """
+    blocks = []
+    opening = None
+    for match in FENCE.finditer(text):
+        line = match.group(0).strip()
+        marker = match.group(1)
+        if opening is None:
+            opening = (match.end() + 1, line, marker)
+        elif line == marker and marker[0] == opening[2][0] and len(marker) >= len(opening[2]):
+            blocks.append((opening[0], match.start(), opening[1], opening[2]))
+            opening = None
+    if opening is not None:
+        blocks.append((opening[0], len(text), opening[1], opening[2]))
+    return blocks
+
+
+def splits_cluster(text: str, index: int) -> bool:
+    """Checks whether cutting `text` before `index` would split an accented character or an emoji sequence."""
+    following = text[index]
+    return bool(unicodedata.combining(following) or following in JOINERS
+                or "\U0001f3fb" <= following <= "\U0001f3ff" or text[index - 1] == "\u200d")
+
+
+class MessageChunker:
+    """
+    Splits a long response into messages that fit a platform's limit.
+
+    Each message ends at the last paragraph break, line break, sentence end
+    or space in the second half of the allowed length, in that order of
+    preference. Only when there is none is the text cut hard, and never
+    inside an accented character or an emoji sequence. A code block cut in
+    two is closed at the end of one message and re-opened, with its
+    language, at the start of the next.
+
+    Every cut only looks at the next message's worth of text, so splitting
+    takes time linear in the length of the response.
+    """
+
+    def __init__(self, limits: MessageLimits, reserve: int = 0):
+        """
+        Args:
+            limits (MessageLimits): The platform's message limits.
+            reserve (int): Length kept free in every message, e.g. for a mention prefix.
+        """
+        self.limits = limits
+        self.budget = limits.limit - reserve
+        if self.budget <= 2 * FENCE_RESERVE:
+            raise ValueError("The reserve leaves no room for text.")
+
+    def fit(self, text: str, start: int, budget: int) -> int:
+        """Returns the furthest end such that `text[start:end]` counts at most `budget`."""
+        end = min(len(text), start + budget)
+        while True:
+            over = self.limits.measure(text[start:end]) - budget
+            if over <= 0:
+                return end
+            # No character counts more than twice, so this never cuts off more than needed
+            end -= (over + 1) // 2
+
+    def cut(self, text: str, start: int, end: int) -> tuple:
+        """
+        Picks where a message starting at `start` and ending by `end` at the latest ends.
+
+        Args:
+            text (str): The full response.
+            start (int): Where the message's text starts.
+            end (int): The furthest the message's text may reach.
+
+        Returns:
+            tuple: Where the message's text ends and where the next message's text starts.
+        """
+        window = text[start:end]
+        floor = len(window) // 2
+        index = window.rfind("\n\n")
+        if index >= floor:
+            return start + index, start + index + 2
+        index = window.rfind("\n")
+        if index >= floor:
+            return start + index, start + index + 1
+        last = None
+        for last in SENTENCE_END.finditer(window, floor):
+            pass
+        if last is not None:
+            return start + last.end(), start + last.end() + 1
+        index = max(window.rfind(" "), window.rfind("\t"))
+        if index >= floor:
+            return start + index, start + index + 1
+        while end - start > 1 and splits_cluster(text, end):
+            end -= 1
+        return end, end
+
+    def split(self, text: str):
+        """
+        Yields the messages `text` is split into, lazily, so the first can be sent while the rest is cut.
+
+        Args:
+            text (str): The full response.
+
+        Yields:
+            str: Messages within the limit; a text that fits is yielded unchanged.
+        """
+        if len(text) <= self.budget and self.limits.measure(text) <= self.budget:
+            yield text
+            return
+        blocks = code_blocks(text) if self.limits.markdown else []
+        reserve = FENCE_RESERVE if blocks else 0
+        block = 0
+        prefix = ""
+        start = 0
+        while start < len(text):
+            budget = self.budget - self.limits.measure(prefix)
+            if len(text) - start <= budget and self.fit(text, start, budget) == len(text):
+                chunk = (prefix + text[start:]).rstrip()
+                if chunk:
+                    yield chunk
+                return
+            end, following = self.cut(text, start, self.fit(text, start, budget - reserve))
+            while block < len(blocks) and blocks[block][1] <= end:
+                block += 1
+            if block < len(blocks) and blocks[block][0] <= end:
+                body_start, body_end, opening, marker = blocks[block]
+                chunk = prefix + text[start:end].rstrip("\n") + "\n" + marker
+                prefix = opening + "\n"
+                if following >= body_end:
+                    # Only the closing line is left, and the close just added replaces it
+                    closing_end = text.find("\n", body_end)
+                    following = len(text) if closing_end < 0 else closing_end + 1
+                    prefix = ""
+            else:
+                chunk = (prefix + text[start:end]).rstrip()
+                prefix = ""
+                while following < len(text) and text[following] in " \t\n":
+                    following += 1
+            if chunk.strip():
+                yield chunk
+            start = following
+
+
+def split_message(text: str, limits: MessageLimits, reserve: int = 0) -> list:
+    """
+    Splits a response into messages that fit a platform's limit, see `MessageChunker`.
+
+    Args:
+        text (str): The full response.
+        limits (MessageLimits): The platform's message limits.
+        reserve (int): Length kept free in every message, e.g. for a mention prefix.
+
+    Returns:
+        list: The messages, in order.
+    """
+    return list(MessageChunker(limits, reserve).split(text))
+
+
+async def deliver_chunks(chunks, edit, send):
+    """
+    Shows the first chunk in the placeholder message and sends the rest as follow-up messages.
+
+    The placeholder is edited while the follow-ups go out, since it already
+    sits above them in the chat; the follow-ups themselves are sent in
+    order. Pacing them is left to the platform's outbound scheduler. Each
+    delivered chunk is marked on the current request's trace.
+
+    Args:
+        chunks: The messages, e.g. `MessageChunker.split(response)`.
+        edit: Coroutine function `edit(text)` that replaces the placeholder's text.
+        send: Coroutine function `send(text)` that sends a follow-up message.
+    """
+    async def deliver(deliver_one, chunk):
+        await deliver_one(chunk)
+        mark("chunk_delivered")
+
+    chunks = iter(chunks)
+    editing = asyncio.ensure_future(deliver(edit, next(chunks)))
+    try:
+        for chunk in chunks:
+            await deliver(send, chunk)
+    finally:
+        await editing
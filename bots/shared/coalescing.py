@@ -0,0 +1,63 @@
+import asyncio
+import json
+
+
+def make_request_key(payload: dict) -> str:
+    """
+    Builds a key identifying identical requests for coalescing.
+
+    Unlike the cache key the messages are not normalized: only byte-identical
+    requests share an upstream call.
+
+    Args:
+        payload (dict): The request body built by `AIClient.build_payload`.
+
+    Returns:
+        str: The canonical JSON encoding of the request.
+    """
+    return json.dumps(payload, sort_keys=True, ensure_ascii=False)
+
+
+class RequestCoalescer:
+    """
+    Single-flight deduplication of identical concurrent requests.
+
+    The first caller for a key starts the upstream call; callers arriving
+    while it is still in flight await the same task instead of issuing their
+    own. The shared task is shielded, so a caller that is cancelled does not
+    cancel the request for the others.
+    """
+
+    def __init__(self):
+        self.in_flight = {}
+        self.upstream_calls = 0
+        self.coalesced_calls = 0
+
+    async def run(self, key: str, request):
+        """
+        Runs `request()` unless an identical request is already in flight.
+
+        Args:
+            key (str): Identifies the request, see `make_request_key`.
+            request: Coroutine function performing the upstream call.
+
+        Returns:
+            The result of the (possibly shared) upstream call.
+        """
+        task = self.in_flight.get(key)
+        if task is None:
+            self.upstream_calls += 1
+            task = asyncio.ensure_future(request())
+            self.in_flight[key] = task
+            task.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        else:
+            self.coalesced_calls += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        """Returns the upstream call count, the number of calls saved and the requests in flight."""
+        return {
+            "upstream_calls": self.upstream_calls,
+            "coalesced_calls": self.coalesced_calls,
+            "in_flight": len(self.in_flight),
+        }
@@ -0,0 +1,409 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from typing import Optional
+from .metrics import trace_request
+from .scheduler import PRIORITY_COMMAND
+
+# Sent in place of an answer when a job was interrupted too long ago to be worth resuming
+INTERRUPTED_MESSAGE = "Sorry, this request was interrupted by a restart. Please ask again."
+
+
+class Job:
+    """One queued AI request and where to deliver its answer."""
+
+    __slots__ = ("id", "platform", "target", "prompt", "options", "priority", "attempts", "created_at")
+
+    def __init__(self, id: int, platform: str, target: dict, prompt: str, options: dict, priority: int,
+                 attempts: int, created_at: float):
+        self.id = id
+        self.platform = platform
+        self.target = target
+        self.prompt = prompt
+        self.options = options
+        self.priority = priority
+        self.attempts = attempts
+        self.created_at = created_at
+
+    @classmethod
+    def from_row(cls, row) -> "Job":
+        job_id, platform, target, prompt, options, priority, attempts, created_at = row
+        options = json.loads(options)
+        # JSON has no tuples, but conversation keys must be hashable
+        if isinstance(options.get("conversation"), list):
+            options["conversation"] = tuple(options["conversation"])
+        return cls(job_id, platform, json.loads(target), prompt, options, priority, attempts, created_at)
+
+
+class JobStore:
+    """
+    A durable queue of AI jobs in a SQLite database in WAL mode.
+
+    Jobs move from `queued` to `running` when a worker claims them and end up
+    `done` or `failed`. Claiming is one write transaction, and jobs still
+    `running` when the process died are found again on the next start.
+    Finished jobs are kept for `keep_finished` seconds.
+
+    Claiming and recovery can be limited to some platforms, so a pipeline
+    never takes jobs it has no deliverer for. One process should still own
+    a store file, since recovery treats every `running` job of its
+    platforms as interrupted; `job_pipeline_from_env` gives each bot and
+    shard its own file.
+    """
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    COLUMNS = "id, platform, target, prompt, options, priority, attempts, created_at"
+
+    def __init__(self, path: str, keep_finished: float = 3600.0):
+        """
+        Args:
+            path (str): Location of the SQLite database file.
+            keep_finished (float): Seconds finished jobs are kept before they are pruned.
+        """
+        self.keep_finished = keep_finished
+        self.finished = 0
+        self.connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # Losing the last few transitions on power loss is fine; recovery sorts them out
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, platform TEXT NOT NULL, target TEXT NOT NULL, "
+            "prompt TEXT NOT NULL, options TEXT NOT NULL, priority INTEGER NOT NULL, state TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, priority, id)")
+
+    def enqueue(self, platform: str, target: dict, prompt: str, priority: int = PRIORITY_COMMAND,
+                options: dict = None) -> int:
+        """
+        Adds a job to the queue.
+
+        Args:
+            platform (str): The platform whose deliverer sends the answer, e.g. "telegram".
+            target (dict): JSON-serializable reference to the message to answer.
+            prompt (str): The user's message for the AI.
+            priority (int): `PRIORITY_COMMAND` or `PRIORITY_MESSAGE`; lower runs first.
+            options (dict): Keyword arguments for `fetch_ai_response`.
+
+        Returns:
+            int: The job's id.
+        """
+        now = time.time()
+        cursor = self.connection.execute(
+            "INSERT INTO jobs (platform, target, prompt, options, priority, state, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (platform, json.dumps(target), prompt, json.dumps(options or {}), priority, self.QUEUED, now, now),
+        )
+        return cursor.lastrowid
+
+    @staticmethod
+    def platform_filter(platforms) -> tuple:
+        """Returns the SQL condition and parameters limiting a query to `platforms`; no limit if None."""
+        if platforms is None:
+            return "", ()
+        platforms = tuple(platforms)
+        return f" AND platform IN ({', '.join('?' * len(platforms))})", platforms
+
+    def claim(self, platforms=None) -> Optional[Job]:
+        """
+        Marks the most urgent queued job as running and returns it, or None if the queue is empty.
+
+        Args:
+            platforms: Only claim jobs of these platforms; any platform if None.
+        """
+        condition, parameters = self.platform_filter(platforms)
+        # UPDATE ... RETURNING needs SQLite 3.35; a write transaction keeps the SELECT and UPDATE atomic instead
+        with self.connection:
+            self.connection.execute("BEGIN IMMEDIATE")
+            row = self.connection.execute(
+                f"SELECT {self.COLUMNS} FROM jobs WHERE state = ?{condition} ORDER BY priority, id LIMIT 1",
+                (self.QUEUED, *parameters),
+            ).fetchone()
+            if row is None:
+                return None
+            self.connection.execute(
+                "UPDATE jobs SET state = ?, attempts = attempts + 1, updated_at = ? WHERE id = ? AND state = ?",
+                (self.RUNNING, time.time(), row[0], self.QUEUED),
+            )
+        job = Job.from_row(row)
+        job.attempts += 1
+        return job
+
+    def finish(self, job_id: int, ok: bool = True):
+        """Marks a job as done, or as failed for good."""
+        self.connection.execute(
+            "UPDATE jobs SET state = ?, updated_at = ? WHERE id = ?",
+            (self.DONE if ok else self.FAILED, time.time(), job_id),
+        )
+        # Pruning scans the table, so it runs every few hundred finished jobs
+        self.finished += 1
+        if self.finished % 256 == 0:
+            self.prune()
+
+    def requeue(self, job_id: int):
+        """Puts a job back in the queue to be tried again."""
+        self.connection.execute(
+            "UPDATE jobs SET state = ?, updated_at = ? WHERE id = ?", (self.QUEUED, time.time(), job_id)
+        )
+
+    def interrupted(self, platforms=None) -> list:
+        """Returns the jobs of `platforms`, or of all, that were running when the previous process stopped."""
+        condition, parameters = self.platform_filter(platforms)
+        rows = self.connection.execute(
+            f"SELECT {self.COLUMNS} FROM jobs WHERE state = ?{condition} ORDER BY id", (self.RUNNING, *parameters)
+        ).fetchall()
+        return [Job.from_row(row) for row in rows]
+
+    def stale(self, older_than: float, platforms=None) -> list:
+        """Returns queued jobs of `platforms`, or of all, created more than `older_than` seconds ago."""
+        condition, parameters = self.platform_filter(platforms)
+        rows = self.connection.execute(
+            f"SELECT {self.COLUMNS} FROM jobs WHERE state = ? AND created_at < ?{condition} ORDER BY id",
+            (self.QUEUED, time.time() - older_than, *parameters),
+        ).fetchall()
+        return [Job.from_row(row) for row in rows]
+
+    def prune(self):
+        """Deletes finished jobs older than `keep_finished`."""
+        self.connection.execute(
+            "DELETE FROM jobs WHERE state IN (?, ?) AND updated_at < ?",
+            (self.DONE, self.FAILED, time.time() - self.keep_finished),
+        )
+
+    def counts(self, platforms=None) -> dict:
+        """Returns the number of jobs of `platforms`, or of all, in each state."""
+        condition, parameters = self.platform_filter(platforms)
+        counts = {state: 0 for state in (self.QUEUED, self.RUNNING, self.DONE, self.FAILED)}
+        query = f"SELECT state, COUNT(*) FROM jobs WHERE 1{condition} GROUP BY state"
+        for state, count in self.connection.execute(query, parameters):
+            counts[state] = count
+        return counts
+
+    def close(self):
+        self.connection.close()
+
+
+class JobPipeline:
+    """
+    Runs queued AI jobs on a pool of async workers, decoupled from the bots' handlers.
+
+    Handlers send a "Thinking..." message, `submit` a job referencing it and
+    return. Workers claim jobs from the durable `JobStore`, fetch the AI
+    answer and hand it to the deliverer registered for the job's platform,
+    which edits the "Thinking..." message. Ingestion and generation thus
+    scale separately, and jobs survive a restart: on `start`, interrupted
+    jobs are resumed, or answered with `INTERRUPTED_MESSAGE` when they are
+    older than `max_age`.
+    """
+
+    def __init__(self, store: JobStore, ai_client, scheduler=None, workers: int = 8, max_attempts: int = 3,
+                 max_age: float = 600.0, poll_interval: float = 1.0):
+        """
+        Args:
+            store (JobStore): Where jobs are kept.
+            ai_client (AIClient): The AI client answering the jobs.
+            scheduler (RequestScheduler): Optional scheduler whose concurrency cap and lanes the workers respect.
+            workers (int): Number of jobs processed concurrently.
+            max_attempts (int): Attempts per job before it is marked as failed.
+            max_age (float): Seconds after which an interrupted job is given up instead of resumed.
+            poll_interval (float): Seconds idle workers wait before looking at the store again.
+        """
+        self.store = store
+        self.ai_client = ai_client
+        self.scheduler = scheduler
+        self.worker_count = workers
+        self.max_attempts = max_attempts
+        self.max_age = max_age
+        self.poll_interval = poll_interval
+        self.deliverers = {}
+        self.workers = []
+        self.wakeup = asyncio.Event()
+        self.stopping = False
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.resumed = 0
+        self.abandoned = 0
+
+    def register(self, platform: str, deliver):
+        """
+        Sets how answers for a platform are delivered.
+
+        Args:
+            platform (str): The platform name used in `submit`.
+            deliver: Coroutine function taking the job's target and the answer text.
+        """
+        self.deliverers[platform] = deliver
+
+    def submit(self, platform: str, target: dict, prompt: str, priority: int = PRIORITY_COMMAND, **options) -> int:
+        """
+        Queues a job and wakes an idle worker.
+
+        Args:
+            platform (str): The platform whose deliverer sends the answer.
+            target (dict): JSON-serializable reference to the message to answer.
+            prompt (str): The user's message for the AI.
+            priority (int): `PRIORITY_COMMAND` or `PRIORITY_MESSAGE`.
+            **options: Keyword arguments for `fetch_ai_response`, e.g. `use_cache` or `conversation`.
+
+        Returns:
+            int: The job's id.
+        """
+        job_id = self.store.enqueue(platform, target, prompt, priority, options)
+        self.submitted += 1
+        self.wakeup.set()
+        return job_id
+
+    async def start(self):
+        """Recovers jobs left by the previous process and starts the workers."""
+        await self.recover()
+        self.stopping = False
+        self.workers = [asyncio.create_task(self.worker()) for _ in range(self.worker_count)]
+
+    async def recover(self):
+        """Requeues the registered platforms' recent interrupted jobs and gives up on old ones, telling their users."""
+        platforms = tuple(self.deliverers)
+        for job in self.store.interrupted(platforms):
+            self.store.requeue(job.id)
+        for job in self.store.stale(self.max_age, platforms):
+            self.abandoned += 1
+            self.store.finish(job.id, ok=False)
+            deliver = self.deliverers.get(job.platform)
+            if deliver is None:
+                continue
+            try:
+                await deliver(job.target, INTERRUPTED_MESSAGE)
+            except Exception as e:
+                # The message may be gone or, on Discord, its interaction expired
+                print(f"Failed to clean up interrupted job {job.id}: {e}")
+        self.resumed = self.store.counts(platforms)[JobStore.QUEUED]
+        if self.resumed or self.abandoned:
+            print(f"Resuming {self.resumed} queued jobs; gave up on {self.abandoned} stale ones.")
+        self.wakeup.set()
+
+    async def worker(self):
+        """Processes jobs until the pipeline stops."""
+        while not self.stopping:
+            # Cleared before claiming, so a submit in between still wakes this worker
+            self.wakeup.clear()
+            # Only jobs this process can deliver; another bot sharing the store takes the rest
+            job = self.store.claim(tuple(self.deliverers))
+            if job is None:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self.process(job)
+
+    async def process(self, job: Job):
+        """Fetches the answer to one job and delivers it."""
+        deliver = self.deliverers.get(job.platform)
+        if deliver is None:
+            print(f"No deliverer for {job.platform} jobs; job {job.id} failed.")
+            self.store.finish(job.id, ok=False)
+            self.failed += 1
+            return
+        try:
+            # Traced from when a worker picks the job up; the handler's trace ended at submit time
+            with trace_request(job.platform, job.options.get("command")):
+                if self.scheduler is not None:
+                    # Per-user and per-chat limits were applied at submit time; only the cap and lanes apply here
+                    async with self.scheduler.slot(priority=job.priority):
+                        response = await self.ai_client.fetch_ai_response(job.prompt, **job.options)
+                else:
+                    response = await self.ai_client.fetch_ai_response(job.prompt, **job.options)
+                await deliver(job.target, response)
+        except Exception as e:
+            print(f"Job {job.id} failed on attempt {job.attempts}: {e!r}")
+            if job.attempts < self.max_attempts:
+                self.store.requeue(job.id)
+                self.wakeup.set()
+            else:
+                self.store.finish(job.id, ok=False)
+                self.failed += 1
+            return
+        self.store.finish(job.id)
+        self.completed += 1
+
+    async def stop(self):
+        """Lets the workers finish their current jobs, then stops them; queued jobs stay in the store."""
+        self.stopping = True
+        self.wakeup.set()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    async def close(self):
+        """Stops the workers and closes the store."""
+        await self.stop()
+        self.store.close()
+
+    def stats(self) -> dict:
+        """Returns job counts by state and the pipeline's counters."""
+        return {
+            "jobs": self.store.counts(),
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "resumed": self.resumed,
+            "abandoned": self.abandoned,
+        }
+
+
+def job_store_path(path: str, platform: str = None, shard_id: int = None) -> str:
+    """
+    Returns the store file of one bot or runtime process, e.g. `ai_jobs.discord.2.sqlite3`.
+
+    Args:
+        path (str): The configured store, e.g. `ai_jobs.sqlite3`.
+        platform (str): The platform of a bot run on its own; None for the runtime, which hosts several.
+        shard_id (int): The process's shard in sharded mode.
+
+    Returns:
+        str: `path` with the platform and shard inserted before its extension.
+    """
+    root, extension = os.path.splitext(path)
+    parts = [str(part) for part in (platform, shard_id) if part is not None]
+    return ".".join([root, *parts]) + extension
+
+
+def job_pipeline_from_env(ai_client, scheduler=None, shard_id: int = None,
+                          platform: str = None) -> Optional[JobPipeline]:
+    """
+    Builds the job pipeline configured through environment variables.
+
+    The pipeline is off unless `AI_JOBS=1`. `AI_JOBS_PATH` locates the
+    SQLite store, `AI_JOBS_WORKERS` sizes the worker pool,
+    `AI_JOBS_MAX_ATTEMPTS` bounds retries and `AI_JOBS_MAX_AGE` is how old
+    an interrupted job may be and still be resumed. Each bot run on its own
+    and each shard gets its own store file (see `job_store_path`), so
+    processes started in the same directory never claim or recover each
+    other's jobs.
+
+    Args:
+        ai_client (AIClient): The AI client answering the jobs.
+        scheduler (RequestScheduler): Optional scheduler the workers respect.
+        shard_id (int): In sharded mode, the process's shard.
+        platform (str): The platform of a bot run on its own, outside the runtime.
+
+    Returns:
+        JobPipeline: The configured pipeline, or None if it is off.
+    """
+    if os.getenv("AI_JOBS", "0") != "1":
+        return None
+    path = job_store_path(os.getenv("AI_JOBS_PATH", "ai_jobs.sqlite3"), platform, shard_id)
+    return JobPipeline(
+        JobStore(path),
+        ai_client,
+        scheduler=scheduler,
+        workers=int(os.getenv("AI_JOBS_WORKERS", "8")),
+        max_attempts=int(os.getenv("AI_JOBS_MAX_ATTEMPTS", "3")),
+        max_age=float(os.getenv("AI_JOBS_MAX_AGE", "600")),
+    )
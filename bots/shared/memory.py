@@ -0,0 +1,264 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+# Rough size of a token in characters; close enough for budgeting without a tokenizer
+CHARS_PER_TOKEN = 4
+
+SUMMARY_PROMPT = (
+    "Summarize the following conversation between a user and an assistant in a few sentences, "
+    "keeping names, facts and open questions:\n\n"
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimates how many tokens a text takes up in a prompt.
+
+    Args:
+        text (str): The text to measure.
+
+    Returns:
+        int: The approximate token count.
+    """
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+class Conversation:
+    """The remembered turns of one conversation, stored as flat strings to stay small."""
+
+    __slots__ = ("turns", "tokens", "summary", "last_used")
+
+    def __init__(self):
+        # Alternating user and assistant texts, oldest first
+        self.turns = []
+        self.tokens = 0
+        self.summary = None
+        self.last_used = time.monotonic()
+
+
+class ConversationMemory:
+    """
+    Per-conversation chat history with a hard token budget.
+
+    Each conversation (a user in a channel, say) keeps its most recent turns
+    until they exceed `token_budget`; older turns are then dropped, or folded
+    into a running summary when a summarizer is passed to `remember`. Idle
+    conversations expire after `idle_ttl` seconds, and the least recently used
+    ones are evicted once there are more than `max_conversations` or all
+    histories together exceed `max_total_tokens`, so memory stays bounded no
+    matter how many users talk to the bots.
+    """
+
+    def __init__(self, token_budget: int = 1000, max_conversations: int = 100_000,
+                 idle_ttl: float = 86400.0, max_total_tokens: int = 20_000_000, summary_tokens: int = 200):
+        """
+        Args:
+            token_budget (int): Maximum estimated tokens of history sent with a request.
+            max_conversations (int): Number of conversations kept before the least recently used is evicted.
+            idle_ttl (float): Seconds after which an untouched conversation is forgotten.
+            max_total_tokens (int): Maximum estimated tokens of history kept across all conversations.
+            summary_tokens (int): Maximum estimated tokens of a conversation's summary.
+        """
+        self.token_budget = token_budget
+        self.max_conversations = max_conversations
+        self.idle_ttl = idle_ttl
+        self.max_total_tokens = max_total_tokens
+        self.summary_tokens = summary_tokens
+        self.conversations = OrderedDict()
+        self.total_tokens = 0
+        self.evicted = 0
+        self.trimmed_turns = 0
+        self.summaries = 0
+        self.summary_tasks = set()
+
+    def get(self, key) -> Optional[Conversation]:
+        conversation = self.conversations.get(key)
+        if conversation is None:
+            return None
+        if time.monotonic() - conversation.last_used > self.idle_ttl:
+            self.forget(key)
+            return None
+        return conversation
+
+    def history(self, key, skip_last: bool = False) -> list:
+        """
+        Returns the remembered turns of a conversation in chat completions format.
+
+        Args:
+            key: Identifies the conversation, e.g. `("discord", channel_id, user_id)`.
+            skip_last (bool): Leave out the newest exchange, e.g. when its question is asked again.
+
+        Returns:
+            list: Message dicts, starting with the summary as a system message if there is one.
+        """
+        conversation = self.get(key)
+        if conversation is None:
+            return []
+        messages = []
+        if conversation.summary:
+            messages.append({"role": "system", "content": f"Summary of the conversation so far: {conversation.summary}"})
+        turns = conversation.turns[:-2] if skip_last else conversation.turns
+        for i, text in enumerate(turns):
+            messages.append({"role": "assistant" if i % 2 else "user", "content": text})
+        return messages
+
+    def forget(self, key):
+        """
+        Drops a conversation's history.
+
+        Args:
+            key: Identifies the conversation.
+        """
+        conversation = self.conversations.pop(key, None)
+        if conversation is not None:
+            self.total_tokens -= conversation.tokens
+
+    def last_exchange(self, key) -> Optional[tuple]:
+        """
+        Returns the newest exchange of a conversation, or None if the conversation has no turns.
+
+        Args:
+            key: Identifies the conversation.
+
+        Returns:
+            tuple: The (user text, reply text).
+        """
+        conversation = self.get(key)
+        if conversation is None or not conversation.turns:
+            return None
+        return tuple(conversation.turns[-2:])
+
+    def pop_exchange(self, key) -> Optional[tuple]:
+        """
+        Removes the newest exchange of a conversation, e.g. to ask its question again.
+
+        Args:
+            key: Identifies the conversation.
+
+        Returns:
+            tuple: The removed (user text, reply text), or None if the conversation has no turns.
+        """
+        conversation = self.get(key)
+        if conversation is None or not conversation.turns:
+            return None
+        user_text, reply_text = conversation.turns[-2:]
+        del conversation.turns[-2:]
+        removed = estimate_tokens(user_text) + estimate_tokens(reply_text)
+        conversation.tokens -= removed
+        self.total_tokens -= removed
+        return user_text, reply_text
+
+    def remember(self, key, user_text: str, reply_text: str, summarize=None, replace_last: bool = False):
+        """
+        Appends one exchange to a conversation and enforces the budgets.
+
+        Args:
+            key: Identifies the conversation.
+            user_text (str): The user's message.
+            reply_text (str): The AI's reply.
+            summarize: Optional coroutine function taking a prompt and returning a summary or None.
+                When given, turns pushed out of the budget are summarized in the background.
+            replace_last (bool): Replace the newest exchange if it asked the same question, e.g. for a
+                regenerated answer.
+        """
+        last = self.last_exchange(key)
+        if replace_last and last is not None and last[0] == user_text:
+            self.pop_exchange(key)
+        conversation = self.get(key)
+        if conversation is None:
+            conversation = self.conversations[key] = Conversation()
+        self.conversations.move_to_end(key)
+        conversation.last_used = time.monotonic()
+
+        added = estimate_tokens(user_text) + estimate_tokens(reply_text)
+        conversation.turns += [user_text, reply_text]
+        conversation.tokens += added
+        self.total_tokens += added
+
+        dropped = []
+        # Always keep the newest exchange, even if it alone is over budget
+        while conversation.tokens > self.token_budget and len(conversation.turns) > 2:
+            dropped += conversation.turns[:2]
+            removed = estimate_tokens(conversation.turns[0]) + estimate_tokens(conversation.turns[1])
+            del conversation.turns[:2]
+            conversation.tokens -= removed
+            self.total_tokens -= removed
+            self.trimmed_turns += 1
+        if dropped and summarize is not None:
+            task = asyncio.ensure_future(self.summarize(conversation, dropped, summarize))
+            self.summary_tasks.add(task)
+            task.add_done_callback(self.summary_tasks.discard)
+
+        self.evict()
+
+    def evict(self):
+        """Evicts idle and least recently used conversations until every limit holds."""
+        now = time.monotonic()
+        while self.conversations:
+            key, oldest = next(iter(self.conversations.items()))
+            over_limit = (len(self.conversations) > self.max_conversations
+                          or self.total_tokens > self.max_total_tokens)
+            if not over_limit and now - oldest.last_used <= self.idle_ttl:
+                break
+            self.forget(key)
+            self.evicted += 1
+
+    async def summarize(self, conversation: Conversation, dropped: list, summarize):
+        """
+        Folds turns that fell out of the budget into the conversation's summary.
+
+        Args:
+            conversation (Conversation): The conversation the turns were dropped from.
+            dropped (list): Alternating user and assistant texts, oldest first.
+            summarize: Coroutine function taking a prompt and returning a summary or None.
+        """
+        lines = [f"Earlier summary: {conversation.summary}"] if conversation.summary else []
+        for i, text in enumerate(dropped):
+            lines.append(f"{'Assistant' if i % 2 else 'User'}: {text}")
+        try:
+            summary = await summarize(SUMMARY_PROMPT + "\n".join(lines))
+        except Exception as e:
+            print(f"Failed to summarize conversation: {e}")
+            return
+        if summary:
+            conversation.summary = summary[:self.summary_tokens * CHARS_PER_TOKEN]
+            self.summaries += 1
+
+    def close(self):
+        """Cancels summaries still in flight, which would otherwise outlive the AI client."""
+        for task in list(self.summary_tasks):
+            task.cancel()
+
+    def stats(self) -> dict:
+        """Returns the number of conversations, remembered tokens and eviction figures."""
+        return {
+            "conversations": len(self.conversations),
+            "total_tokens": self.total_tokens,
+            "evicted": self.evicted,
+            "trimmed_turns": self.trimmed_turns,
+            "summaries": self.summaries,
+        }
+
+
+def conversation_memory_from_env() -> Optional[ConversationMemory]:
+    """
+    Builds the conversation memory configured through environment variables.
+
+    `AI_MEMORY=0` turns memory off. `AI_MEMORY_TOKENS` is the history budget
+    per conversation, `AI_MEMORY_CONVERSATIONS` and `AI_MEMORY_TOTAL_TOKENS`
+    bound the whole store, and `AI_MEMORY_TTL` forgets idle conversations.
+
+    Returns:
+        ConversationMemory: The configured memory, or None if memory is off.
+    """
+    if os.getenv("AI_MEMORY", "1") != "1":
+        return None
+    return ConversationMemory(
+        token_budget=int(os.getenv("AI_MEMORY_TOKENS", "1000")),
+        max_conversations=int(os.getenv("AI_MEMORY_CONVERSATIONS", "100000")),
+        idle_ttl=float(os.getenv("AI_MEMORY_TTL", "86400")),
+        max_total_tokens=int(os.getenv("AI_MEMORY_TOTAL_TOKENS", "20000000")),
+    )
@@ -0,0 +1,299 @@
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Upper bounds, in seconds, of the latency histograms' buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# The stages a request is timed at, measured from when the bot received it
+STAGES = ("thinking_sent", "ai_start", "first_byte", "ai_done", "chunk_delivered", "done")
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """A monotonically increasing count per combination of label values."""
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+
+    def inc(self, *labels, amount: float = 1):
+        """Adds `amount` to the series of the given label values."""
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        return self.values.get(labels, 0)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in self.values.items():
+            lines.append(f"{self.name}{format_labels(self.labels, labels)} {value:g}")
+        return lines
+
+
+class Histogram:
+    """
+    Counts observations into fixed buckets per combination of label values.
+
+    Observing costs a binary search over the bucket bounds and two additions;
+    the cumulative counts Prometheus expects are only built when rendering.
+    """
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # Per series: a count per bucket, plus one for values above the last bound, then the sum
+        self.series = {}
+
+    def observe(self, value: float, *labels):
+        """Records one observation in the series of the given label values."""
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def count(self, *labels) -> int:
+        series = self.series.get(labels)
+        return sum(series[:-1]) if series is not None else 0
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, series in self.series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                le = 'le="+Inf"' if bound == "+Inf" else f'le="{bound:g}"'
+                lines.append(f"{self.name}_bucket{format_labels(self.labels, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, labels)} {series[-1]:g}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, labels)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """The bots' counters and histograms, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self.metrics = []
+        self.requests = self.counter("bot_requests_total", "Requests received, by platform and command.",
+                                     ("platform", "command"))
+        self.errors = self.counter("bot_errors_total", "Requests that failed or were refused, by platform and kind.",
+                                   ("platform", "kind"))
+        self.stages = self.histogram("bot_stage_seconds", "Seconds from receiving a request to each stage.",
+                                     ("platform", "stage"))
+        self.tokens = self.counter("ai_tokens_total", "Tokens reported by the AI API, by kind.", ("kind",))
+        self.cache = self.counter("ai_cache_requests_total", "Response cache lookups, by result.", ("result",))
+
+    def counter(self, name: str, help: str, labels: tuple = ()) -> Counter:
+        metric = Counter(name, help, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Returns every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# The process-wide registry the bots and the AI client record into
+METRICS = MetricsRegistry()
+# `METRICS_ENABLED=0` stops timing requests altogether, `OTEL_TRACING=1` also emits OpenTelemetry spans (needs
+# the opentelemetry-api package and a configured SDK). Both are read on first use, after `.env` is loaded;
+# None until then, and a benchmark may set them directly
+METRICS_ENABLED = None
+OTEL_TRACING = None
+
+_current = ContextVar("request_trace", default=None)
+_tracer = None
+
+
+def metrics_enabled() -> bool:
+    """Returns whether requests are timed, reading `METRICS_ENABLED` on the first call."""
+    global METRICS_ENABLED
+    if METRICS_ENABLED is None:
+        from .settings import load_env
+        load_env()
+        METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+    return METRICS_ENABLED
+
+
+def otel_tracer():
+    """Returns the OpenTelemetry tracer, or None if tracing is off or the package is missing."""
+    global _tracer, OTEL_TRACING
+    if OTEL_TRACING is None:
+        from .settings import load_env
+        load_env()
+        OTEL_TRACING = os.getenv("OTEL_TRACING", "0") == "1"
+    if _tracer is None and OTEL_TRACING:
+        try:
+            from opentelemetry import trace
+        except ImportError:
+            print("OTEL_TRACING is set but opentelemetry-api is not installed; spans are disabled.")
+            OTEL_TRACING = False
+            return None
+        _tracer = trace.get_tracer("bots")
+    return _tracer
+
+
+class RequestTrace:
+    """
+    Times one request through its stages.
+
+    Each `mark` observes the seconds since the request was received in the
+    `bot_stage_seconds` histogram and, with OpenTelemetry on, adds an event
+    to the request's span.
+    """
+
+    __slots__ = ("platform", "started", "span", "registry")
+
+    def __init__(self, platform: str, command: str, registry: MetricsRegistry = METRICS):
+        self.platform = platform
+        self.registry = registry
+        self.started = time.perf_counter()
+        tracer = otel_tracer()
+        self.span = tracer.start_span("bot.request", attributes={"bot.platform": platform,
+                                                                 "bot.command": command or ""}) if tracer else None
+        registry.requests.inc(platform, command or "")
+
+    def mark(self, stage: str):
+        """Records that the request reached `stage`, see `STAGES`."""
+        self.registry.stages.observe(time.perf_counter() - self.started, self.platform, stage)
+        if self.span is not None:
+            self.span.add_event(stage)
+
+    def error(self, kind: str):
+        """Counts a failure of the request, e.g. "ai", "shed" or "exception"."""
+        self.registry.errors.inc(self.platform, kind)
+        if self.span is not None:
+            self.span.set_attribute("bot.error", kind)
+
+    def finish(self):
+        self.mark("done")
+        if self.span is not None:
+            self.span.end()
+
+
+@contextmanager
+def trace_request(platform: str, command: str = None, registry: MetricsRegistry = METRICS):
+    """
+    Traces the request handled inside the block; stages marked in it, or in tasks it starts, belong to it.
+
+    Args:
+        platform (str): "discord", "telegram" or "twitter".
+        command (str): The command that triggered the request.
+        registry (MetricsRegistry): Where the timings are recorded.
+
+    Yields:
+        RequestTrace: The trace, or None when metrics are disabled.
+    """
+    if not metrics_enabled():
+        yield None
+        return
+    trace = RequestTrace(platform, command, registry)
+    token = _current.set(trace)
+    try:
+        yield trace
+    except BaseException:
+        trace.error("exception")
+        raise
+    finally:
+        _current.reset(token)
+        trace.finish()
+
+
+def mark(stage: str):
+    """Marks a stage of the current request, if one is being traced."""
+    trace = _current.get()
+    if trace is not None:
+        trace.mark(stage)
+
+
+def record_error(kind: str):
+    """Counts a failure of the current request, if one is being traced."""
+    trace = _current.get()
+    if trace is not None:
+        trace.error(kind)
+
+
+def record_usage(usage: dict, registry: MetricsRegistry = METRICS):
+    """Counts the tokens an AI API answer reports in its `usage` object."""
+    if usage:
+        registry.tokens.inc("prompt", amount=usage.get("prompt_tokens") or 0)
+        registry.tokens.inc("completion", amount=usage.get("completion_tokens") or 0)
+
+
+class MetricsServer:
+    """Serves the registry on `GET /metrics` for Prometheus to scrape."""
+
+    def __init__(self, registry: MetricsRegistry = METRICS, host: str = "0.0.0.0", port: int = 9100):
+        """
+        Args:
+            registry (MetricsRegistry): The metrics to serve.
+            host (str): Interface to listen on.
+            port (int): Port to listen on; 0 picks a free one.
+        """
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.runner = None
+
+    async def handle_metrics(self, request):
+        from aiohttp import web
+        return web.Response(body=self.registry.render().encode(),
+                            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    async def start(self):
+        """Starts listening on the running loop."""
+        # Imported here so processes without a metrics port never load aiohttp's server
+        from aiohttp import web
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle_metrics)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        print(f"Serving metrics on {self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+
+def metrics_server_from_env():
+    """
+    Builds the metrics server configured through environment variables.
+
+    The server is off unless `METRICS_PORT` is set; `METRICS_HOST` sets the
+    interface it listens on.
+
+    Returns:
+        MetricsServer: The configured, not yet started, server, or None.
+    """
+    port = os.getenv("METRICS_PORT")
+    if not port:
+        return None
+    return MetricsServer(METRICS, host=os.getenv("METRICS_HOST", "0.0.0.0"), port=int(port))
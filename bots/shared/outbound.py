@@ -0,0 +1,322 @@
+import asyncio
+import itertools
+import os
+import time
+from collections import deque
+from .resilience import LatencyTracker
+from .scheduler import TokenBucket
+
+# Priority lanes for outgoing messages: answers go out ahead of placeholders, greetings and interim edits
+PRIORITY_FINAL = 0
+PRIORITY_COSMETIC = 1
+OUTBOUND_LANES = {PRIORITY_FINAL: "final", PRIORITY_COSMETIC: "cosmetic"}
+
+
+class RouteLimit:
+    """
+    A platform rate limit, as a token bucket per route or one shared by all routes.
+
+    Routes are tuples whose first item is their kind, e.g. `("chat", chat_id)`.
+    """
+
+    def __init__(self, name: str, rate: float, capacity: float, per_route: bool = True, kinds: tuple = None,
+                 applies=None):
+        """
+        Args:
+            name (str): Name of the limit, used in statistics.
+            rate (float): Sends per second the limit allows in the long run.
+            capacity (float): Sends allowed in a burst.
+            per_route (bool): One bucket per route if true, otherwise one for all matching routes.
+            kinds (tuple): Route kinds the limit applies to; all if omitted.
+            applies: Optional predicate further restricting the routes the limit applies to.
+        """
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+        self.per_route = per_route
+        self.kinds = kinds
+        self.applies = applies
+
+    def matches(self, route: tuple) -> bool:
+        if self.kinds is not None and route[0] not in self.kinds:
+            return False
+        return self.applies is None or self.applies(route)
+
+
+# Telegram: about 30 messages per second overall, one per second in a private chat and 20 per minute in a group
+TELEGRAM_ROUTES = (
+    RouteLimit("global", 30, 30, per_route=False),
+    RouteLimit("chat", 1, 3, applies=lambda route: route[1] > 0),
+    RouteLimit("group", 20 / 60, 20, applies=lambda route: route[1] < 0),
+)
+# Discord: 50 requests per second per bot, and about 5 messages per 5 seconds in a channel. Interaction
+# follow-ups and edits (`("interaction", token)` routes) go through the interaction's webhook, which Discord
+# limits per token, not per channel; only the global limit applies to them, and discord.py waits out the rest
+DISCORD_ROUTES = (
+    RouteLimit("global", 50, 50, per_route=False),
+    RouteLimit("channel", 1, 5, kinds=("channel",)),
+)
+
+
+def twitter_routes(posts_per_window: int = 300, window: float = 10800.0) -> tuple:
+    """
+    Returns Twitter's limits: the account's tweets per window, and direct messages per day.
+
+    Args:
+        posts_per_window (int): Tweets the account may post per `window`.
+        window (float): Length of the tweet limit's window in seconds.
+    """
+    return (
+        RouteLimit("tweets", posts_per_window / window, posts_per_window, per_route=False, kinds=("mention",)),
+        RouteLimit("direct_messages", 1000 / 86400, 1000, per_route=False, kinds=("dm",)),
+    )
+
+
+class Send:
+    """One queued outgoing call."""
+
+    __slots__ = ("call", "priority", "merge_key", "futures", "queued_at", "attempts")
+
+    def __init__(self, call, priority: int, merge_key):
+        self.call = call
+        self.priority = priority
+        self.merge_key = merge_key
+        self.futures = []
+        self.queued_at = time.monotonic()
+        self.attempts = 0
+
+
+class OutboundScheduler:
+    """
+    Schedules a platform's outgoing messages and edits within its rate limits.
+
+    Sends to one route (a chat, channel or user) go out one at a time and in
+    order, so a greeting never lands after the answer it precedes. Across
+    routes, final answers are sent ahead of cosmetic messages: "Thinking..."
+    placeholders, greetings and interim streaming edits. A send waits,
+    without holding a worker, until every bucket its route draws from has a
+    token, and an edit queued behind an edit of the same message replaces
+    it, so only the latest text is sent.
+
+    When the platform still answers 429, `retry_after` extracts the wait
+    from the exception; the route is paused for that long and the send is
+    retried up to `max_retries` times.
+    """
+
+    def __init__(self, platform: str, limits: tuple, retry_after=None, workers: int = 8, max_retries: int = 3,
+                 max_buckets: int = 100_000):
+        """
+        Args:
+            platform (str): Name of the platform, used in log messages.
+            limits (tuple): The platform's `RouteLimit`s.
+            retry_after: Function returning the seconds to wait if an exception is a rate limit answer, else None.
+            workers (int): Number of sends in flight at once.
+            max_retries (int): Retries of a send answered with a rate limit.
+            max_buckets (int): Per-route buckets kept before full ones are dropped.
+        """
+        self.platform = platform
+        self.limits = limits
+        self.retry_after = retry_after or (lambda error: None)
+        self.worker_count = workers
+        self.max_retries = max_retries
+        self.max_buckets = max_buckets
+        self.buckets = {}
+        self.routes = {}
+        self.paused_until = {}
+        self.timers = {}
+        self.ready = asyncio.PriorityQueue()
+        self.order = itertools.count()
+        self.workers = []
+        self.latency = {priority: LatencyTracker(1000) for priority in OUTBOUND_LANES}
+        self.sent = 0
+        self.merged = 0
+        self.rate_limited = 0
+        self.failed = 0
+
+    async def send(self, route: tuple, call, priority: int = PRIORITY_FINAL, merge_key=None):
+        """
+        Queues a send and waits for its result.
+
+        Args:
+            route (tuple): The route the send draws from, e.g. `("chat", chat_id)`.
+            call: Coroutine function without arguments performing the send.
+            priority (int): `PRIORITY_FINAL` or `PRIORITY_COSMETIC`.
+            merge_key: Identifies the edited message; a queued send with the same key is replaced by this one.
+
+        Returns:
+            The call's result.
+        """
+        if not self.workers:
+            # Started on first use, on whichever loop the bot sends from
+            self.workers = [asyncio.create_task(self.worker()) for _ in range(self.worker_count)]
+        future = asyncio.get_running_loop().create_future()
+        queue = self.routes.get(route)
+        if queue is None:
+            queue = self.routes[route] = deque()
+            self.ready.put_nowait((priority, next(self.order), route))
+        pending = queue[-1] if queue else None
+        if merge_key is not None and pending is not None and pending.merge_key == merge_key and not pending.attempts:
+            # Only the newest edit of a message matters, as long as the older one has not been sent yet
+            pending.call = call
+            pending.priority = min(pending.priority, priority)
+            self.merged += 1
+        else:
+            pending = Send(call, priority, merge_key)
+            queue.append(pending)
+        pending.futures.append(future)
+        return await asyncio.shield(future)
+
+    def route_buckets(self, route: tuple) -> list:
+        buckets = []
+        for limit in self.limits:
+            if not limit.matches(route):
+                continue
+            key = (limit.name, route) if limit.per_route else (limit.name,)
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                if len(self.buckets) >= self.max_buckets:
+                    for stale in [k for k, b in self.buckets.items() if b.is_full()]:
+                        del self.buckets[stale]
+                bucket = self.buckets[key] = TokenBucket(limit.rate, limit.capacity)
+            buckets.append(bucket)
+        return buckets
+
+    def delay(self, route: tuple, buckets: list) -> float:
+        """Returns how long the route must wait for a token from every bucket, or for a 429 pause to end."""
+        delay = self.paused_until.get(route, 0.0) - time.monotonic()
+        for bucket in buckets:
+            bucket.refill()
+            if bucket.tokens < 1:
+                delay = max(delay, (1 - bucket.tokens) / bucket.rate)
+        return delay
+
+    def requeue(self, route: tuple, delay: float = 0.0):
+        """Puts a route back in line, after `delay` seconds."""
+        queue = self.routes.get(route)
+        if not queue:
+            return
+        entry = (queue[0].priority, next(self.order), route)
+        if delay > 0:
+            # A route is in line at most once, so one timer per route
+            self.timers[route] = asyncio.get_running_loop().call_later(delay, self.wake, entry)
+        else:
+            self.ready.put_nowait(entry)
+
+    def wake(self, entry: tuple):
+        self.timers.pop(entry[2], None)
+        self.ready.put_nowait(entry)
+
+    async def worker(self):
+        """Sends the head of the most urgent ready route until cancelled."""
+        while True:
+            _, _, route = await self.ready.get()
+            if route not in self.routes:
+                # Queued before `close` dropped the route
+                continue
+            buckets = self.route_buckets(route)
+            delay = self.delay(route, buckets)
+            if delay > 0:
+                self.requeue(route, delay)
+                continue
+            for bucket in buckets:
+                bucket.tokens -= 1
+            await self.dispatch(route)
+
+    async def dispatch(self, route: tuple):
+        """Performs the send at the head of a route and moves the route on."""
+        queue = self.routes[route]
+        head = queue[0]
+        if not head.attempts:
+            self.latency[head.priority].record(time.monotonic() - head.queued_at)
+        head.attempts += 1
+        try:
+            result = await head.call()
+        except Exception as e:
+            retry_after = self.retry_after(e)
+            if retry_after is None or head.attempts > self.max_retries:
+                if retry_after is not None:
+                    self.rate_limited += 1
+                self.failed += 1
+                self.settle(route, error=e)
+                return
+            self.rate_limited += 1
+            print(f"{self.platform} rate limited a send to {route}; retrying in {retry_after:.1f}s.")
+            self.paused_until[route] = time.monotonic() + retry_after
+            self.requeue(route, retry_after)
+            return
+        self.sent += 1
+        self.settle(route, result=result)
+
+    def settle(self, route: tuple, result=None, error: Exception = None):
+        """Resolves the head of a route and queues the route again if more sends wait."""
+        queue = self.routes[route]
+        head = queue.popleft()
+        for future in head.futures:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        if queue:
+            self.requeue(route)
+        else:
+            del self.routes[route]
+            self.paused_until.pop(route, None)
+
+    async def close(self):
+        """Stops the workers; sends still queued are cancelled."""
+        for task in self.workers:
+            task.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        for queue in self.routes.values():
+            for pending in queue:
+                for future in pending.futures:
+                    future.cancel()
+        self.routes = {}
+        self.paused_until = {}
+        # Workers started by a later send must not find routes of the closed ones
+        for timer in self.timers.values():
+            timer.cancel()
+        self.timers = {}
+        while not self.ready.empty():
+            self.ready.get_nowait()
+
+    def stats(self) -> dict:
+        """Returns sends, merged edits, 429 answers, failures, queued sends and queue latency per lane."""
+        latency = {}
+        for priority, tracker in self.latency.items():
+            latency[OUTBOUND_LANES[priority]] = {"p50": tracker.percentile(50), "p95": tracker.percentile(95)}
+        return {
+            "sent": self.sent,
+            "merged": self.merged,
+            "rate_limited": self.rate_limited,
+            "failed": self.failed,
+            "queued": sum(len(queue) for queue in self.routes.values()),
+            "queue_latency": latency,
+        }
+
+
+def outbound_scheduler_from_env(platform: str, retry_after=None) -> OutboundScheduler:
+    """
+    Builds a platform's outbound scheduler configured through environment variables.
+
+    `OUTBOUND_WORKERS` sets how many sends are in flight per platform;
+    Twitter's tweet limit comes from `TWITTER_POSTS_PER_WINDOW` and
+    `TWITTER_POST_WINDOW`.
+
+    Args:
+        platform (str): "discord", "telegram" or "twitter".
+        retry_after: Function returning the seconds to wait if an exception is a rate limit answer, else None.
+
+    Returns:
+        OutboundScheduler: The configured, not yet started, scheduler.
+    """
+    if platform == "twitter":
+        limits = twitter_routes(int(os.getenv("TWITTER_POSTS_PER_WINDOW", "300")),
+                                float(os.getenv("TWITTER_POST_WINDOW", "10800")))
+    else:
+        limits = {"discord": DISCORD_ROUTES, "telegram": TELEGRAM_ROUTES}[platform]
+    return OutboundScheduler(platform, limits, retry_after=retry_after,
+                             workers=int(os.getenv("OUTBOUND_WORKERS", "8")))
@@ -0,0 +1,163 @@
+import random
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+
+class CircuitOpen(Exception):
+    """Raised when the circuit breaker refuses a request because upstream is failing."""
+
+
+class RetryPolicy:
+    """
+    Jittered exponential backoff for retryable upstream failures.
+
+    Responses with status 429 or 5xx, timeouts and connection errors are
+    retried up to `max_attempts` times in total. The delay before attempt n
+    is drawn uniformly from [0, min(max_delay, base_delay * 2**n)] ("full
+    jitter"), unless the server sent a `Retry-After` header, which is honored
+    as long as it does not exceed `max_retry_after`.
+    """
+
+    RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8.0,
+                 max_retry_after: float = 30.0):
+        """
+        Args:
+            max_attempts (int): Total attempts per request, including the first.
+            base_delay (float): Backoff ceiling in seconds for the first retry.
+            max_delay (float): Upper bound of the backoff ceiling.
+            max_retry_after (float): Longest `Retry-After` the client is willing to wait.
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+
+    def is_retryable(self, status: int) -> bool:
+        return status in self.RETRYABLE_STATUSES
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> Optional[float]:
+        """
+        Returns the seconds to wait before the next attempt, or None to give up.
+
+        Args:
+            attempt (int): Number of attempts made so far.
+            retry_after (float): The server's `Retry-After`, in seconds, if it sent one.
+        """
+        if attempt >= self.max_attempts:
+            return None
+        if retry_after is not None:
+            return retry_after if retry_after <= self.max_retry_after else None
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parses a `Retry-After` header given either in seconds or as an HTTP date.
+
+    Args:
+        value (str): The header value, or None if absent.
+
+    Returns:
+        float: Seconds to wait, or None if the header is absent or malformed.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """
+    Fails fast while upstream is down.
+
+    After `failure_threshold` consecutive failures the circuit opens and every
+    request is refused for `reset_timeout` seconds. Then a single trial request
+    is let through (half-open): success closes the circuit, failure opens it
+    again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Args:
+            failure_threshold (int): Consecutive failures that open the circuit.
+            reset_timeout (float): Seconds the circuit stays open before a trial request.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.rejected = 0
+
+    def check(self):
+        """Raises `CircuitOpen` unless a request may be sent now."""
+        if self.state == self.CLOSED:
+            return
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self.trial_in_flight = False
+        if self.state == self.HALF_OPEN and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return
+        self.rejected += 1
+        raise CircuitOpen(f"AI backend circuit is {self.state}")
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self.trial_in_flight = False
+
+    def stats(self) -> dict:
+        return {"state": self.state, "consecutive_failures": self.failures, "rejected": self.rejected}
+
+
+class LatencyTracker:
+    """Keeps the most recent request latencies and answers percentile queries over them."""
+
+    def __init__(self, window: int = 200):
+        """
+        Args:
+            window (int): Number of most recent samples kept.
+        """
+        self.samples = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        """
+        Returns the given percentile of the recorded latencies.
+
+        Args:
+            percentile (float): A value between 0 and 100.
+
+        Returns:
+            float: The latency in seconds, or None if nothing has been recorded yet.
+        """
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(len(ordered) * percentile / 100))
+        return ordered[index]
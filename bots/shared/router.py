@@ -0,0 +1,399 @@
+import json
+import os
+import time
+from collections import deque
+from typing import Optional
+from .ai_client import ERROR_RESPONSE, AIClient
+from .memory import conversation_memory_from_env
+from .metrics import record_error
+from .resilience import CircuitBreaker
+from .usage import QUOTA_RESPONSE, QuotaExceeded, metered, usage_ledger_from_env
+
+
+class BackendHealth:
+    """
+    Rolling latency and error figures for one backend.
+
+    Only outcomes from the last `window` seconds count, so a backend that was
+    demoted for being slow or failing is retried once its bad samples age out.
+    """
+
+    def __init__(self, window: float = 60.0, max_samples: int = 500):
+        """
+        Args:
+            window (float): Seconds an outcome stays in the statistics.
+            max_samples (int): Maximum number of outcomes kept.
+        """
+        self.window = window
+        self.outcomes = deque(maxlen=max_samples)
+        self.requests = 0
+        self.failures = 0
+
+    def record(self, ok: bool, latency: float):
+        self.requests += 1
+        self.failures += not ok
+        self.outcomes.append((time.monotonic(), ok, latency))
+
+    def prune(self):
+        horizon = time.monotonic() - self.window
+        while self.outcomes and self.outcomes[0][0] < horizon:
+            self.outcomes.popleft()
+
+    def error_rate(self) -> float:
+        self.prune()
+        if not self.outcomes:
+            return 0.0
+        return sum(1 for _, ok, _ in self.outcomes if not ok) / len(self.outcomes)
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        """Returns a latency percentile over recent outcomes, failures included, or None without samples."""
+        self.prune()
+        if not self.outcomes:
+            return None
+        ordered = sorted(latency for _, _, latency in self.outcomes)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "failures": self.failures,
+            "error_rate": self.error_rate(),
+            "latency_p50": self.percentile(50),
+            "latency_p95": self.percentile(95),
+        }
+
+
+class RoutingRule:
+    """
+    Picks an ordered list of backends for requests that match all of its conditions.
+
+    Conditions left as None match everything.
+    """
+
+    def __init__(self, backends: list, commands: list = None, tiers: list = None,
+                 min_prompt_chars: int = None, max_prompt_chars: int = None):
+        """
+        Args:
+            backends (list): Backend names in order of preference.
+            commands (list): Commands the rule applies to, e.g. `["ask"]`.
+            tiers (list): User tiers the rule applies to, e.g. `["premium"]`.
+            min_prompt_chars (int): Shortest prompt the rule applies to.
+            max_prompt_chars (int): Longest prompt the rule applies to.
+        """
+        self.backends = backends
+        self.commands = set(commands) if commands is not None else None
+        self.tiers = set(tiers) if tiers is not None else None
+        self.min_prompt_chars = min_prompt_chars
+        self.max_prompt_chars = max_prompt_chars
+
+    def matches(self, message: str, command: Optional[str], tier: str) -> bool:
+        if self.commands is not None and command not in self.commands:
+            return False
+        if self.tiers is not None and tier not in self.tiers:
+            return False
+        if self.min_prompt_chars is not None and len(message) < self.min_prompt_chars:
+            return False
+        if self.max_prompt_chars is not None and len(message) > self.max_prompt_chars:
+            return False
+        return True
+
+
+class AIRouter:
+    """
+    Routes each AI request to one of several backends (provider, endpoint and model).
+
+    The first matching `RoutingRule` gives the preferred backends for a
+    request. Backends that are currently unhealthy are moved to the back of
+    that list: their circuit is open, their recent error rate is above
+    `max_error_rate`, or their recent p95 latency is above `latency_budget`.
+    The request then goes to each backend in turn until one answers.
+
+    Offers the same interface as `AIClient`, so bots use either one. The
+    conversation memory and the usage ledger live in the router rather than
+    in the backends, so a conversation keeps its history, and a user their
+    quota, when they move to another backend.
+    """
+
+    def __init__(self, backends: dict, rules: list = None, default: list = None, user_tiers: dict = None,
+                 max_error_rate: float = 0.5, latency_budget: float = None, health_window: float = 60.0,
+                 memory=None, summarize: bool = False, ledger=None):
+        """
+        Args:
+            backends (dict): `AIClient` instances by backend name.
+            rules (list): `RoutingRule`s, tried in order.
+            default (list): Backend names used when no rule matches; all backends if omitted.
+            user_tiers (dict): Tier names by user id (as strings); users not listed are in tier "default".
+            max_error_rate (float): Recent error rate above which a backend is demoted.
+            latency_budget (float): Recent p95 latency in seconds above which a backend is demoted.
+            health_window (float): Seconds of history the health figures cover.
+            memory (ConversationMemory): Optional per-conversation history sent with each request.
+            summarize (bool): Whether turns that fall out of the memory budget are summarized by the AI.
+            ledger (UsageLedger): Optional token accounting and quotas.
+        """
+        self.backends = backends
+        self.rules = rules or []
+        self.default = default or list(backends)
+        self.user_tiers = user_tiers or {}
+        self.max_error_rate = max_error_rate
+        self.latency_budget = latency_budget
+        self.health = {name: BackendHealth(window=health_window) for name in backends}
+        self.memory = memory
+        self.summarize = summarize
+        self.ledger = ledger
+        # Requests are reserved for the largest answer any backend gives; each backend caps it further
+        self.max_tokens = max(client.max_tokens for client in backends.values())
+        self.failovers = 0
+
+    async def start(self):
+        for client in self.backends.values():
+            await client.start()
+        if self.ledger is not None:
+            await self.ledger.start()
+
+    async def close(self):
+        if self.memory is not None:
+            self.memory.close()
+        if self.ledger is not None:
+            await self.ledger.close()
+        for client in self.backends.values():
+            await client.close()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def tier_of(self, user_id) -> str:
+        return self.user_tiers.get(str(user_id), "default") if user_id is not None else "default"
+
+    def is_healthy(self, name: str) -> bool:
+        breaker = self.backends[name].breaker
+        if breaker is not None and breaker.state == CircuitBreaker.OPEN:
+            return False
+        health = self.health[name]
+        if health.error_rate() > self.max_error_rate:
+            return False
+        if self.latency_budget is not None:
+            p95 = health.percentile(95)
+            if p95 is not None and p95 > self.latency_budget:
+                return False
+        return True
+
+    def candidates(self, message: str, command: str = None, user_id=None) -> list:
+        """
+        Returns the backend names to try for a request, best first.
+
+        Args:
+            message (str): The user's input message.
+            command (str): The bot command that triggered the request.
+            user_id: The requesting user.
+        """
+        tier = self.tier_of(user_id)
+        preferred = next(
+            (rule.backends for rule in self.rules if rule.matches(message, command, tier)),
+            self.default,
+        )
+        healthy = [name for name in preferred if self.is_healthy(name)]
+        unhealthy = sorted(
+            (name for name in preferred if name not in healthy),
+            key=lambda name: self.health[name].error_rate(),
+        )
+        return healthy + unhealthy
+
+    def history(self, conversation, skip_last: bool = False) -> list:
+        """Returns the remembered messages of a conversation, or none without memory."""
+        if self.memory is None or conversation is None:
+            return []
+        return self.memory.history(conversation, skip_last=skip_last)
+
+    def remember(self, conversation, message: str, response_text: str, replace_last: bool = False):
+        """Stores a successful exchange in the conversation's memory."""
+        if self.memory is not None and conversation is not None:
+            summarize = self.summarize_turns if self.summarize else None
+            self.memory.remember(conversation, message, response_text, summarize=summarize,
+                                 replace_last=replace_last)
+
+    async def summarize_turns(self, prompt: str):
+        """Asks the AI for a summary of old conversation turns; returns None on failure."""
+        response_text = await self.fetch_ai_response(prompt, use_cache=False, command="summary")
+        return response_text if response_text != ERROR_RESPONSE else None
+
+    async def fetch_ai_response(self, message: str, use_cache: bool = True, command: str = None, user_id=None,
+                                conversation=None, replace_last: bool = False) -> str:
+        """
+        Fetches an AI-generated response from the best available backend, failing over on errors.
+
+        Args:
+            message (str): The user's input message to send to the AI.
+            use_cache (bool): Whether the response cache may answer or store this request.
+            command (str): The bot command that triggered the request, used by the routing rules.
+            user_id: The requesting user, whose tier is used by the routing rules.
+            conversation: Key of the conversation whose history is sent along and extended, if any.
+            replace_last (bool): Ask the conversation's newest question again: its exchange is not sent
+                along and is replaced by the new one once the answer arrives.
+
+        Returns:
+            str: The response from the AI, or an error message if every backend failed or the request is over quota.
+        """
+        history = self.history(conversation, skip_last=replace_last)
+        try:
+            with metered(self.ledger, conversation, user_id, message, history, self.max_tokens) as reservation:
+                for attempt, name in enumerate(self.candidates(message, command, user_id)):
+                    if attempt:
+                        self.failovers += 1
+                    started = time.monotonic()
+                    response_text = await self.backends[name].complete(
+                        message, use_cache=use_cache, history=history,
+                        max_tokens=reservation and reservation.max_tokens)
+                    self.health[name].record(response_text is not None, time.monotonic() - started)
+                    if response_text is not None:
+                        if reservation is not None:
+                            reservation.produced(response_text)
+                        self.remember(conversation, message, response_text, replace_last)
+                        return response_text
+        except QuotaExceeded as e:
+            print(f"{e}; refusing the request.")
+            record_error("quota")
+            return QUOTA_RESPONSE
+        return ERROR_RESPONSE
+
+    async def stream_ai_response(self, message: str, use_cache: bool = True, command: str = None, user_id=None,
+                                 conversation=None, replace_last: bool = False):
+        """
+        Streams an AI-generated response from the best available backend.
+
+        Fails over to the next backend only while nothing has been yielded yet,
+        since a partially shown answer cannot be taken back.
+
+        Args:
+            message (str): The user's input message to send to the AI.
+            use_cache (bool): Whether the response cache may answer or store this request.
+            command (str): The bot command that triggered the request, used by the routing rules.
+            user_id: The requesting user, whose tier is used by the routing rules.
+            conversation: Key of the conversation whose history is sent along and extended, if any.
+            replace_last (bool): Ask the conversation's newest question again: its exchange is not sent
+                along and is replaced by the new one once the answer arrives.
+
+        Yields:
+            str: The next fragment of the response, or a single error message if every backend failed or the
+                request is over quota.
+        """
+        history = self.history(conversation, skip_last=replace_last)
+        try:
+            with metered(self.ledger, conversation, user_id, message, history, self.max_tokens) as reservation:
+                for attempt, name in enumerate(self.candidates(message, command, user_id)):
+                    if attempt:
+                        self.failovers += 1
+                    started = time.monotonic()
+                    fragments = self.backends[name].stream_completion(
+                        message, use_cache=use_cache, history=history,
+                        max_tokens=reservation and reservation.max_tokens)
+                    try:
+                        first = await fragments.__anext__()
+                    except StopAsyncIteration:
+                        self.health[name].record(True, time.monotonic() - started)
+                        return
+                    # AIClient reports a failed stream as a lone error message before any text
+                    if first == ERROR_RESPONSE:
+                        await fragments.aclose()
+                        self.health[name].record(False, time.monotonic() - started)
+                        continue
+                    self.health[name].record(True, time.monotonic() - started)
+                    parts = [first]
+                    yield first
+                    async for fragment in fragments:
+                        parts.append(fragment)
+                        yield fragment
+                    response_text = "".join(parts).strip()
+                    if reservation is not None:
+                        reservation.produced(response_text)
+                    self.remember(conversation, message, response_text, replace_last)
+                    return
+        except QuotaExceeded as e:
+            print(f"{e}; refusing the request.")
+            record_error("quota")
+            yield QUOTA_RESPONSE
+            return
+        yield ERROR_RESPONSE
+
+    def stats(self) -> dict:
+        """Returns per-backend health figures, the number of failovers and the ledger's figures."""
+        return {
+            "failovers": self.failovers,
+            "usage": self.ledger.stats() if self.ledger is not None else None,
+            "backends": {
+                name: {**self.health[name].stats(), "healthy": self.is_healthy(name), "model": client.model}
+                for name, client in self.backends.items()
+            },
+        }
+
+
+def router_from_config(path: str, client_settings) -> AIRouter:
+    """
+    Builds an `AIRouter` from a JSON routing file.
+
+    The file looks like::
+
+        {
+          "backends": {
+            "fast": {"model": "openai/gpt-4o-mini", "max_tokens": 300},
+            "smart": {"model": "openai/gpt-4"},
+            "backup": {"model": "anthropic/claude-3-haiku", "base_url": "https://...",
+                       "api_key_env": "BACKUP_API_KEY"}
+          },
+          "rules": [
+            {"tiers": ["premium"], "backends": ["smart", "backup"]},
+            {"commands": ["ask"], "max_prompt_chars": 280, "backends": ["fast", "smart"]}
+          ],
+          "default": ["smart", "fast", "backup"],
+          "user_tiers": {"123456789": "premium"},
+          "latency_budget": 20
+        }
+
+    Args:
+        path (str): Location of the JSON file.
+        client_settings: Callable returning fresh `AIClient` keyword arguments, see `ai_client_settings_from_env`.
+
+    Returns:
+        AIRouter: The configured router.
+    """
+    with open(path) as f:
+        config = json.load(f)
+
+    backends = {}
+    summarize = False
+    for name, spec in config["backends"].items():
+        settings = client_settings()
+        # Conversations are remembered once, by the router
+        settings.pop("memory", None)
+        summarize = settings.pop("summarize", False)
+        if "api_key_env" in spec:
+            settings["api_key"] = os.getenv(spec["api_key_env"])
+        for key in ("base_url", "model", "max_tokens", "temperature"):
+            if key in spec:
+                settings[key] = spec[key]
+        backends[name] = AIClient(**settings)
+
+    rules = [
+        RoutingRule(
+            rule["backends"],
+            commands=rule.get("commands"),
+            tiers=rule.get("tiers"),
+            min_prompt_chars=rule.get("min_prompt_chars"),
+            max_prompt_chars=rule.get("max_prompt_chars"),
+        )
+        for rule in config.get("rules", [])
+    ]
+    return AIRouter(
+        backends,
+        rules=rules,
+        default=config.get("default"),
+        user_tiers=config.get("user_tiers"),
+        max_error_rate=config.get("max_error_rate", 0.5),
+        latency_budget=config.get("latency_budget"),
+        memory=conversation_memory_from_env(),
+        summarize=summarize,
+        ledger=usage_ledger_from_env(),
+    )
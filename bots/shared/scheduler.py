@@ -0,0 +1,226 @@
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from contextlib import asynccontextmanager
+
+# Priority lanes: explicit commands are served ahead of catch-all chat messages
+PRIORITY_COMMAND = 0
+PRIORITY_MESSAGE = 1
+LANE_NAMES = {PRIORITY_COMMAND: "command", PRIORITY_MESSAGE: "message"}
+
+SHED_MESSAGE = "Too many requests right now, please try again in a moment."
+
+
+class RequestShed(Exception):
+    """Raised when the scheduler refuses a request instead of queueing it."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class TokenBucket:
+    """A token bucket refilled continuously at `rate` tokens per second up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self) -> bool:
+        """Takes one token if available and returns whether it did."""
+        self.refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def give_back(self):
+        """Returns a token taken for a request that was not admitted after all."""
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def is_full(self) -> bool:
+        self.refill()
+        return self.tokens >= self.capacity
+
+
+class RequestScheduler:
+    """
+    Admission control in front of the AI backend, shared by all bots.
+
+    Every request first takes a token from its user's and its chat's bucket;
+    a request without tokens is shed. Admitted requests run while fewer than
+    `max_concurrency` are active and otherwise wait in a priority queue, where
+    commands are served before catch-all messages and FIFO within a lane. When
+    `max_queue` requests are already waiting, new ones are shed as well.
+    """
+
+    def __init__(self, max_concurrency: int = 16, max_queue: int = 500,
+                 user_rate: float = 20 / 60, user_burst: float = 5,
+                 chat_rate: float = 60 / 60, chat_burst: float = 20):
+        """
+        Args:
+            max_concurrency (int): Maximum number of AI requests running at once.
+            max_queue (int): Maximum number of requests waiting for a slot.
+            user_rate (float): Requests per second each user's bucket refills with.
+            user_burst (float): Size of each user's bucket.
+            chat_rate (float): Requests per second each chat's bucket refills with.
+            chat_burst (float): Size of each chat's bucket.
+        """
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.user_buckets = {}
+        self.chat_buckets = {}
+        self.active = 0
+        self.waiters = []
+        self.sequence = itertools.count()
+        self.shed = {"user_rate": 0, "chat_rate": 0, "queue_full": 0}
+        self.waits = {
+            lane: {"admitted": 0, "total_wait": 0.0, "max_wait": 0.0}
+            for lane in LANE_NAMES
+        }
+
+    def bucket(self, buckets: dict, key, rate: float, capacity: float) -> TokenBucket:
+        bucket = buckets.get(key)
+        if bucket is None:
+            # Full buckets carry no state, so drop them before the table grows unbounded
+            if len(buckets) >= 10_000:
+                for stale in [k for k, b in buckets.items() if b.is_full()]:
+                    del buckets[stale]
+            bucket = buckets[key] = TokenBucket(rate, capacity)
+        return bucket
+
+    def take_tokens(self, user_id, chat_id):
+        """Takes one token from the user's and the chat's bucket, or raises `RequestShed`."""
+        user_bucket = None
+        if user_id is not None:
+            user_bucket = self.bucket(self.user_buckets, user_id, self.user_rate, self.user_burst)
+            if not user_bucket.try_take():
+                self.shed["user_rate"] += 1
+                raise RequestShed("user_rate")
+        if chat_id is not None:
+            chat_bucket = self.bucket(self.chat_buckets, chat_id, self.chat_rate, self.chat_burst)
+            if not chat_bucket.try_take():
+                if user_bucket is not None:
+                    user_bucket.give_back()
+                self.shed["chat_rate"] += 1
+                raise RequestShed("chat_rate")
+
+    async def acquire(self, user_id=None, chat_id=None, priority: int = PRIORITY_COMMAND):
+        """
+        Waits for a slot to run one AI request.
+
+        Args:
+            user_id: The requesting user, or None to skip the per-user limit.
+            chat_id: The chat or channel, or None to skip the per-chat limit.
+            priority (int): `PRIORITY_COMMAND` or `PRIORITY_MESSAGE`.
+
+        Raises:
+            RequestShed: If a rate limit is exhausted or the queue is full.
+        """
+        queued = self.active >= self.max_concurrency or bool(self.waiters)
+        # Checked before the buckets, so a request shed for a full queue costs its user no token
+        if queued and len(self.waiters) >= self.max_queue:
+            self.shed["queue_full"] += 1
+            raise RequestShed("queue_full")
+        self.take_tokens(user_id, chat_id)
+        started = time.monotonic()
+        if not queued:
+            self.active += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            entry = (priority, next(self.sequence), future)
+            heapq.heappush(self.waiters, entry)
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # The slot was handed over just before the cancellation; pass it on
+                    self.release()
+                elif entry in self.waiters:
+                    # `release` may already have popped the cancelled entry
+                    self.waiters.remove(entry)
+                    heapq.heapify(self.waiters)
+                raise
+        wait = time.monotonic() - started
+        lane = self.waits[priority]
+        lane["admitted"] += 1
+        lane["total_wait"] += wait
+        lane["max_wait"] = max(lane["max_wait"], wait)
+
+    def release(self):
+        """Frees a slot, handing it straight to the highest-priority waiter if there is one."""
+        while self.waiters:
+            _, _, future = heapq.heappop(self.waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self, user_id=None, chat_id=None, priority: int = PRIORITY_COMMAND):
+        """
+        Holds a slot for the duration of the `async with` block.
+
+        Args:
+            user_id: The requesting user, or None to skip the per-user limit.
+            chat_id: The chat or channel, or None to skip the per-chat limit.
+            priority (int): `PRIORITY_COMMAND` or `PRIORITY_MESSAGE`.
+
+        Raises:
+            RequestShed: If a rate limit is exhausted or the queue is full.
+        """
+        await self.acquire(user_id, chat_id, priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        """Returns active requests, queue depth per lane, wait times per lane and shed counts."""
+        depth = {name: 0 for name in LANE_NAMES.values()}
+        for priority, _, future in self.waiters:
+            if not future.done():
+                depth[LANE_NAMES[priority]] += 1
+        waits = {}
+        for priority, lane in self.waits.items():
+            admitted = lane["admitted"]
+            waits[LANE_NAMES[priority]] = {
+                "admitted": admitted,
+                "avg_wait": lane["total_wait"] / admitted if admitted else 0.0,
+                "max_wait": lane["max_wait"],
+            }
+        return {"active": self.active, "queue_depth": depth, "waits": waits, "shed": dict(self.shed)}
+
+
+def request_scheduler_from_env() -> RequestScheduler:
+    """
+    Builds the request scheduler configured through environment variables.
+
+    `AI_MAX_CONCURRENCY` and `AI_MAX_QUEUE` bound running and waiting
+    requests; `AI_USER_RATE_PER_MIN`/`AI_USER_BURST` and
+    `AI_CHAT_RATE_PER_MIN`/`AI_CHAT_BURST` size the token buckets.
+
+    Returns:
+        RequestScheduler: The configured scheduler.
+    """
+    return RequestScheduler(
+        max_concurrency=int(os.getenv("AI_MAX_CONCURRENCY", "16")),
+        max_queue=int(os.getenv("AI_MAX_QUEUE", "500")),
+        user_rate=float(os.getenv("AI_USER_RATE_PER_MIN", "20")) / 60,
+        user_burst=float(os.getenv("AI_USER_BURST", "5")),
+        chat_rate=float(os.getenv("AI_CHAT_RATE_PER_MIN", "60")) / 60,
+        chat_burst=float(os.getenv("AI_CHAT_BURST", "20")),
+    )
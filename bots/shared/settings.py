@@ -0,0 +1,142 @@
+import os
+from dataclasses import dataclass
+from typing import Optional, Tuple, Union
+
+# The process's settings, read on the first call to `settings_from_env`
+_settings = None
+_env_loaded = False
+
+
+def load_env():
+    """
+    Loads `.env` into the environment, once per process.
+
+    The bots used to do this when their modules were imported. It now happens
+    when a bot or the runtime is built, so importing a module never touches
+    the file system.
+    """
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
+
+
+def _number(environ, name: str, default, kind):
+    value = environ.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        return kind(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a number, not {value!r}")
+
+
+def _choice(environ, name: str, default: str, choices: tuple) -> str:
+    value = environ.get(name) or default
+    if value not in choices:
+        raise ValueError(f"{name} must be one of {', '.join(choices)}, not {value!r}")
+    return value
+
+
+def _shards(environ) -> Union[int, str, None]:
+    value = environ.get("DISCORD_SHARDS") or None
+    if value is None or value == "auto":
+        return value
+    shards = _number(environ, "DISCORD_SHARDS", None, int)
+    if shards < 1:
+        raise ValueError(f"DISCORD_SHARDS must be auto or a positive number, not {value!r}")
+    return shards
+
+
+@dataclass(frozen=True)
+class Settings:
+    """
+    Configuration of the bot entry points, parsed and checked once.
+
+    The shared components (AI client, scheduler, cache, ...) keep their own
+    `*_from_env` factories; these are the settings of the bots and the
+    runtime themselves. Pass a `Settings` to a bot to configure it without
+    touching the environment, e.g. `dataclasses.replace(settings_from_env(),
+    ai_streaming=True)`.
+    """
+
+    discord_bot_token: Optional[str] = None
+    # Shards of the auto-sharded bot: a count, "auto" for Discord's recommendation, or None for one per process
+    discord_shards: Union[int, str, None] = None
+    # Discord's max_concurrency: shards that may identify in the same 5 second window
+    discord_identify_concurrency: int = 1
+    # Where the hash of the last synced command tree is kept
+    discord_commands_state: str = "discord_commands.json"
+    telegram_bot_token: Optional[str] = None
+    # Bot API server to talk to, e.g. a self-hosted telegram-bot-api; the public one if unset
+    telegram_base_url: Optional[str] = None
+    telegram_mode: str = "polling"
+    telegram_workers: int = 16
+    twitter_api_key: Optional[str] = None
+    twitter_api_secret: Optional[str] = None
+    twitter_access_token: Optional[str] = None
+    twitter_access_secret: Optional[str] = None
+    twitter_workers: int = 8
+    twitter_queue_size: int = 100
+    twitter_identity_refresh: float = 3600.0
+    # "thread" chains the parts of a long answer; "flat" replies to the mention with every part
+    twitter_reply_mode: str = "thread"
+    ai_streaming: bool = False
+    # Platforms `run_bots` hosts; empty means every platform with credentials
+    bot_platforms: Tuple[str, ...] = ()
+    bot_processes: int = 1
+    bot_stats_interval: float = 0.0
+
+    @classmethod
+    def from_env(cls, environ=None) -> "Settings":
+        """
+        Reads the settings from environment variables.
+
+        Args:
+            environ: A mapping to read instead of `os.environ`.
+
+        Returns:
+            Settings: The parsed settings.
+
+        Raises:
+            ValueError: If a number or a choice is malformed, naming the variable.
+        """
+        environ = os.environ if environ is None else environ
+        platforms = environ.get("BOT_PLATFORMS") or ""
+        return cls(
+            discord_bot_token=environ.get("DISCORD_BOT_TOKEN"),
+            discord_shards=_shards(environ),
+            discord_identify_concurrency=_number(environ, "DISCORD_IDENTIFY_CONCURRENCY", 1, int),
+            discord_commands_state=environ.get("DISCORD_COMMANDS_STATE") or "discord_commands.json",
+            telegram_bot_token=environ.get("TELEGRAM_BOT_TOKEN"),
+            telegram_base_url=environ.get("TELEGRAM_BASE_URL"),
+            telegram_mode=_choice(environ, "TELEGRAM_MODE", "polling", ("polling", "webhook")),
+            telegram_workers=_number(environ, "TELEGRAM_WORKERS", 16, int),
+            twitter_api_key=environ.get("TWITTER_API_KEY"),
+            twitter_api_secret=environ.get("TWITTER_API_SECRET"),
+            twitter_access_token=environ.get("TWITTER_ACCESS_TOKEN"),
+            twitter_access_secret=environ.get("TWITTER_ACCESS_SECRET"),
+            twitter_workers=_number(environ, "TWITTER_WORKERS", 8, int),
+            twitter_queue_size=_number(environ, "TWITTER_QUEUE_SIZE", 100, int),
+            twitter_identity_refresh=_number(environ, "TWITTER_IDENTITY_REFRESH", 3600.0, float),
+            twitter_reply_mode=_choice(environ, "TWITTER_REPLY_MODE", "thread", ("thread", "flat")),
+            ai_streaming=environ.get("AI_STREAMING", "0") == "1",
+            bot_platforms=tuple(name.strip() for name in platforms.split(",") if name.strip()),
+            bot_processes=_number(environ, "BOT_PROCESSES", 1, int),
+            bot_stats_interval=_number(environ, "BOT_STATS_INTERVAL", 0.0, float),
+        )
+
+
+def settings_from_env() -> Settings:
+    """
+    Returns the process's settings, loading `.env` and reading the environment on the first call.
+
+    Returns:
+        Settings: The same instance on every call.
+    """
+    global _settings
+    if _settings is None:
+        load_env()
+        _settings = Settings.from_env()
+    return _settings
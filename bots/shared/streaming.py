@@ -0,0 +1,133 @@
+import time
+from .ai_client import ERROR_RESPONSE
+from .chunking import FENCE, FENCE_RESERVE, MessageChunker, MessageLimits, code_blocks, splits_cluster
+from .metrics import mark
+
+
+class StreamingReply:
+    """
+    Renders a streamed AI response into one or more platform messages.
+
+    Text is appended as it arrives and pushed to the current message with
+    edits coalesced to at most one per `edit_interval` seconds, to stay within
+    the platform's edit rate limits. Those interim edits are cosmetic; the
+    edit or send that completes a message is flagged final, so an outbound
+    scheduler can send it first. Once the text no longer fits in one
+    message, measured as the platform counts it, it is cut at the last line
+    or word break that fits, the full message is finalized and the rest
+    spills into a newly sent message. As with `MessageChunker`, a code block
+    cut in two is closed at the end of one message and re-opened, with its
+    language, at the start of the next.
+    """
+
+    def __init__(self, message, edit, send, limits: MessageLimits, edit_interval: float = 1.0):
+        """
+        Args:
+            message: The initial "Thinking..." message to edit.
+            edit: Coroutine function `edit(message, text, final)` that replaces a message's text.
+            send: Coroutine function `send(text, final)` that sends a new message and returns it.
+            limits (MessageLimits): The platform's message limits, e.g. `chunking.TELEGRAM`.
+            edit_interval (float): Minimum seconds between two edits of the same message.
+        """
+        self.message = message
+        self.edit = edit
+        self.send = send
+        self.limits = limits
+        # Only its `fit`, so the cut measures text exactly as the chunker does
+        self.chunker = MessageChunker(limits)
+        self.edit_interval = edit_interval
+        self.text = ""
+        self.shown = None
+        self.last_edit = 0.0
+
+    async def feed(self, fragment: str):
+        """
+        Appends a fragment of the response and updates the chat if due.
+
+        Args:
+            fragment (str): The next piece of streamed text.
+        """
+        self.text += fragment
+        while self.limits.measure(self.text) > self.limits.limit:
+            cut = self.cut_point(self.text)
+            head, self.text = self.carry_fence(self.text[:cut], self.text[cut:])
+            await self.flush(head, final=True)
+            # The next message is created lazily so a trailing space never becomes an empty message
+            self.message = None
+            self.shown = None
+        if self.text and time.monotonic() - self.last_edit >= self.edit_interval:
+            await self.flush(self.text)
+
+    async def finish(self):
+        """Pushes whatever text is still pending once the stream has ended."""
+        self.text = self.text.rstrip()
+        if self.text:
+            await self.flush(self.text, final=True)
+        elif self.message is not None and self.shown is None:
+            # A stream that brought no text must not leave "Thinking..." on screen for good
+            await self.flush(ERROR_RESPONSE, final=True)
+
+    async def flush(self, text: str, final: bool = False):
+        """
+        Shows `text` in the current message, sending a new message if there is none.
+
+        Args:
+            text (str): The complete text the current message should display.
+            final (bool): Whether `text` is the message's last version.
+        """
+        if self.message is None:
+            self.message = await self.send(text, final)
+        elif text != self.shown:
+            await self.edit(self.message, text, final)
+        self.shown = text
+        self.last_edit = time.monotonic()
+        if final:
+            mark("chunk_delivered")
+
+    def carry_fence(self, head: str, rest: str) -> tuple:
+        """
+        Closes a code block left open at the end of `head` and re-opens it at the start of `rest`.
+
+        Args:
+            head (str): The text that stays in the current message.
+            rest (str): The text that spills into the next message.
+
+        Returns:
+            tuple: The current message's final text and the next message's text so far.
+        """
+        blocks = code_blocks(head) if self.limits.markdown else []
+        if not blocks or blocks[-1][1] < len(head):
+            return head, rest.lstrip()
+        _, _, opening, marker = blocks[-1]
+        head = head.rstrip("\n") + "\n" + marker
+        # Only the line break at the cut goes; indentation inside the block is kept
+        rest = rest[1:] if rest[:1] in ("\n", " ") else rest
+        closing = FENCE.match(rest)
+        line = closing.group(0).strip() if closing is not None else ""
+        if line and line == closing.group(1) and line[0] == marker[0] and len(line) >= len(marker):
+            # Only the closing line is left, and the close just added replaces it
+            return head, rest[closing.end():].lstrip()
+        return head, opening + "\n" + rest
+
+    def cut_point(self, text: str) -> int:
+        """
+        Picks where to split an overlong text, preferring a line or word break.
+
+        Args:
+            text (str): Text longer than the limit.
+
+        Returns:
+            int: The length of the part that stays in the current message.
+        """
+        # Room for closing a code block that has to be split
+        reserve = FENCE_RESERVE if self.limits.markdown and FENCE.search(text) else 0
+        end = self.chunker.fit(text, 0, self.limits.limit - reserve)
+        for separator in ("\n", " "):
+            index = text.rfind(separator, 0, end)
+            if index > end // 2:
+                return index
+        # A hard cut never splits an accented character or an emoji sequence
+        cut = end
+        while cut > 1 and splits_cluster(text, cut):
+            cut -= 1
+        return cut
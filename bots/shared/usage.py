@@ -0,0 +1,382 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+from .memory import CHARS_PER_TOKEN, estimate_tokens
+
+# Sent in place of an answer when a user or chat has used up its tokens for the period
+QUOTA_RESPONSE = "You have reached your AI usage limit for now. Please try again later."
+
+
+class QuotaExceeded(Exception):
+    """Raised instead of calling the AI API when a request would exceed a token quota."""
+
+
+def usage_account(conversation, user_id) -> Optional[tuple]:
+    """
+    Returns the (platform, chat, user) a request is billed to, or None if it cannot be attributed.
+
+    Args:
+        conversation: The request's conversation key, `(platform, chat, user)`.
+        user_id: The requesting user, if the conversation does not name one.
+    """
+    if conversation is None:
+        return None
+    platform, chat, user = conversation
+    return (str(platform), str(chat), str(user_id if user_id is not None else user))
+
+
+def prompt_tokens(message: str, history: list = None) -> int:
+    """Estimates the prompt tokens of a message sent after `history`."""
+    return estimate_tokens(message) + sum(estimate_tokens(turn["content"]) for turn in history or ())
+
+
+class Reservation:
+    """The tokens held for one request until its actual usage is known."""
+
+    __slots__ = ("account", "prompt_tokens", "max_tokens", "held", "usage", "output_chars")
+
+    def __init__(self, account: tuple, prompt_tokens: int, max_tokens: int, held: int):
+        self.account = account
+        self.prompt_tokens = prompt_tokens
+        self.max_tokens = max_tokens
+        self.held = held
+        # (prompt, completion) tokens reported by the API, summed over hedged and retried calls
+        self.usage = None
+        self.output_chars = 0
+
+    def report(self, usage: dict):
+        prompt, completion = self.usage or (0, 0)
+        self.usage = (prompt + (usage.get("prompt_tokens") or 0), completion + (usage.get("completion_tokens") or 0))
+
+    def produced(self, text: str):
+        """Counts answer text, billed by estimate when the API reports no usage."""
+        if text:
+            self.output_chars += len(text)
+
+    def tokens(self) -> tuple:
+        """Returns the (prompt, completion) tokens to bill."""
+        if self.usage is not None:
+            return self.usage
+        if not self.output_chars:
+            # Nothing came back, so nothing was generated
+            return 0, 0
+        return self.prompt_tokens, self.output_chars // CHARS_PER_TOKEN + 1
+
+
+_current = ContextVar("usage_reservation", default=None)
+
+
+def charge_usage(usage: dict):
+    """Bills the `usage` object of an AI API answer to the current request, if it is metered."""
+    reservation = _current.get()
+    if reservation is not None and usage is not None:
+        reservation.report(usage)
+
+
+class UsageLedger:
+    """
+    Counts the AI tokens used per platform, chat and user, and enforces quotas.
+
+    The request path only touches dicts: `reserve` checks the user's and
+    the chat's quota and holds the tokens the request may use, `settle`
+    replaces the hold with the tokens the API reported. Settled usage is
+    collected per (platform, chat, user, period) and written to SQLite in
+    one transaction every `flush_interval` seconds, off the event loop;
+    when another process sharing the database wrote since, the flush also
+    re-reads the period's totals, so the processes see each other's usage.
+
+    `max_tokens` is picked per request: what is left of the model's context
+    after the prompt, capped by the configured maximum and by the quota
+    left. A request that would get fewer than `min_tokens` is refused.
+    """
+
+    def __init__(self, path: str = ":memory:", user_quota: int = None, chat_quota: int = None,
+                 period: float = 86400.0, context_tokens: int = 8192, min_tokens: int = 64,
+                 flush_interval: float = 5.0):
+        """
+        Args:
+            path (str): Location of the SQLite database file.
+            user_quota (int): Tokens a user may use per period, across chats; unlimited if omitted.
+            chat_quota (int): Tokens a chat may use per period, across users; unlimited if omitted.
+            period (float): Length of a quota period in seconds, aligned to the epoch (UTC days by default).
+            context_tokens (int): The model's context window, shared by the prompt and the answer.
+            min_tokens (int): Smallest answer worth requesting; requests that would get fewer are refused.
+            flush_interval (float): Seconds between writes of the collected usage.
+        """
+        self.user_quota = user_quota
+        self.chat_quota = chat_quota
+        self.period = period
+        self.context_tokens = context_tokens
+        self.min_tokens = min_tokens
+        self.flush_interval = flush_interval
+        self.current_period = self.period_of(time.time())
+        # Unwritten usage: [prompt, completion] by (platform, chat, user, period)
+        self.pending = {}
+        # Tokens used this period, and held by requests in flight, by ("user" or "chat", platform, id)
+        self.used = {}
+        self.held = {}
+        self.refused = 0
+        self.flushes = 0
+        self.flush_task = None
+        # Flushes run on a worker thread; closing waits for one in progress
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS usage ("
+            "platform TEXT NOT NULL, chat TEXT NOT NULL, user TEXT NOT NULL, period INTEGER NOT NULL, "
+            "prompt_tokens INTEGER NOT NULL, completion_tokens INTEGER NOT NULL, "
+            "PRIMARY KEY (period, platform, chat, user))"
+        )
+        self.used = self.load(self.current_period)
+        self.data_version = self.connection.execute("PRAGMA data_version").fetchone()[0]
+
+    def period_of(self, timestamp: float) -> int:
+        return int(timestamp // self.period)
+
+    def load(self, period: int) -> dict:
+        """Returns the tokens recorded in the database for a period, by quota key."""
+        used = {}
+        rows = self.connection.execute(
+            "SELECT platform, chat, user, prompt_tokens + completion_tokens FROM usage WHERE period = ?", (period,)
+        )
+        for platform, chat, user, tokens in rows:
+            for key in (("user", platform, user), ("chat", platform, chat)):
+                used[key] = used.get(key, 0) + tokens
+        return used
+
+    @property
+    def enforcing(self) -> bool:
+        """Whether any quota is set."""
+        return self.user_quota is not None or self.chat_quota is not None
+
+    def quota_keys(self, account: tuple) -> list:
+        platform, chat, user = account
+        keys = []
+        if self.user_quota is not None:
+            keys.append((("user", platform, user), self.user_quota))
+        if self.chat_quota is not None:
+            keys.append((("chat", platform, chat), self.chat_quota))
+        return keys
+
+    def roll_period(self):
+        period = self.period_of(time.time())
+        if period != self.current_period:
+            self.current_period = period
+            self.used = {}
+
+    def remaining(self, account: tuple) -> Optional[int]:
+        """Returns the tokens the account may still use this period, or None without quotas."""
+        self.roll_period()
+        remaining = None
+        for key, quota in self.quota_keys(account):
+            left = quota - self.used.get(key, 0) - self.held.get(key, 0)
+            remaining = left if remaining is None else min(remaining, left)
+        return remaining
+
+    def reserve(self, account: tuple, prompt_tokens: int, max_tokens: int) -> Reservation:
+        """
+        Picks a request's `max_tokens` and holds its tokens against the quotas.
+
+        Args:
+            account (tuple): The (platform, chat, user) billed, see `usage_account`.
+            prompt_tokens (int): Estimated tokens of the prompt.
+            max_tokens (int): The most tokens the request may generate.
+
+        Returns:
+            Reservation: The hold, with the `max_tokens` to request.
+
+        Raises:
+            QuotaExceeded: If fewer than `min_tokens` would be left for the answer.
+        """
+        # A prompt that fills the context is cut short upstream rather than refused here
+        limit = min(max_tokens, max(self.min_tokens, self.context_tokens - prompt_tokens))
+        remaining = self.remaining(account)
+        if remaining is not None:
+            limit = min(limit, remaining - prompt_tokens)
+            if limit < min(self.min_tokens, max_tokens):
+                self.refused += 1
+                raise QuotaExceeded(f"{account[0]} user {account[2]} in chat {account[1]} is out of tokens")
+        held = prompt_tokens + limit
+        for key, _ in self.quota_keys(account):
+            self.held[key] = self.held.get(key, 0) + held
+        return Reservation(account, prompt_tokens, limit, held)
+
+    def settle(self, reservation: Reservation):
+        """Releases a request's hold and records the tokens it used."""
+        for key, _ in self.quota_keys(reservation.account):
+            held = self.held.get(key, 0) - reservation.held
+            if held > 0:
+                self.held[key] = held
+            else:
+                self.held.pop(key, None)
+        prompt, completion = reservation.tokens()
+        if prompt or completion:
+            self.record(reservation.account, prompt, completion)
+
+    def record(self, account: tuple, prompt: int, completion: int):
+        """Adds used tokens to the account's totals and to the next flush."""
+        self.roll_period()
+        key = account + (self.current_period,)
+        pending = self.pending.get(key)
+        if pending is None:
+            self.pending[key] = [prompt, completion]
+        else:
+            pending[0] += prompt
+            pending[1] += completion
+        platform, chat, user = account
+        for quota_key in (("user", platform, user), ("chat", platform, chat)):
+            self.used[quota_key] = self.used.get(quota_key, 0) + prompt + completion
+
+    def write(self, batch: dict, period: int):
+        """
+        Adds a batch of usage to the database in one transaction.
+
+        Returns:
+            dict: The period's totals by quota key if quotas are enforced and another process wrote, else None.
+        """
+        with self.lock, self.connection:
+            # Changes only when another process commits, so a lone process never re-reads its own usage
+            version = self.connection.execute("PRAGMA data_version").fetchone()[0]
+            self.connection.execute("BEGIN")
+            self.connection.executemany(
+                "INSERT INTO usage (platform, chat, user, period, prompt_tokens, completion_tokens) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (period, platform, chat, user) DO UPDATE SET "
+                "prompt_tokens = prompt_tokens + excluded.prompt_tokens, "
+                "completion_tokens = completion_tokens + excluded.completion_tokens",
+                # Rows are built one at a time; a list of them all would set off a garbage collection
+                (key + (prompt, completion) for key, (prompt, completion) in batch.items()),
+            )
+            if not self.enforcing or version == self.data_version:
+                return None
+            self.data_version = version
+            return self.load(period)
+
+    async def flush(self):
+        """Writes the collected usage on a worker thread and picks up other processes' usage."""
+        if not self.pending and not self.enforcing:
+            return
+        batch, self.pending = self.pending, {}
+        period = self.current_period
+        try:
+            used = await asyncio.get_running_loop().run_in_executor(None, self.write, batch, period)
+        except sqlite3.Error:
+            # Kept for the next flush
+            for key, (prompt, completion) in batch.items():
+                pending = self.pending.setdefault(key, [0, 0])
+                pending[0] += prompt
+                pending[1] += completion
+            raise
+        self.flushes += 1
+        if used is None or period != self.current_period:
+            return
+        # Usage settled while the batch was written is not in the database yet
+        for (platform, chat, user, pending_period), (prompt, completion) in self.pending.items():
+            if pending_period == period:
+                for key in (("user", platform, user), ("chat", platform, chat)):
+                    used[key] = used.get(key, 0) + prompt + completion
+        self.used = used
+
+    async def run_flusher(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except sqlite3.Error as e:
+                print(f"Failed to write AI usage: {e}")
+
+    async def start(self):
+        """Starts the periodic flush on the running loop. Calling it again is a no-op."""
+        if self.flush_task is None:
+            self.flush_task = asyncio.create_task(self.run_flusher())
+
+    async def close(self):
+        """Stops the periodic flush, writes what is left and closes the database."""
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            await asyncio.gather(self.flush_task, return_exceptions=True)
+            self.flush_task = None
+        if self.pending:
+            self.write(self.pending, self.current_period)
+            self.pending = {}
+        with self.lock:
+            self.connection.close()
+
+    def stats(self) -> dict:
+        """Returns the accounts with usage this period, refused requests and unwritten rows."""
+        return {
+            "users": sum(1 for key in self.used if key[0] == "user"),
+            "refused": self.refused,
+            "pending": len(self.pending),
+            "flushes": self.flushes,
+        }
+
+
+@contextmanager
+def metered(ledger: Optional[UsageLedger], conversation, user_id, message: str, history: list, max_tokens: int):
+    """
+    Holds a request's tokens for the duration of the block and bills what it used when the block ends.
+
+    API usage reported inside the block, also by tasks it starts, is billed
+    to the request, see `charge_usage`.
+
+    Args:
+        ledger (UsageLedger): The ledger, or None when usage is not tracked.
+        conversation: The request's conversation key.
+        user_id: The requesting user.
+        message (str): The user's input message.
+        history (list): Earlier messages of the conversation sent along.
+        max_tokens (int): The most tokens the request may generate.
+
+    Yields:
+        Reservation: The hold, or None when the request is not metered.
+
+    Raises:
+        QuotaExceeded: If the request is over quota.
+    """
+    account = usage_account(conversation, user_id) if ledger is not None else None
+    if account is None:
+        yield None
+        return
+    reservation = ledger.reserve(account, prompt_tokens(message, history), max_tokens)
+    # Restored rather than reset: a stream's generator may be finalized from another context
+    previous = _current.get()
+    _current.set(reservation)
+    try:
+        yield reservation
+    finally:
+        _current.set(previous)
+        ledger.settle(reservation)
+
+
+def usage_ledger_from_env() -> Optional[UsageLedger]:
+    """
+    Builds the usage ledger configured through environment variables.
+
+    `AI_USAGE=0` turns accounting off. Usage is kept in memory unless
+    `AI_USAGE_PATH` locates a SQLite database, which keeps it across
+    restarts and shares it between processes. `AI_USER_TOKEN_QUOTA` and `AI_CHAT_TOKEN_QUOTA` set the tokens
+    a user or chat may use per `AI_QUOTA_PERIOD` seconds (no quota unless
+    set), `AI_CONTEXT_TOKENS` is the model's context window and
+    `AI_USAGE_FLUSH_INTERVAL` how often usage is written.
+
+    Returns:
+        UsageLedger: The configured ledger, or None if accounting is off.
+    """
+    if os.getenv("AI_USAGE", "1") != "1":
+        return None
+    user_quota = os.getenv("AI_USER_TOKEN_QUOTA")
+    chat_quota = os.getenv("AI_CHAT_TOKEN_QUOTA")
+    return UsageLedger(
+        os.getenv("AI_USAGE_PATH") or ":memory:",
+        user_quota=int(user_quota) if user_quota else None,
+        chat_quota=int(chat_quota) if chat_quota else None,
+        period=float(os.getenv("AI_QUOTA_PERIOD", "86400")),
+        context_tokens=int(os.getenv("AI_CONTEXT_TOKENS", "8192")),
+        flush_interval=float(os.getenv("AI_USAGE_FLUSH_INTERVAL", "5")),
+    )
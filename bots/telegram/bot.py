@@ -1,17 +1,31 @@
-import os
-import json
-import aiohttp
-from dotenv import load_dotenv
 from telegram import Update
-from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, filters, ContextTypes
+from telegram.error import RetryAfter
+from telegram.ext import Application, ApplicationBuilder, CommandHandler, MessageHandler, filters, ContextTypes
+from bots.shared.ai_client import ai_client_from_env
+from bots.shared.cache import strip_bypass_flag
+from bots.shared.chunking import TELEGRAM, MessageChunker, deliver_chunks
+from bots.shared.jobs import job_pipeline_from_env
+from bots.shared.metrics import mark, record_error, trace_request
+from bots.shared.outbound import PRIORITY_COSMETIC, PRIORITY_FINAL, outbound_scheduler_from_env
+from bots.shared.scheduler import (
+    PRIORITY_COMMAND,
+    PRIORITY_MESSAGE,
+    SHED_MESSAGE,
+    RequestShed,
+    request_scheduler_from_env,
+)
+from bots.shared.settings import Settings, settings_from_env
+from bots.shared.streaming import StreamingReply
 
-# Load environment variables
-load_dotenv()
 
-# Fetch tokens and keys from environment variables
-TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
-OPEN_ROUTER_API_KEY = os.getenv("OPEN_ROUTER_API_KEY")
-AI_BASE_URL = "https://openrouter.ai/api/v1"
+def telegram_retry_after(error: Exception):
+    """Returns the seconds Telegram asks to wait if `error` is a flood-control answer, else None."""
+    if not isinstance(error, RetryAfter):
+        return None
+    retry_after = error.retry_after
+    # Recent python-telegram-bot versions may give a timedelta
+    return retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else float(retry_after)
+
 
 class TelegramAIChatBot:
     """
@@ -19,9 +33,52 @@ class TelegramAIChatBot:
     Provides both personalized greetings and AI responses.
     """
     
-    def __init__(self):
-        """Initializes the bot with commands and sets up handlers."""
-        self.application = ApplicationBuilder().token(TELEGRAM_BOT_TOKEN).build()
+    def __init__(self, ai_client=None, scheduler=None, token: str = None, base_url: str = None, workers: int = None,
+                 jobs=None, outbound=None, settings: Settings = None):
+        """
+        Initializes the bot with commands and sets up handlers.
+
+        Args:
+            ai_client (AIClient): The AI client; one is built from the environment, and owned by the bot, if omitted.
+            scheduler (RequestScheduler): Admission control for AI requests; built from the environment if omitted.
+            token (str): The bot token; `TELEGRAM_BOT_TOKEN` if omitted.
+            base_url (str): Base URL of the Bot API server, up to and including `/bot`; `TELEGRAM_BASE_URL`,
+                or the public one, if omitted.
+            workers (int): Number of updates handled concurrently; `TELEGRAM_WORKERS` if omitted.
+            jobs (JobPipeline): Durable job queue answering requests; built from the environment, and owned
+                by the bot, if omitted. Requests are answered inline when there is none.
+            outbound (OutboundScheduler): Paces the bot's replies and edits; built from the environment if omitted.
+            settings (Settings): The bot's settings; read from the environment, and `.env`, if omitted.
+        """
+        self.settings = settings or settings_from_env()
+        token = token or self.settings.telegram_bot_token
+        base_url = base_url or self.settings.telegram_base_url
+        workers = workers or self.settings.telegram_workers
+        # Shared AI client, bound to the application's start/stop lifecycle unless it was passed in
+        self.owns_ai_client = ai_client is None
+        self.ai_client = ai_client or ai_client_from_env()
+        # Caps concurrent AI requests, rate-limits each user and chat, and serves commands first
+        self.scheduler = scheduler or request_scheduler_from_env()
+        # Optional durable queue between the handlers and the AI calls
+        self.owns_jobs = jobs is None
+        self.jobs = jobs if jobs is not None else job_pipeline_from_env(self.ai_client, self.scheduler,
+                                                                         platform="telegram")
+        if self.jobs is not None:
+            self.jobs.register("telegram", self.deliver_job)
+        # Paces replies and edits per chat within Telegram's limits, answers first
+        self.outbound = outbound or outbound_scheduler_from_env("telegram", retry_after=telegram_retry_after)
+        builder = (
+            ApplicationBuilder()
+            .token(token)
+            # Updates are handled concurrently; the scheduler bounds the AI requests they make
+            .concurrent_updates(workers)
+            .post_init(self.on_startup)
+            .post_shutdown(self.on_shutdown)
+        )
+        if base_url:
+            builder = builder.base_url(base_url)
+        self.workers = workers
+        self.application = builder.build()
         
         # Register bot commands
         self.setup_commands()
@@ -40,6 +97,50 @@ class TelegramAIChatBot:
         # Catch-all handler for regular messages
         self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
 
+    async def on_startup(self, application: Application):
+        """Opens the pooled AI client, and resumes queued jobs, once the application is initialized."""
+        await self.ai_client.start()
+        if self.jobs is not None and self.owns_jobs:
+            await self.jobs.start()
+
+    async def on_shutdown(self, application: Application):
+        """Closes the job queue and the AI client's connections, if the bot owns them, when the application shuts down."""
+        if self.jobs is not None and self.owns_jobs:
+            await self.jobs.close()
+        await self.outbound.close()
+        if self.owns_ai_client:
+            await self.ai_client.close()
+
+    async def reply(self, update: Update, text: str, priority: int = PRIORITY_FINAL):
+        """
+        Replies to the update's message through the outbound scheduler.
+
+        Args:
+            update (Update): The Telegram update object.
+            text (str): The reply's text.
+            priority (int): `PRIORITY_FINAL` for answers, `PRIORITY_COSMETIC` for placeholders and greetings.
+
+        Returns:
+            Message: The sent message.
+        """
+        return await self.outbound.send(("chat", update.effective_chat.id), lambda: update.message.reply_text(text),
+                                        priority)
+
+    async def edit_message(self, chat_id: int, message_id: int, text: str, priority: int = PRIORITY_FINAL):
+        """
+        Replaces a message's text through the outbound scheduler; a queued edit of the same message is dropped.
+
+        Args:
+            chat_id (int): The chat of the message.
+            message_id (int): The message to edit.
+            text (str): The new text.
+            priority (int): `PRIORITY_FINAL` for answers, `PRIORITY_COSMETIC` for interim streaming edits.
+        """
+        bot = self.application.bot
+        await self.outbound.send(("chat", chat_id),
+                                 lambda: bot.edit_message_text(text, chat_id=chat_id, message_id=message_id),
+                                 priority, merge_key=message_id)
+
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
         Responds to the /start command with a welcome message.
@@ -48,7 +149,8 @@ class TelegramAIChatBot:
             update (Update): The Telegram update object.
             context (ContextTypes.DEFAULT_TYPE): The context for the command.
         """
-        await update.message.reply_text("Welcome! Use /call <message> or /ask <question> to interact with the AI.")
+        await self.reply(update, "Welcome! Use /call <message> or /ask <question> to interact with the AI.",
+                         PRIORITY_COSMETIC)
 
     async def call_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
@@ -60,14 +162,14 @@ class TelegramAIChatBot:
         """
         user_name = update.effective_user.first_name or "User"
         greeting = f"Hello, {user_name}, I am your assistant."
-        await update.message.reply_text(greeting)
+        await self.reply(update, greeting, PRIORITY_COSMETIC)
         
         # Get the message text after /call command
-        message_text = " ".join(context.args)
+        message_text, use_cache = strip_bypass_flag(" ".join(context.args))
         if message_text:
-            await self.show_thinking_message(update, message_text)
+            await self.show_thinking_message(update, message_text, use_cache=use_cache, command="call")
         else:
-            await update.message.reply_text("Please provide a message after /call.")
+            await self.reply(update, "Please provide a message after /call.")
 
     async def ask_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
@@ -77,11 +179,11 @@ class TelegramAIChatBot:
             update (Update): The Telegram update object.
             context (ContextTypes.DEFAULT_TYPE): The context for the command.
         """
-        question_text = " ".join(context.args)
+        question_text, use_cache = strip_bypass_flag(" ".join(context.args))
         if question_text:
-            await self.show_thinking_message(update, question_text)
+            await self.show_thinking_message(update, question_text, use_cache=use_cache, command="ask")
         else:
-            await update.message.reply_text("Please provide a question after /ask.")
+            await self.reply(update, "Please provide a question after /ask.")
 
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
@@ -92,59 +194,143 @@ class TelegramAIChatBot:
             context (ContextTypes.DEFAULT_TYPE): The context for the command.
         """
         message_text = update.message.text
-        await self.show_thinking_message(update, message_text)
+        await self.show_thinking_message(update, message_text, priority=PRIORITY_MESSAGE, command="message")
 
-    async def fetch_ai_response(self, message: str) -> str:
+    async def fetch_ai_response(self, message: str, use_cache: bool = True, command: str = None, user_id=None,
+                                conversation=None) -> str:
         """
         Fetches an AI-generated response based on the given user message.
 
         Args:
             message (str): The user's input message to send to the AI.
+            use_cache (bool): Whether the response cache may answer this request.
+            command (str): The command that triggered the request, used for model routing.
+            user_id: The requesting user, used for model routing.
+            conversation: Key of the conversation to continue, if any.
 
         Returns:
             str: The response from the AI, or an error message if the request fails.
         """
-        headers = {
-            "Authorization": f"Bearer {OPEN_ROUTER_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        data = {
-            "model": "openai/gpt-4",
-            "prompt": message,
-            "max_tokens": 1000,
-            "temperature": 1.0
-        }
-
-        async with aiohttp.ClientSession() as session:
-            async with session.post(AI_BASE_URL + "/completions", headers=headers, json=data) as response:
-                if response.status == 200:
-                    response_data = await response.json()
-                    return response_data["choices"][0]["text"].strip()
-                else:
-                    error_message = await response.text()
-                    print(f"HTTP error {response.status}: {error_message}")
-                    return "Failed to get a response due to an HTTP error."
-
-    async def show_thinking_message(self, update: Update, message: str):
+        return await self.ai_client.fetch_ai_response(message, use_cache=use_cache, command=command, user_id=user_id,
+                                                      conversation=conversation)
+
+    def conversation_key(self, update: Update) -> tuple:
+        """Identifies the conversation of the update's user in its chat."""
+        return ("telegram", update.effective_chat.id, update.effective_user.id)
+
+    async def show_thinking_message(self, update: Update, message: str, use_cache: bool = True,
+                                    priority: int = PRIORITY_COMMAND, command: str = None):
         """
         Sends a "Thinking..." message, fetches an AI response, and updates with the final response.
 
         Args:
             update (Update): The Telegram update object.
             message (str): The user's message to be processed by the AI.
+            use_cache (bool): Whether the response cache may answer this request.
+            priority (int): The scheduler lane; catch-all messages wait behind commands.
+            command (str): The command that triggered the request, used for model routing.
         """
         if update.message:  # Ensure message is not None
-            thinking_message = await update.message.reply_text("Thinking...")
-            ai_response = await self.fetch_ai_response(message)
-            
-            # If response is too long, send it in chunks
-            await self.display_response_with_chunks(update, ai_response, thinking_message)
+            with trace_request("telegram", command):
+                thinking_message = await self.reply(update, "Thinking...", PRIORITY_COSMETIC)
+                mark("thinking_sent")
+                if self.jobs is not None:
+                    await self.submit_job(update, message, thinking_message, use_cache=use_cache, priority=priority,
+                                          command=command)
+                    return
+                try:
+                    async with self.scheduler.slot(update.effective_user.id, update.effective_chat.id, priority):
+                        if self.settings.ai_streaming:
+                            await self.stream_response(update, message, thinking_message, use_cache=use_cache,
+                                                       command=command)
+                            return
+                        ai_response = await self.fetch_ai_response(message, use_cache=use_cache, command=command,
+                                                                   user_id=update.effective_user.id,
+                                                                   conversation=self.conversation_key(update))
+                except RequestShed:
+                    record_error("shed")
+                    await self.edit_message(thinking_message.chat_id, thinking_message.message_id, SHED_MESSAGE)
+                    return
+
+                # If response is too long, send it in chunks
+                await self.display_response_with_chunks(update, ai_response, thinking_message)
         else:
             print("Received an update with no message content.")
 
+    async def submit_job(self, update: Update, message: str, thinking_message, use_cache: bool = True,
+                         priority: int = PRIORITY_COMMAND, command: str = None):
+        """
+        Queues the AI request on the job pipeline, which later edits the "Thinking..." message.
+
+        Args:
+            update (Update): The Telegram update object.
+            message (str): The user's message to be processed by the AI.
+            thinking_message: The "Thinking..." message to answer in.
+            use_cache (bool): Whether the response cache may answer this request.
+            priority (int): The scheduler lane; catch-all messages wait behind commands.
+            command (str): The command that triggered the request, used for model routing.
+        """
+        try:
+            self.scheduler.take_tokens(update.effective_user.id, update.effective_chat.id)
+        except RequestShed:
+            record_error("shed")
+            await self.edit_message(thinking_message.chat_id, thinking_message.message_id, SHED_MESSAGE)
+            return
+        target = {"chat_id": thinking_message.chat_id, "message_id": thinking_message.message_id}
+        self.jobs.submit("telegram", target, message, priority=priority, use_cache=use_cache, command=command,
+                         user_id=update.effective_user.id, conversation=self.conversation_key(update))
+
+    async def deliver_job(self, target: dict, response: str):
+        """
+        Delivers a queued job's AI response by editing its "Thinking..." message, in chunks if needed.
+
+        Args:
+            target (dict): The chat id and message id of the "Thinking..." message.
+            response (str): The AI response.
+        """
+        bot = self.application.bot
+        chat_id = target["chat_id"]
+
+        async def edit(text):
+            await self.edit_message(chat_id, target["message_id"], text)
+
+        async def send(text):
+            await self.outbound.send(("chat", chat_id), lambda: bot.send_message(chat_id, text))
+
+        await deliver_chunks(MessageChunker(TELEGRAM).split(response), edit, send)
+
+    async def stream_response(self, update: Update, message: str, thinking_message, use_cache: bool = True,
+                              command: str = None):
+        """
+        Streams the AI response into the "Thinking..." message as tokens arrive, spilling into
+        new messages once it passes Telegram's 4096 character limit.
+
+        Args:
+            update (Update): The Telegram update object.
+            message (str): The user's message to be processed by the AI.
+            thinking_message: The initial "Thinking..." message to edit.
+            use_cache (bool): Whether the response cache may answer this request.
+            command (str): The command that triggered the request, used for model routing.
+        """
+        async def edit(target, text, final):
+            await self.edit_message(target.chat_id, target.message_id, text,
+                                    PRIORITY_FINAL if final else PRIORITY_COSMETIC)
+
+        async def send(text, final):
+            return await self.reply(update, text, PRIORITY_FINAL if final else PRIORITY_COSMETIC)
+
+        reply = StreamingReply(thinking_message, edit, send, TELEGRAM)
+        fragments = self.ai_client.stream_ai_response(message, use_cache=use_cache, command=command,
+                                                      user_id=update.effective_user.id,
+                                                      conversation=self.conversation_key(update))
+        async for fragment in fragments:
+            await reply.feed(fragment)
+        await reply.finish()
+
     async def display_response_with_chunks(self, update: Update, response: str, message):
         """
-        Edits or splits the AI response into manageable chunks if the response length exceeds Telegram's message limit.
+        Edits the AI response into the "Thinking..." message, splitting it on paragraph, sentence and
+        code block boundaries into replies if it exceeds Telegram's message limit.
 
         Args:
             update (Update): The Telegram update object.
@@ -152,20 +338,24 @@ class TelegramAIChatBot:
             message: The initial "Thinking..." message to edit or replace.
         """
         if update.message:  # Ensure message is not None
-            if len(response) > 4096:
-                response_chunks = [response[i:i + 4096] for i in range(0, len(response), 4096)]
-                await message.edit_text(response_chunks[0])
-                for chunk in response_chunks[1:]:
-                    await update.message.reply_text(chunk)
-            else:
-                await message.edit_text(response)
+            async def edit(text):
+                await self.edit_message(message.chat_id, message.message_id, text)
+
+            async def send(text):
+                await self.reply(update, text)
+
+            await deliver_chunks(MessageChunker(TELEGRAM).split(response), edit, send)
         else:
             print("Received an update with no message content.")
 
 def run_telegram_bot():
-    """Function to instantiate and run the Telegram bot."""
-    bot = TelegramAIChatBot()
-    bot.application.run_polling()
+    """Function to instantiate and run the Telegram bot, polling or behind a webhook per `TELEGRAM_MODE`."""
+    bot = TelegramAIChatBot(settings=settings_from_env())
+    if bot.settings.telegram_mode == "webhook":
+        from bots.telegram.webhook import run_webhook
+        run_webhook(bot)
+    else:
+        bot.application.run_polling()
 
 # Run the bot when the script is executed directly
 if __name__ == "__main__":
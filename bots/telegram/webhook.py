@@ -0,0 +1,227 @@
+import asyncio
+import hmac
+import os
+import signal
+from collections import deque
+from aiohttp import web
+from telegram import Update
+from bots.shared.metrics import METRICS
+
+# Header in which Telegram echoes the secret token registered with setWebhook
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class TelegramWebhookServer:
+    """
+    Receives Telegram updates over a webhook instead of long polling.
+
+    Every POST is checked against the secret token, put on a bounded queue
+    and acknowledged at once; `workers` tasks then feed the queued updates to
+    the application's handlers. When the queue is full the update is refused
+    with 503, and Telegram delivers it again later.
+
+    Several replicas can run behind a load balancer: each one serves the same
+    path and secret, and only the one started with `webhook_url` registers the
+    webhook. Stopping a replica does not remove the webhook.
+    """
+
+    def __init__(self, application, secret_token: str, host: str = "0.0.0.0", port: int = 8443,
+                 path: str = "/telegram", queue_size: int = 1000, workers: int = 16, webhook_url: str = None,
+                 max_connections: int = 40):
+        """
+        Args:
+            application (telegram.ext.Application): The bot's application, whose handlers process the updates.
+            secret_token (str): Secret Telegram must send in `X-Telegram-Bot-Api-Secret-Token`.
+            host (str): Interface to listen on.
+            port (int): Port to listen on; 0 picks a free one.
+            path (str): URL path updates are posted to.
+            queue_size (int): Maximum number of updates waiting for a worker.
+            workers (int): Number of updates processed concurrently.
+            webhook_url (str): Public URL to register with Telegram on start; registration is skipped if omitted.
+            max_connections (int): Concurrent connections Telegram may open to the webhook.
+        """
+        if not secret_token:
+            raise ValueError("A webhook secret token is required.")
+        self.application = application
+        self.secret_token = secret_token
+        self.host = host
+        self.port = port
+        self.path = path
+        self.worker_count = workers
+        self.webhook_url = webhook_url
+        self.max_connections = max_connections
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.workers = []
+        # Telegram redelivers updates it did not see acknowledged; recent ids are dropped
+        self.recent_ids = set()
+        self.recent_order = deque()
+        self.max_recent = 10_000
+        self.runner = None
+        self.received = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.shed = 0
+        self.processed = 0
+        self.failed = 0
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        """Validates, queues and acknowledges one update."""
+        token = request.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(token.encode(), self.secret_token.encode()):
+            self.rejected += 1
+            return web.Response(status=403)
+        try:
+            data = await request.json()
+            update_id = data["update_id"]
+        except (ValueError, KeyError, TypeError):
+            return web.Response(status=400)
+
+        self.received += 1
+        if update_id in self.recent_ids:
+            self.duplicates += 1
+            return web.Response()
+        try:
+            self.queue.put_nowait(data)
+        except asyncio.QueueFull:
+            self.shed += 1
+            return web.Response(status=503, headers={"Retry-After": "1"})
+        self.recent_ids.add(update_id)
+        self.recent_order.append(update_id)
+        if len(self.recent_order) > self.max_recent:
+            self.recent_ids.discard(self.recent_order.popleft())
+        return web.Response()
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        """Lets a load balancer check the replica, reporting its queue depth."""
+        return web.json_response({"status": "ok", "queue_depth": self.queue.qsize()})
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        """Serves the process's metrics, so each replica can be scraped on its webhook port."""
+        return web.Response(body=METRICS.render().encode(),
+                            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    async def worker(self):
+        """Processes queued updates one at a time until cancelled."""
+        while True:
+            data = await self.queue.get()
+            try:
+                update = Update.de_json(data, self.application.bot)
+                await self.application.process_update(update)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"Failed to process Telegram update: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def start(self):
+        """Initializes the application, starts the workers, listens for updates and registers the webhook."""
+        await self.application.initialize()
+        await self.application.start()
+        self.workers = [asyncio.create_task(self.worker()) for _ in range(self.worker_count)]
+
+        app = web.Application()
+        app.router.add_post(self.path, self.handle_update)
+        app.router.add_get("/healthz", self.handle_health)
+        app.router.add_get("/metrics", self.handle_metrics)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        print(f"Telegram webhook listening on {self.host}:{self.port}{self.path}")
+
+        if self.webhook_url:
+            await self.application.bot.set_webhook(
+                self.webhook_url,
+                secret_token=self.secret_token,
+                max_connections=self.max_connections,
+            )
+
+    async def stop(self):
+        """Stops accepting updates, finishes the queued ones and shuts the application down."""
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+        await self.queue.join()
+        for task in self.workers:
+            task.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        if self.application.running:
+            await self.application.stop()
+        await self.application.shutdown()
+
+    def stats(self) -> dict:
+        """Returns counts of received, duplicate, rejected, shed, processed and failed updates."""
+        return {
+            "received": self.received,
+            "duplicates": self.duplicates,
+            "rejected": self.rejected,
+            "shed": self.shed,
+            "processed": self.processed,
+            "failed": self.failed,
+            "queue_depth": self.queue.qsize(),
+        }
+
+
+def webhook_server_from_env(application, workers: int = 16) -> TelegramWebhookServer:
+    """
+    Builds the webhook server configured through environment variables.
+
+    `TELEGRAM_WEBHOOK_SECRET` is required. `TELEGRAM_WEBHOOK_HOST`,
+    `TELEGRAM_WEBHOOK_PORT` and `TELEGRAM_WEBHOOK_PATH` set where it listens,
+    `TELEGRAM_WEBHOOK_QUEUE` bounds the queue, and `TELEGRAM_WEBHOOK_URL`,
+    set on one replica only, registers the webhook with Telegram.
+
+    Args:
+        application (telegram.ext.Application): The bot's application.
+        workers (int): Number of updates processed concurrently.
+
+    Returns:
+        TelegramWebhookServer: The configured, not yet started, server.
+    """
+    return TelegramWebhookServer(
+        application,
+        secret_token=os.getenv("TELEGRAM_WEBHOOK_SECRET"),
+        host=os.getenv("TELEGRAM_WEBHOOK_HOST", "0.0.0.0"),
+        port=int(os.getenv("TELEGRAM_WEBHOOK_PORT", "8443")),
+        path=os.getenv("TELEGRAM_WEBHOOK_PATH", "/telegram"),
+        queue_size=int(os.getenv("TELEGRAM_WEBHOOK_QUEUE", "1000")),
+        workers=workers,
+        webhook_url=os.getenv("TELEGRAM_WEBHOOK_URL"),
+        max_connections=int(os.getenv("TELEGRAM_WEBHOOK_MAX_CONNECTIONS", "40")),
+    )
+
+
+async def serve_webhook(bot):
+    """
+    Runs a Telegram bot behind its webhook until SIGINT or SIGTERM.
+
+    Args:
+        bot (TelegramAIChatBot): The bot to serve.
+    """
+    server = webhook_server_from_env(bot.application, workers=bot.workers)
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopping.set)
+
+    await server.start()
+    # Unlike run_polling, a manually started application does not call the post_init/post_shutdown hooks
+    await bot.on_startup(bot.application)
+    try:
+        await stopping.wait()
+    finally:
+        await server.stop()
+        await bot.on_shutdown(bot.application)
+
+
+def run_webhook(bot):
+    """
+    Runs a Telegram bot behind its webhook.
+
+    Args:
+        bot (TelegramAIChatBot): The bot to serve.
+    """
+    asyncio.run(serve_webhook(bot))
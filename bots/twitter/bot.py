@@ -1,128 +1,428 @@
-import os
 import asyncio
-import aiohttp
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import tweepy
-from dotenv import load_dotenv
 from tweepy import Stream
 from tweepy.streaming import StreamListener
+from bots.shared.ai_client import ai_client_from_env
+from bots.shared.cache import strip_bypass_flag
+from bots.shared.chunking import TWITTER, split_message
+from bots.shared.jobs import job_pipeline_from_env
+from bots.shared.metrics import mark, record_error, trace_request
+from bots.shared.outbound import PRIORITY_COSMETIC, PRIORITY_FINAL, outbound_scheduler_from_env
+from bots.shared.scheduler import SHED_MESSAGE, RequestShed, request_scheduler_from_env
+from bots.shared.settings import Settings, settings_from_env
+from bots.twitter.threads import thread_publisher_from_env, twitter_retry_after
 
-# Load environment variables
-load_dotenv()
 
-# Fetch tokens and keys from environment variables
-TWITTER_API_KEY = os.getenv("TWITTER_API_KEY")
-TWITTER_API_SECRET = os.getenv("TWITTER_API_SECRET")
-TWITTER_ACCESS_TOKEN = os.getenv("TWITTER_ACCESS_TOKEN")
-TWITTER_ACCESS_SECRET = os.getenv("TWITTER_ACCESS_SECRET")
-OPEN_ROUTER_API_KEY = os.getenv("OPEN_ROUTER_API_KEY")
-AI_BASE_URL = "https://openrouter.ai/api/v1"
+def twitter_auth(settings: Settings = None) -> tweepy.OAuthHandler:
+    """
+    Builds the OAuth handler for the bot account.
+
+    Args:
+        settings (Settings): Holds the API key and access token; read from the environment if omitted.
 
-# Setup Tweepy API
-auth = tweepy.OAuthHandler(TWITTER_API_KEY, TWITTER_API_SECRET)
-auth.set_access_token(TWITTER_ACCESS_TOKEN, TWITTER_ACCESS_SECRET)
-api = tweepy.API(auth)
+    Returns:
+        tweepy.OAuthHandler: The handler, for `tweepy.API` and the stream.
+    """
+    settings = settings or settings_from_env()
+    auth = tweepy.OAuthHandler(settings.twitter_api_key, settings.twitter_api_secret)
+    auth.set_access_token(settings.twitter_access_token, settings.twitter_access_secret)
+    return auth
 
 class AIChatBotListener(StreamListener):
     """
     A Twitter bot listener that responds to mentions and direct messages using the AI API.
     """
-    
-    async def fetch_ai_response(self, message: str) -> str:
+
+    def __init__(self, api=None, ai_client=None, scheduler=None, workers: int = None, queue_size: int = None,
+                 identity_refresh: float = None, loop: asyncio.AbstractEventLoop = None, jobs=None,
+                 reply_mode: str = None, outbound=None, settings: Settings = None):
+        """
+        Initializes the listener with a persistent event loop and a bounded worker pool.
+
+        The stream delivers events on its own thread, so the listener runs one
+        long-lived loop in a background thread, or uses `loop` when it shares
+        an already running loop with other bots; the owner of that loop then
+        awaits `start_workers()` and `aclose()` itself. Stream callbacks only enqueue
+        events; `workers` tasks on the loop handle them concurrently, and
+        blocking tweepy calls run on a thread pool of the same size. When
+        `queue_size` events are waiting, the stream thread blocks until a
+        worker frees a slot.
+
+        The bot's own user id and screen name are resolved once here and
+        refreshed every `identity_refresh` seconds, so handling an event never
+        calls `api.me()`.
+
+        Args:
+            api: The tweepy API used to post replies; one authenticated with `twitter_auth` if omitted.
+            ai_client (AIClient): The AI client; one is built from the environment if omitted.
+            scheduler (RequestScheduler): Admission control for AI requests; built from the environment if omitted.
+            workers (int): Number of events handled concurrently; `TWITTER_WORKERS` if omitted.
+            queue_size (int): Maximum number of events waiting for a worker; `TWITTER_QUEUE_SIZE` if omitted.
+            identity_refresh (float): Seconds between refreshes of the bot's identity; `TWITTER_IDENTITY_REFRESH`
+                if omitted.
+            loop (asyncio.AbstractEventLoop): A running loop to share; the listener runs its own if omitted.
+            jobs (JobPipeline): Durable job queue answering requests; built from the environment, and owned
+                by the listener, if omitted. Requests are answered inline when there is none.
+            reply_mode (str): "thread" to post long answers as numbered reply chains, "flat" to reply to
+                the mention with every part; `TWITTER_REPLY_MODE` if omitted.
+            outbound (OutboundScheduler): Paces tweets and direct messages; built from the environment if omitted.
+            settings (Settings): The listener's settings; read from the environment, and `.env`, if omitted.
+        """
+        self.settings = settings or settings_from_env()
+        workers = workers or self.settings.twitter_workers
+        queue_size = queue_size or self.settings.twitter_queue_size
+        identity_refresh = identity_refresh or self.settings.twitter_identity_refresh
+        reply_mode = reply_mode or self.settings.twitter_reply_mode
+        super().__init__(api if api is not None else tweepy.API(twitter_auth(self.settings)))
+        self.owns_loop = loop is None
+        if self.owns_loop:
+            self.loop = asyncio.new_event_loop()
+            self.loop_thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+            self.loop_thread.start()
+        else:
+            self.loop = loop
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tweepy")
+        self.owns_ai_client = ai_client is None
+        self.ai_client = ai_client or ai_client_from_env()
+        self.scheduler = scheduler or request_scheduler_from_env()
+        self.owns_jobs = jobs is None
+        self.jobs = jobs if jobs is not None else job_pipeline_from_env(self.ai_client, self.scheduler,
+                                                                         platform="twitter")
+        if self.jobs is not None:
+            self.jobs.register("twitter", self.deliver_job)
+        # Paces tweets and direct messages within the account's limits, answers first
+        self.outbound = outbound or outbound_scheduler_from_env("twitter", retry_after=twitter_retry_after)
+        # Posts answers to mentions as reply chains, see `ThreadPublisher`
+        self.threads = thread_publisher_from_env(self.post_reply) if reply_mode == "thread" else None
+        self.worker_count = workers
+        self.queue_size = queue_size
+        self.identity_refresh = identity_refresh
+        self.user_id = None
+        self.screen_name = None
+        if self.owns_loop:
+            self.run_async(self.start_workers())
+
+    async def start_workers(self):
+        """Resolves the bot's identity, opens the AI client and starts the worker tasks on the listener's loop."""
+        await self.resolve_identity()
+        await self.ai_client.start()
+        if self.threads is not None:
+            await self.threads.start()
+        if self.jobs is not None and self.owns_jobs:
+            await self.jobs.start()
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.workers = [asyncio.create_task(self.worker()) for _ in range(self.worker_count)]
+        self.identity_task = asyncio.create_task(self.refresh_identity(self.identity_refresh))
+
+    async def resolve_identity(self):
+        """Fetches and caches the bot account's numeric user id and screen name."""
+        me = await self.call_api(self.api.me)
+        self.user_id = me.id
+        self.screen_name = me.screen_name
+
+    async def refresh_identity(self, interval: float):
+        """
+        Re-resolves the bot's identity every `interval` seconds, e.g. after a rename.
+
+        Args:
+            interval (float): Seconds between refreshes.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.resolve_identity()
+            except Exception as e:
+                print(f"Failed to refresh the bot's Twitter identity: {e}")
+
+    def is_own_tweet(self, status) -> bool:
+        """
+        Checks whether a tweet was written by the bot itself.
+
+        Compares numeric user ids, which unlike screen names never change.
+
+        Args:
+            status: The tweet status to check.
+        """
+        return status.user.id == self.user_id
+
+    async def worker(self):
+        """Handles queued events one at a time until cancelled."""
+        while True:
+            job = await self.queue.get()
+            try:
+                await job
+            except Exception as e:
+                print(f"Failed to handle Twitter event: {e}")
+            finally:
+                self.queue.task_done()
+
+    def run_async(self, coro):
+        """
+        Runs a coroutine on the listener's event loop and waits for its result.
+
+        Args:
+            coro: The coroutine to run.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def submit(self, job):
+        """
+        Queues a coroutine for the worker pool, blocking while the queue is full.
+
+        Args:
+            job: The coroutine handling one event.
+        """
+        self.run_async(self.queue.put(job))
+
+    async def call_api(self, method, *args, **kwargs):
+        """
+        Runs a blocking tweepy call on the listener's thread pool.
+
+        Args:
+            method: The tweepy API method to call.
+        """
+        return await self.loop.run_in_executor(self.executor, partial(method, *args, **kwargs))
+
+    async def drain(self):
+        """Waits for queued events to finish, then stops the workers and closes the AI client if the listener owns it."""
+        await self.queue.join()
+        self.identity_task.cancel()
+        for task in self.workers:
+            task.cancel()
+        await asyncio.gather(self.identity_task, *self.workers, return_exceptions=True)
+        if self.jobs is not None and self.owns_jobs:
+            await self.jobs.close()
+        if self.threads is not None:
+            await self.threads.close()
+        await self.outbound.close()
+        if self.owns_ai_client:
+            await self.ai_client.close()
+
+    async def aclose(self):
+        """Finishes pending events and stops the workers when the listener shares its loop."""
+        await self.drain()
+        # Let in-flight tweepy calls finish without blocking the shared loop
+        await self.loop.run_in_executor(None, self.executor.shutdown)
+
+    def close(self):
+        """Finishes pending events, closes the AI client's connections and stops the event loop."""
+        self.run_async(self.drain())
+        self.executor.shutdown()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.loop_thread.join()
+
+    async def post_reply(self, text: str, reply_to: int, priority: int = PRIORITY_FINAL) -> int:
+        """
+        Tweets a reply through the outbound scheduler and returns its id.
+
+        Args:
+            text (str): The tweet's text.
+            reply_to (int): Id of the tweet replied to.
+            priority (int): `PRIORITY_FINAL` for answers, `PRIORITY_COSMETIC` for greetings.
+        """
+        status = await self.outbound.send(
+            ("mention", reply_to),
+            lambda: self.call_api(self.api.update_status, text, in_reply_to_status_id=reply_to),
+            priority,
+        )
+        return status.id
+
+    async def send_direct_message(self, recipient_id, text: str, priority: int = PRIORITY_FINAL):
+        """
+        Sends a direct message through the outbound scheduler.
+
+        Args:
+            recipient_id: The Twitter user ID to send the DM to.
+            text (str): The message's text.
+            priority (int): `PRIORITY_FINAL` for answers, `PRIORITY_COSMETIC` for placeholders.
+        """
+        await self.outbound.send(("dm", recipient_id),
+                                 lambda: self.call_api(self.api.send_direct_message, recipient_id, text), priority)
+
+    async def reply_with_parts(self, status_id: int, screen_name: str, response: str):
+        """
+        Answers a mention, as a numbered reply chain in thread mode, otherwise as sibling replies.
+
+        In thread mode this waits until the whole thread is posted, so a rate
+        limited account slows down the handling of new mentions too.
+
+        Args:
+            status_id (int): Id of the mention.
+            screen_name (str): Screen name of the mention's author.
+            response (str): The AI response.
+        """
+        mention = f"@{screen_name} "
+        if self.threads is not None:
+            await self.threads.publish(status_id, status_id, response, mention=mention)
+            mark("chunk_delivered")
+            return
+        for chunk in split_message(response, TWITTER, reserve=TWITTER.measure(mention)):
+            await self.post_reply(mention + chunk, status_id)
+            mark("chunk_delivered")
+
+    async def fetch_ai_response(self, message: str, use_cache: bool = True, command: str = None, user_id=None,
+                                conversation=None) -> str:
         """
         Fetches an AI-generated response based on the given user message.
 
         Args:
             message (str): The user's input message to send to the AI.
+            use_cache (bool): Whether the response cache may answer this request.
+            command (str): The command that triggered the request, used for model routing.
+            user_id: The requesting user, used for model routing.
+            conversation: Key of the conversation to continue, if any.
 
         Returns:
             str: The response from the AI, or an error message if the request fails.
         """
-        headers = {
-            "Authorization": f"Bearer {OPEN_ROUTER_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        data = {
-            "model": "openai/gpt-4",
-            "prompt": message,
-            "max_tokens": 1000,
-            "temperature": 1.0
-        }
-
-        async with aiohttp.ClientSession() as session:
-            async with session.post(AI_BASE_URL + "/completions", headers=headers, json=data) as response:
-                if response.status == 200:
-                    response_data = await response.json()
-                    return response_data["choices"][0]["text"].strip()
-                else:
-                    error_message = await response.text()
-                    print(f"HTTP error {response.status}: {error_message}")
-                    return "Failed to get a response due to an HTTP error."
+        return await self.ai_client.fetch_ai_response(message, use_cache=use_cache, command=command, user_id=user_id,
+                                                      conversation=conversation)
 
     def on_status(self, status):
         """
-        Event handler for when a tweet mentions the bot.
+        Event handler for when a tweet mentions the bot. Queues the tweet for the worker pool.
+        """
+        self.submit(self.handle_status(status))
+
+    def on_direct_message(self, status):
+        """
+        Event handler for direct messages to the bot. Queues the message for the worker pool.
+        """
+        self.submit(self.handle_direct_message(status))
+
+    async def handle_status(self, status):
         """
-        if status.user.screen_name != api.me().screen_name:
+        Replies to a tweet mentioning the bot.
+
+        Args:
+            status: The tweet status mentioning the bot.
+        """
+        if not self.is_own_tweet(status):
             command, *message_parts = status.text.split(maxsplit=1)
-            message = message_parts[0] if message_parts else ""
+            message, use_cache = strip_bypass_flag(message_parts[0] if message_parts else "")
 
             if "/call" in command:
-                user_name = status.user.screen_name
-                greeting = f"Hello, {user_name}, I am your assistant."
-                api.update_status(f"@{status.user.screen_name} {greeting}", in_reply_to_status_id=status.id)
-                asyncio.run(self.respond_with_ai(status, message))
+                with trace_request("twitter", "call"):
+                    user_name = status.user.screen_name
+                    greeting = f"Hello, {user_name}, I am your assistant."
+                    await self.post_reply(f"@{status.user.screen_name} {greeting}", status.id, PRIORITY_COSMETIC)
+                    await self.respond_with_ai(status, message, use_cache=use_cache, command="call")
 
             elif "/ask" in command:
-                asyncio.run(self.respond_with_ai(status, message))
+                with trace_request("twitter", "ask"):
+                    await self.respond_with_ai(status, message, use_cache=use_cache, command="ask")
 
-    def on_direct_message(self, status):
+    async def handle_direct_message(self, status):
         """
-        Event handler for direct messages to the bot.
+        Replies to a direct message sent to the bot.
+
+        Args:
+            status: The event carrying the direct message.
         """
         dm_text = status.direct_message['text']
         sender_id = status.direct_message['sender_id']
         command, *message_parts = dm_text.split(maxsplit=1)
-        message = message_parts[0] if message_parts else ""
+        message, use_cache = strip_bypass_flag(message_parts[0] if message_parts else "")
 
         if command in ["/call", "/ask"]:
-            api.send_direct_message(sender_id, "Thinking...")
-            asyncio.run(self.respond_with_ai_dm(sender_id, message))
+            with trace_request("twitter", command.lstrip("/")):
+                await self.send_direct_message(sender_id, "Thinking...", PRIORITY_COSMETIC)
+                mark("thinking_sent")
+                await self.respond_with_ai_dm(sender_id, message, use_cache=use_cache, command=command.lstrip("/"))
 
-    async def respond_with_ai(self, status, message: str):
+    async def respond_with_ai(self, status, message: str, use_cache: bool = True, command: str = None):
         """
-        Sends the AI response as a tweet reply.
+        Sends the AI response as a reply thread, or as replies to the tweet in flat mode.
 
         Args:
             status: The tweet status to reply to.
             message (str): The user’s question or message for the AI.
+            use_cache (bool): Whether the response cache may answer this request.
+            command (str): The command that triggered the request, used for model routing.
         """
-        ai_response = await self.fetch_ai_response(message)
+        if self.jobs is not None:
+            try:
+                self.scheduler.take_tokens(status.user.id, None)
+            except RequestShed as e:
+                record_error("shed")
+                print(f"Dropped mention {status.id} from @{status.user.screen_name}: {e.reason}")
+                return
+            target = {"kind": "mention", "status_id": status.id, "screen_name": status.user.screen_name}
+            self.jobs.submit("twitter", target, message, use_cache=use_cache, command=command,
+                             user_id=status.user.id, conversation=("twitter", "mention", status.user.id))
+            return
+        try:
+            async with self.scheduler.slot(status.user.id):
+                ai_response = await self.fetch_ai_response(message, use_cache=use_cache, command=command,
+                                                           user_id=status.user.id,
+                                                           conversation=("twitter", "mention", status.user.id))
+        except RequestShed as e:
+            record_error("shed")
+            # Replying would spend tweet rate limit on a refusal, so the mention is dropped
+            print(f"Dropped mention {status.id} from @{status.user.screen_name}: {e.reason}")
+            return
 
-        # Split response if too long and tweet it
-        response_chunks = [ai_response[i:i + 240] for i in range(0, len(ai_response), 240)]
-        for chunk in response_chunks:
-            api.update_status(f"@{status.user.screen_name} {chunk}", in_reply_to_status_id=status.id)
+        await self.reply_with_parts(status.id, status.user.screen_name, ai_response)
 
-    async def respond_with_ai_dm(self, sender_id, message: str):
+    async def respond_with_ai_dm(self, sender_id, message: str, use_cache: bool = True, command: str = None):
         """
         Sends the AI response as a direct message.
 
         Args:
             sender_id: The Twitter user ID to send the DM to.
             message (str): The user’s question or message for the AI.
+            use_cache (bool): Whether the response cache may answer this request.
+            command (str): The command that triggered the request, used for model routing.
         """
-        ai_response = await self.fetch_ai_response(message)
+        if self.jobs is not None:
+            try:
+                self.scheduler.take_tokens(sender_id, None)
+            except RequestShed:
+                record_error("shed")
+                await self.send_direct_message(sender_id, SHED_MESSAGE)
+                return
+            self.jobs.submit("twitter", {"kind": "dm", "sender_id": sender_id}, message, use_cache=use_cache,
+                             command=command, user_id=sender_id, conversation=("twitter", "dm", sender_id))
+            return
+        try:
+            async with self.scheduler.slot(sender_id):
+                ai_response = await self.fetch_ai_response(message, use_cache=use_cache, command=command,
+                                                           user_id=sender_id,
+                                                           conversation=("twitter", "dm", sender_id))
+        except RequestShed:
+            record_error("shed")
+            ai_response = SHED_MESSAGE
 
         # Split response if too long and DM it
-        response_chunks = [ai_response[i:i + 240] for i in range(0, len(ai_response), 240)]
-        for chunk in response_chunks:
-            api.send_direct_message(sender_id, chunk)
+        for chunk in split_message(ai_response, TWITTER):
+            await self.send_direct_message(sender_id, chunk)
+            mark("chunk_delivered")
+
+    async def deliver_job(self, target: dict, response: str):
+        """
+        Delivers a queued job's AI response as tweet replies or direct messages.
+
+        Args:
+            target (dict): The kind of request, with the tweet to reply to or the DM sender.
+            response (str): The AI response.
+        """
+        if target["kind"] == "dm":
+            for chunk in split_message(response, TWITTER):
+                await self.send_direct_message(target["sender_id"], chunk)
+                mark("chunk_delivered")
+            return
+        await self.reply_with_parts(target["status_id"], target["screen_name"], response)
 
 def run_twitter_bot():
     """Function to instantiate and start the Twitter bot stream."""
-    listener = AIChatBotListener()
+    settings = settings_from_env()
+    auth = twitter_auth(settings)
+    listener = AIChatBotListener(tweepy.API(auth), settings=settings)
     stream = Stream(auth, listener)
-    stream.filter(track=[f"@{api.me().screen_name}"], is_async=True)
+    stream.filter(track=[f"@{listener.screen_name}"], is_async=True)
 
 # Start the Twitter bot when the script is executed directly
 if __name__ == "__main__":
@@ -0,0 +1,238 @@
+import asyncio
+import os
+import random
+import time
+from collections import OrderedDict
+from tweepy import RateLimitError
+from bots.shared.chunking import TWITTER, split_message
+from bots.shared.scheduler import TokenBucket
+
+
+def twitter_retry_after(error: Exception):
+    """Returns the seconds until Twitter's rate limit resets if `error` is a rate limit answer, else None."""
+    if not isinstance(error, RateLimitError):
+        return None
+    response = getattr(error, "response", None)
+    reset = response.headers.get("x-rate-limit-reset") if response is not None else None
+    # Twitter's limits are counted in 15 minute windows; without the header a minute is a cautious guess
+    return max(0.0, float(reset) - time.time()) if reset else 60.0
+
+
+def number_parts(text: str, mention: str = "") -> list:
+    """
+    Splits a response into numbered thread parts, each fitting in a tweet.
+
+    Only the first part carries `mention`; the others reply to the bot's own
+    previous tweet. Parts end with " i/n" when there is more than one.
+
+    Args:
+        text (str): The full response.
+        mention (str): Prefix of the first part, e.g. "@user ".
+
+    Returns:
+        list: The tweets' texts, in order.
+    """
+    reserve = TWITTER.measure(mention)
+    parts = split_message(text, TWITTER, reserve=reserve)
+    if len(parts) == 1:
+        return [mention + parts[0]]
+    # The numbering's width depends on the part count, which depends on the room left for text
+    digits = 1
+    while True:
+        parts = split_message(text, TWITTER, reserve=reserve + 2 * digits + 2)
+        if len(str(len(parts))) <= digits:
+            break
+        digits = len(str(len(parts)))
+    return [(mention if i == 0 else "") + f"{part} {i + 1}/{len(parts)}" for i, part in enumerate(parts)]
+
+
+class Thread:
+    """A reply thread being posted, and how far it got."""
+
+    __slots__ = ("key", "reply_to", "parts", "posted", "attempts", "done")
+
+    def __init__(self, key, reply_to: int, parts: list):
+        self.key = key
+        self.reply_to = reply_to
+        self.parts = parts
+        # Ids of the tweets posted so far; the next part replies to the last one
+        self.posted = []
+        self.attempts = 0
+        self.done = None
+
+    @property
+    def complete(self) -> bool:
+        return len(self.posted) == len(self.parts)
+
+    @property
+    def last_id(self) -> int:
+        return self.posted[-1] if self.posted else self.reply_to
+
+
+class ThreadPublisher:
+    """
+    Posts long answers as reply chains through a rate-limited async queue.
+
+    Each part of a thread replies to the part before it, the first to the
+    mention, so the answer reads top to bottom instead of as sibling
+    replies. `workers` tasks post threads concurrently, each thread in
+    order. Given `posts_per_window`, every tweet first takes a token from a
+    bucket sized to the account's posting limit; without it `post` is
+    expected to pace itself, e.g. through an outbound scheduler.
+
+    When a post fails the thread is retried from the first part not yet
+    posted, after a backoff or, on a rate limit, once the limit resets.
+    A thread that still fails keeps its progress, so publishing it again
+    under the same key, e.g. when the job queue retries it, resumes it
+    instead of posting the first parts twice.
+    """
+
+    def __init__(self, post, workers: int = 4, posts_per_window: int = None, window: float = 10800.0,
+                 max_attempts: int = 5, backoff: float = 2.0, max_pending: int = 1000):
+        """
+        Args:
+            post: Coroutine function `post(text, reply_to)` that tweets a reply and returns its id.
+            workers (int): Number of threads posted concurrently.
+            posts_per_window (int): Tweets the account may post per `window`; unpaced if omitted.
+            window (float): Length of the posting limit's window in seconds.
+            max_attempts (int): Attempts per thread before `publish` gives up.
+            backoff (float): Base of the exponential delay between attempts, in seconds.
+            max_pending (int): Unfinished threads remembered for resuming.
+        """
+        self.post = post
+        self.worker_count = workers
+        self.bucket = TokenBucket(posts_per_window / window, posts_per_window) if posts_per_window else None
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_pending = max_pending
+        self.queue = asyncio.Queue()
+        self.threads = OrderedDict()
+        self.workers = []
+        self.tweets = 0
+        self.published = 0
+        self.retries = 0
+        self.failed = 0
+
+    async def start(self):
+        """Starts the posting workers on the running loop."""
+        self.workers = [asyncio.create_task(self.worker()) for _ in range(self.worker_count)]
+
+    async def publish(self, key, reply_to: int, text: str, mention: str = "") -> list:
+        """
+        Posts `text` as a thread under the tweet `reply_to` and waits until it is complete.
+
+        Args:
+            key: Identifies the thread, e.g. the mention's id; a failed thread with the same key is resumed.
+            reply_to (int): Id of the tweet the thread answers.
+            text (str): The full response.
+            mention (str): Prefix of the first part, e.g. "@user ".
+
+        Returns:
+            list: Ids of the thread's tweets.
+        """
+        thread = self.threads.get(key)
+        if thread is None:
+            thread = Thread(key, reply_to, number_parts(text, mention))
+            self.threads[key] = thread
+            while len(self.threads) > self.max_pending:
+                self.threads.popitem(last=False)
+        elif thread.done is not None and not thread.done.done():
+            # Already being posted
+            return await asyncio.shield(thread.done)
+        else:
+            # Resumed: the parts already posted fixed the thread's text
+            self.threads.move_to_end(key)
+            thread.attempts = 0
+        thread.done = asyncio.get_running_loop().create_future()
+        await self.queue.put(thread)
+        return await asyncio.shield(thread.done)
+
+    async def take_token(self):
+        """Waits until the posting limit allows another tweet."""
+        while self.bucket is not None and not self.bucket.try_take():
+            await asyncio.sleep((1 - self.bucket.tokens) / self.bucket.rate)
+
+    def retry_delay(self, error: Exception, attempt: int) -> float:
+        """Seconds to wait before retrying after `error`: until the limit resets, or a jittered backoff."""
+        retry_after = twitter_retry_after(error)
+        if retry_after is not None:
+            return retry_after
+        return self.backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.0)
+
+    async def worker(self):
+        """Posts queued threads until cancelled; an unexpected error fails its thread, not the worker."""
+        while True:
+            thread = await self.queue.get()
+            try:
+                await self.advance(thread)
+            except Exception as e:
+                print(f"Posting thread {thread.key} failed: {e!r}")
+                self.failed += 1
+                if not thread.done.done():
+                    thread.done.set_exception(e)
+            finally:
+                self.queue.task_done()
+
+    async def advance(self, thread: Thread):
+        """Posts a thread's remaining parts, scheduling a retry or failing it on error."""
+        thread.attempts += 1
+        try:
+            while not thread.complete:
+                await self.take_token()
+                status_id = await self.post(thread.parts[len(thread.posted)], thread.last_id)
+                thread.posted.append(status_id)
+                self.tweets += 1
+        except Exception as e:
+            # Any error fails or retries the thread; cancellation is not an Exception and stops the worker
+            if thread.attempts >= self.max_attempts:
+                self.failed += 1
+                if not thread.done.done():
+                    thread.done.set_exception(e)
+                return
+            self.retries += 1
+            delay = self.retry_delay(e, thread.attempts)
+            print(f"Posting thread {thread.key} stopped after {len(thread.posted)} of {len(thread.parts)} "
+                  f"tweets ({e}); retrying in {delay:.1f}s.")
+            asyncio.get_running_loop().call_later(delay, self.queue.put_nowait, thread)
+            return
+        self.threads.pop(thread.key, None)
+        self.published += 1
+        if not thread.done.done():
+            thread.done.set_result(list(thread.posted))
+
+    async def close(self):
+        """Stops the workers; threads still waiting for a retry are failed."""
+        for task in self.workers:
+            task.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        for thread in self.threads.values():
+            if thread.done is not None and not thread.done.done():
+                thread.done.cancel()
+
+    def stats(self) -> dict:
+        """Returns counts of tweets posted and threads published, retried, failed and pending."""
+        return {
+            "tweets": self.tweets,
+            "published": self.published,
+            "retries": self.retries,
+            "failed": self.failed,
+            "pending": len(self.threads),
+        }
+
+
+def thread_publisher_from_env(post) -> ThreadPublisher:
+    """
+    Builds the thread publisher configured through environment variables.
+
+    `TWITTER_THREAD_WORKERS` sets how many threads are posted at once. The
+    posting limit is left to `post`, which goes through the listener's
+    outbound scheduler.
+
+    Args:
+        post: Coroutine function `post(text, reply_to)` that tweets a reply, within the posting limit, and returns its id.
+
+    Returns:
+        ThreadPublisher: The configured, not yet started, publisher.
+    """
+    return ThreadPublisher(post, workers=int(os.getenv("TWITTER_THREAD_WORKERS", "4")))
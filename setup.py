@@ -6,18 +6,19 @@ setup(
     name="bot",
     version="0.1.0",
     description="A suite of AI-powered bots for Discord, Telegram, and Twitter",
-    long_description=open("README.md").read(),
+    long_description=open("readme.md").read(),
     long_description_content_type="text/markdown",
     author="Khanh Tran",
     author_email="tryevertth@gmail.com",
     url="https://github.com/tryevertthhub/bot",
-    packages=find_packages(),
+    packages=find_packages(exclude=["benchmarks", "benchmarks.*"]),
     install_requires=[
         "discord.py",
         "python-telegram-bot",
         "tweepy",
         "aiohttp",
-        "python-dotenv"
+        "python-dotenv",
+        "cryptography>=39"
     ],
     classifiers=[
         "Programming Language :: Python :: 3",
@@ -27,9 +28,10 @@ setup(
     python_requires=">=3.8",
     entry_points={
         "console_scripts": [
-            "run_discord_bot=bot.discord:run_discord_bot",
-            "run_telegram_bot=bot.telegram:run_telegram_bot",
-            "run_twitter_bot=bot.twitter:run_twitter_bot"
+            "run_bots=bots.runtime:main",
+            "run_discord_bot=bots.discord.bot:run_discord_bot",
+            "run_telegram_bot=bots.telegram.bot:run_telegram_bot",
+            "run_twitter_bot=bots.twitter.bot:run_twitter_bot"
         ]
     },
 )